@@ -24,6 +24,7 @@ class Settings(BaseSettings):
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str = "claude_neo4j_2025"
     NEO4J_DATABASE: str = "neo4j"
+    CHANGE_FEED_ENABLED: bool = True  # log loads to the knowledge graph change feed
 
     # Redis for task queue
     REDIS_HOST: str = "localhost"
@@ -0,0 +1,67 @@
+"""Change Log Events for Graph Loads
+
+The knowledge graph keeps an append-only change log that downstream caches
+and indexes follow (GET /api/v1/graph/changes on the knowledge-graph
+service). Loads append their events in the same transaction as the write,
+in the format of the knowledge-graph service's services/changes.py. Events
+are appended pending and numbered by the knowledge-graph service, so both
+writers share one sequence. The knowledge-graph tests check that this copy
+matches (test_etl_change_log_matches_the_change_feed_format).
+
+Loaded entities are merged by type and name and carry the id from
+neo4j_client.entity_id; events refer to them by that id (entity_id, from_id,
+to_id), with the names also given in properties.
+"""
+
+from typing import Any, Dict, Optional
+import json
+
+CHANGE_SOURCE = "etl-processing"
+
+APPEND_CHANGES_QUERY = """
+WITH datetime.realtime() AS now
+UNWIND range(0, size($events) - 1) AS i
+CREATE (c:ChangeEvent:PendingChange)
+SET c = $events[i], c.position = i,
+    c.stamp = now.epochSeconds * 1000000000 + now.nanosecond,
+    c.at = toString(now)
+"""
+
+
+def _properties(properties: Dict[str, Any]) -> str:
+    return json.dumps(properties, default=str, separators=(",", ":"))
+
+
+def entity_change(
+    op: str,
+    entity_type: str,
+    entity_id: Optional[str],
+    properties: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Event for an entity created or updated by a load"""
+    return {
+        "source": CHANGE_SOURCE,
+        "kind": "entity",
+        "op": op,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "properties": _properties(properties)
+    }
+
+
+def relationship_change(
+    rel_type: str,
+    from_id: Optional[str],
+    to_id: Optional[str],
+    properties: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Event for a relationship created by a load"""
+    return {
+        "source": CHANGE_SOURCE,
+        "kind": "relationship",
+        "op": "create",
+        "rel_type": rel_type,
+        "from_id": from_id,
+        "to_id": to_id,
+        "properties": _properties(properties)
+    }
@@ -3,9 +3,23 @@
 from typing import List, Dict, Any
 from neo4j import GraphDatabase, AsyncGraphDatabase
 from datetime import datetime
+import hashlib
 
 from config import get_settings
 from models.etl_task import ExtractedEntity, ExtractedRelationship, GraphLoadResult
+from processors.change_log import APPEND_CHANGES_QUERY, entity_change, relationship_change
+
+
+def entity_id(entity_type: str, name: str) -> str:
+    """
+    Stable id of an extracted entity
+
+    Loads merge entities by type and name, so the id is derived from them:
+    '<type>_<hash of the name>', e.g. 'product_1f0c...'. Reloading the same
+    entity keeps its id, and change events can refer to it.
+    """
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).hexdigest()
+    return f"{entity_type.lower()}_{digest}"
 
 
 class Neo4jClient:
@@ -41,24 +55,8 @@ class Neo4jClient:
         with self.driver.session(database=self.settings.NEO4J_DATABASE) as session:
             for entity in entities:
                 try:
-                    # Create or merge entity node
-                    query = f"""
-                    MERGE (n:{entity.type.value} {{name: $name}})
-                    ON CREATE SET
-                        n.created_at = datetime(),
-                        n.confidence = $confidence,
-                        n.metadata = $metadata
-                    ON MATCH SET
-                        n.updated_at = datetime(),
-                        n.confidence = $confidence
-                    RETURN n
-                    """
-
-                    session.run(
-                        query,
-                        name=entity.text,
-                        confidence=entity.confidence,
-                        metadata=entity.metadata
+                    session.execute_write(
+                        self._load_entity_tx, entity, self.settings.CHANGE_FEED_ENABLED
                     )
 
                     result.entities_created += 1
@@ -85,24 +83,8 @@ class Neo4jClient:
         with self.driver.session(database=self.settings.NEO4J_DATABASE) as session:
             for rel in relationships:
                 try:
-                    # Create relationship between nodes
-                    query = f"""
-                    MATCH (a {{name: $source}})
-                    MATCH (b {{name: $target}})
-                    MERGE (a)-[r:{rel.relation_type.value}]->(b)
-                    ON CREATE SET
-                        r.created_at = datetime(),
-                        r.confidence = $confidence,
-                        r.metadata = $metadata
-                    RETURN r
-                    """
-
-                    session.run(
-                        query,
-                        source=rel.source_entity,
-                        target=rel.target_entity,
-                        confidence=rel.confidence,
-                        metadata=rel.metadata
+                    session.execute_write(
+                        self._load_relationship_tx, rel, self.settings.CHANGE_FEED_ENABLED
                     )
 
                     result.relationships_created += 1
@@ -117,6 +99,79 @@ class Neo4jClient:
 
         return result
 
+    @staticmethod
+    def _load_entity_tx(tx, entity: ExtractedEntity, log_changes: bool):
+        """Create or merge an entity node and log the change"""
+        # updated_at is only set on match, so it is still null on a new node;
+        # nodes merged before ids were assigned get theirs on the next load
+        query = f"""
+        MERGE (n:{entity.type.value} {{name: $name}})
+        ON CREATE SET
+            n.id = $id,
+            n.created_at = datetime(),
+            n.confidence = $confidence,
+            n.metadata = $metadata
+        ON MATCH SET
+            n.id = coalesce(n.id, $id),
+            n.updated_at = datetime(),
+            n.confidence = $confidence
+        RETURN n.id AS id, n.updated_at IS NULL AS created
+        """
+        record = tx.run(
+            query,
+            id=entity_id(entity.type.value, entity.text),
+            name=entity.text,
+            confidence=entity.confidence,
+            metadata=entity.metadata
+        ).single()
+
+        if log_changes:
+            event = entity_change(
+                "create" if record["created"] else "update",
+                entity.type.value,
+                record["id"],
+                {"name": entity.text, "confidence": entity.confidence}
+            )
+            tx.run(APPEND_CHANGES_QUERY, events=[event])
+
+    @staticmethod
+    def _load_relationship_tx(tx, rel: ExtractedRelationship, log_changes: bool):
+        """Merge a relationship between named nodes and log the ones created"""
+        rel_type = rel.relation_type.value
+        query = f"""
+        MATCH (a {{name: $source}})
+        MATCH (b {{name: $target}})
+        WITH a, b, EXISTS {{ (a)-[:{rel_type}]->(b) }} AS existed
+        MERGE (a)-[r:{rel_type}]->(b)
+        ON CREATE SET
+            r.created_at = datetime(),
+            r.confidence = $confidence,
+            r.metadata = $metadata
+        RETURN a.id AS from_id, b.id AS to_id, existed
+        """
+        records = list(tx.run(
+            query,
+            source=rel.source_entity,
+            target=rel.target_entity,
+            confidence=rel.confidence,
+            metadata=rel.metadata
+        ))
+        if not log_changes:
+            return
+
+        events = [
+            relationship_change(
+                rel_type,
+                record["from_id"],
+                record["to_id"],
+                {"source": rel.source_entity, "target": rel.target_entity, "confidence": rel.confidence}
+            )
+            for record in records
+            if not record["existed"]
+        ]
+        if events:
+            tx.run(APPEND_CHANGES_QUERY, events=events)
+
     async def health_check(self) -> bool:
         """Check Neo4j connection health"""
         try:
@@ -0,0 +1,114 @@
+"""
+API Responses
+
+JSON rendering for graph payloads. Row-heavy endpoints return their body
+through GraphJSONResponse directly, so rows are encoded once by orjson (or
+the stdlib encoder when orjson is not installed) instead of being
+re-validated by the response model first. Neo4j temporal values become
+ISO 8601 strings and spatial points become coordinate lists. Values that
+are already encoded (product cards) are spliced into the body as bytes.
+"""
+from typing import Any, Dict, List, Optional
+from fastapi.responses import JSONResponse, Response
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def encode_value(value: Any) -> Any:
+    """
+    JSON form of a value the encoder does not handle natively
+
+    Args:
+        value: Neo4j temporal (Date, Time, DateTime, Duration), spatial point,
+            Python date/time, set, or any other object
+
+    Returns:
+        ISO 8601 string for temporal values, a list for points, tuples and
+        sets, str() for anything else
+    """
+    if hasattr(value, "iso_format"):
+        return value.iso_format()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, (tuple, set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode content as compact UTF-8 JSON
+
+    Args:
+        content: JSON-like structure, possibly holding Neo4j values
+
+    Returns:
+        Encoded bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=encode_value, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        content, default=encode_value, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class GraphJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def query_response(
+    results: List[Dict[str, Any]],
+    message: str,
+    next_cursor: Optional[str] = None,
+    truncated: bool = False
+) -> GraphJSONResponse:
+    """
+    Render a QueryResponse body without re-validating its rows
+
+    Args:
+        results: Result rows
+        message: Response message
+        next_cursor: Cursor for the next page, if any
+        truncated: Whether the rows were cut off at the row limit
+
+    Returns:
+        GraphJSONResponse with the QueryResponse fields
+    """
+    return GraphJSONResponse({
+        "success": True,
+        "message": message,
+        "results": results,
+        "count": len(results),
+        "next_cursor": next_cursor,
+        "truncated": truncated
+    })
+
+
+def encoded_response(content: Dict[str, Any], encoded: Dict[str, bytes]) -> Response:
+    """
+    Render a JSON object holding values that are already encoded
+
+    Args:
+        content: Fields to encode
+        encoded: Fields whose values are JSON bytes, written out unchanged
+
+    Returns:
+        Response whose body is content with the encoded fields appended
+    """
+    body = [dumps(content)[:-1]]
+    separator = b"," if content else b""
+    for key, value in encoded.items():
+        body.append(separator + dumps(key) + b":" + value)
+        separator = b","
+    body.append(b"}")
+    return Response(content=b"".join(body), media_type="application/json")
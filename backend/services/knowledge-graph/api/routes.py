@@ -3,52 +3,65 @@ API Routes
 
 FastAPI route definitions for Knowledge Graph Service
 """
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional
+from .responses import GraphJSONResponse, encoded_response, query_response
 from .schemas import (
     EntityCreateRequest, EntityUpdateRequest, EntityResponse,
+    BulkEntityCreateRequest, BulkWriteResponse, BulkUpsertResponse,
+    BatchGetRequest, BatchGetResponse, ResolveRequest, ResolveResponse,
     RelationshipCreateRequest, RelationshipResponse,
-    QueryRequest, QueryResponse, SearchRequest, HealthResponse
+    BulkRelationshipUpsertRequest, BulkRelationshipResponse, BatchRequest, BatchResponse,
+    QueryRequest, QueryResponse, SearchRequest, SemanticSearchRequest, SemanticSearchResponse,
+    SubgraphResponse, HealthResponse,
+    AnalyticsResponse, RecommendationResponse, OfferResponse,
+    ProductCardsRequest, ProductCardsResponse, ChangesResponse
 )
-from services.graph_service import GraphService
+from services.async_graph_service import AsyncGraphService
+from services.batch import BatchError
+from services.cypher import SUBGRAPH_MAX_DEPTH, CHANGE_FEED_MAX_EVENTS
 from config import get_settings
 from datetime import datetime
+import asyncio
+import json
+import zlib
 import logging
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/v1/graph", tags=["knowledge-graph"])
+router = APIRouter(
+    prefix="/api/v1/graph",
+    tags=["knowledge-graph"],
+    default_response_class=GraphJSONResponse
+)
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Idle change streams send a comment this often so proxies keep them open
+CHANGE_STREAM_HEARTBEAT_SECONDS = 15.0
 
 
-def get_graph_service():
+def get_graph_service(request: Request) -> AsyncGraphService:
     """
-    Dependency: Provide GraphService instance
+    Dependency: Provide the shared AsyncGraphService instance
 
-    Yields:
-        GraphService: Configured service instance
+    The service is created once in the application lifespan (see main.py)
+    so every request reuses the same pooled Neo4j driver.
 
-    Note: Uses try/finally to ensure connection cleanup
+    Returns:
+        AsyncGraphService: Process-wide service instance
     """
-    settings = get_settings()
-    service = GraphService(
-        uri=settings.NEO4J_URI,
-        user=settings.NEO4J_USER,
-        password=settings.NEO4J_PASSWORD
-    )
-    try:
-        yield service
-    finally:
-        service.close()
+    return request.app.state.graph_service
 
 
 @router.get("/health", response_model=HealthResponse)
-async def health_check(service: GraphService = Depends(get_graph_service)):
+async def health_check(service: AsyncGraphService = Depends(get_graph_service)):
     """
     Health check endpoint
 
     Returns:
         HealthResponse: Service health status
     """
-    is_healthy = service.health_check()
+    is_healthy = await service.health_check()
     return HealthResponse(
         status="healthy" if is_healthy else "unhealthy",
         database="neo4j",
@@ -56,37 +69,83 @@ async def health_check(service: GraphService = Depends(get_graph_service)):
     )
 
 
+@router.get("/pool", response_model=QueryResponse)
+async def get_pool_metrics(service: AsyncGraphService = Depends(get_graph_service)):
+    """
+    Connection pool utilization metrics
+
+    Returns:
+        QueryResponse: Pool size, sessions in use and idle, peak usage
+        and utilization
+    """
+    return QueryResponse(
+        success=True,
+        message="Pool metrics retrieved successfully",
+        results=[service.pool_metrics()],
+        count=1
+    )
+
+
+@router.get("/cache", response_model=QueryResponse)
+async def get_cache_metrics(service: AsyncGraphService = Depends(get_graph_service)):
+    """
+    Read-through cache metrics
+
+    Returns:
+        QueryResponse: Hit/miss counters, hit ratio and size of the entity
+        and relationship read caches
+    """
+    return QueryResponse(
+        success=True,
+        message="Cache metrics retrieved successfully",
+        results=[service.cache_metrics()],
+        count=1
+    )
+
+
 @router.get("/entities", response_model=QueryResponse)
 async def list_entities(
     search: Optional[str] = None,
     entity_type: Optional[str] = None,
-    limit: int = 100,
-    service: GraphService = Depends(get_graph_service)
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     List all entities with optional search and filtering
 
+    Without search text, entities are paged in (type, id) order: pass the
+    returned next_cursor back as cursor to fetch the following page.
+
     Args:
         search: Optional search text to filter entities
         entity_type: Optional entity type filter
         limit: Maximum number of entities to return (default: 100)
+        cursor: Cursor from a previous page
 
     Returns:
         QueryResponse: List of entities matching criteria
     """
     try:
-        results = service.search_entities(
-            entity_type=entity_type,
-            search_text=search,
-            properties=None,
-            limit=limit
-        )
-        return QueryResponse(
-            success=True,
-            message="Entities retrieved successfully",
-            results=results,
-            count=len(results)
-        )
+        next_cursor = None
+        if search:
+            if cursor:
+                raise ValueError("cursor pagination is not supported with search")
+            results = await service.search_entities(
+                entity_type=entity_type,
+                search_text=search,
+                properties=None,
+                limit=limit
+            )
+        else:
+            results, next_cursor = await service.list_entities(
+                entity_type=entity_type,
+                limit=limit,
+                cursor=cursor
+            )
+        return query_response(results, "Entities retrieved successfully", next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to list entities: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -95,7 +154,7 @@ async def list_entities(
 @router.post("/entities", response_model=EntityResponse, status_code=status.HTTP_201_CREATED)
 async def create_entity(
     request: EntityCreateRequest,
-    service: GraphService = Depends(get_graph_service)
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Create new entity
@@ -110,7 +169,7 @@ async def create_entity(
         HTTPException: 400 if validation fails, 500 if creation fails
     """
     try:
-        entity_id = service.create_entity(
+        entity_id = await service.create_entity(
             entity_type=request.entity_type,
             properties=request.properties
         )
@@ -127,24 +186,188 @@ async def create_entity(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/entities:bulk", response_model=BulkWriteResponse)
+async def create_entities_bulk(
+    request: BulkEntityCreateRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Create many entities in batched transactions
+
+    Rows are grouped by entity type and written with UNWIND in chunks of
+    batch_size. Invalid or conflicting rows are reported individually and
+    do not abort the rest of the batch.
+
+    Args:
+        request: Entities to create and batch size
+
+    Returns:
+        BulkWriteResponse: Created/failed counts and per-row errors
+
+    Raises:
+        HTTPException: 500 if the database cannot be reached
+    """
+    try:
+        result = await service.create_entities_bulk(
+            entities=[entity.model_dump() for entity in request.entities],
+            batch_size=request.batch_size
+        )
+    except Exception as e:
+        logger.error(f"Bulk entity creation failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return BulkWriteResponse(
+        success=result["failed"] == 0,
+        message=f"Created {result['created']} entities, {result['failed']} failed",
+        **result
+    )
+
+
+@router.post("/entities:upsert", response_model=BulkUpsertResponse)
+async def upsert_entities(
+    request: BulkEntityCreateRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Create or update entities, skipping those whose content is unchanged
+
+    A content hash stored on each node lets unchanged rows be skipped without
+    a write, so re-syncing a mostly static catalog is nearly free.
+
+    Args:
+        request: Entities to upsert and batch size
+
+    Returns:
+        BulkUpsertResponse: Written/skipped/failed counts and per-row errors
+
+    Raises:
+        HTTPException: 500 if the database cannot be reached
+    """
+    try:
+        result = await service.upsert_entities(
+            entities=[entity.model_dump() for entity in request.entities],
+            batch_size=request.batch_size
+        )
+    except Exception as e:
+        logger.error(f"Entity upsert failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return BulkUpsertResponse(
+        success=result["failed"] == 0,
+        message=(
+            f"Wrote {result['written']} entities, {result['skipped']} unchanged, "
+            f"{result['failed']} failed"
+        ),
+        **result
+    )
+
+
+@router.post("/entities:batchGet", response_model=BatchGetResponse)
+async def batch_get_entities(
+    request: BatchGetRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Fetch many entities by id in one round-trip
+
+    Replaces one GET /entities/{id} per entity: ids are resolved with one
+    UNWIND query per label (or from the entity cache) and returned in
+    request order, with found=false for ids that do not exist.
+
+    Args:
+        request: Entity ids and optional entity type
+
+    Returns:
+        BatchGetResponse: One entry per requested id
+
+    Raises:
+        HTTPException: 400 if entity_type is invalid
+    """
+    try:
+        results = await service.batch_get_entities(request.ids, entity_type=request.entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch get of {len(request.ids)} entities failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    found = sum(1 for result in results if result["found"])
+    return GraphJSONResponse({
+        "success": True,
+        "message": f"Found {found} of {len(results)} entities",
+        "results": results,
+        "found": found,
+        "missing": len(results) - found
+    })
+
+
+@router.post("/entities:resolve", response_model=ResolveResponse)
+async def resolve_entities(
+    request: ResolveRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Match surface strings to existing entities by name
+
+    Names are compared by character-trigram similarity, so spelling,
+    casing, punctuation and word-order variants ("Gel Memory-Foam",
+    "gel memory foam") resolve to the same entity. Callers creating
+    entities can use the best candidate instead of a new node.
+
+    Args:
+        request: Surface strings, optional entity type, candidate limit and
+            minimum score
+
+    Returns:
+        ResolveResponse: Candidates per name, best first
+
+    Raises:
+        HTTPException: 400 if entity_type is invalid
+    """
+    try:
+        results = await service.resolve_entities(
+            request.names,
+            entity_type=request.entity_type,
+            limit=request.limit,
+            min_score=request.min_score
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Entity resolution failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    matched = sum(1 for result in results if result["candidates"])
+    return GraphJSONResponse({
+        "success": True,
+        "message": f"Matched {matched} of {len(results)} names",
+        "results": results
+    })
+
+
 @router.get("/entities/{entity_id}", response_model=EntityResponse)
 async def get_entity(
     entity_id: str,
-    service: GraphService = Depends(get_graph_service)
+    entity_type: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Get entity by ID
 
     Args:
         entity_id: Entity identifier
+        entity_type: Optional entity type, enables a direct index lookup
 
     Returns:
         EntityResponse: Entity data
 
     Raises:
-        HTTPException: 404 if entity not found
+        HTTPException: 400 if entity_type is invalid, 404 if entity not found
     """
-    entity = service.query_entity(entity_id)
+    try:
+        entity = await service.query_entity(entity_id, entity_type=entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not entity:
         raise HTTPException(
             status_code=404,
@@ -161,7 +384,8 @@ async def get_entity(
 async def update_entity(
     entity_id: str,
     request: EntityUpdateRequest,
-    service: GraphService = Depends(get_graph_service)
+    entity_type: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Update entity properties
@@ -169,21 +393,27 @@ async def update_entity(
     Args:
         entity_id: Entity identifier
         request: Update request with properties
+        entity_type: Optional entity type, enables a direct index lookup
 
     Returns:
         EntityResponse: Update confirmation
 
     Raises:
-        HTTPException: 404 if entity not found, 500 if update fails
+        HTTPException: 400 if entity_type is invalid, 404 if entity not found,
+        500 if update fails
     """
     # Verify entity exists
-    if not service.query_entity(entity_id):
+    try:
+        entity = await service.query_entity(entity_id, entity_type=entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not entity:
         raise HTTPException(
             status_code=404,
             detail=f"Entity {entity_id} not found"
         )
 
-    success = service.update_entity(entity_id, request.properties)
+    success = await service.update_entity(entity_id, request.properties, entity_type=entity_type)
     if not success:
         raise HTTPException(
             status_code=500,
@@ -200,21 +430,26 @@ async def update_entity(
 @router.delete("/entities/{entity_id}", response_model=EntityResponse)
 async def delete_entity(
     entity_id: str,
-    service: GraphService = Depends(get_graph_service)
+    entity_type: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Delete entity and its relationships
 
     Args:
         entity_id: Entity identifier
+        entity_type: Optional entity type, enables a direct index lookup
 
     Returns:
         EntityResponse: Deletion confirmation
 
     Raises:
-        HTTPException: 404 if entity not found
+        HTTPException: 400 if entity_type is invalid, 404 if entity not found
     """
-    success = service.delete_entity(entity_id)
+    try:
+        success = await service.delete_entity(entity_id, entity_type=entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not success:
         raise HTTPException(
             status_code=404,
@@ -227,42 +462,95 @@ async def delete_entity(
     )
 
 
+@router.get("/entities/{entity_id}/subgraph", response_model=SubgraphResponse)
+async def get_subgraph(
+    entity_id: str,
+    depth: int = Query(default=2, ge=1, le=SUBGRAPH_MAX_DEPTH),
+    rel_types: Optional[List[str]] = Query(None, description="Relationship types to follow"),
+    max_nodes: int = Query(default=200, ge=1, le=2000),
+    fanout: int = Query(default=50, ge=1, le=1000, description="Relationships expanded per node per hop"),
+    entity_type: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Get the neighborhood of an entity in one round-trip
+
+    Traverses relationships in both directions up to `depth` hops and
+    returns the distinct nodes and edges found. Per-node fan-out and the
+    total node count are capped, so supernodes are sampled rather than
+    expanded in full.
+
+    Args:
+        entity_id: Root entity identifier
+        depth: Number of hops (default: 2)
+        rel_types: Optional relationship types to follow (repeatable)
+        max_nodes: Maximum nodes returned, root included (default: 200)
+        fanout: Maximum relationships expanded per node per hop (default: 50)
+        entity_type: Optional root entity type, enables a direct index lookup
+
+    Returns:
+        SubgraphResponse: Nodes and edges of the neighborhood
+
+    Raises:
+        HTTPException: 400 if a parameter is invalid, 404 if entity not found
+    """
+    try:
+        subgraph = await service.subgraph(
+            entity_id,
+            depth=depth,
+            rel_types=rel_types,
+            max_nodes=max_nodes,
+            fanout=fanout,
+            entity_type=entity_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to get subgraph of {entity_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if subgraph is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Entity {entity_id} not found"
+        )
+    return GraphJSONResponse({
+        "success": True,
+        "message": f"Subgraph retrieved: {len(subgraph['nodes'])} nodes, {len(subgraph['edges'])} edges",
+        **subgraph
+    })
+
+
 @router.get("/relationships", response_model=QueryResponse)
 async def list_relationships(
-    limit: int = 100,
-    service: GraphService = Depends(get_graph_service)
+    rel_type: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     List all relationships
 
+    Relationships are paged by source entity; pass the returned next_cursor
+    back as cursor to fetch the following page.
+
     Args:
+        rel_type: Optional relationship type filter
         limit: Maximum number of relationships to return (default: 100)
+        cursor: Cursor from a previous page
 
     Returns:
         QueryResponse: List of all relationships
     """
     try:
-        # Execute Cypher query to get all relationships with their nodes
-        query = """
-        MATCH (source)-[r]->(target)
-        RETURN
-            id(r) as id,
-            source.id as source_id,
-            labels(source)[0] as source_type,
-            type(r) as type,
-            target.id as target_id,
-            labels(target)[0] as target_type,
-            properties(r) as properties
-        LIMIT $limit
-        """
-        results = service.execute_cypher(query, {"limit": limit})
-
-        return QueryResponse(
-            success=True,
-            message="Relationships retrieved successfully",
-            results=results,
-            count=len(results)
+        results, next_cursor = await service.list_relationships(
+            rel_type=rel_type,
+            limit=limit,
+            cursor=cursor
         )
+
+        return query_response(results, "Relationships retrieved successfully", next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to list relationships: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -271,7 +559,7 @@ async def list_relationships(
 @router.post("/relationships", response_model=RelationshipResponse, status_code=status.HTTP_201_CREATED)
 async def create_relationship(
     request: RelationshipCreateRequest,
-    service: GraphService = Depends(get_graph_service)
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Create relationship between entities
@@ -285,24 +573,31 @@ async def create_relationship(
     Raises:
         HTTPException: 404 if entities not found, 400 if creation fails
     """
-    # Verify both entities exist
-    if not service.query_entity(request.from_id):
+    # Verify both entities exist (also primes the id -> label cache)
+    try:
+        source = await service.query_entity(request.from_id, entity_type=request.from_type)
+        target = await service.query_entity(request.to_id, entity_type=request.to_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not source:
         raise HTTPException(
             status_code=404,
             detail=f"Source entity {request.from_id} not found"
         )
-    if not service.query_entity(request.to_id):
+    if not target:
         raise HTTPException(
             status_code=404,
             detail=f"Target entity {request.to_id} not found"
         )
 
     try:
-        success = service.create_relationship(
+        success = await service.create_relationship(
             from_id=request.from_id,
             to_id=request.to_id,
             rel_type=request.rel_type,
-            properties=request.properties
+            properties=request.properties,
+            from_type=request.from_type,
+            to_type=request.to_type
         )
 
         if not success:
@@ -323,12 +618,56 @@ async def create_relationship(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/relationships:bulk", response_model=BulkRelationshipResponse)
+async def upsert_relationships_bulk(
+    request: BulkRelationshipUpsertRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Create or update many relationships in batched transactions
+
+    Rows are grouped by relationship type and written with UNWIND + MERGE
+    in chunks of batch_size, so re-running an import updates existing
+    edges instead of duplicating them. Pass from_type/to_type to resolve
+    endpoints with a direct index lookup.
+
+    Args:
+        request: Relationships to upsert and batch size
+
+    Returns:
+        BulkRelationshipResponse: Created/matched/missing/failed counts and
+        per-row errors
+
+    Raises:
+        HTTPException: 500 if the database cannot be reached
+    """
+    try:
+        result = await service.upsert_relationships_bulk(
+            relationships=[relationship.model_dump() for relationship in request.relationships],
+            batch_size=request.batch_size
+        )
+    except Exception as e:
+        logger.error(f"Bulk relationship upsert failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return BulkRelationshipResponse(
+        success=result["failed"] == 0 and result["missing"] == 0,
+        message=(
+            f"Created {result['created']}, matched {result['matched']} relationships; "
+            f"{result['missing']} missing endpoints, {result['failed']} failed"
+        ),
+        **result
+    )
+
+
 @router.delete("/relationships", response_model=RelationshipResponse)
 async def delete_relationship(
     from_id: str,
     to_id: str,
     rel_type: str,
-    service: GraphService = Depends(get_graph_service)
+    from_type: Optional[str] = None,
+    to_type: Optional[str] = None,
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Delete relationship between entities
@@ -337,14 +676,24 @@ async def delete_relationship(
         from_id: Source entity ID
         to_id: Target entity ID
         rel_type: Relationship type
+        from_type: Optional source entity type
+        to_type: Optional target entity type
 
     Returns:
         RelationshipResponse: Deletion confirmation
 
     Raises:
-        HTTPException: 404 if relationship not found
+        HTTPException: 400 if an entity type is invalid,
+        404 if relationship not found
     """
-    success = service.delete_relationship(from_id, to_id, rel_type)
+    try:
+        success = await service.delete_relationship(
+            from_id, to_id, rel_type,
+            from_type=from_type,
+            to_type=to_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not success:
         raise HTTPException(
             status_code=404,
@@ -356,36 +705,89 @@ async def delete_relationship(
     )
 
 
+@router.post("/batch", response_model=BatchResponse)
+async def execute_batch(
+    request: BatchRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Apply create, update, delete and relate operations atomically
+
+    Replaces a sequence of single-entity calls (e.g. a product with its
+    features, offers and edges): every operation is validated against the
+    entity and relationship models first, then all of them are written in
+    one transaction, grouped into a few UNWIND statements. Either every
+    operation is applied or none is.
+
+    Args:
+        request: Ordered operations
+
+    Returns:
+        BatchResponse: Counts per operation kind
+
+    Raises:
+        HTTPException: 400 with per-operation 'errors' ({index, error}) if an
+        operation is invalid or refers to a missing entity; 500 if the
+        transaction fails
+    """
+    try:
+        result = await service.execute_batch(
+            [operation.model_dump(exclude_none=True) for operation in request.operations]
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return BatchResponse(
+        success=True,
+        message=f"Applied {result['operations']} operations in {result['statements']} statements",
+        **result
+    )
+
+
 @router.post("/query", response_model=QueryResponse)
 async def execute_query(
     request: QueryRequest,
-    service: GraphService = Depends(get_graph_service)
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Execute custom Cypher query
 
+    Queries run with a transaction timeout and a row ceiling; results past
+    the ceiling are dropped and flagged with truncated=true. When plan
+    checking is enabled, queries whose plan scans all nodes or builds a
+    cartesian product above the configured estimate are rejected.
+
     Args:
-        request: Query request with Cypher string and parameters
+        request: Query request with Cypher string, parameters and optional
+            tighter timeout / row limit
 
     Returns:
         QueryResponse: Query results
 
     Raises:
-        HTTPException: 400 if query is invalid or contains dangerous operations
+        HTTPException: 400 if query is invalid, contains dangerous operations
+        or fails the plan check
     """
     try:
-        results = service.execute_cypher(
+        result = await service.execute_query(
             query=request.query,
-            params=request.params
+            params=request.params,
+            timeout=request.timeout,
+            max_rows=request.max_rows
         )
-        return QueryResponse(
-            success=True,
-            message="Query executed successfully",
-            results=results,
-            count=len(results)
+        return query_response(
+            result["records"],
+            "Query executed successfully (results truncated)"
+            if result["truncated"] else "Query executed successfully",
+            truncated=result["truncated"]
         )
     except ValueError as e:
-        logger.warning(f"Dangerous query rejected: {e}")
+        logger.warning(f"Query rejected: {e}")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Query execution failed: {e}", exc_info=True)
@@ -395,11 +797,14 @@ async def execute_query(
 @router.post("/search", response_model=QueryResponse)
 async def search_entities(
     request: SearchRequest,
-    service: GraphService = Depends(get_graph_service)
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Search entities by type, text, or properties
 
+    Text searches use the full-text indexes; results are ordered by
+    relevance and include 'score', 'highlight' and 'entity_type'.
+
     Args:
         request: Search request with filters
 
@@ -407,55 +812,85 @@ async def search_entities(
         QueryResponse: Search results
 
     Raises:
-        HTTPException: 500 if search fails
+        HTTPException: 400 if filters are invalid, 500 if search fails
     """
     try:
-        results = service.search_entities(
+        results = await service.search_entities(
             entity_type=request.entity_type,
             search_text=request.search_text,
             properties=request.properties,
-            limit=request.limit
-        )
-        return QueryResponse(
-            success=True,
-            message="Search completed successfully",
-            results=results,
-            count=len(results)
+            limit=request.limit,
+            min_score=request.min_score
         )
+        return query_response(results, "Search completed successfully")
+    except ValueError as e:
+        logger.warning(f"Invalid search request: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/search/semantic", response_model=SemanticSearchResponse)
+async def semantic_search(
+    request: SemanticSearchRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Find entities similar to a text
+
+    Compares the text to entity names and descriptions as hashed TF-IDF
+    vectors (cosine similarity), so "cooling pillow for hot sleepers"
+    finds products sharing its more distinctive words in any order, rather
+    than only exact substrings.
+
+    Args:
+        request: Query text, optional entity types, result limit and
+            minimum score
+
+    Returns:
+        SemanticSearchResponse: Matches, best first
+
+    Raises:
+        HTTPException: 400 if an entity type is invalid, 500 if search fails
+    """
+    try:
+        results = await service.semantic_search(
+            request.text,
+            entity_types=request.entity_types,
+            limit=request.limit,
+            min_score=request.min_score
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Semantic search failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return GraphJSONResponse({
+        "success": True,
+        "message": f"Found {len(results)} similar entities",
+        "results": results,
+        "count": len(results)
+    })
+
+
 @router.get("/stats", response_model=QueryResponse)
 async def get_graph_stats(
-    service: GraphService = Depends(get_graph_service)
+    service: AsyncGraphService = Depends(get_graph_service)
 ):
     """
     Get graph statistics
 
+    Counts come from Neo4j's count store, so the endpoint costs the same on
+    any graph size and is safe to poll.
+
     Returns:
-        QueryResponse: Graph statistics including node and relationship counts
+        QueryResponse: Graph statistics including node and relationship
+        counts, per node label and per relationship type
     """
     try:
-        # Execute Cypher queries to get stats
-        node_count_query = "MATCH (n) RETURN count(n) as total_nodes"
-        rel_count_query = "MATCH ()-[r]->() RETURN count(r) as total_relationships"
-        node_types_query = """
-        MATCH (n)
-        RETURN labels(n)[0] as type, count(*) as count
-        ORDER BY count DESC
-        """
-
-        node_count_result = service.execute_cypher(node_count_query, {})
-        rel_count_result = service.execute_cypher(rel_count_query, {})
-        node_types_result = service.execute_cypher(node_types_query, {})
-
-        stats = {
-            "total_nodes": node_count_result[0]["total_nodes"] if node_count_result else 0,
-            "total_relationships": rel_count_result[0]["total_relationships"] if rel_count_result else 0,
-            "node_types": node_types_result
-        }
+        stats = await service.graph_stats()
 
         return QueryResponse(
             success=True,
@@ -466,3 +901,506 @@ async def get_graph_stats(
     except Exception as e:
         logger.error(f"Failed to get stats: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/pagerank", response_model=AnalyticsResponse)
+async def analytics_pagerank(
+    entity_type: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=1000),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Rank entities by PageRank centrality
+
+    Computed on the in-memory graph projection, so it does not query Neo4j
+    (except to build the projection on first use).
+
+    Args:
+        entity_type: Optional label to rank within (e.g. Product)
+        limit: Number of entities to return
+
+    Returns:
+        AnalyticsResponse: Entities with id, type and score, best first
+    """
+    try:
+        projection = await service.get_projection()
+        results = projection.pagerank(entity_type=entity_type, limit=limit)
+
+        return AnalyticsResponse(
+            success=True,
+            message=f"Ranked {len(results)} entities",
+            results=results,
+            projection=service.projection_info()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to compute PageRank: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/degree", response_model=AnalyticsResponse)
+async def analytics_degree(
+    entity_type: Optional[str] = None,
+    direction: str = Query(default="both", description="out, in or both"),
+    limit: int = Query(default=20, ge=1, le=1000),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Rank entities by number of relationships
+
+    Args:
+        entity_type: Optional label to rank within
+        direction: Count outgoing, incoming or all relationships
+        limit: Number of entities to return
+
+    Returns:
+        AnalyticsResponse: Entities with id, type and degree, highest first
+    """
+    try:
+        projection = await service.get_projection()
+        results = projection.degree(entity_type=entity_type, direction=direction, limit=limit)
+
+        return AnalyticsResponse(
+            success=True,
+            message=f"Ranked {len(results)} entities",
+            results=results,
+            projection=service.projection_info()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to compute degree: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/similar/{entity_id}", response_model=AnalyticsResponse)
+async def analytics_similar(
+    entity_id: str,
+    entity_type: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=1000),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Find entities that share the most neighbours with an entity
+
+    For a feature, returns the features found on the same products; for a
+    product, the products sharing its features, problems and scenarios.
+
+    Args:
+        entity_id: Entity to compare against
+        entity_type: Label of candidates (default: the entity's own label)
+        limit: Number of entities to return
+
+    Returns:
+        AnalyticsResponse: Entities with id, type, shared neighbour count and
+        Jaccard similarity, most shared first
+
+    Raises:
+        HTTPException: 400 if entity_type is invalid, 404 if the entity is
+        not in the projection
+    """
+    try:
+        projection = await service.get_projection()
+        results = projection.similar(entity_id, entity_type=entity_type, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to find entities similar to {entity_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if results is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Entity {entity_id} not found in analytics projection"
+        )
+    return AnalyticsResponse(
+        success=True,
+        message=f"Found {len(results)} similar entities",
+        results=results,
+        projection=service.projection_info()
+    )
+
+
+@router.post("/analytics/refresh", response_model=AnalyticsResponse)
+async def analytics_refresh(
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Rebuild the analytics projection from Neo4j now
+
+    Returns:
+        AnalyticsResponse: Description of the new snapshot
+    """
+    try:
+        await service.refresh_projection()
+
+        return AnalyticsResponse(
+            success=True,
+            message="Analytics projection rebuilt",
+            projection=service.projection_info()
+        )
+    except Exception as e:
+        logger.error(f"Failed to rebuild analytics projection: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/recommendations", response_model=RecommendationResponse)
+async def get_recommendations(
+    problem: Optional[str] = Query(None, description="Problem id the product solves"),
+    user_group: Optional[str] = Query(None, description="UserGroup id the product targets"),
+    scenario: Optional[str] = Query(None, description="Scenario id the product applies to"),
+    limit: int = Query(default=20, ge=1, le=1000),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Products that solve a problem for a user group in a scenario
+
+    Any of the three facets may be omitted, but at least one is required.
+    Answered from the precomputed recommendation index; a product's score is
+    the product of its SOLVES effectiveness, APPLIES_TO relevance and
+    1 / TARGETS priority for the requested facets.
+
+    Args:
+        problem: Problem id
+        user_group: UserGroup id
+        scenario: Scenario id
+        limit: Maximum products to return
+
+    Returns:
+        RecommendationResponse: Ranked products and total matches
+
+    Raises:
+        HTTPException: 400 if no facet is given
+    """
+    try:
+        result = await service.recommend(
+            problem=problem, user_group=user_group, scenario=scenario, limit=limit
+        )
+
+        return RecommendationResponse(
+            success=True,
+            message=f"Found {result['total']} products",
+            products=result["products"],
+            total=result["total"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to get recommendations: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/offers", response_model=OfferResponse)
+async def get_offers(
+    sku: str = Query(..., min_length=1, description="Product SKU"),
+    region: Optional[str] = Query(None, description="Region code; all regions if omitted"),
+    include_unavailable: bool = Query(False, description="Include offers with availability false"),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Offers for a SKU that are valid now
+
+    Answered from the in-memory offer index; offers outside their
+    valid_from/valid_until window are filtered out at lookup time.
+
+    Args:
+        sku: Product SKU
+        region: Region code
+        include_unavailable: Also return unavailable offers
+
+    Returns:
+        OfferResponse: Offers, available first, then cheapest first
+
+    Raises:
+        HTTPException: 400 if sku is empty
+    """
+    try:
+        offers = await service.find_offers(
+            sku, region=region, include_unavailable=include_unavailable
+        )
+
+        return OfferResponse(
+            success=True,
+            message=f"Found {len(offers)} offers",
+            offers=offers,
+            count=len(offers)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to get offers: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/products/{product_id}/card", response_model=EntityResponse)
+async def get_product_card(
+    product_id: str,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Storefront card of a product
+
+    Answered from the materialized product cards: the product with its
+    features, the problems it solves, its target user groups, its best
+    offer and its competitor comparisons, written out as stored.
+
+    Args:
+        product_id: Product id
+
+    Returns:
+        EntityResponse: The card as data
+
+    Raises:
+        HTTPException: 404 if the product does not exist
+    """
+    try:
+        card = await service.get_product_card(product_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to get product card {product_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if card is None:
+        raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+    return encoded_response(
+        {"success": True, "message": "Product card retrieved successfully"},
+        {"data": card}
+    )
+
+
+@router.post("/products/cards", response_model=ProductCardsResponse)
+async def get_product_cards(
+    request: ProductCardsRequest,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Storefront cards of many products in one round-trip
+
+    Args:
+        request: Product ids
+
+    Returns:
+        ProductCardsResponse: Cards of the found products in request order,
+        plus the ids that have none
+
+    Raises:
+        HTTPException: 400 if an id is empty
+    """
+    try:
+        cards = await service.get_product_cards(request.ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to get {len(request.ids)} product cards: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    found = [cards[product_id] for product_id in dict.fromkeys(request.ids) if product_id in cards]
+    missing = [product_id for product_id in dict.fromkeys(request.ids) if product_id not in cards]
+    return encoded_response(
+        {
+            "success": True,
+            "message": f"Found {len(found)} of {len(found) + len(missing)} product cards",
+            "missing": missing
+        },
+        {"results": b"[" + b",".join(found) + b"]"}
+    )
+
+
+@router.get("/changes", response_model=ChangesResponse)
+async def get_changes(
+    since: int = Query(default=0, ge=0, description="Last sequence number already seen"),
+    limit: int = Query(default=100, ge=1, le=CHANGE_FEED_MAX_EVENTS),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Entity and relationship changes after a sequence number
+
+    Every write through this service and the ETL pipeline is logged in its
+    own transaction with a sequence number that follows commit order, so a
+    consumer that passes back next_since sees every change exactly once.
+
+    Args:
+        since: Last sequence number already seen (0 for the start of the log)
+        limit: Maximum events to return
+
+    Returns:
+        ChangesResponse: Events, oldest first, and the next since
+
+    Raises:
+        HTTPException: 400 if since or limit is invalid
+    """
+    try:
+        page = await service.get_changes(since, limit)
+
+        return ChangesResponse(
+            success=True,
+            message=f"Found {len(page['changes'])} changes",
+            changes=page["changes"],
+            count=len(page["changes"]),
+            next_since=page["next_since"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to read changes since {since}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _sse_events(changes: AsyncIterator[Dict[str, Any]], heartbeat: float) -> AsyncIterator[bytes]:
+    """
+    Encode change events as Server-Sent Events, with keep-alive comments while idle
+
+    The event id is the sequence number, so a reconnecting EventSource
+    resumes through Last-Event-ID.
+    """
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(changes.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=heartbeat)
+            if not done:
+                yield b": keep-alive\n\n"
+                continue
+            change, pending = pending.result(), None
+            data = json.dumps(change, default=str, separators=(",", ":"))
+            yield f"id: {change['seq']}\nevent: change\ndata: {data}\n\n".encode("utf-8")
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        # Headers are already sent; end the stream and let the client reconnect
+        logger.error(f"Change stream aborted: {e}", exc_info=True)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await changes.aclose()
+
+
+@router.get("/changes/stream")
+async def stream_changes(
+    since: Optional[int] = Query(None, ge=0, description="Last sequence number already seen; "
+                                                         "only new changes if omitted"),
+    limit: int = Query(default=100, ge=1, le=CHANGE_FEED_MAX_EVENTS, description="Events read per poll"),
+    last_event_id: Optional[str] = Header(None),
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Follow the change feed as Server-Sent Events
+
+    Each event is "id: <seq>", "event: change" and the event as JSON data.
+    The log is polled every CHANGE_FEED_POLL_SECONDS; idle streams get a
+    keep-alive comment. A reconnecting client's Last-Event-ID header takes
+    precedence over since.
+
+    Args:
+        since: Last sequence number already seen
+        limit: Maximum events read per poll
+        last_event_id: Sequence number of the last event received (sent by EventSource)
+
+    Returns:
+        StreamingResponse: text/event-stream
+
+    Raises:
+        HTTPException: 400 if Last-Event-ID is not a sequence number
+    """
+    if last_event_id is not None:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Last-Event-ID: {last_event_id}")
+        if since < 0:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must not be negative")
+
+    return StreamingResponse(
+        _sse_events(service.stream_changes(since, limit), CHANGE_STREAM_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _ndjson_chunks(
+    records: AsyncIterator[Dict[str, Any]],
+    compress: bool
+) -> AsyncIterator[bytes]:
+    """
+    Encode records as NDJSON, buffered into ~64KB chunks and optionally gzipped
+
+    Neo4j temporal/spatial values are written with str(). If reading the
+    records fails, the error is re-raised without the final chunk (or gzip
+    trailer), so the server aborts the chunked response and the client sees
+    an incomplete transfer rather than a clean, truncated export.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    buffered = 0
+    try:
+        async for record in records:
+            line = json.dumps(record, default=str, separators=(",", ":")).encode("utf-8")
+            buffer.append(line)
+            buffer.append(b"\n")
+            buffered += len(line) + 1
+            if buffered >= EXPORT_CHUNK_BYTES:
+                chunk = b"".join(buffer)
+                buffer, buffered = [], 0
+                chunk = compressor.compress(chunk) if compressor else chunk
+                if chunk:
+                    yield chunk
+    except Exception as e:
+        # Headers are already sent: abort the response instead of ending it cleanly
+        logger.error(f"Graph export aborted: {e}", exc_info=True)
+        raise
+
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+@router.get("/export")
+async def export_graph(
+    entity_types: Optional[List[str]] = Query(None, description="Node labels to export"),
+    rel_types: Optional[List[str]] = Query(None, description="Relationship types to export"),
+    include_relationships: bool = True,
+    gzip: bool = False,
+    service: AsyncGraphService = Depends(get_graph_service)
+):
+    """
+    Stream the knowledge graph as NDJSON
+
+    Emits one JSON object per line: every node ({"kind": "node", ...}) and
+    then every relationship ({"kind": "relationship", ...}). Records are
+    fetched from Neo4j in batches while the response is written, so exports
+    of any size run in constant memory.
+
+    Args:
+        entity_types: Optional node labels to export (repeatable)
+        rel_types: Optional relationship types to export (repeatable)
+        include_relationships: Whether to export relationships
+        gzip: Compress the stream (Content-Encoding: gzip)
+
+    Returns:
+        StreamingResponse: application/x-ndjson stream
+
+    Raises:
+        HTTPException: 400 if a type filter is invalid
+    """
+    try:
+        records = service.export_graph(
+            entity_types=entity_types,
+            rel_types=rel_types,
+            include_relationships=include_relationships,
+            fetch_size=get_settings().EXPORT_FETCH_SIZE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"Content-Disposition": 'attachment; filename="graph-export.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _ndjson_chunks(records, compress=gzip),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
@@ -4,7 +4,8 @@ API Request/Response Schemas
 Pydantic models for API request and response validation
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Literal
+from services.cypher import BATCH_GET_MAX_IDS, BATCH_MAX_OPERATIONS, RESOLUTION_MAX_NAMES
 
 
 class EntityCreateRequest(BaseModel):
@@ -13,6 +14,117 @@ class EntityCreateRequest(BaseModel):
     properties: Dict[str, Any] = Field(..., description="Entity properties including 'id'")
 
 
+class BulkEntityCreateRequest(BaseModel):
+    """Request to create many entities at once"""
+    entities: List[EntityCreateRequest] = Field(..., description="Entities to create")
+    batch_size: int = Field(
+        default=1000,
+        ge=1,
+        le=10000,
+        description="Rows written per UNWIND transaction"
+    )
+
+
+class BulkWriteResponse(BaseModel):
+    """Bulk write response"""
+    success: bool = Field(..., description="True if every row was written")
+    message: str = Field(..., description="Response message")
+    created: int = Field(default=0, description="Number of rows written")
+    failed: int = Field(default=0, description="Number of rows rejected")
+    errors: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Per-row errors with the index of the rejected input row"
+    )
+
+
+class BulkUpsertResponse(BaseModel):
+    """Change-detecting upsert response"""
+    success: bool = Field(..., description="True if every row was processed")
+    message: str = Field(..., description="Response message")
+    written: int = Field(default=0, description="Rows created or changed")
+    skipped: int = Field(default=0, description="Rows whose content was unchanged")
+    failed: int = Field(default=0, description="Number of rows rejected")
+    errors: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Per-row errors with the index of the rejected input row"
+    )
+
+
+class BatchGetRequest(BaseModel):
+    """Request to fetch many entities by id"""
+    ids: List[str] = Field(..., min_length=1, max_length=BATCH_GET_MAX_IDS, description="Entity ids to fetch")
+    entity_type: Optional[str] = Field(None, description="Entity type all entities must have")
+
+
+class BatchGetResponse(BaseModel):
+    """Batch get response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="One {id, found, entity_type, properties} entry per requested id, in request order"
+    )
+    found: int = Field(default=0, description="Number of requested ids that were found")
+    missing: int = Field(default=0, description="Number of requested ids that were not found")
+
+
+class ResolveRequest(BaseModel):
+    """Request to match surface strings to existing entities"""
+    names: List[str] = Field(
+        ..., min_length=1, max_length=RESOLUTION_MAX_NAMES, description="Surface strings to resolve"
+    )
+    entity_type: Optional[str] = Field(None, description="Entity type to match against; all if omitted")
+    limit: int = Field(default=5, ge=1, le=50, description="Maximum candidates per name")
+    min_score: float = Field(default=0.3, ge=0.0, le=1.0, description="Minimum trigram similarity")
+
+
+class ResolveResponse(BaseModel):
+    """Entity resolution response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="One {name, candidates} entry per input name, in order; candidates "
+                    "have id, entity_type, name and score, best first"
+    )
+
+
+class SemanticSearchRequest(BaseModel):
+    """Request to find entities similar to a text"""
+    text: str = Field(..., min_length=1, description="Query text, compared to entity names and descriptions")
+    entity_types: Optional[List[str]] = Field(None, description="Entity types to search; all if omitted")
+    limit: int = Field(default=10, ge=1, le=100, description="Maximum results")
+    min_score: float = Field(default=0.0, ge=0.0, le=1.0, description="Minimum cosine similarity")
+
+
+class SemanticSearchResponse(BaseModel):
+    """Semantic search response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Matches with id, entity_type, name and score, best first"
+    )
+    count: int = Field(0, description="Number of results")
+
+
+class ProductCardsRequest(BaseModel):
+    """Request to fetch many product cards"""
+    ids: List[str] = Field(..., min_length=1, max_length=BATCH_GET_MAX_IDS, description="Product ids")
+
+
+class ProductCardsResponse(BaseModel):
+    """Product card batch response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    missing: List[str] = Field(default_factory=list, description="Requested ids with no product card")
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Cards ({product, features, problems, user_groups, best_offer, offer_count, "
+                    "competitors}) of the found products, in request order"
+    )
+
+
 class EntityUpdateRequest(BaseModel):
     """Request to update entity"""
     properties: Dict[str, Any] = Field(..., description="Properties to update")
@@ -31,6 +143,71 @@ class RelationshipCreateRequest(BaseModel):
     to_id: str = Field(..., description="Target entity ID")
     rel_type: str = Field(..., description="Relationship type (e.g., HAS_FEATURE)")
     properties: Dict[str, Any] = Field(default_factory=dict, description="Relationship properties")
+    from_type: Optional[str] = Field(None, description="Optional source entity type")
+    to_type: Optional[str] = Field(None, description="Optional target entity type")
+
+
+class BulkRelationshipUpsertRequest(BaseModel):
+    """Request to create or update many relationships at once"""
+    relationships: List[RelationshipCreateRequest] = Field(..., description="Relationships to upsert")
+    batch_size: int = Field(
+        default=1000,
+        ge=1,
+        le=10000,
+        description="Rows written per UNWIND transaction"
+    )
+
+
+class BulkRelationshipResponse(BaseModel):
+    """Bulk relationship upsert response"""
+    success: bool = Field(..., description="True if no row was rejected or missing an endpoint")
+    message: str = Field(..., description="Response message")
+    created: int = Field(default=0, description="Relationships created")
+    matched: int = Field(default=0, description="Existing relationships matched and updated")
+    missing: int = Field(default=0, description="Rows skipped because an endpoint does not exist")
+    failed: int = Field(default=0, description="Rows rejected")
+    errors: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Per-row errors with the index of the rejected input row"
+    )
+
+
+class BatchOperation(BaseModel):
+    """One operation of a mixed-operation batch"""
+    op: Literal["create", "update", "delete", "relate"] = Field(..., description="Operation kind")
+    entity_type: Optional[str] = Field(
+        None, description="Entity type (required for create; optional for update/delete)"
+    )
+    id: Optional[str] = Field(None, description="Entity ID (update/delete)")
+    properties: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Entity properties including 'id' (create), properties to set (update) "
+                    "or relationship properties (relate)"
+    )
+    from_id: Optional[str] = Field(None, description="Source entity ID (relate)")
+    to_id: Optional[str] = Field(None, description="Target entity ID (relate)")
+    rel_type: Optional[str] = Field(None, description="Relationship type (relate)")
+    from_type: Optional[str] = Field(None, description="Optional source entity type (relate)")
+    to_type: Optional[str] = Field(None, description="Optional target entity type (relate)")
+
+
+class BatchRequest(BaseModel):
+    """Ordered operations applied in one transaction"""
+    operations: List[BatchOperation] = Field(
+        ..., min_length=1, max_length=BATCH_MAX_OPERATIONS, description="Operations, applied in order"
+    )
+
+
+class BatchResponse(BaseModel):
+    """Mixed-operation batch response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    operations: int = Field(0, description="Operations applied")
+    statements: int = Field(0, description="UNWIND statements the operations were grouped into")
+    created: int = Field(0, description="Entities created")
+    updated: int = Field(0, description="Entities updated")
+    deleted: int = Field(0, description="Entities deleted")
+    related: int = Field(0, description="Relationships created or updated")
 
 
 class RelationshipResponse(BaseModel):
@@ -44,6 +221,16 @@ class QueryRequest(BaseModel):
     """Cypher query request"""
     query: str = Field(..., description="Cypher query string")
     params: Dict[str, Any] = Field(default_factory=dict, description="Query parameters")
+    timeout: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Transaction timeout in seconds (capped by QUERY_TIMEOUT_SECONDS)"
+    )
+    max_rows: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Maximum rows returned (capped by QUERY_MAX_ROWS)"
+    )
 
 
 class QueryResponse(BaseModel):
@@ -52,6 +239,83 @@ class QueryResponse(BaseModel):
     message: str = Field(..., description="Response message")
     results: List[Dict[str, Any]] = Field(default_factory=list, description="Query results")
     count: int = Field(default=0, description="Number of results")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Opaque cursor for the next page, null on the last page"
+    )
+    truncated: bool = Field(
+        default=False,
+        description="True if the result was cut off at the row limit"
+    )
+
+
+class SubgraphResponse(BaseModel):
+    """Neighborhood subgraph response"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    root: str = Field(..., description="Root entity ID")
+    nodes: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Distinct nodes with entity_type, depth (hops from root) and properties"
+    )
+    edges: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Distinct relationships between returned nodes"
+    )
+    truncated: bool = Field(
+        default=False,
+        description="True if the neighborhood had more than max_nodes nodes and was cut off"
+    )
+
+
+class AnalyticsResponse(BaseModel):
+    """Analytics result computed on the in-memory graph projection"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    results: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Ranked entities with id, type and the metric"
+    )
+    projection: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Snapshot the results were computed on (size, age, stale)"
+    )
+
+
+class RecommendationResponse(BaseModel):
+    """Ranked products for a (problem, user group, scenario) combination"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    products: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Products with product_id and score, best first"
+    )
+    total: int = Field(default=0, description="Products matching the combination")
+
+
+class OfferResponse(BaseModel):
+    """Currently valid offers for a SKU"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    offers: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Offers (price, currency, availability, stock, merchant, window), "
+                    "available first, then cheapest first"
+    )
+    count: int = Field(default=0, description="Number of offers")
+
+
+class ChangesResponse(BaseModel):
+    """Page of the change feed"""
+    success: bool = Field(..., description="Operation success status")
+    message: str = Field(..., description="Response message")
+    changes: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Events ({seq, at, source, kind, op, entity_type, entity_id, rel_type, "
+                    "from_id, to_id, properties}), oldest first"
+    )
+    count: int = Field(default=0, description="Number of events")
+    next_since: int = Field(..., description="Sequence number to pass as since on the next read")
 
 
 class SearchRequest(BaseModel):
@@ -60,6 +324,11 @@ class SearchRequest(BaseModel):
     search_text: Optional[str] = Field(None, description="Text search on name/description")
     properties: Optional[Dict[str, Any]] = Field(None, description="Property filters")
     limit: int = Field(default=100, ge=1, le=1000, description="Maximum results")
+    min_score: Optional[float] = Field(
+        None,
+        ge=0.0,
+        description="Minimum full-text relevance score for text searches"
+    )
 
 
 class HealthResponse(BaseModel):
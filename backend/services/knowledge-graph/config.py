@@ -3,6 +3,9 @@ Configuration management for Knowledge Graph Service
 Uses pydantic-settings for environment variable support
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from services.base import (
+    DEFAULT_CONNECTION_ACQUISITION_TIMEOUT, DEFAULT_MAX_CONNECTION_LIFETIME, DEFAULT_MAX_CONNECTION_POOL_SIZE
+)
 
 
 class Settings(BaseSettings):
@@ -10,10 +13,64 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     # Neo4j Configuration
-    NEO4J_URI: str = "bolt://localhost:7687"
+    NEO4J_URI: str = "bolt://localhost:7687"  # neo4j:// enables cluster read routing
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str = "password"
 
+    # Neo4j Connection Pool
+    NEO4J_MAX_CONNECTION_POOL_SIZE: int = DEFAULT_MAX_CONNECTION_POOL_SIZE
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = DEFAULT_CONNECTION_ACQUISITION_TIMEOUT  # seconds
+    NEO4J_MAX_CONNECTION_LIFETIME: int = DEFAULT_MAX_CONNECTION_LIFETIME  # seconds
+
+    # Entity id -> label routing cache (enables index seeks on id lookups)
+    ENTITY_LABEL_CACHE_SIZE: int = 100000
+
+    # Read-through cache for entity and relationship reads (0 disables)
+    READ_CACHE_SIZE: int = 50000  # entries per cache
+    READ_CACHE_TTL_SECONDS: float = 60.0
+
+    # Custom Cypher guards (/query)
+    QUERY_TIMEOUT_SECONDS: float = 30.0  # transaction timeout
+    QUERY_MAX_ROWS: int = 10000  # results beyond this are truncated
+    QUERY_FETCH_SIZE: int = 500  # records pulled from Neo4j per round-trip
+    QUERY_PLAN_CHECK: bool = True  # EXPLAIN first and reject expensive plans
+    QUERY_PLAN_MAX_ESTIMATED_ROWS: float = 100000
+    QUERY_VALIDATION_CACHE_SIZE: int = 256  # EXPLAINed query texts (and types) remembered
+
+    # Streaming export
+    EXPORT_FETCH_SIZE: int = 1000  # records pulled from Neo4j per round-trip
+
+    # Analytics projection (in-memory CSR snapshot)
+    PROJECTION_REFRESH_SECONDS: float = 300.0  # rebuild check interval; 0 disables
+    PROJECTION_MAX_AGE_SECONDS: float = 3600.0  # rebuild even without local writes
+
+    # Recommendation index
+    RECOMMENDATION_MAX_AGE_SECONDS: float = 3600.0  # rebuild to pick up external writes
+
+    # Entity resolution
+    RESOLUTION_MAX_AGE_SECONDS: float = 3600.0  # rebuild to pick up external writes
+
+    # Semantic search
+    SEMANTIC_INDEX_MAX_AGE_SECONDS: float = 3600.0  # rebuild to pick up external writes
+    SEMANTIC_DIMENSIONS: int = 256  # 1 KiB of vector per entity
+    SEMANTIC_IVF_MIN_ENTITIES: int = 50000  # labels this large use IVF; 0 disables
+    SEMANTIC_IVF_PROBES: int = 32  # IVF clusters scored per query
+
+    # Offer index
+    OFFER_INDEX_REFRESH_SECONDS: float = 30.0  # delta refresh interval; 0 disables
+    OFFER_INDEX_MAX_AGE_SECONDS: float = 3600.0  # full reload (picks up deletions)
+
+    # Product cards
+    PRODUCT_CARD_MAX_AGE_SECONDS: float = 3600.0  # rebuild to pick up external writes
+    PRODUCT_CARD_SNAPSHOT_PATH: str = ""  # NDJSON snapshot for warm restarts; empty disables
+
+    # Change feed
+    CHANGE_FEED_ENABLED: bool = True  # log writes in their own transaction
+    CHANGE_FEED_POLL_SECONDS: float = 1.0  # change stream poll and read-triggered sequencing interval
+    CHANGE_FEED_RETENTION_EVENTS: int = 1000000  # newest events kept (0 keeps all)
+    CHANGE_FEED_RETENTION_SECONDS: float = 604800.0  # events dropped after this age (0 keeps all)
+    CHANGE_FEED_MAINTENANCE_SECONDS: float = 60.0  # numbering/retention interval (0 disables)
+
     # API Configuration
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8001
@@ -3,12 +3,15 @@ Knowledge Graph Service - FastAPI Application
 
 Main application entry point for the Knowledge Graph microservice
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 from config import get_settings
 from api.routes import router
+from services.async_graph_service import AsyncGraphService
+from services.bookmarks import BOOKMARK_HEADER, bookmark_scope, parse_bookmark_header
 import uvicorn
 
 
@@ -27,13 +30,32 @@ async def lifespan(app: FastAPI):
     """
     Application lifespan events
 
-    Handles startup and shutdown operations
+    Handles startup and shutdown operations. A single AsyncGraphService (and
+    therefore a single async Neo4j driver and connection pool) is shared by
+    all requests for the lifetime of the process.
     """
     logger.info("Starting Knowledge Graph Service")
     logger.info(f"Neo4j URI: {settings.NEO4J_URI}")
     logger.info(f"API Host: {settings.API_HOST}:{settings.API_PORT}")
+    app.state.graph_service = AsyncGraphService.from_settings(settings)
+    refreshers = []
+    if settings.PROJECTION_REFRESH_SECONDS > 0:
+        refreshers.append(asyncio.create_task(
+            app.state.graph_service.refresh_projection_periodically()
+        ))
+    if settings.OFFER_INDEX_REFRESH_SECONDS > 0:
+        refreshers.append(asyncio.create_task(
+            app.state.graph_service.refresh_offers_periodically()
+        ))
+    if settings.CHANGE_FEED_MAINTENANCE_SECONDS > 0:
+        refreshers.append(asyncio.create_task(
+            app.state.graph_service.maintain_changes_periodically()
+        ))
     yield
     logger.info("Shutting down Knowledge Graph Service")
+    for refresher in refreshers:
+        refresher.cancel()
+    await app.state.graph_service.close()
 
 
 # Create FastAPI application
@@ -54,9 +76,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[BOOKMARK_HEADER],
 )
 
 
+@app.middleware("http")
+async def propagate_bookmarks(request: Request, call_next):
+    """Causal consistency: wait for the client's bookmarks and return ours"""
+    with bookmark_scope(parse_bookmark_header(request.headers.get(BOOKMARK_HEADER))) as scope:
+        response = await call_next(request)
+    if scope.bookmarks:
+        response.headers[BOOKMARK_HEADER] = ",".join(scope.bookmarks)
+    return response
+
+
 # Include API router
 app.include_router(router)
 
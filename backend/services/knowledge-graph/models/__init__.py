@@ -11,7 +11,8 @@ from .entities import (
     UserGroup,
     Competitor,
     Offer,
-    Merchant
+    Merchant,
+    ENTITY_MODELS
 )
 
 from .relationships import (
@@ -20,7 +21,8 @@ from .relationships import (
     HasFeature,
     Solves,
     AppliesTo,
-    Targets
+    Targets,
+    RELATIONSHIP_MODELS
 )
 
 __all__ = [
@@ -35,11 +37,13 @@ __all__ = [
     "Competitor",
     "Offer",
     "Merchant",
+    "ENTITY_MODELS",
     # Relationship types
     "RelationshipType",
     "BaseRelationship",
     "HasFeature",
     "Solves",
     "AppliesTo",
-    "Targets"
+    "Targets",
+    "RELATIONSHIP_MODELS"
 ]
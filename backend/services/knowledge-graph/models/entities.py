@@ -178,3 +178,16 @@ class Merchant(BaseEntity):
         le=1.0,
         description="Commission rate from 0.0 to 1.0"
     )
+
+
+# Model validating the properties of each entity type
+ENTITY_MODELS = {
+    EntityType.PRODUCT.value: Product,
+    EntityType.FEATURE.value: Feature,
+    EntityType.SCENARIO.value: Scenario,
+    EntityType.PROBLEM.value: Problem,
+    EntityType.USER_GROUP.value: UserGroup,
+    EntityType.COMPETITOR.value: Competitor,
+    EntityType.OFFER.value: Offer,
+    EntityType.MERCHANT.value: Merchant
+}
@@ -143,3 +143,16 @@ class GeneratedFrom(BaseRelationship):
         default=RelationshipType.GENERATED_FROM,
         description="Relationship type"
     )
+
+
+# Model validating the properties of each relationship type
+RELATIONSHIP_MODELS = {
+    RelationshipType.HAS_FEATURE.value: HasFeature,
+    RelationshipType.SOLVES.value: Solves,
+    RelationshipType.APPLIES_TO.value: AppliesTo,
+    RelationshipType.TARGETS.value: Targets,
+    RelationshipType.COMPARES_WITH.value: ComparesWith,
+    RelationshipType.HAS_OFFER.value: HasOffer,
+    RelationshipType.SOLD_BY.value: SoldBy,
+    RelationshipType.GENERATED_FROM.value: GeneratedFrom
+}
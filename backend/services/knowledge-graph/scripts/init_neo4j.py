@@ -17,6 +17,9 @@ import os
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import get_settings
+from services.cypher import (
+    ENTITY_TYPES, ENTITY_FULLTEXT_INDEX, fulltext_index_name
+)
 
 
 def init_database():
@@ -47,6 +50,9 @@ def init_database():
         "CREATE CONSTRAINT competitor_id IF NOT EXISTS FOR (c:Competitor) REQUIRE c.id IS UNIQUE",
         "CREATE CONSTRAINT offer_id IF NOT EXISTS FOR (o:Offer) REQUIRE o.offer_id IS UNIQUE",
         "CREATE CONSTRAINT merchant_id IF NOT EXISTS FOR (m:Merchant) REQUIRE m.merchant_id IS UNIQUE",
+        # Change feed: the single sequence counter, and events ordered by seq
+        "CREATE CONSTRAINT change_sequence_id IF NOT EXISTS FOR (s:ChangeSequence) REQUIRE s.id IS UNIQUE",
+        "CREATE CONSTRAINT change_event_seq IF NOT EXISTS FOR (c:ChangeEvent) REQUIRE c.seq IS UNIQUE",
     ]
 
     # Define indexes (frequently queried properties)
@@ -56,12 +62,26 @@ def init_database():
         "CREATE INDEX product_brand IF NOT EXISTS FOR (p:Product) ON (p.brand)",
         "CREATE INDEX offer_region IF NOT EXISTS FOR (o:Offer) ON (o.region)",
         "CREATE INDEX offer_merchant IF NOT EXISTS FOR (o:Offer) ON (o.merchant_id)",
+        "CREATE INDEX offer_updated_at IF NOT EXISTS FOR (o:Offer) ON (o.updated_at)",
+        # Offer/Merchant uniqueness is keyed on offer_id/merchant_id; the API
+        # looks entities up by id, so index that too
+        "CREATE INDEX offer_entity_id IF NOT EXISTS FOR (o:Offer) ON (o.id)",
+        "CREATE INDEX merchant_entity_id IF NOT EXISTS FOR (m:Merchant) ON (m.id)",
+        # Change feed retention by age
+        "CREATE INDEX change_event_stamp IF NOT EXISTS FOR (c:ChangeEvent) ON (c.stamp)",
     ]
 
-    # Define full-text indexes (search capability)
+    # Define full-text indexes (search capability): one per entity label for
+    # typed searches, and one across all labels for untyped searches
     fulltext_indexes = [
-        "CREATE FULLTEXT INDEX product_search IF NOT EXISTS FOR (p:Product) ON EACH [p.name, p.description]",
+        f"CREATE FULLTEXT INDEX {fulltext_index_name(entity_type)} IF NOT EXISTS "
+        f"FOR (n:{entity_type}) ON EACH [n.name, n.description]"
+        for entity_type in ENTITY_TYPES
     ]
+    fulltext_indexes.append(
+        f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS "
+        f"FOR (n:{'|'.join(ENTITY_TYPES)}) ON EACH [n.name, n.description]"
+    )
 
     with driver.session() as session:
         # Create constraints
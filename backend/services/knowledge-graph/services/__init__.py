@@ -2,5 +2,6 @@
 Services for Knowledge Graph operations
 """
 from .graph_service import GraphService
+from .async_graph_service import AsyncGraphService
 
-__all__ = ["GraphService"]
+__all__ = ["GraphService", "AsyncGraphService"]
@@ -0,0 +1,2013 @@
+"""
+Async Neo4j Graph Database Service
+
+Graph service built on the async Neo4j driver. The API routes use this
+service so that a request waiting on Neo4j does not hold a worker thread;
+GraphService keeps only the bulk write paths, for scripts.
+Query text and record decoding are shared through services.cypher.
+"""
+from neo4j import AsyncGraphDatabase, Query
+from typing import List, Dict, Optional, Any, Tuple, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+from datetime import datetime
+import time
+import logging
+from . import cypher
+from .base import BaseGraphService
+from .read_cache import MISSING
+from .batch import BatchError, BatchStatement, unapplied
+from .changes import batch_changes, entity_change, merge_changes, relationship_change, upsert_changes
+from .cypher import CHANGE_FEED_BATCH_SIZE, DEFAULT_BATCH_SIZE, DEFAULT_FETCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGraphService(BaseGraphService):
+    """Async Neo4j graph database service with transaction support"""
+
+    # In-flight projection rebuild shared by concurrent refresh_projection() calls
+    _projection_task: Optional[asyncio.Task] = None
+    # In-flight recommendation index rebuild
+    _recommendations_task: Optional[asyncio.Task] = None
+    # In-flight entity resolution index rebuild
+    _resolver_task: Optional[asyncio.Task] = None
+    # In-flight semantic search index rebuild
+    _semantic_task: Optional[asyncio.Task] = None
+    # In-flight offer index refresh
+    _offers_task: Optional[asyncio.Task] = None
+    # In-flight product card rebuild
+    _cards_task: Optional[asyncio.Task] = None
+    # In-flight change sequencing run shared by change feed readers
+    _sequence_task: Optional[asyncio.Task] = None
+
+    def _create_driver(self, uri: str, **kwargs):
+        """Create the async Neo4j driver"""
+        return AsyncGraphDatabase.driver(uri, **kwargs)
+
+    async def close(self):
+        """Close driver connection and release resources"""
+        await asyncio.to_thread(self._save_cards)
+        if self.driver:
+            await self.driver.close()
+            logger.info("Neo4j connection closed")
+
+    @asynccontextmanager
+    async def _pooled_session(self, read_only: bool = False, **kwargs):
+        """
+        Open an async driver session while tracking pool utilization
+
+        Read-only sessions are routed to cluster readers (followers) when the
+        driver uses a neo4j:// routing URI. Sessions opened while handling a
+        request that carries bookmarks wait for those transactions, and hand
+        their own bookmarks back to the request.
+
+        Args:
+            read_only: Open the session with read access
+            **kwargs: Passed through to driver.session()
+
+        Yields:
+            neo4j.AsyncSession: Session bound to a pooled connection
+        """
+        scope = self._session_options(read_only, kwargs)
+        async with self.driver.session(**kwargs) as session:
+            self._session_opened()
+            try:
+                yield session
+            finally:
+                self._session_closed()
+                if scope is not None:
+                    scope.update((await session.last_bookmarks()).raw_values)
+
+    async def health_check(self) -> bool:
+        """
+        Verify database connectivity
+
+        Returns:
+            True if database is accessible, False otherwise
+        """
+        try:
+            async with self._pooled_session() as session:
+                result = await session.run("RETURN 1 as test")
+                record = await result.single()
+                return record["test"] == 1
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+            return False
+
+    async def create_entity(self, entity_type: str, properties: Dict[str, Any]) -> str:
+        """
+        Create entity node in Neo4j
+
+        Args:
+            entity_type: Entity type (used as node label)
+            properties: Entity properties including 'id'
+
+        Returns:
+            Entity ID
+
+        Raises:
+            ValueError: If entity_type is invalid or properties missing 'id'
+            Exception: If creation fails
+        """
+        self._validate_new_entity(entity_type, properties)
+
+        try:
+            async with self._pooled_session() as session:
+                entity_id = await session.execute_write(
+                    self._create_entity_tx,
+                    entity_type,
+                    properties,
+                    changes=self.change_feed
+                )
+                self._label_cache.put(entity_id, entity_type)
+                self._invalidate(entity_id)
+                self._entity_written(entity_id, entity_type, properties)
+                await self._sync_cards(session)
+                logger.info(f"Created entity: {entity_type} with id={entity_id}")
+                return entity_id
+        except Exception as e:
+            logger.error(f"Failed to create entity: {e}", exc_info=True)
+            raise
+
+    async def create_entities_bulk(
+        self,
+        entities: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Create many entities with batched UNWIND transactions
+
+        Entities are grouped by label and written in chunks of batch_size,
+        one transaction per chunk. Failed chunks are retried row by row so
+        only the offending rows are reported.
+
+        Args:
+            entities: List of {"entity_type": str, "properties": dict}
+            batch_size: Maximum rows per UNWIND transaction
+
+        Returns:
+            Dict with 'created' and 'failed' counts and per-row 'errors'
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_entities(entities)
+        created = 0
+        async with self._pooled_session() as session:
+            for entity_type, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    try:
+                        created += await session.execute_write(
+                            self._create_entities_batch_tx,
+                            entity_type,
+                            [properties for _, properties in chunk],
+                            changes=self.change_feed
+                        )
+                        for _, properties in chunk:
+                            self._label_cache.put(properties["id"], entity_type)
+                    except Exception as e:
+                        logger.warning(
+                            f"Bulk create of {len(chunk)} {entity_type} rows failed, "
+                            f"retrying row by row: {e}"
+                        )
+                        for index, properties in chunk:
+                            try:
+                                await session.execute_write(
+                                    self._create_entity_tx,
+                                    entity_type,
+                                    properties,
+                                    changes=self.change_feed
+                                )
+                                self._label_cache.put(properties["id"], entity_type)
+                                created += 1
+                            except Exception as row_error:
+                                errors.append({
+                                    "index": index,
+                                    "id": properties.get("id"),
+                                    "error": str(row_error)
+                                })
+
+            self._invalidate(*(
+                properties["id"] for rows in groups.values() for _, properties in rows
+            ))
+            failed = {error["index"] for error in errors}
+            for entity_type, rows in groups.items():
+                for index, properties in rows:
+                    if index not in failed:
+                        self._entity_written(properties["id"], entity_type, properties)
+            await self._sync_cards(session)
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Bulk created {created} entities, {len(errors)} failed")
+        return {"created": created, "failed": len(errors), "errors": errors}
+
+    async def upsert_entities(
+        self,
+        entities: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Create or update many entities, skipping those whose content is unchanged
+
+        Each entity's properties are hashed (see cypher.content_hash) and the
+        digest is stored on the node. Per chunk of batch_size rows the stored
+        hashes are read first, and only new or changed rows are written with
+        UNWIND + MERGE; properties not given are kept. A chunk with no changes
+        costs one read transaction and no write.
+
+        Args:
+            entities: List of {"entity_type": str, "properties": dict}
+            batch_size: Maximum rows per transaction
+
+        Returns:
+            Dict with 'written', 'skipped' (unchanged) and 'failed' counts and
+            per-row 'errors' ({"index", "id", "error"})
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_entities(entities)
+        written = skipped = 0
+        written_ids = []
+        now = datetime.utcnow().isoformat()
+        async with self._pooled_session() as session:
+            for entity_type, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    hashes = {properties["id"]: cypher.content_hash(properties) for _, properties in chunk}
+                    try:
+                        stored = await session.execute_read(
+                            self._entity_hashes_tx, entity_type, list(hashes)
+                        )
+                        changed = [
+                            {"id": properties["id"], "properties": properties, "hash": hashes[properties["id"]]}
+                            for _, properties in chunk
+                            if stored.get(properties["id"]) != hashes[properties["id"]]
+                        ]
+                        count = await session.execute_write(
+                            self._upsert_entities_batch_tx, entity_type, changed, now,
+                            existing=stored, changes=self.change_feed
+                        ) if changed else 0
+                    except Exception as e:
+                        logger.warning(f"Upsert of {len(chunk)} {entity_type} rows failed: {e}")
+                        errors.extend(
+                            {"index": index, "id": properties["id"], "error": str(e)}
+                            for index, properties in chunk
+                        )
+                        continue
+                    written += count
+                    skipped += len(chunk) - count
+                    written_ids.extend(row["id"] for row in changed)
+                    for row in changed:
+                        self._entity_written(row["id"], entity_type, {"updated_at": now, **row["properties"]})
+                    for _, properties in chunk:
+                        self._label_cache.put(properties["id"], entity_type)
+
+            if written_ids:
+                self._invalidate(*written_ids)
+            await self._sync_cards(session)
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Upserted entities: {written} written, {skipped} unchanged, {len(errors)} failed")
+        return {"written": written, "skipped": skipped, "failed": len(errors), "errors": errors}
+
+    async def query_entity(
+        self,
+        entity_id: str,
+        entity_type: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Query entity by ID
+
+        Args:
+            entity_id: Entity identifier
+            entity_type: Optional entity type; falls back to the label cache
+
+        Returns:
+            Entity properties dict or None if not found
+
+        Raises:
+            ValueError: If entity_type is invalid
+        """
+        label, cached = self._resolve_label(entity_id, entity_type)
+        hit = self._cached_entity(entity_id, entity_type)
+        if hit is not MISSING:
+            return hit
+        version = self._entity_cache.version()
+        try:
+            async with self._pooled_session(read_only=True) as session:
+                found = await session.execute_read(self._query_entity_tx, entity_id, label)
+                if found is None and cached:
+                    # Stale cache entry (entity removed or relabelled elsewhere)
+                    self._label_cache.discard(entity_id)
+                    found = await session.execute_read(self._query_entity_tx, entity_id, None)
+        except Exception as e:
+            logger.error(f"Failed to query entity {entity_id}: {e}", exc_info=True)
+            return None
+
+        if found is None:
+            return None
+        properties, found_label = found
+        if found_label:
+            self._label_cache.put(entity_id, found_label)
+        self._store_entity(entity_id, properties, found_label, version)
+        return properties
+
+    async def batch_get_entities(
+        self,
+        entity_ids: List[str],
+        entity_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch many entities by id in one round-trip
+
+        Cached entities are served from the entity cache; the rest are read
+        in a single transaction with one UNWIND query per label (taken from
+        entity_type or the label cache, with a query probing every label for
+        ids of unknown type).
+
+        Args:
+            entity_ids: Entity ids; duplicates are allowed
+            entity_type: Optional entity type all entities must have
+
+        Returns:
+            One {"id", "found", "entity_type", "properties"} entry per
+            requested id, in request order; missing entities have found=False
+
+        Raises:
+            ValueError: If no ids or too many are given, or entity_type is invalid
+        """
+        found, groups, from_label_cache = self._plan_batch_get(entity_ids, entity_type)
+        if groups:
+            version = self._entity_cache.version()
+            async with self._pooled_session(read_only=True) as session:
+                read = await session.execute_read(self._entities_by_id_tx, groups)
+                stale = [entity_id for entity_id in from_label_cache if entity_id not in read]
+                if stale:
+                    # Stale label cache entries (removed or relabelled elsewhere)
+                    for entity_id in stale:
+                        self._label_cache.discard(entity_id)
+                    read.update(await session.execute_read(self._entities_by_id_tx, {None: stale}))
+            self._store_entities(read, version)
+            found.update(read)
+        return self._batch_get_results(entity_ids, found)
+
+    async def update_entity(
+        self,
+        entity_id: str,
+        properties: Dict[str, Any],
+        entity_type: Optional[str] = None
+    ) -> bool:
+        """
+        Update entity properties
+
+        Args:
+            entity_id: Entity identifier
+            properties: Properties to update
+            entity_type: Optional entity type; falls back to the label cache
+
+        Returns:
+            True if successful, False otherwise
+        """
+        label, cached = self._resolve_label(entity_id, entity_type)
+        try:
+            async with self._pooled_session() as session:
+                success = await session.execute_write(
+                    self._update_entity_tx,
+                    entity_id,
+                    properties,
+                    label,
+                    changes=self.change_feed
+                )
+                if not success and cached:
+                    self._label_cache.discard(entity_id)
+                    success = await session.execute_write(
+                        self._update_entity_tx,
+                        entity_id,
+                        properties,
+                        None,
+                        changes=self.change_feed
+                    )
+                if success:
+                    self._invalidate(entity_id)
+                    self._entity_written(entity_id, label, properties)
+                    await self._sync_cards(session)
+                    logger.info(f"Updated entity: {entity_id}")
+                return success
+        except Exception as e:
+            logger.error(f"Failed to update entity {entity_id}: {e}", exc_info=True)
+            return False
+
+    async def delete_entity(self, entity_id: str, entity_type: Optional[str] = None) -> bool:
+        """
+        Delete entity and all its relationships
+
+        Args:
+            entity_id: Entity identifier
+            entity_type: Optional entity type; falls back to the label cache
+
+        Returns:
+            True if deleted, False if not found
+        """
+        label, cached = self._resolve_label(entity_id, entity_type)
+        try:
+            async with self._pooled_session() as session:
+                deleted = await session.execute_write(
+                    self._delete_entity_tx,
+                    entity_id,
+                    label,
+                    changes=self.change_feed
+                )
+                if not deleted and cached:
+                    deleted = await session.execute_write(
+                        self._delete_entity_tx,
+                        entity_id,
+                        None,
+                        changes=self.change_feed
+                    )
+                self._label_cache.discard(entity_id)
+                self._invalidate(entity_id)
+                if deleted:
+                    self._entity_deleted(entity_id)
+                    await self._sync_cards(session)
+                    logger.info(f"Deleted entity: {entity_id}")
+                return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete entity {entity_id}: {e}", exc_info=True)
+            return False
+
+    async def create_relationship(
+        self,
+        from_id: str,
+        to_id: str,
+        rel_type: str,
+        properties: Dict[str, Any] = None,
+        from_type: Optional[str] = None,
+        to_type: Optional[str] = None
+    ) -> bool:
+        """
+        Create relationship between entities
+
+        Args:
+            from_id: Source entity ID
+            to_id: Target entity ID
+            rel_type: Relationship type
+            properties: Optional relationship properties
+            from_type: Optional source entity type; falls back to the label cache
+            to_type: Optional target entity type; falls back to the label cache
+
+        Returns:
+            True if successful, False otherwise
+        """
+        if properties is None:
+            properties = {}
+
+        # Validate relationship type
+        if rel_type not in cypher.RELATIONSHIP_TYPES:
+            raise ValueError(f"Invalid relationship type: {rel_type}")
+
+        from_label, from_cached = self._resolve_label(from_id, from_type)
+        to_label, to_cached = self._resolve_label(to_id, to_type)
+        try:
+            async with self._pooled_session() as session:
+                success = await session.execute_write(
+                    self._create_relationship_tx,
+                    from_id,
+                    to_id,
+                    rel_type,
+                    properties,
+                    from_label,
+                    to_label,
+                    changes=self.change_feed
+                )
+                if not success and (from_cached or to_cached):
+                    self._label_cache.discard(from_id)
+                    self._label_cache.discard(to_id)
+                    success = await session.execute_write(
+                        self._create_relationship_tx,
+                        from_id,
+                        to_id,
+                        rel_type,
+                        properties,
+                        from_type,
+                        to_type,
+                        changes=self.change_feed
+                    )
+                if success:
+                    self._invalidate(from_id, to_id)
+                    if rel_type in cypher.RECOMMENDATION_REL_TYPES:
+                        await self._sync_recommendations(session, [from_id])
+                    await self._sync_cards(session)
+                    logger.info(f"Created relationship: {from_id} -{rel_type}-> {to_id}")
+                return success
+        except Exception as e:
+            logger.error(f"Failed to create relationship: {e}", exc_info=True)
+            return False
+
+    async def upsert_relationships_bulk(
+        self,
+        relationships: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Create or update many relationships with batched UNWIND + MERGE
+
+        Rows are grouped by relationship type and endpoint labels, and each
+        chunk of batch_size rows is one transaction. Endpoints are matched by
+        label-qualified id when the label is given (from_type/to_type) or
+        cached. Relationships that already exist are matched and get their
+        properties merged instead of being duplicated.
+
+        Args:
+            relationships: List of {"from_id", "to_id", "rel_type",
+                "properties", "from_type", "to_type"}
+            batch_size: Maximum rows per UNWIND transaction
+
+        Returns:
+            Dict with 'created', 'matched', 'missing' (rows whose endpoints
+            do not exist) and 'failed' counts, plus per-row 'errors'
+            ({"index", "id", "error"}), index referring to the input list
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_relationships(relationships)
+        created = matched = missing = 0
+        recommendation_sources = set()
+        async with self._pooled_session() as session:
+            for (rel_type, from_label, to_label), rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    try:
+                        counts = await session.execute_write(
+                            self._merge_relationships_batch_tx,
+                            rel_type,
+                            from_label,
+                            to_label,
+                            chunk,
+                            changes=self.change_feed
+                        )
+                    except Exception as e:
+                        logger.warning(
+                            f"Bulk upsert of {len(chunk)} {rel_type} rows failed: {e}"
+                        )
+                        errors.extend(
+                            {
+                                "index": row["index"],
+                                "id": f"{row['from_id']}->{row['to_id']}",
+                                "error": str(e)
+                            }
+                            for row in chunk
+                        )
+                        continue
+                    created += counts["created"]
+                    matched += counts["matched"]
+                    missing += len(chunk) - counts["created"] - counts["matched"]
+                    self._invalidate(*(
+                        entity_id for row in chunk for entity_id in (row["from_id"], row["to_id"])
+                    ))
+                    if rel_type in cypher.RECOMMENDATION_REL_TYPES:
+                        recommendation_sources.update(row["from_id"] for row in chunk)
+            await self._sync_recommendations(session, recommendation_sources)
+            await self._sync_cards(session)
+
+        errors.sort(key=lambda error: error["index"])
+        logger.info(
+            f"Bulk upserted relationships: {created} created, {matched} matched, "
+            f"{missing} missing endpoints, {len(errors)} failed"
+        )
+        return {
+            "created": created,
+            "matched": matched,
+            "missing": missing,
+            "failed": len(errors),
+            "errors": errors
+        }
+
+    async def delete_relationship(
+        self,
+        from_id: str,
+        to_id: str,
+        rel_type: str,
+        from_type: Optional[str] = None,
+        to_type: Optional[str] = None
+    ) -> bool:
+        """
+        Delete specific relationship between entities
+
+        Args:
+            from_id: Source entity ID
+            to_id: Target entity ID
+            rel_type: Relationship type
+            from_type: Optional source entity type; falls back to the label cache
+            to_type: Optional target entity type; falls back to the label cache
+
+        Returns:
+            True if deleted, False if not found
+        """
+        from_label, from_cached = self._resolve_label(from_id, from_type)
+        to_label, to_cached = self._resolve_label(to_id, to_type)
+        try:
+            async with self._pooled_session() as session:
+                deleted = await session.execute_write(
+                    self._delete_relationship_tx,
+                    from_id,
+                    to_id,
+                    rel_type,
+                    from_label,
+                    to_label,
+                    changes=self.change_feed
+                )
+                if not deleted and (from_cached or to_cached):
+                    self._label_cache.discard(from_id)
+                    self._label_cache.discard(to_id)
+                    deleted = await session.execute_write(
+                        self._delete_relationship_tx,
+                        from_id,
+                        to_id,
+                        rel_type,
+                        from_type,
+                        to_type,
+                        changes=self.change_feed
+                    )
+                if deleted:
+                    self._invalidate(from_id, to_id)
+                    if rel_type in cypher.RECOMMENDATION_REL_TYPES:
+                        await self._sync_recommendations(session, [from_id])
+                    await self._sync_cards(session)
+                    logger.info(f"Deleted relationship: {from_id} -{rel_type}-> {to_id}")
+                return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete relationship: {e}", exc_info=True)
+            return False
+
+    async def execute_batch(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply create, update, delete and relate operations in one transaction
+
+        Every operation is validated against the entity and relationship
+        models before anything is written. Operations of the same kind and
+        label share one UNWIND statement wherever that keeps the effect of
+        their order (see services.batch), and all statements run in a single
+        write transaction: if any update, delete or relate finds no entity,
+        or a statement fails, nothing is written.
+
+        Args:
+            operations: Ordered operations (see batch.plan_batch)
+
+        Returns:
+            Dict with the 'operations' and 'statements' run and the
+            'created', 'updated', 'deleted' and 'related' counts
+
+        Raises:
+            ValueError: If the batch is empty or too long
+            BatchError: If operations are invalid or refer to missing entities
+        """
+        plan = self._plan_batch(operations)
+        try:
+            async with self._pooled_session() as session:
+                try:
+                    await session.execute_write(self._batch_tx, plan.statements, changes=self.change_feed)
+                except BatchError as e:
+                    # A cached label may be stale: retry probing every label
+                    if not self._discard_batch_labels(plan, {error["index"] for error in e.errors}):
+                        raise
+                    plan = self._plan_batch(operations)
+                    await session.execute_write(self._batch_tx, plan.statements, changes=self.change_feed)
+                await self._sync_recommendations(session, self._batch_committed(plan))
+                await self._sync_cards(session)
+        except BatchError as e:
+            logger.warning(f"Batch rolled back: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Batch failed: {e}", exc_info=True)
+            raise
+        logger.info(f"Applied batch of {len(plan.operations)} operations in {len(plan.statements)} statements")
+        return {"operations": len(plan.operations), "statements": len(plan.statements), **plan.counts()}
+
+    async def query_relationships(
+        self,
+        entity_id: str,
+        rel_type: Optional[str] = None,
+        direction: str = "outgoing",
+        entity_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query entity relationships
+
+        Args:
+            entity_id: Entity identifier
+            rel_type: Optional relationship type filter
+            direction: 'outgoing', 'incoming', or 'both'
+            entity_type: Optional entity type; falls back to the label cache
+
+        Returns:
+            List of relationship dictionaries
+        """
+        label, cached = self._resolve_label(entity_id, entity_type)
+        key = (entity_id, rel_type, direction, entity_type)
+        hit = self._cached_relationships(key)
+        if hit is not MISSING:
+            return hit
+        version = self._relationship_cache.version()
+        try:
+            async with self._pooled_session(read_only=True) as session:
+                results = await session.execute_read(
+                    self._query_relationships_tx,
+                    entity_id,
+                    rel_type,
+                    direction,
+                    label
+                )
+                if not results and cached:
+                    self._label_cache.discard(entity_id)
+                    results = await session.execute_read(
+                        self._query_relationships_tx,
+                        entity_id,
+                        rel_type,
+                        direction,
+                        None
+                    )
+                self._store_relationships(key, entity_id, results, version)
+                return results
+        except Exception as e:
+            logger.error(f"Failed to query relationships for {entity_id}: {e}", exc_info=True)
+            return []
+
+    async def subgraph(
+        self,
+        entity_id: str,
+        depth: int = 2,
+        rel_types: Optional[List[str]] = None,
+        max_nodes: int = 200,
+        fanout: int = 50,
+        entity_type: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the neighborhood of an entity in a single traversal
+
+        Relationships are followed in both directions up to `depth` hops.
+        Each node expands at most `fanout` relationships per hop and the
+        result holds at most `max_nodes` nodes, so supernodes cannot blow
+        the response up.
+
+        Args:
+            entity_id: Root entity identifier
+            depth: Number of hops (1 to SUBGRAPH_MAX_DEPTH)
+            rel_types: Optional relationship types to follow (default: all)
+            max_nodes: Maximum nodes returned, root included
+            fanout: Maximum relationships expanded per node per hop
+            entity_type: Optional root entity type; falls back to the label cache
+
+        Returns:
+            Dict with deduplicated 'nodes' and 'edges' (see
+            cypher.subgraph_from_record), or None if the root does not exist
+
+        Raises:
+            ValueError: If a bound, the entity type or a relationship type is invalid
+        """
+        self._validate_subgraph(depth, rel_types, max_nodes, fanout)
+        label, cached = self._resolve_label(entity_id, entity_type)
+        async with self._pooled_session(read_only=True) as session:
+            result = await session.execute_read(
+                self._subgraph_tx,
+                entity_id,
+                label,
+                depth,
+                rel_types,
+                max_nodes,
+                fanout
+            )
+            if result is None and cached:
+                self._label_cache.discard(entity_id)
+                result = await session.execute_read(
+                    self._subgraph_tx,
+                    entity_id,
+                    None,
+                    depth,
+                    rel_types,
+                    max_nodes,
+                    fanout
+                )
+        self._remember_subgraph(result)
+        return result
+
+    async def search_entities(
+        self,
+        entity_type: Optional[str] = None,
+        search_text: Optional[str] = None,
+        properties: Optional[Dict[str, Any]] = None,
+        limit: int = 100,
+        min_score: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search entities by type, text, or properties
+
+        Text searches are relevance-ranked through the full-text indexes,
+        falling back to a CONTAINS scan if the full-text query fails (e.g.
+        the indexes do not exist yet).
+
+        Args:
+            entity_type: Optional entity type filter
+            search_text: Optional text search on name/description
+            properties: Optional property filters
+            limit: Maximum results (default 100)
+            min_score: Optional minimum relevance score for text searches
+
+        Returns:
+            List of matching entities
+
+        Raises:
+            ValueError: If entity_type or a property name is invalid
+        """
+        self._validate_entity_type(entity_type)
+        cypher.property_filters(properties)
+
+        try:
+            async with self._pooled_session(read_only=True) as session:
+                if search_text and cypher.fulltext_terms(search_text):
+                    try:
+                        return await session.execute_read(
+                            self._fulltext_search_tx,
+                            entity_type,
+                            search_text,
+                            properties,
+                            limit,
+                            min_score
+                        )
+                    except Exception as e:
+                        logger.warning(
+                            f"Full-text search unavailable, falling back to scan: {e}"
+                        )
+                return await session.execute_read(
+                    self._search_entities_tx,
+                    entity_type,
+                    search_text,
+                    properties,
+                    limit
+                )
+        except Exception as e:
+            logger.error(f"Failed to search entities: {e}", exc_info=True)
+            return []
+
+    async def list_entities(
+        self,
+        entity_type: Optional[str] = None,
+        properties: Optional[Dict[str, Any]] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Page through entities in (label, id) order
+
+        Args:
+            entity_type: Optional entity type filter
+            properties: Optional property filters
+            limit: Page size
+            cursor: Cursor returned with the previous page
+
+        Returns:
+            Tuple of (entities, next cursor or None on the last page)
+
+        Raises:
+            ValueError: If entity_type, a property name or the cursor is invalid
+        """
+        labels, after_id = self._entity_page_plan(entity_type, properties, cursor)
+        async with self._pooled_session(read_only=True) as session:
+            rows = await session.execute_read(
+                self._list_entities_tx,
+                labels,
+                after_id,
+                properties,
+                limit
+            )
+        return self._entity_page(rows, limit)
+
+    async def list_relationships(
+        self,
+        rel_type: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Page through relationships in (source label, source id, element id) order
+
+        Args:
+            rel_type: Optional relationship type filter
+            limit: Page size
+            cursor: Cursor returned with the previous page
+
+        Returns:
+            Tuple of (relationships, next cursor or None on the last page)
+
+        Raises:
+            ValueError: If rel_type or the cursor is invalid
+        """
+        labels, after = self._relationship_page_plan(rel_type, cursor)
+        async with self._pooled_session(read_only=True) as session:
+            rows = await session.execute_read(
+                self._list_relationships_tx,
+                labels,
+                after,
+                rel_type,
+                limit
+            )
+        return self._relationship_page(rows, limit)
+
+    def export_graph(
+        self,
+        entity_types: Optional[List[str]] = None,
+        rel_types: Optional[List[str]] = None,
+        include_relationships: bool = True,
+        fetch_size: int = DEFAULT_FETCH_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the graph as export records: all nodes, then all relationships
+
+        Validation happens eagerly so errors surface before the response
+        starts; the returned async iterator then pulls records from Neo4j in
+        batches of fetch_size as it is consumed.
+
+        Args:
+            entity_types: Optional node labels to export (default: all nodes)
+            rel_types: Optional relationship types to export (default: all)
+            include_relationships: Whether to export relationships at all
+            fetch_size: Records fetched per round-trip
+
+        Returns:
+            Async iterator of node records followed by relationship records
+
+        Raises:
+            ValueError: If an entity or relationship type is invalid
+        """
+        self._validate_export(entity_types, rel_types, fetch_size)
+        return self._export_records(
+            entity_types, rel_types, include_relationships, fetch_size
+        )
+
+    async def _export_records(
+        self,
+        entity_types: Optional[List[str]],
+        rel_types: Optional[List[str]],
+        include_relationships: bool,
+        fetch_size: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async generator behind export_graph; holds one session while streaming"""
+        exported = 0
+        async with self._pooled_session(read_only=True, fetch_size=fetch_size) as session:
+            for query in cypher.export_node_queries(entity_types):
+                result = await session.run(query)
+                async for record in result:
+                    exported += 1
+                    yield cypher.export_node(record["n"])
+
+            if include_relationships:
+                for query in cypher.export_relationship_queries(rel_types, entity_types):
+                    result = await session.run(query)
+                    async for record in result:
+                        exported += 1
+                        yield cypher.export_relationship(record)
+
+        logger.info(f"Exported {exported} graph records")
+
+    async def graph_stats(self) -> Dict[str, Any]:
+        """
+        Node and relationship counts, overall and per label / type
+
+        Served from Neo4j's count store, so the cost does not grow with the
+        graph (see cypher.graph_stats_query).
+
+        Returns:
+            Dict with 'total_nodes', 'total_relationships', 'node_types'
+            and 'relationship_types'
+        """
+        async with self._pooled_session(read_only=True) as session:
+            return await session.execute_read(self._graph_stats_tx)
+
+    async def refresh_projection(self):
+        """
+        Rebuild the analytics projection from Neo4j
+
+        Streams every entity id (label by label) and every relationship's
+        endpoint ids, then freezes them into CSR arrays in a worker thread.
+        The previous snapshot keeps serving until the new one is ready, and
+        concurrent callers share a single rebuild.
+
+        Returns:
+            GraphProjection: The new snapshot
+        """
+        if self._projection_task is None or self._projection_task.done():
+            self._projection_task = asyncio.ensure_future(self._load_projection())
+        return await asyncio.shield(self._projection_task)
+
+    async def _load_projection(self):
+        """Load and build a projection snapshot (behind refresh_projection)"""
+        builder = self._projection_builder()
+        async with self._pooled_session(read_only=True, fetch_size=DEFAULT_FETCH_SIZE) as session:
+            for label, query in cypher.projection_node_queries():
+                result = await session.run(query)
+                async for record in result:
+                    builder.add_node(record["id"], label)
+            result = await session.run(cypher.PROJECTION_RELATIONSHIPS_QUERY)
+            async for record in result:
+                builder.add_relationship(record["source_id"], record["target_id"])
+        self._projection = await asyncio.to_thread(builder.build)
+        logger.info(
+            f"Built analytics projection: {self._projection.node_count} nodes, "
+            f"{self._projection.relationship_count} relationships "
+            f"in {self._projection.build_seconds:.2f}s"
+        )
+        return self._projection
+
+    async def get_projection(self):
+        """
+        Current analytics projection, built on first use
+
+        Returns:
+            GraphProjection: Latest snapshot (possibly stale, see projection_info)
+        """
+        if self._projection is None:
+            return await self.refresh_projection()
+        return self._projection
+
+    async def refresh_projection_periodically(self):
+        """
+        Keep the analytics projection fresh (run as a background task)
+
+        Every projection_refresh_interval seconds, rebuilds a projection that
+        has been built before and has since missed writes through this service
+        or outlived projection_max_age.
+        """
+        while True:
+            await asyncio.sleep(self.projection_refresh_interval)
+            if self._projection is None or not self._projection_stale():
+                continue
+            try:
+                await self.refresh_projection()
+            except Exception as e:
+                logger.error(f"Failed to refresh analytics projection: {e}")
+
+    async def refresh_recommendations(self) -> Dict[str, Any]:
+        """
+        Rebuild the recommendation index from Neo4j
+
+        Concurrent callers share a single rebuild.
+
+        Returns:
+            Index metrics (see recommendation_metrics)
+        """
+        if self._recommendations_task is None or self._recommendations_task.done():
+            self._recommendations_task = asyncio.ensure_future(self._load_recommendations())
+        return await asyncio.shield(self._recommendations_task)
+
+    async def _load_recommendations(self) -> Dict[str, Any]:
+        """Load every recommendation relationship (behind refresh_recommendations)"""
+        async with self._pooled_session(read_only=True) as session:
+            rows = await session.execute_read(self._recommendation_rows_tx, None)
+        self._recommendations.load(rows)
+        metrics = self._recommendations.metrics()
+        logger.info(
+            f"Built recommendation index: {metrics['products']} products, {metrics['keys']} keys"
+        )
+        return metrics
+
+    async def recommend(
+        self,
+        problem: Optional[str] = None,
+        user_group: Optional[str] = None,
+        scenario: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        Products for a (problem, user group, scenario) combination, best first
+
+        Served from the in-memory recommendation index. The first call builds
+        it; afterwards a stale or expired index keeps answering while it is
+        rebuilt in the background.
+
+        Args:
+            problem: Problem id the product must solve (SOLVES)
+            user_group: UserGroup id the product must target (TARGETS)
+            scenario: Scenario id the product must apply to (APPLIES_TO)
+            limit: Maximum products to return
+
+        Returns:
+            Dict with 'products' ([{"product_id", "score"}]) and 'total' matches
+
+        Raises:
+            ValueError: If no facet is given or limit is not positive
+        """
+        self._validate_recommendation(problem, user_group, scenario, limit)
+        if not self._recommendations.built:
+            await self.refresh_recommendations()
+        elif self._recommendations_due() and (
+            self._recommendations_task is None or self._recommendations_task.done()
+        ):
+            self._recommendations_task = asyncio.ensure_future(self._load_recommendations())
+        products, total = self._recommendations.lookup(problem, user_group, scenario, limit)
+        return {"products": products, "total": total}
+
+    async def _sync_recommendations(self, session, product_ids):
+        """Re-index products whose recommendation relationships changed (once the index is built)"""
+        if not self._recommendations.built or not product_ids:
+            return
+        product_ids = list(product_ids)
+        try:
+            rows = await session.execute_read(self._recommendation_rows_tx, product_ids)
+            self._recommendations.update_products(product_ids, rows)
+        except Exception as e:
+            logger.warning(f"Recommendation index update failed, rebuilding later: {e}")
+            self._recommendations.stale = True
+
+    async def refresh_product_cards(self) -> Dict[str, Any]:
+        """
+        Rebuild the product cards from Neo4j
+
+        Streams one card row per product and renders the cards in a worker
+        thread, then writes the snapshot if one is configured. The previous
+        cards keep answering until the new ones are ready, and concurrent
+        callers share a single rebuild.
+
+        Returns:
+            Index metrics (see product_card_metrics)
+        """
+        if self._cards_task is None or self._cards_task.done():
+            self._cards_task = asyncio.ensure_future(self._load_product_cards())
+        return await asyncio.shield(self._cards_task)
+
+    async def _load_product_cards(self, restore: bool = False) -> Dict[str, Any]:
+        """Load every product's card row and render the cards (behind refresh_product_cards)"""
+        if restore and await asyncio.to_thread(self._restore_cards):
+            return self._cards.metrics()
+        async with self._pooled_session(read_only=True, fetch_size=DEFAULT_FETCH_SIZE) as session:
+            result = await session.run(cypher.product_cards_query())
+            rows = [dict(record) async for record in result]
+        await asyncio.to_thread(self._cards.load, rows)
+        await asyncio.to_thread(self._save_cards)
+        metrics = self._cards.metrics()
+        logger.info(f"Built product cards: {metrics['products']} products, {metrics['bytes']} bytes")
+        return metrics
+
+    async def get_product_cards(self, product_ids: List[str]) -> Dict[str, bytes]:
+        """
+        Encoded storefront cards of products
+
+        Served from the in-memory card index. The first call restores it from
+        its snapshot or builds it; afterwards a stale or expired index keeps
+        answering while it is rebuilt in the background. Cards still dirty
+        from a write that could not re-render them, or whose best offer has
+        expired, are re-rendered first.
+
+        Args:
+            product_ids: Product ids
+
+        Returns:
+            Dict of product id -> card as compact JSON bytes ({"product",
+            "features", "problems", "user_groups", "best_offer",
+            "offer_count", "competitors"}); unknown products are left out
+
+        Raises:
+            ValueError: If the request is invalid (see _validate_product_cards)
+        """
+        self._validate_product_cards(product_ids)
+        if not self._cards.built:
+            if self._cards_task is None or self._cards_task.done():
+                self._cards_task = asyncio.ensure_future(self._load_product_cards(restore=True))
+            await asyncio.shield(self._cards_task)
+        elif self._cards_due() and (self._cards_task is None or self._cards_task.done()):
+            self._cards_task = asyncio.ensure_future(self._load_product_cards())
+        cards, pending = self._cards.get(product_ids)
+        if pending:
+            async with self._pooled_session(read_only=True) as session:
+                await self._sync_cards(session, pending)
+            cards, _ = self._cards.get(product_ids)
+        return cards
+
+    async def get_product_card(self, product_id: str) -> Optional[bytes]:
+        """
+        Encoded storefront card of a product (see get_product_cards)
+
+        Args:
+            product_id: Product id
+
+        Returns:
+            Card as compact JSON bytes, or None if the product does not exist
+        """
+        return (await self.get_product_cards([product_id])).get(product_id)
+
+    async def _sync_cards(self, session, product_ids=None):
+        """Re-render dirty product cards, or product_ids (once the cards are built)"""
+        if not self._cards.built or (product_ids is None and not self._cards.dirty):
+            return
+        product_ids = self._cards.claim(product_ids)
+        try:
+            for start in range(0, len(product_ids), DEFAULT_BATCH_SIZE):
+                chunk = product_ids[start:start + DEFAULT_BATCH_SIZE]
+                rows = await session.execute_read(self._product_card_rows_tx, chunk)
+                self._cards.update_products(chunk, rows)
+        except Exception as e:
+            logger.warning(f"Product card update failed, re-rendering on read: {e}")
+            self._cards.mark_dirty(product_ids)
+
+    async def refresh_resolver(self) -> Dict[str, Any]:
+        """
+        Rebuild the entity resolution index from Neo4j
+
+        Streams every named entity (label by label) and builds the trigram
+        index in a worker thread. The previous index keeps answering until
+        the new one is ready, and concurrent callers share a single rebuild.
+
+        Returns:
+            Index info (see resolver_info)
+        """
+        if self._resolver_task is None or self._resolver_task.done():
+            self._resolver_task = asyncio.ensure_future(self._load_resolver())
+        return await asyncio.shield(self._resolver_task)
+
+    async def _load_resolver(self) -> Dict[str, Any]:
+        """Load entity names and build the resolution index (behind refresh_resolver)"""
+        names = {}
+        async with self._pooled_session(read_only=True, fetch_size=DEFAULT_FETCH_SIZE) as session:
+            for label, query in cypher.resolution_name_queries():
+                result = await session.run(query)
+                names[label] = [(record["id"], record["name"]) async for record in result]
+        self._resolver = await asyncio.to_thread(self._resolver_build, names)
+        info = self._resolver.info()
+        logger.info(
+            f"Built entity resolution index: {info['entities']} entities "
+            f"in {info['build_seconds']:.2f}s"
+        )
+        return info
+
+    async def resolve_entities(
+        self,
+        names: List[str],
+        entity_type: Optional[str] = None,
+        limit: int = 5,
+        min_score: float = 0.3
+    ) -> List[Dict[str, Any]]:
+        """
+        Match surface strings to existing entities by name similarity
+
+        Served from the in-memory trigram index. The first call builds it;
+        afterwards an expired index keeps answering while it is rebuilt in
+        the background.
+
+        Args:
+            names: Surface strings to resolve
+            entity_type: Optional entity type to match against
+            limit: Maximum candidates per name
+            min_score: Minimum trigram similarity (0-1)
+
+        Returns:
+            One {"name", "candidates"} entry per input name, in order; candidates
+            are {"id", "entity_type", "name", "score"}, best first
+
+        Raises:
+            ValueError: If the request is invalid (see _validate_resolution)
+        """
+        self._validate_resolution(names, entity_type, limit, min_score)
+        if self._resolver is None:
+            await self.refresh_resolver()
+        elif self._resolver_due() and (self._resolver_task is None or self._resolver_task.done()):
+            self._resolver_task = asyncio.ensure_future(self._load_resolver())
+        return await asyncio.to_thread(self._resolve_names, names, entity_type, limit, min_score)
+
+    async def refresh_semantic_index(self) -> Dict[str, Any]:
+        """
+        Rebuild the semantic search index from Neo4j
+
+        Streams the name and description of every entity (label by label)
+        and builds the vectors in a worker thread. The previous index keeps
+        answering until the new one is ready, and concurrent callers share a
+        single rebuild.
+
+        Returns:
+            Index info (see semantic_info)
+        """
+        if self._semantic_task is None or self._semantic_task.done():
+            self._semantic_task = asyncio.ensure_future(self._load_semantic_index())
+        return await asyncio.shield(self._semantic_task)
+
+    async def _load_semantic_index(self) -> Dict[str, Any]:
+        """Load entity texts and build the semantic search index (behind refresh_semantic_index)"""
+        documents = {}
+        async with self._pooled_session(read_only=True, fetch_size=DEFAULT_FETCH_SIZE) as session:
+            for label, query in cypher.semantic_document_queries():
+                result = await session.run(query)
+                documents[label] = [
+                    (record["id"], record["name"], record["description"]) async for record in result
+                ]
+        self._semantic = await asyncio.to_thread(self._semantic_build, documents)
+        info = self._semantic.info()
+        logger.info(
+            f"Built semantic search index: {info['entities']} entities "
+            f"in {info['build_seconds']:.2f}s"
+        )
+        return info
+
+    async def semantic_search(
+        self,
+        text: str,
+        entity_types: Optional[List[str]] = None,
+        limit: int = 10,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Find entities whose name and description are similar to a text
+
+        Served from the in-memory vector index. The first call builds it;
+        afterwards an expired index keeps answering while it is rebuilt in
+        the background.
+
+        Args:
+            text: Query text
+            entity_types: Entity types to search; all if omitted
+            limit: Maximum results
+            min_score: Minimum cosine similarity (0-1)
+
+        Returns:
+            Matches ({"id", "entity_type", "name", "score"}), best first
+
+        Raises:
+            ValueError: If the request is invalid (see _validate_semantic_search)
+        """
+        self._validate_semantic_search(text, entity_types, limit, min_score)
+        if self._semantic is None:
+            await self.refresh_semantic_index()
+        elif self._semantic_due() and (self._semantic_task is None or self._semantic_task.done()):
+            self._semantic_task = asyncio.ensure_future(self._load_semantic_index())
+        return await asyncio.to_thread(self._semantic_search, text, entity_types, limit, min_score)
+
+    async def refresh_offers(self, full: bool = False) -> Dict[str, Any]:
+        """
+        Refresh the offer index from Neo4j
+
+        Applies the offers whose updated_at is at or after the index's
+        watermark, or reloads every offer when full is set (or the index is
+        empty), which also drops offers deleted by other writers. Concurrent
+        callers share a single refresh.
+
+        Args:
+            full: Reload every offer instead of applying a delta
+
+        Returns:
+            Index metrics (see offer_metrics)
+        """
+        if self._offers_task is None or self._offers_task.done():
+            self._offers_task = asyncio.ensure_future(self._load_offers(full))
+        return await asyncio.shield(self._offers_task)
+
+    async def _load_offers(self, full: bool) -> Dict[str, Any]:
+        """Load all offers or a delta into the index (behind refresh_offers)"""
+        since = None if full or not self._offers.built else self._offers.delta_since
+        async with self._pooled_session(read_only=True, fetch_size=DEFAULT_FETCH_SIZE) as session:
+            offers = await session.execute_read(self._offers_tx, since)
+        if since is None:
+            self._offers.load(offers)
+            logger.info(f"Built offer index: {len(offers)} offers")
+        else:
+            self._offers.apply(offers)
+        return self._offers.metrics()
+
+    async def find_offers(
+        self,
+        sku: str,
+        region: Optional[str] = None,
+        include_unavailable: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Offers for a SKU that are currently within their validity window
+
+        Served from the in-memory offer index. The first call builds it;
+        afterwards a due refresh runs in the background while the current
+        index keeps answering.
+
+        Args:
+            sku: Product SKU
+            region: Region code, or None for every region
+            include_unavailable: Also return offers with availability false
+
+        Returns:
+            Offers, available first, then cheapest first
+
+        Raises:
+            ValueError: If sku is empty
+        """
+        self._validate_offer_lookup(sku)
+        if not self._offers.built:
+            await self.refresh_offers(full=True)
+        elif (self._offers_full_refresh_due() or self._offers_delta_due()) and (
+            self._offers_task is None or self._offers_task.done()
+        ):
+            self._offers_task = asyncio.ensure_future(
+                self._load_offers(self._offers_full_refresh_due())
+            )
+        return self._offers.lookup(sku, region, include_unavailable=include_unavailable)
+
+    async def refresh_offers_periodically(self):
+        """
+        Keep the offer index fresh (run as a background task)
+
+        Every offer_refresh_interval seconds, applies the offers updated since
+        the last refresh, and reloads the index fully when it is missing or
+        older than offer_max_age.
+        """
+        while True:
+            await asyncio.sleep(self.offer_refresh_interval)
+            try:
+                await self.refresh_offers(full=self._offers_full_refresh_due())
+            except Exception as e:
+                logger.error(f"Failed to refresh offer index: {e}")
+
+    async def get_changes(self, since: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """
+        Read the change feed after a sequence number
+
+        The read runs on a read session. Events committed since the last
+        sequencing run are numbered in the background by one run shared
+        by every reader, started at most once per change_poll_interval, so
+        they become readable on a later read (or after the maintenance
+        task's next compact_changes when nobody reads).
+
+        Args:
+            since: Last sequence number already seen (0 for the start of the log)
+            limit: Maximum events to return
+
+        Returns:
+            Dict with 'changes' (events, oldest first; see changes.decode_change)
+            and 'next_since' to pass on the next read
+
+        Raises:
+            ValueError: If since is negative or limit out of range
+        """
+        self._validate_changes(since, limit)
+        if self._changes_sequencing_due() and (
+            self._sequence_task is None or self._sequence_task.done()
+        ):
+            self._sequence_task = asyncio.ensure_future(self._sequence_pending_changes())
+        async with self._pooled_session(read_only=True) as session:
+            events = await session.execute_read(self._changes_tx, since, limit)
+        return self._changes_page(events, since)
+
+    async def sequence_changes(self) -> int:
+        """
+        Number the committed change events that are still pending
+
+        Concurrent callers share one run, which numbers events in
+        transactions of at most CHANGE_FEED_BATCH_SIZE until none are left.
+
+        Returns:
+            Number of events numbered by the run
+        """
+        if self._sequence_task is None or self._sequence_task.done():
+            self._sequence_task = asyncio.ensure_future(self._sequence_pending_changes())
+        return await asyncio.shield(self._sequence_task)
+
+    async def _sequence_pending_changes(self) -> int:
+        """Number pending change events in batches (see sequence_changes)"""
+        self._changes_sequenced_at = time.time()
+        sequenced = 0
+        async with self._pooled_session() as session:
+            count = CHANGE_FEED_BATCH_SIZE
+            while count == CHANGE_FEED_BATCH_SIZE:
+                count = await session.execute_write(self._sequence_changes_tx, CHANGE_FEED_BATCH_SIZE)
+                sequenced += count
+        return sequenced
+
+    async def latest_change_seq(self) -> int:
+        """Sequence number of the newest change event (0 if none were logged)"""
+        async with self._pooled_session(read_only=True) as session:
+            return await session.execute_read(self._latest_change_tx)
+
+    async def compact_changes(self) -> Dict[str, int]:
+        """
+        Number every pending change event, then delete the events past the
+        change_retention_events / change_retention_seconds limits
+
+        Both run in transactions of at most CHANGE_FEED_BATCH_SIZE events.
+
+        Returns:
+            Dict with 'sequenced' and 'deleted' event counts
+        """
+        sequenced = await self.sequence_changes()
+        deleted = 0
+        async with self._pooled_session() as session:
+            latest = await session.execute_read(self._latest_change_tx)
+            for field, bound in self._change_retention_bounds(latest):
+                count = CHANGE_FEED_BATCH_SIZE
+                while count == CHANGE_FEED_BATCH_SIZE:
+                    count = await session.execute_write(
+                        self._expire_changes_tx, field, bound, CHANGE_FEED_BATCH_SIZE
+                    )
+                    deleted += count
+        if sequenced or deleted:
+            logger.info(f"Change feed: {sequenced} events numbered, {deleted} expired")
+        return {"sequenced": sequenced, "deleted": deleted}
+
+    async def maintain_changes_periodically(self):
+        """
+        Background task running compact_changes every change_maintenance_interval
+        seconds, so events are numbered and expired without a reader
+        """
+        while True:
+            await asyncio.sleep(self.change_maintenance_interval)
+            try:
+                await self.compact_changes()
+            except Exception as e:
+                logger.error(f"Failed to maintain change feed: {e}")
+
+    async def stream_changes(
+        self,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Follow the change feed
+
+        Yields logged events, then polls the log every change_poll_interval
+        seconds for new ones until the consumer stops iterating.
+
+        Args:
+            since: Last sequence number already seen; None starts after the
+                newest event, once the events pending at subscribe time are
+                numbered
+            limit: Maximum events read per poll
+
+        Yields:
+            Events in sequence order (see changes.decode_change)
+
+        Raises:
+            ValueError: If since is negative or limit out of range
+        """
+        if since is None:
+            await self.sequence_changes()
+            since = await self.latest_change_seq()
+        self._validate_changes(since, limit)
+        while True:
+            page = await self.get_changes(since, limit)
+            for change in page["changes"]:
+                yield change
+            since = page["next_since"]
+            if len(page["changes"]) < limit:
+                await asyncio.sleep(self.change_poll_interval)
+
+    async def execute_query(
+        self,
+        query: str,
+        params: Dict[str, Any] = None,
+        timeout: Optional[float] = None,
+        max_rows: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Execute custom Cypher query under resource guards
+
+        The query runs with a transaction timeout, is streamed with a bounded
+        fetch size and stops after max_rows records. When plan checking is
+        enabled it is first EXPLAINed and rejected if the plan contains an
+        AllNodesScan or CartesianProduct above the configured estimate; query
+        texts that pass are remembered so repeated queries skip the EXPLAIN.
+
+        Args:
+            query: Cypher query string
+            params: Query parameters
+            timeout: Optional timeout in seconds (capped at query_timeout)
+            max_rows: Optional row cap (capped at query_max_rows)
+
+        Returns:
+            Dict with 'records' (list of result dictionaries) and 'truncated'
+            (True if more rows were available than max_rows)
+
+        Raises:
+            ValueError: If query contains dangerous operations or fails the plan check
+        """
+        if params is None:
+            params = {}
+
+        cypher.check_query_safety(query)
+        timeout, max_rows = self._query_limits(timeout, max_rows)
+
+        try:
+            query_type = self._known_query_type(query)
+            if query_type is None:
+                # EXPLAIN in a write session: the query may turn out to write
+                async with self._pooled_session() as session:
+                    explained = await session.run(Query(f"EXPLAIN {query}", timeout=timeout), **params)
+                    query_type = self._explained(query, await explained.consume())
+            writes = query_type != "r"
+
+            async with self._pooled_session(
+                read_only=not writes,
+                fetch_size=self.query_fetch_size
+            ) as session:
+
+                result = await session.run(Query(query, timeout=timeout), **params)
+                records = []
+                truncated = False
+                async for record in result:
+                    if len(records) >= max_rows:
+                        # Leaving the session discards the rest of the stream
+                        truncated = True
+                        break
+                    records.append(dict(record))
+                if writes:
+                    # Arbitrary writes cannot be attributed to entities
+                    self._invalidate_all()
+                logger.info(
+                    f"Executed custom query, returned {len(records)} results"
+                    f"{' (truncated)' if truncated else ''}"
+                )
+                return {"records": records, "truncated": truncated}
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to execute cypher query: {e}", exc_info=True)
+            raise
+
+    async def execute_cypher(self, query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Execute custom Cypher query
+
+        Same guards as execute_query, returning only the records.
+
+        Args:
+            query: Cypher query string
+            params: Query parameters
+
+        Returns:
+            List of result dictionaries
+
+        Raises:
+            ValueError: If query contains dangerous operations or fails the plan check
+        """
+        result = await self.execute_query(query, params)
+        return result["records"]
+
+    # Transaction functions (static coroutines)
+
+    @staticmethod
+    async def _append_changes_tx(tx, events: List[Dict[str, Any]]):
+        """Append change feed events in the transaction of the write they describe"""
+        if events:
+            result = await tx.run(cypher.append_changes_query(), events=events)
+            await result.consume()
+
+    @staticmethod
+    async def _create_entity_tx(
+        tx,
+        entity_type: str,
+        properties: Dict[str, Any],
+        changes: bool = False
+    ) -> str:
+        """Transaction function for creating entity"""
+        result = await tx.run(cypher.create_entity_query(entity_type), properties=properties)
+        record = await result.single()
+        if changes:
+            await AsyncGraphService._append_changes_tx(
+                tx, [entity_change("create", entity_type, record["id"], properties)]
+            )
+        return record["id"]
+
+    @staticmethod
+    async def _create_entities_batch_tx(
+        tx,
+        entity_type: str,
+        rows: List[Dict[str, Any]],
+        changes: bool = False
+    ) -> int:
+        """Transaction function for creating a batch of same-label entities"""
+        result = await tx.run(cypher.create_entities_batch_query(entity_type), rows=rows)
+        record = await result.single()
+        if changes:
+            await AsyncGraphService._append_changes_tx(
+                tx, [entity_change("create", entity_type, row["id"], row) for row in rows]
+            )
+        return record["created"]
+
+    @staticmethod
+    async def _query_entity_tx(
+        tx,
+        entity_id: str,
+        label: Optional[str] = None
+    ) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """Transaction function for querying entity, returns (properties, label)"""
+        result = await tx.run(cypher.query_entity_query(label), id=entity_id)
+        return cypher.entity_from_record(await result.single())
+
+    @staticmethod
+    async def _update_entity_tx(
+        tx,
+        entity_id: str,
+        properties: Dict[str, Any],
+        label: Optional[str] = None,
+        changes: bool = False
+    ) -> bool:
+        """Transaction function for updating entity"""
+        query = cypher.update_entity_query(label, properties.keys())
+        result = await tx.run(query, id=entity_id, props=properties)
+        record = await result.single()
+        if record is None:
+            return False
+        if changes:
+            entity_type = label or cypher.entity_label(list(record["n"].labels))
+            await AsyncGraphService._append_changes_tx(
+                tx, [entity_change("update", entity_type, entity_id, properties)]
+            )
+        return True
+
+    @staticmethod
+    async def _delete_entity_tx(
+        tx,
+        entity_id: str,
+        label: Optional[str] = None,
+        changes: bool = False
+    ) -> bool:
+        """Transaction function for deleting entity"""
+        result = await tx.run(cypher.delete_entity_query(label), id=entity_id)
+        record = await result.single()
+        if record["deleted"] and changes:
+            entity_type = label or cypher.entity_label(record["labels"] or [])
+            await AsyncGraphService._append_changes_tx(tx, [entity_change("delete", entity_type, entity_id)])
+        return record["deleted"] > 0
+
+    @staticmethod
+    async def _create_relationship_tx(
+        tx,
+        from_id: str,
+        to_id: str,
+        rel_type: str,
+        properties: Dict[str, Any],
+        from_label: Optional[str] = None,
+        to_label: Optional[str] = None,
+        changes: bool = False
+    ) -> bool:
+        """Transaction function for creating relationship"""
+        query = cypher.create_relationship_query(rel_type, from_label, to_label)
+        result = await tx.run(query, from_id=from_id, to_id=to_id, properties=properties)
+        if await result.single() is None:
+            return False
+        if changes:
+            await AsyncGraphService._append_changes_tx(
+                tx, [relationship_change("create", rel_type, from_id, to_id, properties)]
+            )
+        return True
+
+    @staticmethod
+    async def _merge_relationships_batch_tx(
+        tx,
+        rel_type: str,
+        from_label: Optional[str],
+        to_label: Optional[str],
+        rows: List[Dict[str, Any]],
+        changes: bool = False
+    ) -> Dict[str, int]:
+        """Transaction function for merging a batch of same-type relationships"""
+        query = cypher.merge_relationships_batch_query(rel_type, from_label, to_label)
+        result = await tx.run(query, rows=rows)
+        record = await result.single()
+        if changes:
+            await AsyncGraphService._append_changes_tx(tx, merge_changes(rel_type, rows, record))
+        return {"created": record["created"], "matched": record["matched"]}
+
+    @staticmethod
+    async def _delete_relationship_tx(
+        tx,
+        from_id: str,
+        to_id: str,
+        rel_type: str,
+        from_label: Optional[str] = None,
+        to_label: Optional[str] = None,
+        changes: bool = False
+    ) -> bool:
+        """Transaction function for deleting relationship"""
+        query = cypher.delete_relationship_query(rel_type, from_label, to_label)
+        result = await tx.run(query, from_id=from_id, to_id=to_id)
+        record = await result.single()
+        if record["deleted"] and changes:
+            await AsyncGraphService._append_changes_tx(
+                tx, [relationship_change("delete", rel_type, from_id, to_id)]
+            )
+        return record["deleted"] > 0
+
+    @staticmethod
+    async def _batch_tx(tx, statements: List[BatchStatement], changes: bool = False):
+        """Transaction function running a batch's statements; raises BatchError to roll back"""
+        events = []
+        for statement in statements:
+            result = await tx.run(statement.query, rows=statement.rows)
+            record = await result.single()
+            if statement.op != "create":
+                errors = unapplied(statement, record["applied"])
+                if errors:
+                    raise BatchError(errors)
+            if changes:
+                events.extend(batch_changes(statement, record))
+        await AsyncGraphService._append_changes_tx(tx, events)
+
+    @staticmethod
+    async def _query_relationships_tx(
+        tx,
+        entity_id: str,
+        rel_type: Optional[str],
+        direction: str,
+        label: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Transaction function for querying relationships"""
+        relationships = []
+        for query_direction, query in cypher.query_relationships_queries(rel_type, direction, label):
+            result = await tx.run(query, id=entity_id)
+            async for record in result:
+                relationships.append(cypher.relationship_from_record(query_direction, record))
+        return relationships
+
+    @staticmethod
+    async def _subgraph_tx(
+        tx,
+        entity_id: str,
+        label: Optional[str],
+        depth: int,
+        rel_types: Optional[List[str]],
+        max_nodes: int,
+        fanout: int
+    ) -> Optional[Dict[str, Any]]:
+        """Transaction function for bounded neighborhood traversal"""
+        query = cypher.subgraph_query(label, depth, rel_types)
+        result = await tx.run(query, id=entity_id, max_nodes=max_nodes, fanout=fanout)
+        return cypher.subgraph_from_record(await result.single(), entity_id, max_nodes)
+
+    @staticmethod
+    async def _list_entities_tx(
+        tx,
+        labels: List[str],
+        after_id: Optional[str],
+        properties: Optional[Dict[str, Any]],
+        limit: int
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Transaction function for keyset-paginated entity listing"""
+        rows = []
+        for position, label in enumerate(labels):
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            # The cursor only applies to the label it was taken from
+            query, params = cypher.list_entities_query(
+                label, after_id if position == 0 else None, properties, remaining
+            )
+            result = await tx.run(query, **params)
+            rows.extend([(label, dict(record["n"])) async for record in result])
+        return rows
+
+    @staticmethod
+    async def _list_relationships_tx(
+        tx,
+        labels: List[str],
+        after: Optional[Dict[str, Any]],
+        rel_type: Optional[str],
+        limit: int
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Transaction function for keyset-paginated relationship listing"""
+        rows = []
+        for position, label in enumerate(labels):
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            query, params = cypher.list_relationships_query(
+                label, after if position == 0 else None, rel_type, remaining
+            )
+            result = await tx.run(query, **params)
+            rows.extend([(label, dict(record)) async for record in result])
+        return rows
+
+    @staticmethod
+    async def _fulltext_search_tx(
+        tx,
+        entity_type: Optional[str],
+        search_text: str,
+        properties: Optional[Dict[str, Any]],
+        limit: int,
+        min_score: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Transaction function for relevance-ranked full-text search"""
+        query, params = cypher.fulltext_search_query(
+            entity_type, search_text, properties, limit, min_score
+        )
+        result = await tx.run(query, **params)
+        return [cypher.fulltext_hit(record, search_text) async for record in result]
+
+    @staticmethod
+    async def _search_entities_tx(
+        tx,
+        entity_type: Optional[str],
+        search_text: Optional[str],
+        properties: Optional[Dict[str, Any]],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Transaction function for searching entities"""
+        query, params = cypher.search_entities_query(
+            entity_type, search_text, properties, limit
+        )
+        result = await tx.run(query, **params)
+        return [dict(record["n"]) async for record in result]
+
+    @staticmethod
+    async def _graph_stats_tx(tx) -> Dict[str, Any]:
+        """Transaction function for count-store graph statistics"""
+        result = await tx.run(cypher.graph_stats_query())
+        return cypher.graph_stats([record async for record in result])
+
+    @staticmethod
+    async def _recommendation_rows_tx(tx, product_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Transaction function reading recommendation relationships (all, or of product_ids)"""
+        if product_ids is None:
+            result = await tx.run(cypher.recommendation_rows_query())
+        else:
+            result = await tx.run(cypher.recommendation_rows_query(product_ids=True), ids=product_ids)
+        return [dict(record) async for record in result]
+
+    @staticmethod
+    async def _product_card_rows_tx(tx, product_ids: List[str]) -> List[Dict[str, Any]]:
+        """Transaction function reading the card rows of product_ids"""
+        result = await tx.run(cypher.product_cards_query(product_ids=True), ids=product_ids)
+        return [dict(record) async for record in result]
+
+    @staticmethod
+    async def _entity_hashes_tx(tx, entity_type: str, entity_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Transaction function reading stored content hashes"""
+        result = await tx.run(cypher.entity_hashes_query(entity_type), ids=entity_ids)
+        return {record["id"]: record["hash"] async for record in result}
+
+    @staticmethod
+    async def _upsert_entities_batch_tx(
+        tx,
+        entity_type: str,
+        rows: List[Dict[str, Any]],
+        now: str,
+        existing=(),
+        changes: bool = False
+    ) -> int:
+        """Transaction function for hash-guarded UNWIND + MERGE upserts (existing: ids stored before)"""
+        result = await tx.run(cypher.upsert_entities_batch_query(entity_type), rows=rows, now=now)
+        record = await result.single()
+        if not record:
+            return 0
+        if changes:
+            await AsyncGraphService._append_changes_tx(
+                tx, upsert_changes(entity_type, rows, record["ids"], existing, now)
+            )
+        return record["written"]
+
+    @staticmethod
+    async def _changes_tx(tx, since: int, limit: int) -> List[Dict[str, Any]]:
+        """Transaction function reading change events after a sequence number"""
+        result = await tx.run(cypher.changes_query(), since=since, limit=limit)
+        return [record["event"] async for record in result]
+
+    @staticmethod
+    async def _latest_change_tx(tx) -> int:
+        """Transaction function reading the change sequence counter"""
+        result = await tx.run(cypher.latest_change_query())
+        record = await result.single()
+        return record["seq"] if record else 0
+
+    @staticmethod
+    async def _sequence_changes_tx(tx, limit: int) -> int:
+        """Transaction function numbering committed pending change events"""
+        # Skip the counter lock when there is nothing to number
+        result = await tx.run(cypher.pending_changes_query())
+        if not (await result.single())["pending"]:
+            return 0
+        result = await tx.run(cypher.lock_change_sequence_query())
+        await result.consume()
+        result = await tx.run(cypher.sequence_changes_query(), limit=limit)
+        return (await result.single())["sequenced"]
+
+    @staticmethod
+    async def _expire_changes_tx(tx, field: str, bound: int, limit: int) -> int:
+        """Transaction function deleting change events past a retention bound"""
+        result = await tx.run(cypher.expire_changes_query(field), bound=bound, limit=limit)
+        return (await result.single())["deleted"]
+
+    @staticmethod
+    async def _offers_tx(tx, since: Optional[str]) -> List[Dict[str, Any]]:
+        """Transaction function reading Offer properties (all, or updated since a watermark)"""
+        if since is None:
+            result = await tx.run(cypher.offers_query())
+        else:
+            result = await tx.run(cypher.offers_query(since=True), since=since)
+        return [record["offer"] async for record in result]
+
+    @staticmethod
+    async def _entities_by_id_tx(
+        tx,
+        groups: Dict[Optional[str], List[str]]
+    ) -> Dict[str, Tuple[Dict[str, Any], Optional[str]]]:
+        """Transaction function reading entities by id, one UNWIND query per label"""
+        found = {}
+        for label, entity_ids in groups.items():
+            result = await tx.run(
+                cypher.entities_by_id_query(label),
+                rows=[{"id": entity_id} for entity_id in entity_ids]
+            )
+            async for record in result:
+                found[record["id"]] = cypher.entity_from_record(record)
+        return found
@@ -0,0 +1,1172 @@
+"""
+Graph Service Base
+
+State and validation shared by GraphService (sync driver) and
+AsyncGraphService (async driver): pool metrics, the id -> label cache, the
+read-through caches, input validation and pagination bookkeeping.
+Subclasses provide the I/O.
+"""
+from typing import List, Dict, Optional, Any, Set, Tuple
+import threading
+import logging
+import time
+from neo4j import Bookmarks, READ_ACCESS
+from .bookmarks import BookmarkScope, current_bookmark_scope
+from .label_cache import LabelCache
+from .read_cache import ReadCache, MISSING
+from .recommendations import RecommendationIndex
+from .offers import OfferIndex, OFFER_LABEL
+from .cards import ProductCardIndex
+from .batch import BatchPlan, plan_batch
+from .changes import decode_change
+from .cypher import (
+    ENTITY_TYPES, RELATIONSHIP_TYPES, SUBGRAPH_MAX_DEPTH, BATCH_GET_MAX_IDS, RESOLUTION_MAX_NAMES,
+    RECOMMENDATION_REL_TYPES, CHANGE_FEED_MAX_EVENTS,
+    encode_cursor, decode_cursor, property_filters, plan_violations
+)
+
+logger = logging.getLogger(__name__)
+
+# Query types reported by EXPLAIN: read only, read/write, write only, schema
+QUERY_TYPES = ("r", "rw", "w", "s")
+
+# Connection pool defaults, also the defaults of the NEO4J_* pool settings
+DEFAULT_MAX_CONNECTION_POOL_SIZE = 50
+DEFAULT_CONNECTION_ACQUISITION_TIMEOUT = 30.0  # seconds
+DEFAULT_MAX_CONNECTION_LIFETIME = 3600  # seconds
+
+
+class BaseGraphService:
+    """Driver-agnostic part of the graph services"""
+
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        max_connection_pool_size: int = DEFAULT_MAX_CONNECTION_POOL_SIZE,
+        connection_acquisition_timeout: float = DEFAULT_CONNECTION_ACQUISITION_TIMEOUT,
+        max_connection_lifetime: int = DEFAULT_MAX_CONNECTION_LIFETIME,
+        label_cache_size: int = 100000,
+        read_cache_size: int = 50000,
+        read_cache_ttl: float = 60.0,
+        query_timeout: float = 30.0,
+        query_max_rows: int = 10000,
+        query_fetch_size: int = 500,
+        query_plan_check: bool = False,
+        query_plan_max_rows: float = 100000,
+        query_validation_cache_size: int = 256,
+        projection_refresh_interval: float = 300.0,
+        projection_max_age: float = 3600.0,
+        recommendation_max_age: float = 3600.0,
+        offer_refresh_interval: float = 30.0,
+        offer_max_age: float = 3600.0,
+        resolution_max_age: float = 3600.0,
+        semantic_max_age: float = 3600.0,
+        semantic_dimensions: int = 256,
+        semantic_ivf_min_entities: int = 50000,
+        semantic_ivf_probes: int = 32,
+        card_max_age: float = 3600.0,
+        card_snapshot_path: Optional[str] = None,
+        change_feed: bool = True,
+        change_poll_interval: float = 1.0,
+        change_retention_events: int = 1000000,
+        change_retention_seconds: float = 604800.0,
+        change_maintenance_interval: float = 60.0
+    ):
+        """
+        Initialize Neo4j driver with connection pooling
+
+        The driver owns the connection pool, so a single service instance should
+        be shared for the lifetime of the process rather than created per request.
+
+        Args:
+            uri: Neo4j connection URI (e.g., bolt://localhost:7687)
+            user: Database username
+            password: Database password
+            max_connection_pool_size: Maximum connections kept in the pool
+            connection_acquisition_timeout: Seconds to wait for a free connection
+            max_connection_lifetime: Seconds before a pooled connection is recycled
+            label_cache_size: Maximum entries in the id -> label routing cache
+            read_cache_size: Maximum entries in each read-through cache
+                (entities, relationships); 0 disables them
+            read_cache_ttl: Seconds a cached read stays valid
+            query_timeout: Transaction timeout in seconds for custom queries
+            query_max_rows: Rows returned by a custom query before it is truncated
+            query_fetch_size: Records pulled per round-trip for custom queries
+            query_plan_check: EXPLAIN custom queries and reject expensive plans
+            query_plan_max_rows: Estimated rows above which an AllNodesScan or
+                CartesianProduct makes the plan check fail
+            query_validation_cache_size: Query texts remembered as EXPLAINed
+                (plan checked and query type known)
+            projection_refresh_interval: Seconds between checks whether the
+                analytics projection needs rebuilding (0 disables the
+                background refresh)
+            projection_max_age: Seconds after which the projection is rebuilt
+                even without writes through this service (e.g. ETL loads)
+            recommendation_max_age: Seconds after which the recommendation
+                index is rebuilt to pick up writes made outside this service
+            offer_refresh_interval: Seconds between offer index delta refreshes
+                (offers with a newer updated_at); 0 disables them
+            offer_max_age: Seconds after which the offer index is fully
+                reloaded (picks up offers deleted by other writers)
+            resolution_max_age: Seconds after which the entity resolution
+                index is rebuilt to pick up writes made outside this service
+            semantic_max_age: Seconds after which the semantic search index
+                is rebuilt to pick up writes made outside this service
+            semantic_dimensions: Dimensions of the semantic search vectors
+            semantic_ivf_min_entities: Labels with at least this many entities
+                are searched through IVF clusters (0 scores every entity)
+            semantic_ivf_probes: IVF clusters scored per semantic query
+            card_max_age: Seconds after which the product cards are rebuilt
+                to pick up writes made outside this service
+            card_snapshot_path: File the product cards are saved to after a
+                build and on close, and restored from on first use while
+                younger than card_max_age (None disables snapshots)
+            change_feed: Log every write to the change feed (see
+                services.changes), in the write's own transaction
+            change_poll_interval: Seconds between change log polls of a
+                change stream, and between sequencing runs started by reads
+            change_retention_events: Newest change events kept by
+                compact_changes (0 keeps all)
+            change_retention_seconds: Age after which compact_changes drops
+                change events (0 keeps all)
+            change_maintenance_interval: Seconds between compact_changes runs
+                of the change maintenance task
+        """
+        self.driver = self._create_driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=max_connection_pool_size,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+            max_connection_lifetime=max_connection_lifetime
+        )
+        self.max_connection_pool_size = max_connection_pool_size
+        self._label_cache = LabelCache(label_cache_size)
+        self._entity_cache = ReadCache(read_cache_size, read_cache_ttl)
+        self._relationship_cache = ReadCache(read_cache_size, read_cache_ttl)
+
+        # Guards for custom Cypher (execute_query)
+        self.query_timeout = query_timeout
+        self.query_max_rows = query_max_rows
+        self.query_fetch_size = query_fetch_size
+        self.query_plan_check = query_plan_check
+        self.query_plan_max_rows = query_plan_max_rows
+        # Custom query text -> EXPLAINed query type. Graph statistics drift,
+        # so plans are re-checked hourly
+        self._validated_queries = ReadCache(query_validation_cache_size, 3600)
+
+        # Analytics projection (see services.projection), built on first use.
+        # Writes bump the generation so the refresh loop knows it is stale.
+        self.projection_refresh_interval = projection_refresh_interval
+        self.projection_max_age = projection_max_age
+        self._projection = None
+        self._projection_lock = threading.Lock()
+        self._write_generation = 0
+
+        # (problem, user group, scenario) -> ranked products, built on first
+        # use and updated by relationship writes
+        self.recommendation_max_age = recommendation_max_age
+        self._recommendations = RecommendationIndex()
+
+        # (sku, region) -> offers for checkout, loaded on first use, updated by
+        # this service's Offer writes and by periodic deltas
+        self.offer_refresh_interval = offer_refresh_interval
+        self.offer_max_age = offer_max_age
+        self._offers = OfferIndex()
+
+        # Trigram name index for entity resolution (see services.resolution),
+        # built on first use and updated by this service's entity writes
+        self.resolution_max_age = resolution_max_age
+        self._resolver = None
+        self._resolver_lock = threading.Lock()
+
+        # Hashed TF-IDF vectors of names and descriptions (see
+        # services.semantic), built on first use and updated by entity writes
+        self.semantic_max_age = semantic_max_age
+        self.semantic_dimensions = semantic_dimensions
+        self.semantic_ivf_min_entities = semantic_ivf_min_entities
+        self.semantic_ivf_probes = semantic_ivf_probes
+        self._semantic = None
+        self._semantic_lock = threading.Lock()
+
+        # Encoded product cards (see services.cards), built on first use and
+        # re-rendered by this service's writes
+        self.card_max_age = card_max_age
+        self.card_snapshot_path = card_snapshot_path or None
+        self._cards = ProductCardIndex()
+        self._cards_lock = threading.Lock()
+
+        # Change feed: events are appended by the write transactions themselves
+        # and numbered afterwards (see cypher.sequence_changes_query)
+        self.change_feed = change_feed
+        self.change_poll_interval = change_poll_interval
+        self.change_retention_events = change_retention_events
+        self.change_retention_seconds = change_retention_seconds
+        self.change_maintenance_interval = change_maintenance_interval
+        self._changes_sequenced_at: Optional[float] = None
+
+        # Pool utilization counters, updated by _pooled_session()
+        self._pool_lock = threading.Lock()
+        self._sessions_in_use = 0
+        self._sessions_peak = 0
+        self._sessions_total = 0
+
+        logger.info(
+            f"Connected to Neo4j at {uri} "
+            f"(pool size={max_connection_pool_size})"
+        )
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Build a service from application settings
+
+        Args:
+            settings: Settings instance (see config.get_settings)
+
+        Returns:
+            Service with pool options taken from settings
+        """
+        return cls(
+            uri=settings.NEO4J_URI,
+            user=settings.NEO4J_USER,
+            password=settings.NEO4J_PASSWORD,
+            max_connection_pool_size=settings.NEO4J_MAX_CONNECTION_POOL_SIZE,
+            connection_acquisition_timeout=settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+            max_connection_lifetime=settings.NEO4J_MAX_CONNECTION_LIFETIME,
+            label_cache_size=settings.ENTITY_LABEL_CACHE_SIZE,
+            read_cache_size=settings.READ_CACHE_SIZE,
+            read_cache_ttl=settings.READ_CACHE_TTL_SECONDS,
+            query_timeout=settings.QUERY_TIMEOUT_SECONDS,
+            query_max_rows=settings.QUERY_MAX_ROWS,
+            query_fetch_size=settings.QUERY_FETCH_SIZE,
+            query_plan_check=settings.QUERY_PLAN_CHECK,
+            query_plan_max_rows=settings.QUERY_PLAN_MAX_ESTIMATED_ROWS,
+            query_validation_cache_size=settings.QUERY_VALIDATION_CACHE_SIZE,
+            projection_refresh_interval=settings.PROJECTION_REFRESH_SECONDS,
+            projection_max_age=settings.PROJECTION_MAX_AGE_SECONDS,
+            recommendation_max_age=settings.RECOMMENDATION_MAX_AGE_SECONDS,
+            offer_refresh_interval=settings.OFFER_INDEX_REFRESH_SECONDS,
+            offer_max_age=settings.OFFER_INDEX_MAX_AGE_SECONDS,
+            resolution_max_age=settings.RESOLUTION_MAX_AGE_SECONDS,
+            semantic_max_age=settings.SEMANTIC_INDEX_MAX_AGE_SECONDS,
+            semantic_dimensions=settings.SEMANTIC_DIMENSIONS,
+            semantic_ivf_min_entities=settings.SEMANTIC_IVF_MIN_ENTITIES,
+            semantic_ivf_probes=settings.SEMANTIC_IVF_PROBES,
+            card_max_age=settings.PRODUCT_CARD_MAX_AGE_SECONDS,
+            card_snapshot_path=settings.PRODUCT_CARD_SNAPSHOT_PATH,
+            change_feed=settings.CHANGE_FEED_ENABLED,
+            change_poll_interval=settings.CHANGE_FEED_POLL_SECONDS,
+            change_retention_events=settings.CHANGE_FEED_RETENTION_EVENTS,
+            change_retention_seconds=settings.CHANGE_FEED_RETENTION_SECONDS,
+            change_maintenance_interval=settings.CHANGE_FEED_MAINTENANCE_SECONDS
+        )
+
+    def _create_driver(self, uri: str, **kwargs):
+        """Create the Neo4j driver (implemented by subclasses)"""
+        raise NotImplementedError
+
+    # Pool metrics
+
+    def _session_opened(self):
+        """Record a session opened (it holds a connection while it runs work)"""
+        with self._pool_lock:
+            self._sessions_in_use += 1
+            self._sessions_total += 1
+            self._sessions_peak = max(self._sessions_peak, self._sessions_in_use)
+
+    def _session_closed(self):
+        """Record a session returned to the pool"""
+        with self._pool_lock:
+            self._sessions_in_use -= 1
+
+    @staticmethod
+    def _session_options(read_only: bool, kwargs: Dict[str, Any]) -> Optional[BookmarkScope]:
+        """
+        Add access mode and request bookmarks to driver.session() kwargs
+
+        Returns:
+            The current request's bookmark scope, to be updated with the
+            session's bookmarks once it closes (None outside a request)
+        """
+        if read_only:
+            kwargs.setdefault("default_access_mode", READ_ACCESS)
+        scope = current_bookmark_scope()
+        if scope is not None and scope.bookmarks:
+            kwargs.setdefault("bookmarks", Bookmarks.from_raw_values(scope.bookmarks))
+        return scope
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """
+        Report connection pool utilization
+
+        Counts are of open sessions. The driver connects lazily, on a
+        session's first transaction, so there is no per-session acquisition
+        time to report; waits for a connection surface as
+        connection_acquisition_timeout errors.
+
+        Returns:
+            Dict with pool size, sessions in use, sessions the pool can still
+            serve without waiting ('idle'), peak usage, utilization ratio and
+            sessions opened so far
+        """
+        with self._pool_lock:
+            in_use = self._sessions_in_use
+            return {
+                "max_pool_size": self.max_connection_pool_size,
+                "in_use": in_use,
+                "idle": max(self.max_connection_pool_size - in_use, 0),
+                "peak_in_use": self._sessions_peak,
+                "utilization": (
+                    in_use / self.max_connection_pool_size
+                    if self.max_connection_pool_size else 0.0
+                ),
+                "sessions_total": self._sessions_total
+            }
+
+    # Read-through caches
+
+    def _cached_entity(self, entity_id: str, entity_type: Optional[str]) -> Any:
+        """
+        Look up a cached query_entity result
+
+        Returns:
+            Entity properties, None if the cached entity has a different label
+            than entity_type, or MISSING on a cache miss
+        """
+        cached = self._entity_cache.get(entity_id)
+        if cached is MISSING:
+            return MISSING
+        properties, label = cached
+        if entity_type and label != entity_type:
+            return None
+        return dict(properties)
+
+    def _store_entity(
+        self,
+        entity_id: str,
+        properties: Dict[str, Any],
+        label: Optional[str],
+        version: int
+    ):
+        """Cache a query_entity result read at cache version `version`"""
+        self._entity_cache.put(
+            entity_id, (dict(properties), label), tags=(entity_id,), version=version
+        )
+
+    def _plan_batch_get(
+        self,
+        entity_ids: List[str],
+        entity_type: Optional[str]
+    ) -> Tuple[Dict[str, Tuple[Dict[str, Any], Optional[str]]], Dict[Optional[str], List[str]], Set[str]]:
+        """
+        Split a batch get into entity cache hits and per-label reads
+
+        Args:
+            entity_ids: Requested ids (duplicates allowed)
+            entity_type: Optional label every entity must have
+
+        Returns:
+            Tuple of (id -> (properties, label) served from the cache,
+            label (None if unknown) -> ids to read, ids whose label came
+            from the label cache)
+
+        Raises:
+            ValueError: If no ids or too many are given, or entity_type is invalid
+        """
+        if not entity_ids:
+            raise ValueError("ids must not be empty")
+        if len(entity_ids) > BATCH_GET_MAX_IDS:
+            raise ValueError(f"At most {BATCH_GET_MAX_IDS} ids can be fetched at once")
+        self._validate_entity_type(entity_type)
+
+        found, groups, from_label_cache = {}, {}, set()
+        for entity_id in dict.fromkeys(entity_ids):
+            cached = self._entity_cache.get(entity_id)
+            if cached is not MISSING:
+                properties, label = cached
+                if not entity_type or label == entity_type:
+                    found[entity_id] = (dict(properties), label)
+                continue
+            label, from_cache = self._resolve_label(entity_id, entity_type)
+            if from_cache:
+                from_label_cache.add(entity_id)
+            groups.setdefault(label, []).append(entity_id)
+        return found, groups, from_label_cache
+
+    def _store_entities(self, found: Dict[str, Tuple[Dict[str, Any], Optional[str]]], version: int):
+        """Cache entities read by a batch get at cache version `version`"""
+        for entity_id, (properties, label) in found.items():
+            if label:
+                self._label_cache.put(entity_id, label)
+            self._store_entity(entity_id, properties, label, version)
+
+    @staticmethod
+    def _batch_get_results(
+        entity_ids: List[str],
+        found: Dict[str, Tuple[Dict[str, Any], Optional[str]]]
+    ) -> List[Dict[str, Any]]:
+        """One {"id", "found", "entity_type", "properties"} entry per requested id, in order"""
+        results = []
+        for entity_id in entity_ids:
+            properties, label = found.get(entity_id, (None, None))
+            results.append({
+                "id": entity_id,
+                "found": entity_id in found,
+                "entity_type": label,
+                "properties": dict(properties) if properties is not None else None
+            })
+        return results
+
+    def _cached_relationships(self, key: Tuple) -> Any:
+        """Look up a cached query_relationships result, or MISSING"""
+        cached = self._relationship_cache.get(key)
+        if cached is MISSING:
+            return MISSING
+        return [dict(relationship) for relationship in cached]
+
+    def _store_relationships(
+        self,
+        key: Tuple,
+        entity_id: str,
+        relationships: List[Dict[str, Any]],
+        version: int
+    ):
+        """
+        Cache a query_relationships result read at cache version `version`
+
+        The entry is tagged with the queried entity and every neighbour it
+        embeds, so a write to any of them invalidates it.
+        """
+        tags = [entity_id]
+        for relationship in relationships:
+            end = relationship.get("target") or relationship.get("source") or {}
+            if end.get("id") is not None:
+                tags.append(end["id"])
+        self._relationship_cache.put(
+            key, [dict(relationship) for relationship in relationships],
+            tags=tags, version=version
+        )
+
+    def _invalidate(self, *entity_ids: str):
+        """Drop cached reads that contain any of the given entities"""
+        self._write_generation += 1
+        self._entity_cache.invalidate(*entity_ids)
+        self._relationship_cache.invalidate(*entity_ids)
+        self._cards.touch(entity_ids)
+
+    def _invalidate_all(self):
+        """Drop every cached read (after writes that cannot be attributed)"""
+        self._write_generation += 1
+        self._recommendations.stale = True
+        self._cards.stale = True
+        self._entity_cache.clear()
+        self._relationship_cache.clear()
+
+    def cache_metrics(self) -> Dict[str, Any]:
+        """
+        Report read-through cache effectiveness
+
+        Returns:
+            Dict with per-cache ('entities', 'relationships') hit and miss
+            counters, hit ratio, size and eviction/expiry/invalidation counts,
+            plus the recommendation, offer, entity resolution, semantic
+            search and product card index sizes and ages ('recommendations',
+            'offers', 'resolution', 'semantic', 'product_cards'; resolution
+            and semantic are None until built)
+        """
+        return {
+            "entities": self._entity_cache.metrics(),
+            "relationships": self._relationship_cache.metrics(),
+            "recommendations": self.recommendation_metrics(),
+            "offers": self.offer_metrics(),
+            "resolution": self.resolver_info(),
+            "semantic": self.semantic_info(),
+            "product_cards": self.product_card_metrics()
+        }
+
+    # Analytics projection
+
+    def _projection_builder(self):
+        """Start a projection snapshot at the current write generation"""
+        # NumPy is only imported once analytics are used
+        from .projection import ProjectionBuilder
+        return ProjectionBuilder(self._write_generation)
+
+    def _projection_stale(self) -> bool:
+        """Whether the projection misses writes or is older than projection_max_age"""
+        projection = self._projection
+        if projection is None:
+            return True
+        return (
+            projection.generation != self._write_generation
+            or projection.info()["age_seconds"] >= self.projection_max_age
+        )
+
+    def projection_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Describe the analytics projection
+
+        Returns:
+            Snapshot size and age plus a 'stale' flag, or None if not built yet
+        """
+        if self._projection is None:
+            return None
+        return {**self._projection.info(), "stale": self._projection_stale()}
+
+    # Recommendation index
+
+    @staticmethod
+    def _validate_recommendation(
+        problem: Optional[str],
+        user_group: Optional[str],
+        scenario: Optional[str],
+        limit: int
+    ):
+        """Raise ValueError unless at least one facet is given and limit is positive"""
+        if not (problem or user_group or scenario):
+            raise ValueError("Specify at least one of problem, user_group or scenario")
+        if limit < 1:
+            raise ValueError("limit must be positive")
+
+    def _recommendations_due(self) -> bool:
+        """Whether the recommendation index needs a (re)build"""
+        index = self._recommendations
+        return (
+            not index.built
+            or index.stale
+            or index.metrics()["age_seconds"] >= self.recommendation_max_age
+        )
+
+    def recommendation_metrics(self) -> Dict[str, Any]:
+        """
+        Describe the recommendation index
+
+        Returns:
+            Dict with product and key counts, build time, age and stale flag
+        """
+        return self._recommendations.metrics()
+
+    # In-memory indexes kept current by this service's writes
+
+    def _entity_written(self, entity_id: str, label: Optional[str], properties: Dict[str, Any]):
+        """Apply a successful entity create/update to the offer, resolution and semantic indexes"""
+        self._offer_written(entity_id, label, properties)
+        if label == "Product":
+            # New products have no card to find them by yet
+            self._cards.touch((), products=(entity_id,))
+        resolver = self._resolver
+        if resolver is not None and "name" in properties:
+            resolver.add(label, entity_id, properties["name"])
+        semantic = self._semantic
+        if semantic is not None and ("name" in properties or "description" in properties):
+            semantic.merge(label, entity_id, properties)
+
+    def _entity_deleted(self, entity_id: str):
+        """Drop a deleted entity from the in-memory indexes"""
+        self._recommendations.remove_entity(entity_id)
+        self._offers.remove(entity_id)
+        self._cards.remove(entity_id)
+        if self._resolver is not None:
+            self._resolver.remove(entity_id)
+        if self._semantic is not None:
+            self._semantic.remove(entity_id)
+
+    # Entity resolution
+
+    @staticmethod
+    def _resolver_build(names: Dict[str, List[Tuple[str, str]]]):
+        """Build an EntityResolver from label -> (id, name) pairs"""
+        # NumPy is only imported once resolution is used
+        from .resolution import EntityResolver
+        return EntityResolver(names)
+
+    def _resolver_due(self) -> bool:
+        """Whether the resolution index needs a (re)build"""
+        resolver = self._resolver
+        return resolver is None or time.time() - resolver.built_at >= self.resolution_max_age
+
+    @staticmethod
+    def _validate_resolution(names: List[str], entity_type: Optional[str], limit: int, min_score: float):
+        """
+        Validate an entity resolution request
+
+        Raises:
+            ValueError: If names is empty or too long, entity_type is invalid,
+                limit is not positive or min_score is outside 0-1
+        """
+        if not names:
+            raise ValueError("names must not be empty")
+        if len(names) > RESOLUTION_MAX_NAMES:
+            raise ValueError(f"At most {RESOLUTION_MAX_NAMES} names can be resolved at once")
+        BaseGraphService._validate_entity_type(entity_type)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        if not 0 <= min_score <= 1:
+            raise ValueError("min_score must be between 0 and 1")
+
+    def _resolve_names(
+        self,
+        names: List[str],
+        entity_type: Optional[str],
+        limit: int,
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """Resolve names against the built resolution index"""
+        resolver = self._resolver
+        return [
+            {"name": name, "candidates": resolver.resolve(name, entity_type, limit, min_score)}
+            for name in names
+        ]
+
+    def resolver_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Describe the entity resolution index
+
+        Returns:
+            Dict with entity counts, build time and age, or None if not built
+        """
+        if self._resolver is None:
+            return None
+        return self._resolver.info()
+
+    # Semantic search
+
+    def _semantic_build(self, documents: Dict[str, List[Tuple[str, Any, Any]]]):
+        """Build a SemanticIndex from label -> (id, name, description) triples"""
+        # NumPy is only imported once semantic search is used
+        from .semantic import SemanticIndex
+        return SemanticIndex(
+            documents,
+            dimensions=self.semantic_dimensions,
+            ivf_min_entities=self.semantic_ivf_min_entities,
+            ivf_probes=self.semantic_ivf_probes
+        )
+
+    def _semantic_due(self) -> bool:
+        """Whether the semantic search index needs a (re)build"""
+        index = self._semantic
+        return index is None or time.time() - index.built_at >= self.semantic_max_age
+
+    @staticmethod
+    def _validate_semantic_search(text: str, entity_types: Optional[List[str]], limit: int, min_score: float):
+        """
+        Validate a semantic search request
+
+        Raises:
+            ValueError: If text is blank, an entity type is invalid, limit is
+                not positive or min_score is outside 0-1
+        """
+        if not text or not text.strip():
+            raise ValueError("text must not be empty")
+        for entity_type in entity_types or ():
+            BaseGraphService._validate_entity_type(entity_type)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        if not 0 <= min_score <= 1:
+            raise ValueError("min_score must be between 0 and 1")
+
+    def _semantic_search(
+        self,
+        text: str,
+        entity_types: Optional[List[str]],
+        limit: int,
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """Search the built semantic index"""
+        return self._semantic.search(text, entity_types, limit, min_score)
+
+    def semantic_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Describe the semantic search index
+
+        Returns:
+            Dict with entity counts, IVF clusters, vocabulary size, build time
+            and age, or None if not built
+        """
+        if self._semantic is None:
+            return None
+        return self._semantic.info()
+
+    # Product cards
+
+    def _cards_due(self) -> bool:
+        """Whether the product cards need a (re)build"""
+        index = self._cards
+        return (
+            not index.built
+            or index.stale
+            or index.metrics()["age_seconds"] >= self.card_max_age
+        )
+
+    def _restore_cards(self) -> bool:
+        """Load the product cards from the snapshot if one is configured, present and fresh"""
+        if self._cards.built or not self.card_snapshot_path:
+            return False
+        try:
+            restored = self._cards.restore(self.card_snapshot_path, self.card_max_age)
+        except Exception as e:
+            logger.warning(f"Could not restore product cards from {self.card_snapshot_path}: {e}")
+            return False
+        if restored:
+            logger.info(
+                f"Restored {self._cards.metrics()['products']} product cards "
+                f"from {self.card_snapshot_path}"
+            )
+        return restored
+
+    def _save_cards(self):
+        """Write the product cards to the snapshot, if one is configured"""
+        if not self._cards.built or not self.card_snapshot_path:
+            return
+        try:
+            count = self._cards.save(self.card_snapshot_path)
+            logger.info(f"Saved {count} product cards to {self.card_snapshot_path}")
+        except Exception as e:
+            logger.warning(f"Could not save product cards to {self.card_snapshot_path}: {e}")
+
+    @staticmethod
+    def _validate_product_cards(product_ids: List[str]):
+        """
+        Validate a product card request
+
+        Raises:
+            ValueError: If product_ids is empty, too long or has an empty id
+        """
+        if not product_ids:
+            raise ValueError("product_ids must not be empty")
+        if len(product_ids) > BATCH_GET_MAX_IDS:
+            raise ValueError(f"At most {BATCH_GET_MAX_IDS} product cards can be fetched at once")
+        if not all(product_ids):
+            raise ValueError("Product ids must not be empty")
+
+    def product_card_metrics(self) -> Dict[str, Any]:
+        """
+        Describe the product card index
+
+        Returns:
+            Dict with card count, encoded size, dirty cards, build time, age
+            and stale flag
+        """
+        return self._cards.metrics()
+
+    # Change feed
+
+    @staticmethod
+    def _validate_changes(since: int, limit: int):
+        """
+        Validate a change feed read
+
+        Raises:
+            ValueError: If since is negative or limit out of range
+        """
+        if since < 0:
+            raise ValueError("since must not be negative")
+        if not 1 <= limit <= CHANGE_FEED_MAX_EVENTS:
+            raise ValueError(f"limit must be between 1 and {CHANGE_FEED_MAX_EVENTS}")
+
+    @staticmethod
+    def _changes_page(events: List[Dict[str, Any]], since: int) -> Dict[str, Any]:
+        """Decode a change log read into {"changes", "next_since"}"""
+        changes = [decode_change(event) for event in events]
+        return {"changes": changes, "next_since": changes[-1]["seq"] if changes else since}
+
+    def _changes_sequencing_due(self) -> bool:
+        """Whether a change read should start a sequencing run (once per change_poll_interval)"""
+        sequenced_at = self._changes_sequenced_at
+        return sequenced_at is None or time.time() - sequenced_at >= self.change_poll_interval
+
+    def _change_retention_bounds(self, latest: int) -> List[Tuple[str, int]]:
+        """
+        Retention limits for cypher.expire_changes_query
+
+        Args:
+            latest: Sequence number of the newest change event
+
+        Returns:
+            (field, bound) pairs: events whose field is below bound are expired
+        """
+        bounds = []
+        if self.change_retention_events > 0 and latest > self.change_retention_events:
+            bounds.append(("seq", latest - self.change_retention_events + 1))
+        if self.change_retention_seconds > 0:
+            bounds.append(("stamp", time.time_ns() - int(self.change_retention_seconds * 1e9)))
+        return bounds
+
+    # Offer index
+
+    def _offer_written(self, entity_id: str, label: Optional[str], properties: Dict[str, Any]):
+        """Apply a successful entity write to the offer index (once it is built)"""
+        if self._offers.built and (label == OFFER_LABEL or entity_id in self._offers):
+            self._offers.merge(entity_id, properties)
+
+    def _offers_full_refresh_due(self) -> bool:
+        """Whether the offer index needs a full (re)load rather than a delta"""
+        built_at = self._offers.built_at
+        return built_at is None or time.time() - built_at >= self.offer_max_age
+
+    def _offers_delta_due(self) -> bool:
+        """Whether offers updated by other writers should be pulled in"""
+        refreshed_at = self._offers.refreshed_at
+        return (
+            self.offer_refresh_interval > 0 and refreshed_at is not None
+            and time.time() - refreshed_at >= self.offer_refresh_interval
+        )
+
+    @staticmethod
+    def _validate_offer_lookup(sku: str):
+        """Raise ValueError unless a SKU is given"""
+        if not sku:
+            raise ValueError("sku is required")
+
+    def offer_metrics(self) -> Dict[str, Any]:
+        """
+        Describe the offer index
+
+        Returns:
+            Dict with offer and key counts, build/refresh times and watermark
+        """
+        return self._offers.metrics()
+
+    # Custom query guards
+
+    def _query_limits(
+        self,
+        timeout: Optional[float],
+        max_rows: Optional[int]
+    ) -> Tuple[float, int]:
+        """Effective timeout and row cap; callers may only tighten the configured ones"""
+        timeout = min(timeout, self.query_timeout) if timeout else self.query_timeout
+        max_rows = min(max_rows, self.query_max_rows) if max_rows else self.query_max_rows
+        return timeout, max_rows
+
+    def _known_query_type(self, query: str) -> Optional[str]:
+        """Type of a query EXPLAINed before ('r', 'rw', 'w' or 's'), None if it must be EXPLAINed"""
+        query_type = self._validated_queries.get(query)
+        return None if query_type is MISSING else query_type
+
+    def _explained(self, query: str, summary) -> str:
+        """
+        Check a query's EXPLAIN summary and remember its type
+
+        The type Neo4j reports is what decides whether the query runs in a
+        read session; procedure calls that write (e.g. apoc.create.*) are
+        reported as writes even though no write clause appears in the text.
+
+        Args:
+            query: Query text
+            summary: ResultSummary of the EXPLAIN
+
+        Returns:
+            Query type ('r', 'rw', 'w' or 's'; 'rw' if Neo4j reported none)
+
+        Raises:
+            ValueError: If the plan check is on and the plan has an
+                AllNodesScan or CartesianProduct estimated above
+                query_plan_max_rows
+        """
+        if self.query_plan_check:
+            violations = plan_violations(summary.plan, self.query_plan_max_rows)
+            if violations:
+                raise ValueError(f"Query rejected by plan check: {', '.join(violations)}")
+        query_type = summary.query_type if summary.query_type in QUERY_TYPES else "rw"
+        self._validated_queries.put(query, query_type)
+        return query_type
+
+    # Validation
+
+    @staticmethod
+    def _validate_entity_type(entity_type: Optional[str]):
+        """Raise ValueError unless entity_type is empty or a known label"""
+        if entity_type and entity_type not in ENTITY_TYPES:
+            raise ValueError(f"Invalid entity type: {entity_type}")
+
+    @staticmethod
+    def _validate_rel_type(rel_type: Optional[str]):
+        """Raise ValueError unless rel_type is empty or a known type"""
+        if rel_type and rel_type not in RELATIONSHIP_TYPES:
+            raise ValueError(f"Invalid relationship type: {rel_type}")
+
+    @staticmethod
+    def _validate_new_entity(entity_type: str, properties: Dict[str, Any]):
+        """
+        Validate an entity about to be created
+
+        Raises:
+            ValueError: If entity_type is invalid or properties missing 'id'
+        """
+        # Validate entity type (prevent injection)
+        if entity_type not in ENTITY_TYPES:
+            raise ValueError(f"Invalid entity type: {entity_type}")
+
+        if "id" not in properties:
+            raise ValueError("Entity properties must include 'id' field")
+
+    def _resolve_label(
+        self,
+        entity_id: str,
+        entity_type: Optional[str]
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Resolve the label to use for an id-based lookup
+
+        Args:
+            entity_id: Entity identifier
+            entity_type: Label supplied by the caller, if any
+
+        Returns:
+            Tuple of (label or None, whether the label came from the cache)
+
+        Raises:
+            ValueError: If entity_type is not a valid entity type
+        """
+        if entity_type:
+            self._validate_entity_type(entity_type)
+            return entity_type, False
+        label = self._label_cache.get(entity_id)
+        return label, label is not None
+
+    # Bulk and pagination bookkeeping
+
+    @staticmethod
+    def _group_bulk_entities(
+        entities: List[Dict[str, Any]]
+    ) -> Tuple[Dict[str, List[Tuple[int, Dict[str, Any]]]], List[Dict[str, Any]]]:
+        """
+        Validate bulk rows and group the valid ones by label
+
+        Returns:
+            Tuple of ({label: [(input index, properties)]}, per-row errors)
+        """
+        errors = []
+        groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        for index, entity in enumerate(entities):
+            entity_type = entity.get("entity_type")
+            properties = entity.get("properties") or {}
+            if entity_type not in ENTITY_TYPES:
+                errors.append({
+                    "index": index,
+                    "id": properties.get("id"),
+                    "error": f"Invalid entity type: {entity_type}"
+                })
+            elif "id" not in properties:
+                errors.append({
+                    "index": index,
+                    "id": None,
+                    "error": "Entity properties must include 'id' field"
+                })
+            else:
+                groups.setdefault(entity_type, []).append((index, properties))
+        return groups, errors
+
+    def _group_bulk_relationships(
+        self,
+        relationships: List[Dict[str, Any]]
+    ) -> Tuple[Dict[Tuple[str, Optional[str], Optional[str]], List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Validate bulk relationship rows and group them for UNWIND batches
+
+        Rows ({"index", "from_id", "to_id", "properties"}, index referring
+        to the input list) are grouped by (rel_type, from label, to label); labels come from
+        the row or the label cache, and stay None (probe every label) when
+        unknown. Repeated (from_id, to_id) pairs within a group are collapsed,
+        the last row's properties winning.
+
+        Returns:
+            Tuple of ({(rel_type, from_label, to_label): [row]}, per-row errors)
+        """
+        errors = []
+        groups: Dict[Tuple[str, Optional[str], Optional[str]], Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        for index, relationship in enumerate(relationships):
+            rel_type = relationship.get("rel_type")
+            from_id = relationship.get("from_id")
+            to_id = relationship.get("to_id")
+            try:
+                if rel_type not in RELATIONSHIP_TYPES:
+                    raise ValueError(f"Invalid relationship type: {rel_type}")
+                if not from_id or not to_id:
+                    raise ValueError("Relationships must include 'from_id' and 'to_id'")
+                from_label, _ = self._resolve_label(from_id, relationship.get("from_type"))
+                to_label, _ = self._resolve_label(to_id, relationship.get("to_type"))
+            except ValueError as e:
+                errors.append({"index": index, "id": f"{from_id}->{to_id}", "error": str(e)})
+                continue
+            rows = groups.setdefault((rel_type, from_label, to_label), {})
+            rows[(from_id, to_id)] = {
+                "index": index,
+                "from_id": from_id,
+                "to_id": to_id,
+                "properties": relationship.get("properties") or {}
+            }
+        return {key: list(rows.values()) for key, rows in groups.items()}, errors
+
+    def _plan_batch(self, operations: List[Dict[str, Any]]) -> BatchPlan:
+        """Validate a mixed-operation batch and plan its statements (see services.batch)"""
+        return plan_batch(operations, self._resolve_label)
+
+    def _discard_batch_labels(self, plan: BatchPlan, indexes: Set[int]) -> bool:
+        """
+        Forget cached labels used by the given operations of a failed batch
+
+        Returns:
+            Whether any did come from the cache (the batch is worth retrying)
+        """
+        stale = plan.cached & indexes
+        for operation in plan.operations:
+            if operation["index"] in stale:
+                for key in ("id", "from_id", "to_id"):
+                    if key in operation:
+                        self._label_cache.discard(operation[key])
+        return bool(stale)
+
+    def _batch_committed(self, plan: BatchPlan) -> Set[str]:
+        """
+        Apply a committed batch to the label cache, read caches and in-memory indexes
+
+        Returns:
+            Source ids of relationships that feed the recommendation index
+        """
+        touched, sources = set(), set()
+        for operation in plan.operations:
+            if operation["op"] == "relate":
+                touched.update((operation["from_id"], operation["to_id"]))
+                if operation["rel_type"] in RECOMMENDATION_REL_TYPES:
+                    sources.add(operation["from_id"])
+                continue
+            entity_id = operation["id"]
+            touched.add(entity_id)
+            if operation["op"] == "delete":
+                self._label_cache.discard(entity_id)
+                self._entity_deleted(entity_id)
+                continue
+            if operation["op"] == "create":
+                self._label_cache.put(entity_id, operation["label"])
+            self._entity_written(entity_id, operation["label"], operation["properties"])
+        self._invalidate(*touched)
+        return sources
+
+    def _entity_page_plan(
+        self,
+        entity_type: Optional[str],
+        properties: Optional[Dict[str, Any]],
+        cursor: Optional[str]
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        Work out which labels an entity page walks and where it resumes
+
+        Returns:
+            Tuple of (labels in listing order, id to resume after in the first label)
+
+        Raises:
+            ValueError: If entity_type, a property name or the cursor is invalid
+        """
+        self._validate_entity_type(entity_type)
+        property_filters(properties)
+
+        labels = [entity_type] if entity_type else list(ENTITY_TYPES)
+        after = decode_cursor(cursor) if cursor else None
+        if not after:
+            return labels, None
+        if after["label"] not in labels:
+            raise ValueError("Invalid cursor")
+        return labels[labels.index(after["label"]):], after["id"]
+
+    def _entity_page(
+        self,
+        rows: List[Tuple[str, Dict[str, Any]]],
+        limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Turn (label, entity) rows into a page and its next cursor"""
+        for label, entity in rows:
+            self._label_cache.put(entity["id"], label)
+
+        next_cursor = None
+        if rows and len(rows) >= limit:
+            label, entity = rows[-1]
+            next_cursor = encode_cursor({"label": label, "id": entity["id"]})
+        return [entity for _, entity in rows], next_cursor
+
+    def _relationship_page_plan(
+        self,
+        rel_type: Optional[str],
+        cursor: Optional[str]
+    ) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+        """
+        Work out which source labels a relationship page walks and where it resumes
+
+        Raises:
+            ValueError: If rel_type or the cursor is invalid
+        """
+        self._validate_rel_type(rel_type)
+        labels = list(ENTITY_TYPES)
+        after = decode_cursor(cursor, ("label", "id", "element_id")) if cursor else None
+        if after:
+            labels = labels[labels.index(after["label"]):]
+        return labels, after
+
+    @staticmethod
+    def _relationship_page(
+        rows: List[Tuple[str, Dict[str, Any]]],
+        limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Turn (source label, relationship) rows into a page and its next cursor"""
+        next_cursor = None
+        if rows and len(rows) >= limit:
+            label, relationship = rows[-1]
+            next_cursor = encode_cursor({
+                "label": label,
+                "id": relationship["source_id"],
+                "element_id": relationship["element_id"]
+            })
+        return [relationship for _, relationship in rows], next_cursor
+
+    def _validate_subgraph(
+        self,
+        depth: int,
+        rel_types: Optional[List[str]],
+        max_nodes: int,
+        fanout: int
+    ):
+        """
+        Validate neighborhood traversal bounds
+
+        Raises:
+            ValueError: If a bound is out of range or a relationship type is invalid
+        """
+        if not 1 <= depth <= SUBGRAPH_MAX_DEPTH:
+            raise ValueError(f"depth must be between 1 and {SUBGRAPH_MAX_DEPTH}")
+        if max_nodes < 1:
+            raise ValueError("max_nodes must be positive")
+        if fanout < 1:
+            raise ValueError("fanout must be positive")
+        for rel_type in rel_types or []:
+            if rel_type not in RELATIONSHIP_TYPES:
+                raise ValueError(f"Invalid relationship type: {rel_type}")
+
+    def _remember_subgraph(self, subgraph: Optional[Dict[str, Any]]):
+        """Record the labels of every traversed node in the label cache"""
+        for node in (subgraph or {}).get("nodes", []):
+            if node["id"] is not None and node["entity_type"]:
+                self._label_cache.put(node["id"], node["entity_type"])
+
+    def _validate_export(
+        self,
+        entity_types: Optional[List[str]],
+        rel_types: Optional[List[str]],
+        fetch_size: int
+    ):
+        """
+        Validate export filters before any record is streamed
+
+        Raises:
+            ValueError: If an entity or relationship type is invalid
+        """
+        for entity_type in entity_types or []:
+            if entity_type not in ENTITY_TYPES:
+                raise ValueError(f"Invalid entity type: {entity_type}")
+        for rel_type in rel_types or []:
+            if rel_type not in RELATIONSHIP_TYPES:
+                raise ValueError(f"Invalid relationship type: {rel_type}")
+        if fetch_size < 1:
+            raise ValueError("fetch_size must be positive")
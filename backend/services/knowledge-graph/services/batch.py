@@ -0,0 +1,285 @@
+"""
+Mixed-Operation Batches
+
+Planning for POST /batch: an ordered list of create, update, delete and
+relate operations is validated up front against the entity and
+relationship models (models.entities, models.relationships), then grouped
+into as few UNWIND statements as the order allows, all run in one write
+transaction.
+
+Operations are grouped by kind and label (relationship type and endpoint
+labels for relates). An operation joins the latest group of its kind
+unless a later group touches one of its entities, in which case it starts
+a new group. Operations on different entities commute, so the grouped
+statements have the same effect as the operations run one by one.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from pydantic import ValidationError
+from models.entities import BaseEntity, ENTITY_MODELS
+from models.relationships import RELATIONSHIP_MODELS
+from . import cypher
+from .cypher import ENTITY_TYPES, RELATIONSHIP_TYPES, BATCH_MAX_OPERATIONS
+
+BATCH_OPERATIONS = ("create", "update", "delete", "relate")
+_COUNTERS = {"create": "created", "update": "updated", "delete": "deleted", "relate": "related"}
+
+# id -> (label, whether it came from the label cache); see BaseGraphService._resolve_label
+LabelResolver = Callable[[str, Optional[str]], Tuple[Optional[str], bool]]
+
+
+class BatchError(ValueError):
+    """A batch rejected as a whole, with the operations at fault"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        """
+        Args:
+            errors: {"index", "error"} per operation at fault
+        """
+        self.errors = errors
+        summary = "; ".join(f"operation {error['index']}: {error['error']}" for error in errors[:3])
+        more = f" (and {len(errors) - 3} more)" if len(errors) > 3 else ""
+        super().__init__(f"Batch rejected: {summary}{more}")
+
+
+class BatchStatement(NamedTuple):
+    """One UNWIND statement of a batch"""
+    op: str
+    query: str
+    rows: List[Dict[str, Any]]
+    # Group key: (op, label) for entity operations, (op, rel_type, from_label, to_label) for relates
+    key: Tuple = ()
+
+
+class BatchPlan(NamedTuple):
+    """Validated operations and the statements applying them"""
+    # Normalized operations ({"index", "op", "label", "id", "properties",
+    # "rel_type", "from_id", "to_id"}), in input order
+    operations: List[Dict[str, Any]]
+    statements: List[BatchStatement]
+    # Indexes of operations matched by a label from the label cache
+    cached: Set[int]
+
+    def counts(self) -> Dict[str, int]:
+        """Operations per kind ('created', 'updated', 'deleted', 'related')"""
+        counts = dict.fromkeys(_COUNTERS.values(), 0)
+        for operation in self.operations:
+            counts[_COUNTERS[operation["op"]]] += 1
+        return counts
+
+
+def _model_errors(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'properties'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def _validate(model: type, properties: Dict[str, Any], partial: bool = False):
+    """
+    Validate properties against a model
+
+    Args:
+        model: Pydantic model class
+        properties: Properties to check
+        partial: Only check the given fields (updates)
+
+    Raises:
+        ValueError: Listing the invalid fields
+    """
+    try:
+        if partial:
+            instance = model.model_construct()
+            for key, value in properties.items():
+                if key in model.model_fields:
+                    model.__pydantic_validator__.validate_assignment(instance, key, value)
+        else:
+            model.model_validate(properties)
+    except ValidationError as e:
+        raise ValueError(_model_errors(e))
+
+
+def _label(
+    entity_id: str,
+    entity_type: Optional[str],
+    created: Dict[str, str],
+    resolve_label: LabelResolver
+) -> Tuple[Optional[str], bool]:
+    """Label of an entity: given, created earlier in the batch, or cached"""
+    if not entity_type and entity_id in created:
+        return created[entity_id], False
+    return resolve_label(entity_id, entity_type)
+
+
+def _plan_operation(
+    index: int,
+    operation: Dict[str, Any],
+    created: Dict[str, str],
+    resolve_label: LabelResolver
+) -> Dict[str, Any]:
+    """Validate and normalize one operation (see BatchPlan.operations)"""
+    op = operation.get("op")
+    properties = operation.get("properties") or {}
+    planned = {"index": index, "op": op, "properties": properties, "cached": False}
+    if op == "create":
+        label = operation.get("entity_type")
+        if label not in ENTITY_TYPES:
+            raise ValueError(f"Invalid entity type: {label}")
+        if "id" not in properties:
+            raise ValueError("Entity properties must include 'id' field")
+        _validate(ENTITY_MODELS[label], properties)
+        created[properties["id"]] = label
+        return {**planned, "label": label, "id": properties["id"]}
+
+    if op in ("update", "delete"):
+        entity_id = operation.get("id")
+        if not entity_id:
+            raise ValueError(f"{op} operations must include 'id'")
+        label, cached = _label(entity_id, operation.get("entity_type"), created, resolve_label)
+        if op == "update":
+            if not properties:
+                raise ValueError("update operations must include properties")
+            if properties.get("id", entity_id) != entity_id:
+                raise ValueError("An entity's id cannot be changed")
+            _validate(ENTITY_MODELS.get(label, BaseEntity), properties, partial=True)
+        else:
+            created.pop(entity_id, None)
+        return {**planned, "label": label, "id": entity_id, "cached": cached}
+
+    if op == "relate":
+        rel_type = operation.get("rel_type")
+        from_id, to_id = operation.get("from_id"), operation.get("to_id")
+        if rel_type not in RELATIONSHIP_TYPES:
+            raise ValueError(f"Invalid relationship type: {rel_type}")
+        if not from_id or not to_id:
+            raise ValueError("Relationships must include 'from_id' and 'to_id'")
+        from_label, from_cached = _label(from_id, operation.get("from_type"), created, resolve_label)
+        to_label, to_cached = _label(to_id, operation.get("to_type"), created, resolve_label)
+        _validate(RELATIONSHIP_MODELS[rel_type], {
+            **properties, "from_id": from_id, "to_id": to_id, "rel_type": rel_type, "properties": properties
+        })
+        return {
+            **planned,
+            "rel_type": rel_type,
+            "from_id": from_id,
+            "to_id": to_id,
+            "from_label": from_label,
+            "to_label": to_label,
+            "cached": from_cached or to_cached
+        }
+
+    raise ValueError(f"Unknown operation: {op} (expected one of {', '.join(BATCH_OPERATIONS)})")
+
+
+def _statement(operation: Dict[str, Any]) -> Tuple[Tuple, Dict[str, Any], Tuple[str, ...]]:
+    """(group key, UNWIND row, entity ids touched) of a normalized operation"""
+    op, index = operation["op"], operation["index"]
+    if op == "create":
+        return (op, operation["label"]), operation["properties"], (operation["id"],)
+    if op == "update":
+        row = {"index": index, "id": operation["id"], "properties": operation["properties"]}
+        return (op, operation["label"]), row, (operation["id"],)
+    if op == "delete":
+        return (op, operation["label"]), {"index": index, "id": operation["id"]}, (operation["id"],)
+    row = {
+        "index": index,
+        "from_id": operation["from_id"],
+        "to_id": operation["to_id"],
+        "properties": operation["properties"]
+    }
+    key = (op, operation["rel_type"], operation["from_label"], operation["to_label"])
+    return key, row, (operation["from_id"], operation["to_id"])
+
+
+def _query(key: Tuple) -> str:
+    op = key[0]
+    if op == "create":
+        return cypher.create_entities_batch_query(key[1])
+    if op == "update":
+        return cypher.update_entities_batch_query(key[1])
+    if op == "delete":
+        return cypher.delete_entities_batch_query(key[1])
+    return cypher.relate_batch_query(*key[1:])
+
+
+def group_operations(operations: List[Dict[str, Any]]) -> List[BatchStatement]:
+    """
+    Group normalized operations into UNWIND statements, keeping their effect
+
+    Args:
+        operations: Normalized operations, in order
+
+    Returns:
+        Statements to run in order
+    """
+    groups: List[Tuple[Tuple, List[Dict[str, Any]]]] = []
+    latest: Dict[Tuple, int] = {}
+    touched: Dict[str, int] = {}
+    for operation in operations:
+        key, row, entity_ids = _statement(operation)
+        group = latest.get(key)
+        if group is None or any(touched.get(entity_id, -1) > group for entity_id in entity_ids):
+            group = latest[key] = len(groups)
+            groups.append((key, []))
+        groups[group][1].append(row)
+        for entity_id in entity_ids:
+            touched[entity_id] = max(touched.get(entity_id, -1), group)
+    return [BatchStatement(key[0], _query(key), rows, key) for key, rows in groups]
+
+
+def plan_batch(operations: List[Dict[str, Any]], resolve_label: LabelResolver) -> BatchPlan:
+    """
+    Validate a batch and plan its statements
+
+    Args:
+        operations: {"op": "create", "entity_type", "properties"},
+            {"op": "update", "id", "properties", "entity_type"?},
+            {"op": "delete", "id", "entity_type"?} or {"op": "relate",
+            "from_id", "to_id", "rel_type", "properties"?, "from_type"?,
+            "to_type"?}
+        resolve_label: Label lookup for entities not created in the batch
+
+    Returns:
+        BatchPlan
+
+    Raises:
+        ValueError: If the batch is empty or too long
+        BatchError: Listing every invalid operation
+    """
+    if not operations:
+        raise ValueError("operations must not be empty")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"At most {BATCH_MAX_OPERATIONS} operations can be batched")
+    planned, errors, created = [], [], {}
+    for index, operation in enumerate(operations):
+        try:
+            planned.append(_plan_operation(index, operation, created, resolve_label))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        raise BatchError(errors)
+    cached = {operation["index"] for operation in planned if operation.pop("cached")}
+    return BatchPlan(planned, group_operations(planned), cached)
+
+
+def unapplied(statement: BatchStatement, applied: List[int]) -> List[Dict[str, Any]]:
+    """
+    Errors for the rows of a statement its query did not apply
+
+    Args:
+        statement: Executed update, delete or relate statement
+        applied: Indexes the query returned
+
+    Returns:
+        {"index", "error"} per row whose entity (or endpoint) was not found
+    """
+    applied = set(applied)
+    errors = []
+    for row in statement.rows:
+        if row["index"] in applied:
+            continue
+        if statement.op == "relate":
+            error = f"Entity {row['from_id']} or {row['to_id']} not found"
+        else:
+            error = f"Entity {row['id']} not found"
+        errors.append({"index": row["index"], "error": error})
+    return errors
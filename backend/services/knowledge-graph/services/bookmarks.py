@@ -0,0 +1,58 @@
+"""
+Causal Bookmarks
+
+Per-request Neo4j bookmark propagation for read-your-writes on clusters.
+A client sends the bookmarks it last received; every session opened while
+handling the request waits for those transactions, and the bookmarks of the
+request's own writes are handed back to the client.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, List, Optional
+
+BOOKMARK_HEADER = "X-Graph-Bookmarks"
+
+
+class BookmarkScope:
+    """Bookmarks known to the current request"""
+
+    def __init__(self, bookmarks: Iterable[str] = ()):
+        self.bookmarks: List[str] = [bookmark for bookmark in bookmarks if bookmark]
+
+    def update(self, bookmarks: Iterable[str]):
+        """Replace the known bookmarks with those returned by a finished session"""
+        bookmarks = [bookmark for bookmark in bookmarks if bookmark]
+        if bookmarks:
+            self.bookmarks = sorted(bookmarks)
+
+
+_current_scope: ContextVar[Optional[BookmarkScope]] = ContextVar("graph_bookmarks", default=None)
+
+
+def current_bookmark_scope() -> Optional[BookmarkScope]:
+    """Bookmark scope of the running request, or None outside of one"""
+    return _current_scope.get()
+
+
+@contextmanager
+def bookmark_scope(bookmarks: Iterable[str] = ()):
+    """
+    Track bookmarks for the duration of a request
+
+    Args:
+        bookmarks: Bookmarks received from the client
+
+    Yields:
+        BookmarkScope: Scope whose bookmarks reflect the request's last session
+    """
+    scope = BookmarkScope(bookmarks)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+def parse_bookmark_header(value: Optional[str]) -> List[str]:
+    """Split a comma-separated bookmark header"""
+    return [bookmark.strip() for bookmark in (value or "").split(",") if bookmark.strip()]
@@ -0,0 +1,384 @@
+"""
+Bulk Loader
+
+Streams entity and relationship rows from CSV, NDJSON or Parquet files, or
+from a synthetic catalog generator, into Neo4j through GraphService's
+batched UNWIND writes, keeping several batches in flight on parallel
+sessions. Used by scripts/bulk_load.py.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import json
+import os
+import random
+import time
+import logging
+from .cypher import DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+RELATIONSHIP_COLUMNS = ("from_id", "to_id", "rel_type", "from_type", "to_type")
+# CSV headers may carry a type suffix, e.g. "price:float"
+CSV_TYPES = {
+    "int": int,
+    "float": float,
+    "bool": lambda value: value.strip().lower() in ("1", "true", "yes"),
+    "json": json.loads
+}
+ERROR_SAMPLES = 10
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream rows from a .csv, .ndjson/.jsonl or .parquet file
+
+    CSV cells are strings unless the header names a type ("price:float",
+    "stock:int", "active:bool", "tags:json"); empty cells are skipped.
+
+    Args:
+        path: Input file
+
+    Yields:
+        One dict per row
+
+    Raises:
+        ValueError: If the format is unsupported or pyarrow is missing for Parquet
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return _csv_rows(path)
+    if extension in (".ndjson", ".jsonl"):
+        return _ndjson_rows(path)
+    if extension == ".parquet":
+        return _parquet_rows(path)
+    raise ValueError(f"Unsupported input format: {path} (expected .csv, .ndjson, .jsonl or .parquet)")
+
+
+def _csv_rows(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        columns = []
+        for header in next(reader, []):
+            name, _, type_name = header.partition(":")
+            if type_name and type_name not in CSV_TYPES:
+                raise ValueError(f"Unknown CSV column type: {header}")
+            columns.append((name, CSV_TYPES.get(type_name)))
+        for cells in reader:
+            yield {
+                name: convert(cell) if convert else cell
+                for (name, convert), cell in zip(columns, cells)
+                if cell != ""
+            }
+
+
+def _ndjson_rows(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _parquet_rows(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet input requires pyarrow (pip install pyarrow)")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=DEFAULT_BATCH_SIZE):
+        for row in batch.to_pylist():
+            yield {key: value for key, value in row.items() if value is not None}
+
+
+def entity_rows(rows: Iterable[Dict[str, Any]], entity_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Shape flat rows as create_entities_bulk input
+
+    Args:
+        rows: Flat rows; an 'entity_type' column overrides entity_type
+        entity_type: Label for rows without an 'entity_type' column
+
+    Yields:
+        {"entity_type", "properties"} dicts
+    """
+    for row in rows:
+        properties = dict(row)
+        yield {"entity_type": properties.pop("entity_type", entity_type), "properties": properties}
+
+
+def relationship_rows(rows: Iterable[Dict[str, Any]], rel_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Shape flat rows as upsert_relationships_bulk input
+
+    Columns other than from_id, to_id, rel_type, from_type and to_type become
+    relationship properties. Give from_type/to_type whenever possible: on
+    large loads the label cache cannot hold every id, and unlabeled endpoints
+    are matched without the per-label unique constraints.
+
+    Args:
+        rows: Flat rows; a 'rel_type' column overrides rel_type
+        rel_type: Relationship type for rows without a 'rel_type' column
+
+    Yields:
+        {"from_id", "to_id", "rel_type", "from_type", "to_type", "properties"} dicts
+    """
+    for row in rows:
+        relationship = {column: row.get(column) for column in RELATIONSHIP_COLUMNS}
+        relationship["rel_type"] = relationship["rel_type"] or rel_type
+        relationship["properties"] = {
+            key: value for key, value in row.items() if key not in RELATIONSHIP_COLUMNS
+        }
+        yield relationship
+
+
+def batched(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of at most size items"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Synthetic catalog: share of nodes per entity type
+SYNTHETIC_MIX = [
+    ("Product", "product", 0.5),
+    ("Feature", "feature", 0.2),
+    ("Problem", "problem", 0.1),
+    ("Scenario", "scenario", 0.1),
+    ("UserGroup", "usergroup", 0.1)
+]
+# Relationships per product: (rel_type, target type, count)
+SYNTHETIC_LINKS = [
+    ("HAS_FEATURE", "Feature", 4),
+    ("SOLVES", "Problem", 2),
+    ("TARGETS", "UserGroup", 1),
+    ("APPLIES_TO", "Scenario", 2)
+]
+SYNTHETIC_CATEGORIES = ["Mattresses", "Pillows", "Bedding", "Bed Frames", "Sleep Accessories"]
+
+
+def synthetic_counts(nodes: int) -> Dict[str, int]:
+    """Nodes per entity type for a synthetic catalog of about `nodes` nodes"""
+    return {entity_type: max(1, int(nodes * share)) for entity_type, _, share in SYNTHETIC_MIX}
+
+
+def synthetic_id(entity_type: str, number: int) -> str:
+    prefix = next(prefix for label, prefix, _ in SYNTHETIC_MIX if label == entity_type)
+    return f"syn-{prefix}-{number}"
+
+
+def synthetic_entities(nodes: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Generate a synthetic catalog's entities
+
+    Args:
+        nodes: Approximate total number of nodes
+        seed: Random seed (same seed, same catalog)
+
+    Yields:
+        create_entities_bulk rows
+    """
+    rng = random.Random(seed)
+    for entity_type, counts in synthetic_counts(nodes).items():
+        for number in range(counts):
+            properties = {
+                "id": synthetic_id(entity_type, number),
+                "name": f"Synthetic {entity_type} {number}",
+                "description": f"Generated {entity_type.lower()} for load testing"
+            }
+            if entity_type == "Product":
+                properties.update({
+                    "sku": f"SYN-{number:08d}",
+                    "category": rng.choice(SYNTHETIC_CATEGORIES),
+                    "brand": f"Brand {rng.randrange(200)}",
+                    "price": round(rng.uniform(20, 2000), 2)
+                })
+            yield {"entity_type": entity_type, "properties": properties}
+
+
+def synthetic_relationships(nodes: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Generate a synthetic catalog's relationships
+
+    Targets are skewed towards low numbers so some features, problems and
+    scenarios are far more popular than others, as in a real catalog.
+
+    Args:
+        nodes: Approximate total number of nodes (as for synthetic_entities)
+        seed: Random seed
+
+    Yields:
+        upsert_relationships_bulk rows, endpoint types included
+    """
+    rng = random.Random(seed)
+    counts = synthetic_counts(nodes)
+    weights = {"HAS_FEATURE": "confidence", "SOLVES": "effectiveness", "APPLIES_TO": "relevance"}
+    for number in range(counts["Product"]):
+        product_id = synthetic_id("Product", number)
+        for rel_type, target_type, links in SYNTHETIC_LINKS:
+            targets = {int(counts[target_type] * rng.random() ** 2) for _ in range(links)}
+            for target in targets:
+                properties = (
+                    {"priority": rng.randint(1, 3)} if rel_type == "TARGETS"
+                    else {weights[rel_type]: round(rng.uniform(0.5, 1.0), 2)}
+                )
+                yield {
+                    "from_id": product_id,
+                    "to_id": synthetic_id(target_type, target),
+                    "rel_type": rel_type,
+                    "from_type": "Product",
+                    "to_type": target_type,
+                    "properties": properties
+                }
+
+
+class BulkLoader:
+    """Writes row streams through a GraphService with parallel batches"""
+
+    def __init__(
+        self,
+        service,
+        batch_size: int = 5000,
+        workers: int = 4,
+        progress: Optional[Callable[[str], None]] = None,
+        progress_interval: float = 5.0
+    ):
+        """
+        Initialize loader
+
+        Args:
+            service: GraphService (sync); its pool should hold at least `workers`
+                connections
+            batch_size: Rows per UNWIND transaction
+            workers: Batches written concurrently, each on its own session
+            progress: Optional callback receiving progress lines
+            progress_interval: Seconds between progress lines
+        """
+        if batch_size < 1 or workers < 1:
+            raise ValueError("batch_size and workers must be positive")
+        self.service = service
+        self.batch_size = batch_size
+        self.workers = workers
+        self.progress = progress
+        self.progress_interval = progress_interval
+
+    def load_entities(self, rows: Iterable[Dict[str, Any]], upsert: bool = False) -> Dict[str, Any]:
+        """
+        Create entities ({"entity_type", "properties"} rows)
+
+        Args:
+            rows: Entity rows
+            upsert: Merge by id and skip unchanged entities (see
+                GraphService.upsert_entities) instead of creating
+
+        Returns:
+            Phase report (see _run)
+        """
+        if upsert:
+            return self._run(
+                "entities", rows,
+                lambda batch: self.service.upsert_entities(batch, batch_size=len(batch))
+            )
+        return self._run(
+            "entities", rows,
+            lambda batch: self.service.create_entities_bulk(batch, batch_size=len(batch))
+        )
+
+    def load_relationships(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Upsert relationships (upsert_relationships_bulk rows)
+
+        Load entities first: rows whose endpoints do not exist are counted as
+        missing.
+
+        Returns:
+            Phase report (see _run)
+        """
+        return self._run(
+            "relationships", rows,
+            lambda batch: self.service.upsert_relationships_bulk(batch, batch_size=len(batch))
+        )
+
+    def _run(
+        self,
+        phase: str,
+        rows: Iterable[Dict[str, Any]],
+        write: Callable[[List[Dict[str, Any]]], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Write rows in batches, at most `workers` in flight and as many queued
+
+        Input is read lazily, so memory stays bounded by the batches in flight.
+
+        Returns:
+            Dict with 'phase', 'rows', 'written', 'skipped', 'missing', 'failed',
+            'seconds', 'rows_per_second' and up to ERROR_SAMPLES 'errors'
+            (index = row number in the input)
+        """
+        report = {
+            "phase": phase, "rows": 0, "written": 0, "skipped": 0, "missing": 0, "failed": 0, "errors": []
+        }
+        started = last_progress = time.perf_counter()
+        pending: Dict[Any, Tuple[int, int]] = {}
+
+        def collect(done):
+            for future in done:
+                offset, size = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"failed": size, "errors": [{"index": 0, "id": None, "error": str(e)}]}
+                report["written"] += (
+                    result.get("created", 0) + result.get("matched", 0) + result.get("written", 0)
+                )
+                report["skipped"] += result.get("skipped", 0)
+                report["missing"] += result.get("missing", 0)
+                report["failed"] += result.get("failed", 0)
+                for error in result.get("errors", []):
+                    if len(report["errors"]) < ERROR_SAMPLES:
+                        report["errors"].append({**error, "index": offset + error["index"]})
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk-load") as executor:
+            for batch in batched(rows, self.batch_size):
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[executor.submit(write, batch)] = (report["rows"], len(batch))
+                report["rows"] += len(batch)
+
+                now = time.perf_counter()
+                if self.progress and now - last_progress >= self.progress_interval:
+                    last_progress = now
+                    self.progress(
+                        f"  {phase}: {report['rows']:,} rows read, "
+                        f"{report['rows'] / (now - started):,.0f} rows/s"
+                    )
+            collect(wait(pending).done)
+
+        report["seconds"] = time.perf_counter() - started
+        report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+        logger.info(
+            f"Bulk loaded {phase}: {report['written']} written, {report['missing']} missing, "
+            f"{report['failed']} failed in {report['seconds']:.1f}s"
+        )
+        return report
+
+
+def format_report(reports: List[Dict[str, Any]]) -> str:
+    """Render phase reports as a throughput table"""
+    lines = [
+        f"{'phase':<14}{'rows':>12}{'written':>12}{'skipped':>12}{'missing':>10}"
+        f"{'failed':>10}{'seconds':>10}{'rows/s':>12}"
+    ]
+    for report in reports:
+        lines.append(
+            f"{report['phase']:<14}{report['rows']:>12,}{report['written']:>12,}"
+            f"{report['skipped']:>12,}{report['missing']:>10,}{report['failed']:>10,}"
+            f"{report['seconds']:>10.1f}{report['rows_per_second']:>12,.0f}"
+        )
+        for error in report["errors"]:
+            lines.append(f"    row {error['index']} ({error.get('id')}): {error['error']}")
+    return "\n".join(lines)
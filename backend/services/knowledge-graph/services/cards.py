@@ -0,0 +1,398 @@
+"""
+Product Cards
+
+Materialized storefront cards: a product with its features, the problems
+it solves (directly or through its features), its target user groups, its
+best offer and its competitor comparisons, pre-encoded as one compact JSON
+blob per product. Reading a card is a dict lookup that returns the blob
+ready to be written to the response, without a query or re-encoding.
+
+The graph services mark the cards of every entity they write as dirty and
+re-render them from Neo4j in the same session. A card whose best offer can
+change over time (an offer's validity window opens or closes) carries an
+expiry and is re-rendered on the first read after it. The index can be
+saved to and restored from an NDJSON snapshot to skip the full build on
+restart.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import json
+import os
+import threading
+import time
+from .offers import parse_timestamp, snapshot as offer_snapshot
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+CARD_SNAPSHOT_VERSION = 1
+# Product properties left out of cards
+CARD_EXCLUDED_PROPERTIES = ("content_hash",)
+
+
+class Card(NamedTuple):
+    """An encoded card and what it depends on"""
+    blob: bytes
+    # Epoch seconds at which the best offer may change (None = never)
+    expires_at: Optional[float]
+    # Features, problems, user groups, offers and competitors on the card
+    related: Tuple[str, ...]
+
+
+def _encode_value(value: Any) -> Any:
+    """JSON form of Neo4j temporal/spatial values and other non-JSON types"""
+    if hasattr(value, "iso_format"):
+        return value.iso_format()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, (tuple, set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def encode(content: Any) -> bytes:
+    """Encode content as compact UTF-8 JSON (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_encode_value)
+    return json.dumps(
+        content, default=_encode_value, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# Catalogs reuse a handful of validity timestamps across many offers
+_parse_iso = lru_cache(maxsize=4096)(parse_timestamp)
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """parse_timestamp, memoized for ISO strings"""
+    return _parse_iso(value) if isinstance(value, str) else parse_timestamp(value)
+
+
+def _descending(value: Any) -> Tuple[bool, float]:
+    """Sort key putting the largest numbers first and missing ones last"""
+    return (value is None, -float(value) if value is not None else 0.0)
+
+
+def best_offer(
+    offers: Iterable[Dict[str, Any]],
+    at: float
+) -> Tuple[Optional[Dict[str, Any]], int, Optional[float]]:
+    """
+    Pick the offer a card shows
+
+    Args:
+        offers: Offer node properties
+        at: Epoch seconds the offers must be valid at
+
+    Returns:
+        Tuple of (cheapest available offer valid at `at` or None, number of
+        available offers valid at `at`, epoch seconds of the next window
+        boundary after `at` or None)
+    """
+    valid, boundaries = [], []
+    for properties in offers:
+        starts = _timestamp(properties.get("valid_from"))
+        ends = _timestamp(properties.get("valid_until"))
+        boundaries.extend(edge for edge in (starts, ends) if edge is not None and edge > at)
+        if (
+            properties.get("availability")
+            and (starts is None or starts <= at)
+            and (ends is None or at < ends)
+        ):
+            price = properties.get("price")
+            valid.append((price is None, price or 0.0, str(properties.get("id")), properties))
+    # Only the offer shown is snapshotted
+    best = offer_snapshot(min(valid, key=lambda entry: entry[:3])[3]) if valid else None
+    return best.public() if best else None, len(valid), min(boundaries) if boundaries else None
+
+
+def render(row: Dict[str, Any], at: Optional[float] = None) -> Tuple[str, Card]:
+    """
+    Build a product's card from its product card row
+
+    Args:
+        row: {"product", "features", "problems", "user_groups", "offers",
+            "competitors"} record (see cypher.product_cards_query)
+        at: Epoch seconds the best offer is picked for (default: now)
+
+    Returns:
+        Tuple of (product id, Card)
+    """
+    at = time.time() if at is None else at
+    product = {
+        key: value for key, value in (row["product"] or {}).items()
+        if key not in CARD_EXCLUDED_PROPERTIES
+    }
+    features = sorted(
+        (feature for feature in row.get("features") or () if feature.get("id") is not None),
+        key=lambda feature: (_descending(feature.get("importance_score")), str(feature.get("name")))
+    )
+
+    problems: Dict[str, Dict[str, Any]] = {}
+    for problem in row.get("problems") or ():
+        if problem.get("id") is None:
+            continue
+        merged = problems.setdefault(problem["id"], {
+            "id": problem["id"],
+            "name": problem.get("name"),
+            "severity": problem.get("severity"),
+            "effectiveness": None,
+            "via": []
+        })
+        effectiveness = problem.get("effectiveness")
+        if effectiveness is not None and (merged["effectiveness"] is None or effectiveness > merged["effectiveness"]):
+            merged["effectiveness"] = effectiveness
+        if problem.get("via") is not None and problem["via"] not in merged["via"]:
+            merged["via"].append(problem["via"])
+    ranked_problems = sorted(
+        problems.values(),
+        key=lambda problem: (_descending(problem["effectiveness"]), str(problem["name"]))
+    )
+
+    user_groups = sorted(
+        (group for group in row.get("user_groups") or () if group.get("id") is not None),
+        key=lambda group: (group.get("priority") is None, group.get("priority") or 0, str(group.get("name")))
+    )
+    competitors = sorted(
+        (competitor for competitor in row.get("competitors") or () if competitor.get("id") is not None),
+        key=lambda competitor: str(competitor.get("name"))
+    )
+    offers = [offer for offer in row.get("offers") or () if offer and offer.get("id") is not None]
+    offer, offer_count, expires_at = best_offer(offers, at)
+
+    card = {
+        "product": product,
+        "features": features,
+        "problems": ranked_problems,
+        "user_groups": user_groups,
+        "best_offer": offer,
+        "offer_count": offer_count,
+        "competitors": competitors
+    }
+    related = tuple(dict.fromkeys(
+        [feature["id"] for feature in features]
+        + list(problems)
+        + [group["id"] for group in user_groups]
+        + [offer["id"] for offer in offers]
+        + [competitor["id"] for competitor in competitors]
+    ))
+    return product.get("id"), Card(encode(card), expires_at, related)
+
+
+class ProductCardIndex:
+    """Thread-safe product id -> encoded card store"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cards: Dict[str, Card] = {}
+        # Related entity id -> products whose card shows it
+        self._by_entity: Dict[str, Set[str]] = {}
+        # Products whose card must be re-rendered (including new products)
+        self._dirty: Set[str] = set()
+        self.built_at: Optional[float] = None
+        self.stale = False
+
+    @property
+    def built(self) -> bool:
+        return self.built_at is not None
+
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """Replace the index with cards rendered from every product's card row"""
+        started = time.time()
+        self._replace((render(row, started) for row in rows), set(), started)
+
+    def update_products(self, product_ids: Iterable[str], rows: Iterable[Dict[str, Any]]):
+        """
+        Re-render products from their current card rows
+
+        Args:
+            product_ids: Products to re-render
+            rows: Card rows of those products; products without a row are
+                removed (deleted, or not a product)
+        """
+        now = time.time()
+        cards = dict(render(row, now) for row in rows)
+        with self._lock:
+            for product_id in set(product_ids):
+                self._set(product_id, cards.get(product_id))
+
+    def touch(self, entity_ids: Iterable[str], products: Iterable[str] = ()):
+        """
+        Mark the cards showing the given entities as dirty
+
+        Args:
+            entity_ids: Written entities (products or related entities)
+            products: Ids known to be products even if they have no card yet
+        """
+        if not self.built:
+            return
+        with self._lock:
+            for entity_id in entity_ids:
+                if entity_id in self._cards:
+                    self._dirty.add(entity_id)
+                self._dirty.update(self._by_entity.get(entity_id, ()))
+            self._dirty.update(products)
+
+    def remove(self, entity_id: str):
+        """Drop a deleted product's card, or mark the cards that showed a deleted entity dirty"""
+        with self._lock:
+            self._set(entity_id, None)
+            self._dirty.discard(entity_id)
+            self._dirty.update(self._by_entity.get(entity_id, ()))
+
+    def claim(self, product_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Take products to re-render, clearing their dirty mark
+
+        A product touched again while it is being re-rendered is marked dirty
+        again, so no write is missed. If re-rendering fails, hand the ids back
+        with mark_dirty().
+
+        Args:
+            product_ids: Products to take (default: every dirty product)
+
+        Returns:
+            Product ids to re-render
+        """
+        with self._lock:
+            if product_ids is None:
+                claimed, self._dirty = list(self._dirty), set()
+                return claimed
+            claimed = list(dict.fromkeys(product_ids))
+            self._dirty.difference_update(claimed)
+            return claimed
+
+    def mark_dirty(self, product_ids: Iterable[str]):
+        """Mark products dirty (e.g. after a failed re-render)"""
+        with self._lock:
+            self._dirty.update(product_ids)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def get(self, product_ids: Iterable[str], at: Optional[float] = None) -> Tuple[Dict[str, bytes], List[str]]:
+        """
+        Look up encoded cards
+
+        Args:
+            product_ids: Products to look up
+            at: Epoch seconds to check card expiry against (default: now)
+
+        Returns:
+            Tuple of (product id -> encoded card for every card present,
+            products that are dirty or expired and need re-rendering first)
+        """
+        at = time.time() if at is None else at
+        found, pending = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                card = self._cards.get(product_id)
+                if product_id in self._dirty or (
+                    card is not None and card.expires_at is not None and card.expires_at <= at
+                ):
+                    pending.append(product_id)
+                if card is not None:
+                    found[product_id] = card.blob
+        return found, pending
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Describe the index
+
+        Returns:
+            Dict with card count, encoded size, dirty cards, build time, age
+            and stale flag
+        """
+        with self._lock:
+            return {
+                "products": len(self._cards),
+                "bytes": sum(len(card.blob) for card in self._cards.values()),
+                "dirty": len(self._dirty),
+                "built_at": self.built_at,
+                "age_seconds": time.time() - self.built_at if self.built else None,
+                "stale": self.stale
+            }
+
+    def save(self, path: str) -> int:
+        """
+        Write the index to an NDJSON snapshot (atomically replaced)
+
+        The first line holds the build time and the dirty products, then
+        each card is a metadata line followed by its encoded card.
+
+        Args:
+            path: Snapshot file
+
+        Returns:
+            Number of cards written
+        """
+        with self._lock:
+            cards = list(self._cards.items())
+            header = {"version": CARD_SNAPSHOT_VERSION, "built_at": self.built_at, "dirty": list(self._dirty)}
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(encode(header) + b"\n")
+            for product_id, card in cards:
+                meta = {"id": product_id, "expires_at": card.expires_at, "related": card.related}
+                snapshot_file.write(encode(meta) + b"\n" + card.blob + b"\n")
+        os.replace(temporary, path)
+        return len(cards)
+
+    def restore(self, path: str, max_age: float) -> bool:
+        """
+        Load the index from a snapshot written by save()
+
+        Args:
+            path: Snapshot file
+            max_age: Seconds after its build time a snapshot is too old to use
+
+        Returns:
+            True if the snapshot was loaded, False if it is missing, too old
+            or of another version
+        """
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, "rb") as snapshot_file:
+            header = json.loads(snapshot_file.readline())
+            if header.get("version") != CARD_SNAPSHOT_VERSION or header.get("built_at") is None:
+                return False
+            if time.time() - header["built_at"] >= max_age:
+                return False
+            cards = []
+            for meta in snapshot_file:
+                meta = json.loads(meta)
+                blob = snapshot_file.readline().rstrip(b"\n")
+                cards.append((meta["id"], Card(blob, meta["expires_at"], tuple(meta["related"]))))
+        self._replace(cards, set(header.get("dirty") or ()), header["built_at"])
+        return True
+
+    def _replace(self, cards: Iterable[Tuple[str, Card]], dirty: Set[str], built_at: float):
+        """Swap in a whole new set of cards"""
+        cards = dict(cards)
+        by_entity: Dict[str, Set[str]] = {}
+        for product_id, card in cards.items():
+            for entity_id in card.related:
+                by_entity.setdefault(entity_id, set()).add(product_id)
+        with self._lock:
+            # Products touched while the new cards were read stay dirty
+            self._cards, self._by_entity, self._dirty = cards, by_entity, dirty | self._dirty
+            self.built_at = built_at
+            self.stale = False
+
+    def _set(self, product_id: str, card: Optional[Card]):
+        """Replace or drop a product's card (lock must be held)"""
+        previous = self._cards.pop(product_id, None)
+        for entity_id in previous.related if previous else ():
+            products = self._by_entity.get(entity_id)
+            if products is not None:
+                products.discard(product_id)
+                if not products:
+                    del self._by_entity[entity_id]
+        if card is None:
+            return
+        self._cards[product_id] = card
+        for entity_id in card.related:
+            self._by_entity.setdefault(entity_id, set()).add(product_id)
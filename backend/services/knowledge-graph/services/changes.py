@@ -0,0 +1,200 @@
+"""
+Change Feed
+
+Events for the append-only log of entity and relationship creates, updates
+and deletes. The graph services append them in the transaction of the
+write they describe (see cypher.append_changes_query), so an event exists
+exactly when its write committed; sequence numbers are assigned after
+commit (see cypher.sequence_changes_query). The ETL pipeline writes the same
+events with source "etl-processing"; the entities it loads get ids derived
+from their type and name.
+
+Events are stored as ChangeEvent nodes: {seq, at, stamp (nanoseconds),
+source, kind ("entity" or "relationship"), op ("create", "update" or
+"delete"), entity_type, entity_id, rel_type, from_id, to_id, properties},
+properties being the written properties as a JSON string. Deleting an entity also removes its
+relationships; no separate events are logged for them.
+"""
+from typing import Any, Dict, List, Optional
+import json
+from .cypher import entity_label
+
+CHANGE_SOURCE = "knowledge-graph"
+CHANGE_OPS = ("create", "update", "delete")
+
+
+def _properties(properties: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(properties, default=str, separators=(",", ":")) if properties else None
+
+
+def entity_change(
+    op: str,
+    entity_type: Optional[str],
+    entity_id: str,
+    properties: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Event for an entity write
+
+    Args:
+        op: 'create', 'update' or 'delete'
+        entity_type: Entity label (None if the writer did not know it)
+        entity_id: Entity id
+        properties: Properties written (all for creates, the changed ones for updates)
+
+    Returns:
+        Event row for cypher.append_changes_query
+    """
+    return {
+        "source": CHANGE_SOURCE,
+        "kind": "entity",
+        "op": op,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "properties": _properties(properties)
+    }
+
+
+def relationship_change(
+    op: str,
+    rel_type: str,
+    from_id: str,
+    to_id: str,
+    properties: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Event for a relationship write
+
+    Args:
+        op: 'create', 'update' or 'delete'
+        rel_type: Relationship type
+        from_id: Source entity id
+        to_id: Target entity id
+        properties: Relationship properties written
+
+    Returns:
+        Event row for cypher.append_changes_query
+    """
+    return {
+        "source": CHANGE_SOURCE,
+        "kind": "relationship",
+        "op": op,
+        "rel_type": rel_type,
+        "from_id": from_id,
+        "to_id": to_id,
+        "properties": _properties(properties)
+    }
+
+
+def upsert_changes(
+    entity_type: str,
+    rows: List[Dict[str, Any]],
+    written_ids: List[str],
+    existing,
+    now: str
+) -> List[Dict[str, Any]]:
+    """
+    Events for a hash-guarded upsert chunk
+
+    Args:
+        entity_type: Entity label
+        rows: Rows sent ({"id", "properties", "hash"})
+        written_ids: Ids the query wrote (unchanged rows are skipped)
+        existing: Ids stored before the write (updates; the rest are creates)
+        now: Timestamp written as updated_at
+
+    Returns:
+        Event rows
+    """
+    written = set(written_ids)
+    return [
+        entity_change(
+            "update" if row["id"] in existing else "create",
+            entity_type, row["id"], {"updated_at": now, **row["properties"]}
+        )
+        for row in rows
+        if row["id"] in written
+    ]
+
+
+def merge_changes(rel_type: str, rows: List[Dict[str, Any]], record) -> List[Dict[str, Any]]:
+    """
+    Events for a relationship MERGE chunk
+
+    Args:
+        rel_type: Relationship type
+        rows: Rows sent ({"index", "from_id", "to_id", "properties"})
+        record: Result with the 'created_rows' and 'matched_rows' indexes
+
+    Returns:
+        Event rows; rows whose endpoints were missing get none
+    """
+    ops = dict.fromkeys(record["matched_rows"], "update")
+    ops.update(dict.fromkeys(record["created_rows"], "create"))
+    return [
+        relationship_change(ops[row["index"]], rel_type, row["from_id"], row["to_id"], row["properties"])
+        for row in rows
+        if row["index"] in ops
+    ]
+
+
+def batch_changes(statement, record) -> List[Dict[str, Any]]:
+    """
+    Events for one executed statement of a mixed-operation batch
+
+    Args:
+        statement: BatchStatement (see services.batch)
+        record: Its result record ('applied' row indexes, plus 'created' for
+            relates and the matching node 'labels' for updates and deletes)
+
+    Returns:
+        Event rows, in row order
+    """
+    if statement.op == "create":
+        return [entity_change("create", statement.key[1], row["id"], row) for row in statement.rows]
+    applied = set(record["applied"])
+    rows = [row for row in statement.rows if row["index"] in applied]
+    if statement.op == "relate":
+        created = set(record["created"])
+        return [
+            relationship_change(
+                "create" if row["index"] in created else "update",
+                statement.key[1], row["from_id"], row["to_id"], row["properties"]
+            )
+            for row in rows
+        ]
+    # Unlabelled updates and deletes take the type from the node they matched
+    labels = dict(zip(record["applied"], record["labels"]))
+    return [
+        entity_change(
+            statement.op, statement.key[1] or entity_label(labels[row["index"]]),
+            row["id"], row.get("properties")
+        )
+        for row in rows
+    ]
+
+
+def decode_change(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    API form of a stored ChangeEvent
+
+    Args:
+        event: ChangeEvent node properties
+
+    Returns:
+        Event with every field present and properties decoded to a dict
+    """
+    properties = event.get("properties")
+    return {
+        "seq": event.get("seq"),
+        "at": event.get("at"),
+        "source": event.get("source"),
+        "kind": event.get("kind"),
+        "op": event.get("op"),
+        "entity_type": event.get("entity_type"),
+        "entity_id": event.get("entity_id"),
+        "rel_type": event.get("rel_type"),
+        "from_id": event.get("from_id"),
+        "to_id": event.get("to_id"),
+        "properties": json.loads(properties) if properties else None
+    }
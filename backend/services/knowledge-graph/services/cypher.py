@@ -0,0 +1,1008 @@
+"""
+Cypher Query Builders
+
+Query text, parameter building and record decoding shared by the
+synchronous GraphService and the AsyncGraphService. Nothing in this module
+performs I/O.
+"""
+from typing import List, Dict, Optional, Any, Tuple
+import re
+import json
+import base64
+import hashlib
+
+# Node labels and relationship types accepted by the service. Cypher cannot
+# parameterize labels/types, so these lists also guard against injection.
+ENTITY_TYPES = ["Product", "Feature", "Scenario", "Problem",
+                "UserGroup", "Competitor", "Offer", "Merchant"]
+RELATIONSHIP_TYPES = ["HAS_FEATURE", "SOLVES", "APPLIES_TO", "TARGETS",
+                      "COMPARES_WITH", "HAS_OFFER", "SOLD_BY", "GENERATED_FROM"]
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FETCH_SIZE = 1000
+
+# Most ids a single batch get may ask for
+BATCH_GET_MAX_IDS = 1000
+# Most surface strings a single entity resolution request may ask for
+RESOLUTION_MAX_NAMES = 1000
+# Most operations a single mixed-operation batch may contain
+BATCH_MAX_OPERATIONS = 1000
+
+# Property holding the digest written by upserts (see content_hash)
+CONTENT_HASH_PROPERTY = "content_hash"
+HASH_EXCLUDED_PROPERTIES = ("created_at", "updated_at", CONTENT_HASH_PROPERTY)
+
+# Change feed (see services.changes): event nodes and the sequence counter
+# they are numbered from. Neither is an entity, so they are left out of
+# unlabelled scans, statistics and exports. Events are appended with the
+# pending label too, which numbering them removes.
+CHANGE_EVENT_LABEL = "ChangeEvent"
+CHANGE_SEQUENCE_LABEL = "ChangeSequence"
+CHANGE_PENDING_LABEL = "PendingChange"
+CHANGE_LABELS = (CHANGE_EVENT_LABEL, CHANGE_SEQUENCE_LABEL)
+# Most events a single change feed read may return
+CHANGE_FEED_MAX_EVENTS = 1000
+# Most events numbered, or deleted by retention, per transaction
+CHANGE_FEED_BATCH_SIZE = 10000
+
+# Neighborhood traversal bounds
+SUBGRAPH_MAX_DEPTH = 4
+
+# Full-text indexes over name/description (created by scripts/init_neo4j.py):
+# one per label for typed searches, plus one spanning every entity label
+ENTITY_FULLTEXT_INDEX = "entity_search"
+
+DANGEROUS_KEYWORDS = ["DROP", "DELETE ALL", "REMOVE ALL"]
+
+_LUCENE_SPECIAL = re.compile(r'([+\-!(){}\[\]^"~*?:\\/&|])')
+
+
+def fulltext_index_name(entity_type: str) -> str:
+    """Name of the full-text index for an entity label (e.g. product_search)"""
+    return f"{entity_type.lower()}_search"
+
+
+def fulltext_terms(search_text: str) -> List[str]:
+    """Split free text into Lucene-escaped query terms"""
+    return [_LUCENE_SPECIAL.sub(r"\\\1", term) for term in search_text.split()]
+
+
+def highlight(entity: Dict[str, Any], search_text: str, width: int = 120) -> Optional[str]:
+    """
+    Build a snippet of name/description with matched terms wrapped in <em>
+
+    Returns:
+        Snippet of the first field containing a search term, or None
+    """
+    terms = [re.escape(term) for term in re.findall(r"\w+", search_text)]
+    if not terms:
+        return None
+    pattern = re.compile("|".join(terms), re.IGNORECASE)
+    for field in ("name", "description"):
+        text = entity.get(field)
+        if not isinstance(text, str):
+            continue
+        match = pattern.search(text)
+        if not match:
+            continue
+        start = max(0, match.start() - width // 2)
+        snippet = text[start:start + width]
+        snippet = pattern.sub(lambda m: f"<em>{m.group(0)}</em>", snippet)
+        prefix = "..." if start > 0 else ""
+        suffix = "..." if start + width < len(text) else ""
+        return f"{prefix}{snippet}{suffix}"
+    return None
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a keyset position as an opaque, URL-safe cursor token"""
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Tuple[str, ...] = ("label", "id")) -> Dict[str, Any]:
+    """
+    Decode a cursor token produced by encode_cursor
+
+    Args:
+        cursor: Cursor token
+        keys: Keyset fields the position must hold ('label' plus string keys)
+
+    Raises:
+        ValueError: If the token is malformed or lacks one of keys
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict) or position.get("label") not in ENTITY_TYPES:
+        raise ValueError("Invalid cursor")
+    if any(not isinstance(position.get(key), str) for key in keys):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def property_filters(properties: Optional[Dict[str, Any]], var: str = "n") -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Build equality WHERE clauses for property filters
+
+    Raises:
+        ValueError: If a property name is not a plain identifier
+    """
+    clauses = []
+    params = {}
+    for key, value in (properties or {}).items():
+        if not key.isidentifier():
+            raise ValueError(f"Invalid property name: {key}")
+        clauses.append(f"{var}.{key} = $prop_{key}")
+        params[f"prop_{key}"] = value
+    return clauses, params
+
+
+def _not_change_labels(var: str) -> str:
+    return " AND ".join(f"NOT {var}:{label}" for label in CHANGE_LABELS)
+
+
+def match_entity(var: str, label: Optional[str], param: str = "id") -> str:
+    """
+    Build a Cypher clause binding `var` to the entity whose id is `$param`
+
+    With a known label this is a single index seek. Without one, every entity
+    label is probed through a UNION subquery, which is still one index seek
+    per label instead of an AllNodesScan.
+    """
+    if label:
+        return f"MATCH ({var}:{label} {{id: ${param}}})"
+    branches = " UNION ALL ".join(
+        f"MATCH ({var}:{entity_type} {{id: ${param}}}) RETURN {var}"
+        for entity_type in ENTITY_TYPES
+    )
+    return f"CALL {{ {branches} }}"
+
+
+def entity_label(labels: List[str]) -> Optional[str]:
+    """Pick the entity type among a node's labels"""
+    for label in labels:
+        if label in ENTITY_TYPES:
+            return label
+    return None
+
+
+def check_query_safety(query: str):
+    """
+    Reject custom queries containing dangerous operations
+
+    Raises:
+        ValueError: If query contains dangerous operations
+    """
+    # Basic safety check (enhance for production)
+    query_upper = query.upper()
+    for keyword in DANGEROUS_KEYWORDS:
+        if keyword in query_upper:
+            raise ValueError(f"Query contains dangerous operation: {keyword}")
+
+
+# Operators that touch every node or multiply row counts; rejected by the
+# plan check when their estimated row count exceeds the configured ceiling
+EXPENSIVE_PLAN_OPERATORS = ("AllNodesScan", "CartesianProduct")
+
+
+def plan_violations(plan: Optional[Dict[str, Any]], max_estimated_rows: float) -> List[str]:
+    """
+    Find expensive operators in an EXPLAIN plan
+
+    Args:
+        plan: ResultSummary.plan of an EXPLAIN query
+        max_estimated_rows: Largest estimated row count tolerated for an
+            expensive operator
+
+    Returns:
+        Descriptions of the offending operators (empty if the plan is acceptable)
+    """
+    violations = []
+    stack = [plan] if plan else []
+    while stack:
+        operator = stack.pop()
+        name = operator.get("operatorType", "").split("@")[0]
+        estimated = operator.get("arguments", {}).get("EstimatedRows", 0)
+        if name in EXPENSIVE_PLAN_OPERATORS and estimated > max_estimated_rows:
+            violations.append(f"{name} (~{int(estimated)} estimated rows)")
+        stack.extend(operator.get("children", []))
+    return violations
+
+
+# Entity queries
+
+def create_entity_query(entity_type: str) -> str:
+    return f"CREATE (n:{entity_type} $properties) RETURN n.id as id"
+
+
+def create_entities_batch_query(entity_type: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    CREATE (n:{entity_type})
+    SET n = row
+    RETURN count(n) as created
+    """
+
+
+def query_entity_query(label: Optional[str]) -> str:
+    return f"{match_entity('n', label)} RETURN n, labels(n) as labels LIMIT 1"
+
+
+def entity_from_record(record) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+    """Decode a query_entity_query record into (properties, label)"""
+    if record:
+        # Convert node to dictionary
+        return dict(record["n"]), entity_label(record["labels"])
+    return None
+
+
+def entities_by_id_query(label: Optional[str]) -> str:
+    """Entities whose ids are in $rows ({"id"}); one index seek per id (and label, if unknown)"""
+    return f"""
+    UNWIND $rows AS row
+    {match_entity_row('n', label, 'id')}
+    RETURN row.id AS id, n, labels(n) as labels
+    """
+
+
+def update_entity_query(label: Optional[str], keys) -> str:
+    # Build SET clause dynamically; partial updates void the upsert content hash
+    set_clauses = [f"n.{key} = $props.{key}" for key in keys]
+    set_clauses.append(f"n.{CONTENT_HASH_PROPERTY} = null")
+    set_clause = ", ".join(set_clauses)
+    return f"{match_entity('n', label)} SET {set_clause} RETURN n"
+
+
+def content_hash(properties: Dict[str, Any]) -> str:
+    """Stable digest of an entity's properties, ignoring timestamps and the hash itself"""
+    content = {key: value for key, value in properties.items() if key not in HASH_EXCLUDED_PROPERTIES}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def entity_hashes_query(entity_type: str) -> str:
+    return f"""
+    UNWIND $ids AS id
+    MATCH (n:{entity_type} {{id: id}})
+    RETURN n.id AS id, n.{CONTENT_HASH_PROPERTY} AS hash
+    """
+
+
+def upsert_entities_batch_query(entity_type: str) -> str:
+    """
+    MERGE rows ({id, properties, hash}) whose stored hash differs
+
+    The hash check is repeated here so concurrent upserts of the same content
+    stay no-ops.
+    """
+    return f"""
+    UNWIND $rows AS row
+    MERGE (n:{entity_type} {{id: row.id}})
+    WITH n, row
+    WHERE n.{CONTENT_HASH_PROPERTY} IS NULL OR n.{CONTENT_HASH_PROPERTY} <> row.hash
+    SET n += row.properties,
+        n.{CONTENT_HASH_PROPERTY} = row.hash,
+        n.updated_at = coalesce(row.properties.updated_at, $now)
+    RETURN count(n) as written, collect(row.id) AS ids
+    """
+
+
+def delete_entity_query(label: Optional[str]) -> str:
+    """Delete an entity, returning its labels (for the change event when no label was given)"""
+    return f"""
+    {match_entity('n', label)}
+    WITH n, labels(n) AS labels
+    DETACH DELETE n
+    RETURN count(n) as deleted, head(collect(labels)) AS labels
+    """
+
+
+# Relationship queries
+
+def create_relationship_query(
+    rel_type: str,
+    from_label: Optional[str],
+    to_label: Optional[str]
+) -> str:
+    return f"""
+    {match_entity('from', from_label, 'from_id')}
+    {match_entity('to', to_label, 'to_id')}
+    CREATE (from)-[r:{rel_type} $properties]->(to)
+    RETURN r
+    """
+
+
+def match_entity_row(var: str, label: Optional[str], field: str) -> str:
+    """
+    Like match_entity, but binds `var` to the entity whose id is `row.<field>`
+    inside an UNWIND over $rows
+    """
+    if label:
+        return f"MATCH ({var}:{label} {{id: row.{field}}})"
+    branches = " UNION ALL ".join(
+        f"WITH row MATCH ({var}:{entity_type} {{id: row.{field}}}) RETURN {var}"
+        for entity_type in ENTITY_TYPES
+    )
+    return f"CALL {{ {branches} }}"
+
+
+def merge_relationships_batch_query(
+    rel_type: str,
+    from_label: Optional[str],
+    to_label: Optional[str]
+) -> str:
+    """
+    Build the UNWIND + MERGE upsert for a batch of same-type relationships
+
+    Rows are {"index", "from_id", "to_id", "properties"}; rows whose
+    endpoints do not exist are dropped by the MATCH. Existing relationships get their
+    properties merged, so re-running an import does not duplicate edges.
+    """
+    return f"""
+    UNWIND $rows AS row
+    {match_entity_row('from', from_label, 'from_id')}
+    {match_entity_row('to', to_label, 'to_id')}
+    WITH from, to, row, EXISTS {{ (from)-[:{rel_type}]->(to) }} AS existed
+    MERGE (from)-[r:{rel_type}]->(to)
+    SET r += row.properties
+    WITH row, existed, count(r) AS merged
+    RETURN
+        sum(CASE WHEN existed THEN 0 ELSE 1 END) AS created,
+        sum(CASE WHEN existed THEN 1 ELSE 0 END) AS matched,
+        collect(CASE WHEN existed THEN null ELSE row.index END) AS created_rows,
+        collect(CASE WHEN existed THEN row.index END) AS matched_rows
+    """
+
+
+def delete_relationship_query(
+    rel_type: str,
+    from_label: Optional[str],
+    to_label: Optional[str]
+) -> str:
+    return f"""
+    {match_entity('from', from_label, 'from_id')}
+    {match_entity('to', to_label, 'to_id')}
+    MATCH (from)-[r:{rel_type}]->(to)
+    DELETE r
+    RETURN count(r) as deleted
+    """
+
+
+# Mixed-operation batches (see services.batch); rows carry their operation's index
+
+def update_entities_batch_query(label: Optional[str]) -> str:
+    """Partial updates from rows ({index, id, properties}); returns the indexes applied and their labels"""
+    return f"""
+    UNWIND $rows AS row
+    {match_entity_row('n', label, 'id')}
+    SET n += row.properties, n.{CONTENT_HASH_PROPERTY} = null
+    RETURN collect(row.index) AS applied, collect(labels(n)) AS labels
+    """
+
+
+def delete_entities_batch_query(label: Optional[str]) -> str:
+    """Deletes from rows ({index, id}); returns the indexes applied and their labels"""
+    return f"""
+    UNWIND $rows AS row
+    {match_entity_row('n', label, 'id')}
+    WITH row, n, labels(n) AS labels
+    DETACH DELETE n
+    RETURN collect(row.index) AS applied, collect(labels) AS labels
+    """
+
+
+def relate_batch_query(rel_type: str, from_label: Optional[str], to_label: Optional[str]) -> str:
+    """MERGEs from rows ({index, from_id, to_id, properties}); returns the indexes applied and created"""
+    return f"""
+    UNWIND $rows AS row
+    {match_entity_row('from', from_label, 'from_id')}
+    {match_entity_row('to', to_label, 'to_id')}
+    WITH from, to, row, EXISTS {{ (from)-[:{rel_type}]->(to) }} AS existed
+    MERGE (from)-[r:{rel_type}]->(to)
+    SET r += row.properties
+    RETURN collect(row.index) AS applied, collect(CASE WHEN existed THEN null ELSE row.index END) AS created
+    """
+
+
+def query_relationships_queries(
+    rel_type: Optional[str],
+    direction: str,
+    label: Optional[str]
+) -> List[Tuple[str, str]]:
+    """
+    Build one query per requested direction
+
+    Returns:
+        List of (direction, query); 'outgoing' rows expose `target`,
+        'incoming' rows expose `source`
+    """
+    rel_pattern = f"[r:{rel_type}]" if rel_type else "[r]"
+    match_clause = match_entity("n", label)
+    queries = []
+    if direction in ["outgoing", "both"]:
+        queries.append(("outgoing", f"""
+        {match_clause}
+        MATCH (n)-{rel_pattern}->(target)
+        RETURN type(r) as rel_type, properties(r) as properties, target
+        """))
+    if direction in ["incoming", "both"]:
+        queries.append(("incoming", f"""
+        {match_clause}
+        MATCH (source)-{rel_pattern}->(n)
+        RETURN type(r) as rel_type, properties(r) as properties, source
+        """))
+    return queries
+
+
+def relationship_from_record(direction: str, record) -> Dict[str, Any]:
+    """Decode a query_relationships_queries record"""
+    end = "target" if direction == "outgoing" else "source"
+    return {
+        "direction": direction,
+        "type": record["rel_type"],
+        "properties": dict(record["properties"]),
+        end: dict(record[end])
+    }
+
+
+# Search and listing queries
+
+def fulltext_search_query(
+    entity_type: Optional[str],
+    search_text: str,
+    properties: Optional[Dict[str, Any]],
+    limit: int,
+    min_score: Optional[float] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Build the relevance-ranked full-text search query and its parameters"""
+    index = fulltext_index_name(entity_type) if entity_type else ENTITY_FULLTEXT_INDEX
+    where_clauses, params = property_filters(properties)
+    params.update({
+        "index": index,
+        "query": " ".join(fulltext_terms(search_text)),
+        "limit": limit
+    })
+    if min_score is not None:
+        where_clauses.append("score >= $min_score")
+        params["min_score"] = min_score
+
+    # Let Lucene cut the top-k itself unless filters are applied afterwards
+    options = "" if where_clauses else ", {limit: $limit}"
+    where_clause = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    query = f"""
+    CALL db.index.fulltext.queryNodes($index, $query{options}) YIELD node AS n, score
+    {where_clause}
+    RETURN n, score, labels(n) as labels
+    ORDER BY score DESC
+    LIMIT $limit
+    """
+    return query, params
+
+
+def fulltext_hit(record, search_text: str) -> Dict[str, Any]:
+    """Decode a full-text search record into an entity with score/highlight"""
+    entity = dict(record["n"])
+    entity["entity_type"] = entity_label(record["labels"])
+    entity["score"] = record["score"]
+    entity["highlight"] = highlight(entity, search_text)
+    return entity
+
+
+def search_entities_query(
+    entity_type: Optional[str],
+    search_text: Optional[str],
+    properties: Optional[Dict[str, Any]],
+    limit: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Build the scan-based search query used when full-text is unavailable"""
+    # Build query dynamically
+    where_clauses = []
+    params = {"limit": limit}
+
+    if entity_type:
+        label_filter = f"n:{entity_type}"
+    else:
+        label_filter = "n"
+        where_clauses.append(_not_change_labels("n"))
+
+    if search_text:
+        where_clauses.append(
+            "(toLower(n.name) CONTAINS toLower($search_text) "
+            "OR toLower(n.description) CONTAINS toLower($search_text))"
+        )
+        params["search_text"] = search_text
+
+    property_clauses, property_params = property_filters(properties)
+    where_clauses.extend(property_clauses)
+    params.update(property_params)
+
+    where_clause = " AND ".join(where_clauses) if where_clauses else "true"
+
+    query = f"MATCH ({label_filter}) WHERE {where_clause} RETURN n LIMIT $limit"
+    return query, params
+
+
+def list_entities_query(
+    label: Optional[str],
+    after_id: Optional[str],
+    properties: Optional[Dict[str, Any]],
+    limit: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Build one label's page of the keyset-paginated entity listing"""
+    property_clauses, params = property_filters(properties)
+    where_clauses = ["n.id IS NOT NULL"] + property_clauses
+    params["limit"] = limit
+    if after_id is not None:
+        where_clauses.append("n.id > $after_id")
+        params["after_id"] = after_id
+    query = f"""
+    MATCH (n:{label})
+    WHERE {' AND '.join(where_clauses)}
+    RETURN n
+    ORDER BY n.id
+    LIMIT $limit
+    """
+    return query, params
+
+
+def list_relationships_query(
+    label: str,
+    after: Optional[Dict[str, Any]],
+    rel_type: Optional[str],
+    limit: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Build one source label's page of the keyset-paginated relationship listing"""
+    rel_pattern = f"[r:{rel_type}]" if rel_type else "[r]"
+    params = {"limit": limit}
+    if after:
+        # Resume inside the last source seen, then continue after it
+        source_filter = "source.id >= $after_id"
+        resume_filter = "WHERE source.id > $after_id OR elementId(r) > $after_element_id"
+        params["after_id"] = after["id"]
+        params["after_element_id"] = after.get("element_id", "")
+    else:
+        source_filter = "source.id IS NOT NULL"
+        resume_filter = ""
+    query = f"""
+    MATCH (source:{label})
+    WHERE {source_filter}
+    MATCH (source)-{rel_pattern}->(target)
+    WITH source, r, target
+    {resume_filter}
+    RETURN
+        id(r) as id,
+        elementId(r) as element_id,
+        source.id as source_id,
+        labels(source)[0] as source_type,
+        type(r) as type,
+        target.id as target_id,
+        labels(target)[0] as target_type,
+        properties(r) as properties
+    ORDER BY source_id, element_id
+    LIMIT $limit
+    """
+    return query, params
+
+
+# Neighborhood queries
+
+def subgraph_query(label: Optional[str], depth: int, rel_types: Optional[List[str]]) -> str:
+    """
+    Build a bounded breadth-first neighborhood query around `$id`
+
+    Hops are unrolled (one CALL per hop) so that each frontier node expands
+    at most `$fanout` relationships and the node set never exceeds
+    `$max_nodes` + 1; supernodes are sampled rather than fully expanded. The
+    one extra node tells subgraph_from_record whether anything was cut. The
+    whole traversal is one query and one round-trip. Relationships are
+    followed in both directions.
+
+    Returns:
+        Query yielding `levels` (nodes per hop, root first) and `rels`
+        (every relationship traversed, possibly with duplicates)
+    """
+    rel_pattern = f"[r:{'|'.join(rel_types)}]" if rel_types else "[r]"
+    hops = "".join(f"""
+    CALL {{
+        WITH frontier
+        UNWIND frontier AS src
+        CALL {{
+            WITH src
+            MATCH (src)-{rel_pattern}-(nbr)
+            RETURN r, nbr
+            LIMIT $fanout
+        }}
+        RETURN collect(r) AS hop_rels, collect(DISTINCT nbr) AS hop_nodes
+    }}
+    WITH levels, nodes, rels + hop_rels AS rels,
+         [n IN hop_nodes WHERE NOT n IN nodes][..($max_nodes + 1 - size(nodes))] AS frontier
+    WITH frontier, levels + [frontier] AS levels, nodes + frontier AS nodes, rels
+    """ for _ in range(depth))
+    return f"""
+    {match_entity('root', label)}
+    WITH [root] AS frontier, [[root]] AS levels, [root] AS nodes, [] AS rels
+    {hops}
+    RETURN levels, rels
+    """
+
+
+def subgraph_from_record(record, entity_id: str, max_nodes: int) -> Optional[Dict[str, Any]]:
+    """
+    Decode a subgraph_query record into deduplicated nodes and edges
+
+    Returns:
+        Dict with 'root', 'nodes' ({"id", "entity_type", "depth",
+        "properties"}), 'edges' ({"element_id", "type", "source_id",
+        "target_id", "properties"}) restricted to returned nodes, and
+        'truncated' (True if the query found more than max_nodes nodes, the
+        extra one being dropped); None if the root entity does not exist
+    """
+    if not record:
+        return None
+    found = [(hop, node) for hop, level in enumerate(record["levels"]) for node in level]
+    nodes = []
+    ids_by_element = {}
+    for hop, node in found[:max_nodes]:
+        properties = dict(node)
+        ids_by_element[node.element_id] = properties.get("id")
+        nodes.append({
+            "id": properties.get("id"),
+            "entity_type": entity_label(list(node.labels)),
+            "depth": hop,
+            "properties": properties
+        })
+
+    edges = []
+    seen = set()
+    for rel in record["rels"]:
+        start, end = rel.start_node.element_id, rel.end_node.element_id
+        if rel.element_id in seen or start not in ids_by_element or end not in ids_by_element:
+            continue
+        seen.add(rel.element_id)
+        edges.append({
+            "element_id": rel.element_id,
+            "type": rel.type,
+            "source_id": ids_by_element[start],
+            "target_id": ids_by_element[end],
+            "properties": dict(rel)
+        })
+
+    return {
+        "root": entity_id,
+        "nodes": nodes,
+        "edges": edges,
+        "truncated": len(found) > max_nodes
+    }
+
+
+# Statistics queries
+
+def graph_stats_query() -> str:
+    """
+    Build the graph statistics query
+
+    Every branch is a plain count over all nodes, one label, all
+    relationships or one relationship type, which Neo4j answers from its
+    count store without touching the data, so the cost is independent of
+    graph size.
+    """
+    branches = ["MATCH (n) RETURN 'total' AS kind, null AS name, count(n) AS count"]
+    branches += [
+        f"MATCH (n:{label}) RETURN 'internal' AS kind, '{label}' AS name, count(n) AS count"
+        for label in CHANGE_LABELS
+    ]
+    branches += [
+        f"MATCH (n:{entity_type}) RETURN 'node' AS kind, '{entity_type}' AS name, count(n) AS count"
+        for entity_type in ENTITY_TYPES
+    ]
+    branches.append(
+        "MATCH ()-[r]->() RETURN 'total_relationships' AS kind, null AS name, count(r) AS count"
+    )
+    branches += [
+        f"MATCH ()-[r:{rel_type}]->() RETURN 'relationship' AS kind, '{rel_type}' AS name, count(r) AS count"
+        for rel_type in RELATIONSHIP_TYPES
+    ]
+    return "\nUNION ALL\n".join(branches)
+
+
+def graph_stats(records) -> Dict[str, Any]:
+    """
+    Decode graph_stats_query records
+
+    Returns:
+        Dict with 'total_nodes', 'total_relationships', and non-empty
+        'node_types' / 'relationship_types' as [{"type", "count"}] sorted by
+        count descending
+    """
+    stats = {
+        "total_nodes": 0,
+        "total_relationships": 0,
+        "node_types": [],
+        "relationship_types": []
+    }
+    for record in records:
+        kind, name, count = record["kind"], record["name"], record["count"]
+        if kind == "total":
+            stats["total_nodes"] += count
+        elif kind == "internal":
+            stats["total_nodes"] -= count
+        elif kind == "total_relationships":
+            stats["total_relationships"] = count
+        elif count:
+            key = "node_types" if kind == "node" else "relationship_types"
+            stats[key].append({"type": name, "count": count})
+    for key in ("node_types", "relationship_types"):
+        stats[key].sort(key=lambda row: row["count"], reverse=True)
+    return stats
+
+
+# Export queries
+
+def export_node_queries(entity_types: Optional[List[str]]) -> List[str]:
+    if entity_types:
+        return [f"MATCH (n:{entity_type}) RETURN n" for entity_type in entity_types]
+    return [f"MATCH (n) WHERE {_not_change_labels('n')} RETURN n"]
+
+
+def export_relationship_queries(
+    rel_types: Optional[List[str]],
+    entity_types: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Relationship export queries, one per type
+
+    Args:
+        rel_types: Relationship types to export (None for all)
+        entity_types: Export only relationships whose two endpoints have one
+            of these labels, so every edge points at exported nodes (None for all)
+    """
+    patterns = [f"[r:{rel_type}]" for rel_type in rel_types] if rel_types else ["[r]"]
+    where = ""
+    if entity_types:
+        labels = "|".join(entity_types)
+        where = f"WHERE source:{labels} AND target:{labels}"
+    return [
+        f"""
+        MATCH (source)-{pattern}->(target)
+        {where}
+        RETURN
+            elementId(r) as element_id,
+            type(r) as type,
+            source.id as source_id,
+            elementId(source) as source_element_id,
+            target.id as target_id,
+            elementId(target) as target_element_id,
+            properties(r) as properties
+        """
+        for pattern in patterns
+    ]
+
+
+def export_node(node) -> Dict[str, Any]:
+    """Decode a node into an export record"""
+    return {
+        "kind": "node",
+        "element_id": node.element_id,
+        "labels": list(node.labels),
+        "properties": dict(node)
+    }
+
+
+def export_relationship(record) -> Dict[str, Any]:
+    """Decode an export_relationship_queries record into an export record"""
+    return {"kind": "relationship", **dict(record)}
+
+
+# Analytics projection
+
+def projection_node_queries() -> List[Tuple[str, str]]:
+    """(label, query) pairs returning the ids of every entity, one label at a time"""
+    return [
+        (entity_type, f"MATCH (n:{entity_type}) WHERE n.id IS NOT NULL RETURN n.id AS id")
+        for entity_type in ENTITY_TYPES
+    ]
+
+
+def resolution_name_queries() -> List[Tuple[str, str]]:
+    """(label, query) pairs returning the id and name of every named entity, one label at a time"""
+    return [
+        (
+            entity_type,
+            f"MATCH (n:{entity_type}) WHERE n.id IS NOT NULL AND n.name IS NOT NULL "
+            "RETURN n.id AS id, n.name AS name"
+        )
+        for entity_type in ENTITY_TYPES
+    ]
+
+
+def semantic_document_queries() -> List[Tuple[str, str]]:
+    """(label, query) pairs returning the id, name and description of every entity with text, one label at a time"""
+    return [
+        (
+            entity_type,
+            f"MATCH (n:{entity_type}) "
+            "WHERE n.id IS NOT NULL AND (n.name IS NOT NULL OR n.description IS NOT NULL) "
+            "RETURN n.id AS id, n.name AS name, n.description AS description"
+        )
+        for entity_type in ENTITY_TYPES
+    ]
+
+
+PROJECTION_RELATIONSHIPS_QUERY = """
+MATCH (source)-[r]->(target)
+RETURN source.id AS source_id, target.id AS target_id
+"""
+
+
+# Recommendation index
+
+RECOMMENDATION_REL_TYPES = ["SOLVES", "TARGETS", "APPLIES_TO"]
+
+
+def recommendation_rows_query(product_ids: bool = False) -> str:
+    """
+    Product -> Problem/UserGroup/Scenario relationships feeding the recommendation index
+
+    Args:
+        product_ids: Restrict to the products in $ids (incremental updates)
+    """
+    match = "UNWIND $ids AS id MATCH (p:Product {id: id})" if product_ids else "MATCH (p:Product)"
+    return f"""
+    {match}-[r:{'|'.join(RECOMMENDATION_REL_TYPES)}]->(target)
+    RETURN p.id AS product_id, type(r) AS type, target.id AS target_id, properties(r) AS properties
+    """
+
+
+# Offer index
+
+def offers_query(since: bool = False) -> str:
+    """
+    Offer node properties for the offer index
+
+    updated_at may be an ISO string (this service's upserts) or a temporal
+    value (the ETL pipeline). The delta compares the raw property in one
+    branch per type, so both are range index seeks on Offer.updated_at and a
+    malformed value is skipped instead of failing the refresh; $since must
+    be a UTC "YYYY-MM-DDTHH:MM:SS" string (see OfferIndex.delta_since).
+
+    Args:
+        since: Only offers with updated_at >= $since (delta refresh)
+    """
+    if not since:
+        return "MATCH (o:Offer) RETURN properties(o) AS offer"
+    return """
+    MATCH (o:Offer) WHERE o.updated_at >= $since RETURN properties(o) AS offer
+    UNION ALL
+    MATCH (o:Offer) WHERE o.updated_at >= datetime($since) RETURN properties(o) AS offer
+    """
+
+
+# Product cards
+
+def product_cards_query(product_ids: bool = False) -> str:
+    """
+    One row per product with everything its storefront card shows
+
+    Problems come both from the product's own SOLVES relationships (via
+    null) and from its features' (via the feature id).
+
+    Args:
+        product_ids: Restrict to the products in $ids (incremental updates)
+    """
+    match = "UNWIND $ids AS id MATCH (p:Product {id: id})" if product_ids else "MATCH (p:Product)"
+    return f"""
+    {match}
+    RETURN properties(p) AS product,
+           [(p)-[r:HAS_FEATURE]->(f:Feature) | {{
+               id: f.id, name: f.name, feature_type: f.feature_type, value: f.value,
+               importance_score: f.importance_score, confidence: r.confidence
+           }}] AS features,
+           [(p)-[s:SOLVES]->(pr:Problem) | {{
+               id: pr.id, name: pr.name, severity: pr.severity, effectiveness: s.effectiveness, via: null
+           }}] + [(p)-[:HAS_FEATURE]->(f:Feature)-[s:SOLVES]->(pr:Problem) | {{
+               id: pr.id, name: pr.name, severity: pr.severity, effectiveness: s.effectiveness, via: f.id
+           }}] AS problems,
+           [(p)-[r:TARGETS]->(g:UserGroup) | {{id: g.id, name: g.name, priority: r.priority}}] AS user_groups,
+           [(p)-[:HAS_OFFER]->(o:Offer) | properties(o)] AS offers,
+           [(p)-[r:COMPARES_WITH]->(c:Competitor) | {{
+               id: c.id, name: c.name, brand: c.brand, product: c.product,
+               comparison_type: r.comparison_type
+           }}] AS competitors
+    """
+
+
+# Change feed
+
+def append_changes_query() -> str:
+    """
+    Append $events (see services.changes) to the change log
+
+    Run inside the transaction of the write the events describe. Events are
+    created pending, stamped with the commit-independent wall clock time
+    (nanoseconds) and their position in $events; sequence numbers are handed
+    out after commit by sequence_changes_query, so writers never share a lock.
+    """
+    return f"""
+    WITH datetime.realtime() AS now
+    UNWIND range(0, size($events) - 1) AS i
+    CREATE (c:{CHANGE_EVENT_LABEL}:{CHANGE_PENDING_LABEL})
+    SET c = $events[i], c.position = i,
+        c.stamp = now.epochSeconds * 1000000000 + now.nanosecond,
+        c.at = toString(now)
+    """
+
+
+def pending_changes_query() -> str:
+    return f"MATCH (c:{CHANGE_PENDING_LABEL}) RETURN count(c) AS pending"
+
+
+def lock_change_sequence_query() -> str:
+    """Write-lock the sequence counter until the transaction ends"""
+    return f"""
+    MERGE (s:{CHANGE_SEQUENCE_LABEL} {{id: 'graph'}})
+    ON CREATE SET s.value = 0
+    SET s._lock = true
+    """
+
+
+def sequence_changes_query() -> str:
+    """
+    Number up to $limit committed pending events, oldest stamp first
+
+    Run after lock_change_sequence_query in the same transaction: sequencing
+    transactions run one at a time and only see committed events, so numbers
+    increase in the order events become readable, without gaps, and a reader
+    paging by seq never skips one.
+    """
+    return f"""
+    MATCH (s:{CHANGE_SEQUENCE_LABEL} {{id: 'graph'}})
+    REMOVE s._lock
+    WITH s
+    OPTIONAL MATCH (c:{CHANGE_PENDING_LABEL})
+    WITH s, c ORDER BY c.stamp, c.position LIMIT $limit
+    WITH s, collect(c) AS events
+    WITH s, events, s.value AS base
+    SET s.value = base + size(events)
+    WITH events, base
+    UNWIND range(0, size(events) - 1) AS i
+    WITH events[i] AS c, base + i + 1 AS seq
+    SET c.seq = seq
+    REMOVE c:{CHANGE_PENDING_LABEL}, c.position
+    RETURN count(c) AS sequenced
+    """
+
+
+def expire_changes_query(field: str) -> str:
+    """
+    Delete up to $limit events whose `field` ('seq' or 'stamp') is below $bound
+
+    Args:
+        field: 'seq' (retention by count) or 'stamp' (retention by age)
+    """
+    if field not in ("seq", "stamp"):
+        raise ValueError(f"Cannot expire changes by {field}")
+    return f"""
+    MATCH (c:{CHANGE_EVENT_LABEL})
+    WHERE c.{field} < $bound
+    WITH c LIMIT $limit
+    DELETE c
+    RETURN count(c) AS deleted
+    """
+
+
+def changes_query() -> str:
+    """Events with a sequence number above $since, oldest first, at most $limit"""
+    return f"""
+    MATCH (c:{CHANGE_EVENT_LABEL})
+    WHERE c.seq > $since
+    RETURN properties(c) AS event
+    ORDER BY c.seq
+    LIMIT $limit
+    """
+
+
+def latest_change_query() -> str:
+    return f"MATCH (s:{CHANGE_SEQUENCE_LABEL} {{id: 'graph'}}) RETURN s.value AS seq"
@@ -1,30 +1,30 @@
 """
-Neo4j Graph Database Service
+Neo4j Graph Database Service (synchronous bulk writer)
 
-This service provides a high-level interface for managing entities and relationships
-in the Neo4j knowledge graph database.
+Synchronous service for scripts such as scripts/bulk_load.py that stream
+large batches into Neo4j from plain threads. It covers connectivity and the
+bulk write paths only; the API and every read path live in
+AsyncGraphService.
 """
 from neo4j import GraphDatabase
 from typing import List, Dict, Optional, Any
+from contextlib import contextmanager
+from datetime import datetime
 import logging
+from . import cypher
+from .base import BaseGraphService
+from .changes import entity_change, merge_changes, upsert_changes
+from .cypher import DEFAULT_BATCH_SIZE
 
 logger = logging.getLogger(__name__)
 
 
-class GraphService:
-    """Neo4j graph database service with transaction support"""
+class GraphService(BaseGraphService):
+    """Neo4j bulk write service on the synchronous driver"""
 
-    def __init__(self, uri: str, user: str, password: str):
-        """
-        Initialize Neo4j driver with connection pooling
-
-        Args:
-            uri: Neo4j connection URI (e.g., bolt://localhost:7687)
-            user: Database username
-            password: Database password
-        """
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        logger.info(f"Connected to Neo4j at {uri}")
+    def _create_driver(self, uri: str, **kwargs):
+        """Create the synchronous Neo4j driver"""
+        return GraphDatabase.driver(uri, **kwargs)
 
     def close(self):
         """Close driver connection and release resources"""
@@ -32,458 +32,320 @@ class GraphService:
             self.driver.close()
             logger.info("Neo4j connection closed")
 
-    def health_check(self) -> bool:
+    @contextmanager
+    def _pooled_session(self, read_only: bool = False, **kwargs):
         """
-        Verify database connectivity
+        Open a driver session while tracking pool utilization
 
-        Returns:
-            True if database is accessible, False otherwise
-        """
-        try:
-            with self.driver.session() as session:
-                result = session.run("RETURN 1 as test")
-                return result.single()["test"] == 1
-        except Exception as e:
-            logger.error(f"Health check failed: {e}")
-            return False
-
-    def create_entity(self, entity_type: str, properties: Dict[str, Any]) -> str:
-        """
-        Create entity node in Neo4j
+        Read-only sessions are routed to cluster readers (followers) when the
+        driver uses a neo4j:// routing URI. Sessions opened while handling a
+        request that carries bookmarks wait for those transactions, and hand
+        their own bookmarks back to the request.
 
         Args:
-            entity_type: Entity type (used as node label)
-            properties: Entity properties including 'id'
-
-        Returns:
-            Entity ID
-
-        Raises:
-            ValueError: If entity_type is invalid or properties missing 'id'
-            Exception: If creation fails
-        """
-        # Validate entity type (prevent injection)
-        valid_types = ["Product", "Feature", "Scenario", "Problem",
-                      "UserGroup", "Competitor", "Offer", "Merchant"]
-        if entity_type not in valid_types:
-            raise ValueError(f"Invalid entity type: {entity_type}")
-
-        if "id" not in properties:
-            raise ValueError("Entity properties must include 'id' field")
-
-        try:
-            with self.driver.session() as session:
-                entity_id = session.execute_write(
-                    self._create_entity_tx,
-                    entity_type,
-                    properties
-                )
-                logger.info(f"Created entity: {entity_type} with id={entity_id}")
-                return entity_id
-        except Exception as e:
-            logger.error(f"Failed to create entity: {e}", exc_info=True)
-            raise
+            read_only: Open the session with read access
+            **kwargs: Passed through to driver.session()
 
-    def query_entity(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        Yields:
+            neo4j.Session: Session bound to a pooled connection
         """
-        Query entity by ID
+        scope = self._session_options(read_only, kwargs)
+        with self.driver.session(**kwargs) as session:
+            self._session_opened()
+            try:
+                yield session
+            finally:
+                self._session_closed()
+                if scope is not None:
+                    scope.update(session.last_bookmarks().raw_values)
 
-        Args:
-            entity_id: Entity identifier
-
-        Returns:
-            Entity properties dict or None if not found
-        """
-        try:
-            with self.driver.session() as session:
-                result = session.execute_read(
-                    self._query_entity_tx,
-                    entity_id
-                )
-                return result
-        except Exception as e:
-            logger.error(f"Failed to query entity {entity_id}: {e}", exc_info=True)
-            return None
-
-    def update_entity(self, entity_id: str, properties: Dict[str, Any]) -> bool:
-        """
-        Update entity properties
-
-        Args:
-            entity_id: Entity identifier
-            properties: Properties to update
-
-        Returns:
-            True if successful, False otherwise
-        """
-        try:
-            with self.driver.session() as session:
-                success = session.execute_write(
-                    self._update_entity_tx,
-                    entity_id,
-                    properties
-                )
-                if success:
-                    logger.info(f"Updated entity: {entity_id}")
-                return success
-        except Exception as e:
-            logger.error(f"Failed to update entity {entity_id}: {e}", exc_info=True)
-            return False
-
-    def delete_entity(self, entity_id: str) -> bool:
+    def health_check(self) -> bool:
         """
-        Delete entity and all its relationships
-
-        Args:
-            entity_id: Entity identifier
+        Verify database connectivity
 
         Returns:
-            True if deleted, False if not found
+            True if database is accessible, False otherwise
         """
         try:
-            with self.driver.session() as session:
-                deleted = session.execute_write(
-                    self._delete_entity_tx,
-                    entity_id
-                )
-                if deleted:
-                    logger.info(f"Deleted entity: {entity_id}")
-                return deleted
+            with self._pooled_session() as session:
+                result = session.run("RETURN 1 as test")
+                return result.single()["test"] == 1
         except Exception as e:
-            logger.error(f"Failed to delete entity {entity_id}: {e}", exc_info=True)
+            logger.error(f"Health check failed: {e}")
             return False
 
-    def create_relationship(
+    def create_entities_bulk(
         self,
-        from_id: str,
-        to_id: str,
-        rel_type: str,
-        properties: Dict[str, Any] = None
-    ) -> bool:
-        """
-        Create relationship between entities
-
-        Args:
-            from_id: Source entity ID
-            to_id: Target entity ID
-            rel_type: Relationship type
-            properties: Optional relationship properties
-
-        Returns:
-            True if successful, False otherwise
+        entities: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
         """
-        if properties is None:
-            properties = {}
+        Create many entities with batched UNWIND transactions
 
-        # Validate relationship type
-        valid_types = ["HAS_FEATURE", "SOLVES", "APPLIES_TO", "TARGETS",
-                      "COMPARES_WITH", "HAS_OFFER", "SOLD_BY", "GENERATED_FROM"]
-        if rel_type not in valid_types:
-            raise ValueError(f"Invalid relationship type: {rel_type}")
-
-        try:
-            with self.driver.session() as session:
-                success = session.execute_write(
-                    self._create_relationship_tx,
-                    from_id,
-                    to_id,
-                    rel_type,
-                    properties
-                )
-                if success:
-                    logger.info(f"Created relationship: {from_id} -{rel_type}-> {to_id}")
-                return success
-        except Exception as e:
-            logger.error(f"Failed to create relationship: {e}", exc_info=True)
-            return False
-
-    def delete_relationship(self, from_id: str, to_id: str, rel_type: str) -> bool:
-        """
-        Delete specific relationship between entities
+        Entities are grouped by label and written in chunks of batch_size,
+        one transaction per chunk. If a chunk fails (e.g. a unique constraint
+        violation), its rows are retried one by one so that only the offending
+        rows are reported and the rest of the batch is still written.
 
         Args:
-            from_id: Source entity ID
-            to_id: Target entity ID
-            rel_type: Relationship type
+            entities: List of {"entity_type": str, "properties": dict}
+            batch_size: Maximum rows per UNWIND transaction
 
         Returns:
-            True if deleted, False if not found
+            Dict with 'created' and 'failed' counts and per-row 'errors'
+            ({"index", "id", "error"}), index referring to the input list
         """
-        try:
-            with self.driver.session() as session:
-                deleted = session.execute_write(
-                    self._delete_relationship_tx,
-                    from_id,
-                    to_id,
-                    rel_type
-                )
-                if deleted:
-                    logger.info(f"Deleted relationship: {from_id} -{rel_type}-> {to_id}")
-                return deleted
-        except Exception as e:
-            logger.error(f"Failed to delete relationship: {e}", exc_info=True)
-            return False
-
-    def query_relationships(
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_entities(entities)
+        created = 0
+        with self._pooled_session() as session:
+            for entity_type, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    try:
+                        created += session.execute_write(
+                            self._create_entities_batch_tx,
+                            entity_type,
+                            [properties for _, properties in chunk],
+                            changes=self.change_feed
+                        )
+                        for _, properties in chunk:
+                            self._label_cache.put(properties["id"], entity_type)
+                    except Exception as e:
+                        logger.warning(
+                            f"Bulk create of {len(chunk)} {entity_type} rows failed, "
+                            f"retrying row by row: {e}"
+                        )
+                        for index, properties in chunk:
+                            try:
+                                session.execute_write(
+                                    self._create_entity_tx,
+                                    entity_type,
+                                    properties,
+                                    changes=self.change_feed
+                                )
+                                self._label_cache.put(properties["id"], entity_type)
+                                created += 1
+                            except Exception as row_error:
+                                errors.append({
+                                    "index": index,
+                                    "id": properties.get("id"),
+                                    "error": str(row_error)
+                                })
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Bulk created {created} entities, {len(errors)} failed")
+        return {"created": created, "failed": len(errors), "errors": errors}
+
+    def upsert_entities(
         self,
-        entity_id: str,
-        rel_type: Optional[str] = None,
-        direction: str = "outgoing"
-    ) -> List[Dict[str, Any]]:
+        entities: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
         """
-        Query entity relationships
+        Create or update many entities, skipping those whose content is unchanged
+
+        Each entity's properties are hashed (see cypher.content_hash) and the
+        digest is stored on the node. Per chunk of batch_size rows the stored
+        hashes are read first, and only new or changed rows are written with
+        UNWIND + MERGE; properties not given are kept. A chunk with no changes
+        costs one read transaction and no write.
 
         Args:
-            entity_id: Entity identifier
-            rel_type: Optional relationship type filter
-            direction: 'outgoing', 'incoming', or 'both'
+            entities: List of {"entity_type": str, "properties": dict}
+            batch_size: Maximum rows per transaction
 
         Returns:
-            List of relationship dictionaries
+            Dict with 'written', 'skipped' (unchanged) and 'failed' counts and
+            per-row 'errors' ({"index", "id", "error"})
         """
-        try:
-            with self.driver.session() as session:
-                results = session.execute_read(
-                    self._query_relationships_tx,
-                    entity_id,
-                    rel_type,
-                    direction
-                )
-                return results
-        except Exception as e:
-            logger.error(f"Failed to query relationships for {entity_id}: {e}", exc_info=True)
-            return []
-
-    def search_entities(
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_entities(entities)
+        written = skipped = 0
+        now = datetime.utcnow().isoformat()
+        with self._pooled_session() as session:
+            for entity_type, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    hashes = {properties["id"]: cypher.content_hash(properties) for _, properties in chunk}
+                    try:
+                        stored = session.execute_read(
+                            self._entity_hashes_tx, entity_type, list(hashes)
+                        )
+                        changed = [
+                            {"id": properties["id"], "properties": properties, "hash": hashes[properties["id"]]}
+                            for _, properties in chunk
+                            if stored.get(properties["id"]) != hashes[properties["id"]]
+                        ]
+                        count = session.execute_write(
+                            self._upsert_entities_batch_tx, entity_type, changed, now,
+                            existing=stored, changes=self.change_feed
+                        ) if changed else 0
+                    except Exception as e:
+                        logger.warning(f"Upsert of {len(chunk)} {entity_type} rows failed: {e}")
+                        errors.extend(
+                            {"index": index, "id": properties["id"], "error": str(e)}
+                            for index, properties in chunk
+                        )
+                        continue
+                    written += count
+                    skipped += len(chunk) - count
+                    for _, properties in chunk:
+                        self._label_cache.put(properties["id"], entity_type)
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Upserted entities: {written} written, {skipped} unchanged, {len(errors)} failed")
+        return {"written": written, "skipped": skipped, "failed": len(errors), "errors": errors}
+
+    def upsert_relationships_bulk(
         self,
-        entity_type: Optional[str] = None,
-        search_text: Optional[str] = None,
-        properties: Optional[Dict[str, Any]] = None,
-        limit: int = 100
-    ) -> List[Dict[str, Any]]:
+        relationships: List[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, Any]:
         """
-        Search entities by type, text, or properties
+        Create or update many relationships with batched UNWIND + MERGE
 
-        Args:
-            entity_type: Optional entity type filter
-            search_text: Optional text search on name/description
-            properties: Optional property filters
-            limit: Maximum results (default 100)
-
-        Returns:
-            List of matching entities
-        """
-        try:
-            with self.driver.session() as session:
-                results = session.execute_read(
-                    self._search_entities_tx,
-                    entity_type,
-                    search_text,
-                    properties,
-                    limit
-                )
-                return results
-        except Exception as e:
-            logger.error(f"Failed to search entities: {e}", exc_info=True)
-            return []
-
-    def execute_cypher(self, query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """
-        Execute custom Cypher query
+        Rows are grouped by relationship type and endpoint labels, and each
+        chunk of batch_size rows is one transaction. Endpoints are matched by
+        label-qualified id when the label is given (from_type/to_type) or
+        cached. Relationships that already exist are matched and get their
+        properties merged instead of being duplicated.
 
         Args:
-            query: Cypher query string
-            params: Query parameters
+            relationships: List of {"from_id", "to_id", "rel_type",
+                "properties", "from_type", "to_type"}
+            batch_size: Maximum rows per UNWIND transaction
 
         Returns:
-            List of result dictionaries
-
-        Raises:
-            ValueError: If query contains dangerous operations
+            Dict with 'created', 'matched', 'missing' (rows whose endpoints
+            do not exist) and 'failed' counts, plus per-row 'errors'
+            ({"index", "id", "error"}), index referring to the input list
         """
-        if params is None:
-            params = {}
-
-        # Basic safety check (enhance for production)
-        dangerous_keywords = ["DROP", "DELETE ALL", "REMOVE ALL"]
-        query_upper = query.upper()
-        for keyword in dangerous_keywords:
-            if keyword in query_upper:
-                raise ValueError(f"Query contains dangerous operation: {keyword}")
-
-        try:
-            with self.driver.session() as session:
-                result = session.run(query, **params)
-                records = []
-                for record in result:
-                    records.append(dict(record))
-                logger.info(f"Executed custom query, returned {len(records)} results")
-                return records
-        except Exception as e:
-            logger.error(f"Failed to execute cypher query: {e}", exc_info=True)
-            raise
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        groups, errors = self._group_bulk_relationships(relationships)
+        created = matched = missing = 0
+        with self._pooled_session() as session:
+            for (rel_type, from_label, to_label), rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    chunk = rows[start:start + batch_size]
+                    try:
+                        counts = session.execute_write(
+                            self._merge_relationships_batch_tx,
+                            rel_type,
+                            from_label,
+                            to_label,
+                            chunk,
+                            changes=self.change_feed
+                        )
+                    except Exception as e:
+                        logger.warning(
+                            f"Bulk upsert of {len(chunk)} {rel_type} rows failed: {e}"
+                        )
+                        errors.extend(
+                            {
+                                "index": row["index"],
+                                "id": f"{row['from_id']}->{row['to_id']}",
+                                "error": str(e)
+                            }
+                            for row in chunk
+                        )
+                        continue
+                    created += counts["created"]
+                    matched += counts["matched"]
+                    missing += len(chunk) - counts["created"] - counts["matched"]
+
+        errors.sort(key=lambda error: error["index"])
+        logger.info(
+            f"Bulk upserted relationships: {created} created, {matched} matched, "
+            f"{missing} missing endpoints, {len(errors)} failed"
+        )
+        return {
+            "created": created,
+            "matched": matched,
+            "missing": missing,
+            "failed": len(errors),
+            "errors": errors
+        }
 
     # Transaction functions (static methods)
 
     @staticmethod
-    def _create_entity_tx(tx, entity_type: str, properties: Dict[str, Any]) -> str:
-        """Transaction function for creating entity"""
-        query = f"CREATE (n:{entity_type} $properties) RETURN n.id as id"
-        result = tx.run(query, properties=properties)
-        return result.single()["id"]
-
-    @staticmethod
-    def _query_entity_tx(tx, entity_id: str) -> Optional[Dict[str, Any]]:
-        """Transaction function for querying entity"""
-        query = "MATCH (n) WHERE n.id = $id RETURN n"
-        result = tx.run(query, id=entity_id)
-        record = result.single()
-        if record:
-            node = record["n"]
-            # Convert node to dictionary
-            return dict(node)
-        return None
+    def _append_changes_tx(tx, events: List[Dict[str, Any]]):
+        """Append change feed events in the transaction of the write they describe"""
+        if events:
+            tx.run(cypher.append_changes_query(), events=events)
 
     @staticmethod
-    def _update_entity_tx(tx, entity_id: str, properties: Dict[str, Any]) -> bool:
-        """Transaction function for updating entity"""
-        # Build SET clause dynamically
-        set_clauses = [f"n.{key} = $props.{key}" for key in properties.keys()]
-        set_clause = ", ".join(set_clauses)
-
-        query = f"MATCH (n) WHERE n.id = $id SET {set_clause} RETURN n"
-        result = tx.run(query, id=entity_id, props=properties)
-        return result.single() is not None
+    def _create_entity_tx(
+        tx,
+        entity_type: str,
+        properties: Dict[str, Any],
+        changes: bool = False
+    ) -> str:
+        """Transaction function for creating entity"""
+        result = tx.run(cypher.create_entity_query(entity_type), properties=properties)
+        entity_id = result.single()["id"]
+        if changes:
+            GraphService._append_changes_tx(tx, [entity_change("create", entity_type, entity_id, properties)])
+        return entity_id
 
     @staticmethod
-    def _delete_entity_tx(tx, entity_id: str) -> bool:
-        """Transaction function for deleting entity"""
-        query = "MATCH (n) WHERE n.id = $id DETACH DELETE n RETURN count(n) as deleted"
-        result = tx.run(query, id=entity_id)
-        count = result.single()["deleted"]
-        return count > 0
+    def _create_entities_batch_tx(
+        tx,
+        entity_type: str,
+        rows: List[Dict[str, Any]],
+        changes: bool = False
+    ) -> int:
+        """Transaction function for creating a batch of same-label entities"""
+        result = tx.run(cypher.create_entities_batch_query(entity_type), rows=rows)
+        created = result.single()["created"]
+        if changes:
+            GraphService._append_changes_tx(
+                tx, [entity_change("create", entity_type, row["id"], row) for row in rows]
+            )
+        return created
 
     @staticmethod
-    def _create_relationship_tx(
+    def _merge_relationships_batch_tx(
         tx,
-        from_id: str,
-        to_id: str,
         rel_type: str,
-        properties: Dict[str, Any]
-    ) -> bool:
-        """Transaction function for creating relationship"""
-        query = f"""
-        MATCH (from) WHERE from.id = $from_id
-        MATCH (to) WHERE to.id = $to_id
-        CREATE (from)-[r:{rel_type} $properties]->(to)
-        RETURN r
-        """
-        result = tx.run(query, from_id=from_id, to_id=to_id, properties=properties)
-        return result.single() is not None
-
-    @staticmethod
-    def _delete_relationship_tx(tx, from_id: str, to_id: str, rel_type: str) -> bool:
-        """Transaction function for deleting relationship"""
-        query = f"""
-        MATCH (from)-[r:{rel_type}]->(to)
-        WHERE from.id = $from_id AND to.id = $to_id
-        DELETE r
-        RETURN count(r) as deleted
-        """
-        result = tx.run(query, from_id=from_id, to_id=to_id)
-        count = result.single()["deleted"]
-        return count > 0
+        from_label: Optional[str],
+        to_label: Optional[str],
+        rows: List[Dict[str, Any]],
+        changes: bool = False
+    ) -> Dict[str, int]:
+        """Transaction function for merging a batch of same-type relationships"""
+        query = cypher.merge_relationships_batch_query(rel_type, from_label, to_label)
+        result = tx.run(query, rows=rows)
+        record = result.single()
+        if changes:
+            GraphService._append_changes_tx(tx, merge_changes(rel_type, rows, record))
+        return {"created": record["created"], "matched": record["matched"]}
 
     @staticmethod
-    def _query_relationships_tx(
-        tx,
-        entity_id: str,
-        rel_type: Optional[str],
-        direction: str
-    ) -> List[Dict[str, Any]]:
-        """Transaction function for querying relationships"""
-        relationships = []
-
-        if direction in ["outgoing", "both"]:
-            if rel_type:
-                query = f"""
-                MATCH (n)-[r:{rel_type}]->(target)
-                WHERE n.id = $id
-                RETURN type(r) as rel_type, properties(r) as properties, target
-                """
-            else:
-                query = """
-                MATCH (n)-[r]->(target)
-                WHERE n.id = $id
-                RETURN type(r) as rel_type, properties(r) as properties, target
-                """
-            result = tx.run(query, id=entity_id)
-            for record in result:
-                relationships.append({
-                    "direction": "outgoing",
-                    "type": record["rel_type"],
-                    "properties": dict(record["properties"]),
-                    "target": dict(record["target"])
-                })
-
-        if direction in ["incoming", "both"]:
-            if rel_type:
-                query = f"""
-                MATCH (source)-[r:{rel_type}]->(n)
-                WHERE n.id = $id
-                RETURN type(r) as rel_type, properties(r) as properties, source
-                """
-            else:
-                query = """
-                MATCH (source)-[r]->(n)
-                WHERE n.id = $id
-                RETURN type(r) as rel_type, properties(r) as properties, source
-                """
-            result = tx.run(query, id=entity_id)
-            for record in result:
-                relationships.append({
-                    "direction": "incoming",
-                    "type": record["rel_type"],
-                    "properties": dict(record["properties"]),
-                    "source": dict(record["source"])
-                })
-
-        return relationships
+    def _entity_hashes_tx(tx, entity_type: str, entity_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Transaction function reading stored content hashes"""
+        result = tx.run(cypher.entity_hashes_query(entity_type), ids=entity_ids)
+        return {record["id"]: record["hash"] for record in result}
 
     @staticmethod
-    def _search_entities_tx(
+    def _upsert_entities_batch_tx(
         tx,
-        entity_type: Optional[str],
-        search_text: Optional[str],
-        properties: Optional[Dict[str, Any]],
-        limit: int
-    ) -> List[Dict[str, Any]]:
-        """Transaction function for searching entities"""
-        # Build query dynamically
-        where_clauses = []
-        params = {"limit": limit}
-
-        if entity_type:
-            label_filter = f"n:{entity_type}"
-        else:
-            label_filter = "n"
-
-        if search_text:
-            where_clauses.append("(n.name CONTAINS $search_text OR n.description CONTAINS $search_text)")
-            params["search_text"] = search_text
-
-        if properties:
-            for key, value in properties.items():
-                where_clauses.append(f"n.{key} = $prop_{key}")
-                params[f"prop_{key}"] = value
-
-        where_clause = " AND ".join(where_clauses) if where_clauses else "true"
-
-        query = f"MATCH ({label_filter}) WHERE {where_clause} RETURN n LIMIT $limit"
-        result = tx.run(query, **params)
-
-        entities = []
-        for record in result:
-            entities.append(dict(record["n"]))
-
-        return entities
+        entity_type: str,
+        rows: List[Dict[str, Any]],
+        now: str,
+        existing=(),
+        changes: bool = False
+    ) -> int:
+        """Transaction function for hash-guarded UNWIND + MERGE upserts (existing: ids stored before)"""
+        result = tx.run(cypher.upsert_entities_batch_query(entity_type), rows=rows, now=now)
+        record = result.single()
+        if not record:
+            return 0
+        if changes:
+            GraphService._append_changes_tx(tx, upsert_changes(entity_type, rows, record["ids"], existing, now))
+        return record["written"]
@@ -0,0 +1,71 @@
+"""
+Entity Label Cache
+
+Bounded LRU mapping entity IDs to their node label. Knowing the label lets
+id-based Cypher use the per-label unique constraints (index seeks) instead
+of scanning every node.
+"""
+from collections import OrderedDict
+from typing import Optional
+import threading
+
+
+class LabelCache:
+    """Thread-safe, size-bounded LRU of entity id -> label"""
+
+    def __init__(self, max_size: int = 100000):
+        """
+        Initialize cache
+
+        Args:
+            max_size: Maximum number of ids kept; least recently used are evicted
+        """
+        self.max_size = max_size
+        self._labels: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, entity_id: str) -> Optional[str]:
+        """
+        Look up the label of an entity
+
+        Args:
+            entity_id: Entity identifier
+
+        Returns:
+            Cached label or None if unknown
+        """
+        with self._lock:
+            label = self._labels.get(entity_id)
+            if label is not None:
+                self._labels.move_to_end(entity_id)
+            return label
+
+    def put(self, entity_id: str, label: str):
+        """
+        Remember the label of an entity
+
+        Args:
+            entity_id: Entity identifier
+            label: Node label (entity type)
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._labels[entity_id] = label
+            self._labels.move_to_end(entity_id)
+            while len(self._labels) > self.max_size:
+                self._labels.popitem(last=False)
+
+    def discard(self, entity_id: str):
+        """Forget an entity (e.g. after deletion)"""
+        with self._lock:
+            self._labels.pop(entity_id, None)
+
+    def clear(self):
+        """Forget all entities"""
+        with self._lock:
+            self._labels.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._labels)
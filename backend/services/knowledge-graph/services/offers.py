@@ -0,0 +1,232 @@
+"""
+Offer Index
+
+In-memory (sku, region) -> offers map for checkout's hot path. Each offer is
+kept as a compact snapshot of its price, availability and validity window,
+so resolving the offers for a SKU is a dict lookup plus a filter on the
+window, without a round-trip to Neo4j. The graph services apply their own
+Offer writes to it directly and pull other writers' changes as deltas.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import threading
+import time
+
+OFFER_LABEL = "Offer"
+
+
+class OfferSnapshot(NamedTuple):
+    """Fields of an Offer needed to resolve it at checkout"""
+    id: str
+    offer_id: Optional[str]
+    sku: str
+    region: Optional[str]
+    merchant_id: Optional[str]
+    price: Optional[float]
+    currency: Optional[str]
+    availability: bool
+    stock_level: Optional[int]
+    valid_from: Optional[str]
+    valid_until: Optional[str]
+    updated_at: Optional[str]
+    # valid_from/valid_until as epoch seconds (None = open-ended)
+    starts: Optional[float]
+    ends: Optional[float]
+
+    def public(self) -> Dict[str, Any]:
+        """Snapshot as an API dict (without the parsed window)"""
+        offer = self._asdict()
+        del offer["starts"], offer["ends"]
+        return offer
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """ISO 8601 string (naive = UTC) or temporal value to epoch seconds; None if absent/invalid"""
+    if value is None:
+        return None
+    if hasattr(value, "to_native"):
+        value = value.to_native()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def snapshot(properties: Dict[str, Any], previous: Optional[OfferSnapshot] = None) -> Optional[OfferSnapshot]:
+    """
+    Build an offer snapshot from (possibly partial) node properties
+
+    Args:
+        properties: Offer node properties, or the changed subset of them
+        previous: Snapshot the changes apply to
+
+    Returns:
+        Snapshot, or None if the offer has no sku (it cannot be indexed)
+    """
+    fields = previous._asdict() if previous else {"id": properties.get("id")}
+    for field in OfferSnapshot._fields:
+        if field in properties and field not in ("starts", "ends"):
+            fields[field] = properties[field]
+    if not fields.get("sku") or fields.get("id") is None:
+        return None
+    for field in OfferSnapshot._fields:
+        fields.setdefault(field, None)
+    fields["availability"] = bool(fields["availability"])
+    fields["valid_from"] = _iso(fields["valid_from"])
+    fields["valid_until"] = _iso(fields["valid_until"])
+    fields["updated_at"] = _iso(fields["updated_at"])
+    fields["starts"] = parse_timestamp(fields["valid_from"])
+    fields["ends"] = parse_timestamp(fields["valid_until"])
+    return OfferSnapshot(**fields)
+
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+class OfferIndex:
+    """Thread-safe (sku, region) -> {offer id: snapshot} index"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._offers: Dict[str, OfferSnapshot] = {}
+        self._by_key: Dict[Tuple[str, Optional[str]], Dict[str, OfferSnapshot]] = {}
+        self._regions: Dict[str, Set[Optional[str]]] = {}
+        self.built_at: Optional[float] = None
+        self.refreshed_at: Optional[float] = None
+        # Latest updated_at seen; deltas fetch offers updated since then
+        self.watermark: Optional[str] = None
+        self._watermark_at: Optional[float] = None
+
+    @property
+    def built(self) -> bool:
+        return self.built_at is not None
+
+    @property
+    def delta_since(self) -> Optional[str]:
+        """
+        Watermark for cypher.offers_query: UTC, truncated to the second
+
+        Stored updated_at strings are compared to it as raw strings (so the
+        range index serves the delta), which holds for UTC ISO 8601 values
+        whatever their fractional digits or zone suffix.
+        """
+        if self._watermark_at is None:
+            return None
+        return datetime.fromtimestamp(self._watermark_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+    def __contains__(self, entity_id: str) -> bool:
+        with self._lock:
+            return entity_id in self._offers
+
+    def load(self, offers: Iterable[Dict[str, Any]]):
+        """Replace the index with the given Offer node properties"""
+        with self._lock:
+            self._offers, self._by_key, self._regions = {}, {}, {}
+            self.watermark = self._watermark_at = None
+            for properties in offers:
+                self._put(snapshot(properties))
+            self.built_at = self.refreshed_at = time.time()
+
+    def apply(self, offers: Iterable[Dict[str, Any]]):
+        """Upsert full Offer node properties (e.g. a delta since the watermark)"""
+        with self._lock:
+            for properties in offers:
+                self._remove(properties.get("id"))
+                self._put(snapshot(properties))
+            self.refreshed_at = time.time()
+
+    def merge(self, entity_id: str, properties: Dict[str, Any]):
+        """Apply a write's (possibly partial) properties to an offer"""
+        with self._lock:
+            previous = self._remove(entity_id)
+            self._put(snapshot({**properties, "id": entity_id}, previous))
+
+    def remove(self, entity_id: str):
+        """Drop a deleted offer"""
+        with self._lock:
+            self._remove(entity_id)
+
+    def lookup(
+        self,
+        sku: str,
+        region: Optional[str] = None,
+        at: Optional[float] = None,
+        include_unavailable: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Offers for a SKU that are valid at a point in time
+
+        Args:
+            sku: Product SKU
+            region: Region code, or None for every region
+            at: Epoch seconds to check the validity window against (default: now)
+            include_unavailable: Also return offers with availability false
+
+        Returns:
+            Offers, available first, then by price (lowest first)
+        """
+        at = time.time() if at is None else at
+        with self._lock:
+            regions = [region] if region is not None else list(self._regions.get(sku, ()))
+            offers = [
+                offer
+                for key in ((sku, region) for region in regions)
+                for offer in self._by_key.get(key, {}).values()
+                if (offer.starts is None or offer.starts <= at)
+                and (offer.ends is None or at < offer.ends)
+                and (include_unavailable or offer.availability)
+            ]
+        offers.sort(key=lambda offer: (
+            not offer.availability, offer.price is None, offer.price or 0.0, offer.id
+        ))
+        return [offer.public() for offer in offers]
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Describe the index
+
+        Returns:
+            Dict with offer and key counts, build/refresh times and watermark
+        """
+        with self._lock:
+            return {
+                "offers": len(self._offers),
+                "keys": len(self._by_key),
+                "built_at": self.built_at,
+                "refreshed_at": self.refreshed_at,
+                "watermark": self.watermark
+            }
+
+    def _put(self, offer: Optional[OfferSnapshot]):
+        """Index a snapshot (lock must be held)"""
+        if offer is None:
+            return
+        self._offers[offer.id] = offer
+        self._by_key.setdefault((offer.sku, offer.region), {})[offer.id] = offer
+        self._regions.setdefault(offer.sku, set()).add(offer.region)
+        updated_at = parse_timestamp(offer.updated_at)
+        if updated_at is not None and (self._watermark_at is None or updated_at > self._watermark_at):
+            self.watermark, self._watermark_at = offer.updated_at, updated_at
+
+    def _remove(self, entity_id: Optional[str]) -> Optional[OfferSnapshot]:
+        """Unindex an offer, returning its snapshot (lock must be held)"""
+        offer = self._offers.pop(entity_id, None)
+        if offer is None:
+            return None
+        key = (offer.sku, offer.region)
+        offers = self._by_key.get(key, {})
+        offers.pop(entity_id, None)
+        if not offers:
+            self._by_key.pop(key, None)
+            regions = self._regions.get(offer.sku, set())
+            regions.discard(offer.region)
+            if not regions:
+                self._regions.pop(offer.sku, None)
+        return offer
@@ -0,0 +1,310 @@
+"""
+Graph Projection
+
+In-memory snapshot of the graph for analytics. Entity ids are interned to
+dense integers and relationships are stored as NumPy CSR adjacency arrays,
+so PageRank, degree and co-occurrence similarity run as vectorized array
+operations without touching Neo4j.
+"""
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+import numpy as np
+from .cypher import ENTITY_TYPES
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6
+DEGREE_DIRECTIONS = ("both", "out", "in")
+
+
+def _csr(sources: np.ndarray, targets: np.ndarray, node_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR (indptr, indices) for edges given as parallel source/target arrays"""
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr, targets[order]
+
+
+class ProjectionBuilder:
+    """Accumulates nodes and relationships streamed from Neo4j"""
+
+    def __init__(self, generation: int = 0):
+        """
+        Initialize builder
+
+        Args:
+            generation: Service write generation the snapshot reflects
+        """
+        self.generation = generation
+        self.started = time.perf_counter()
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.label_names: List[str] = []
+        self._label_codes: Dict[str, int] = {}
+        self._labels = array("h")
+        self._sources = array("q")
+        self._targets = array("q")
+        self.dropped = 0
+
+    def add_node(self, entity_id: str, label: str):
+        """Intern an entity; ids seen before keep their first label"""
+        if entity_id is None or entity_id in self.index:
+            return
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.label_names)
+            self.label_names.append(label)
+        self.index[entity_id] = len(self.ids)
+        self.ids.append(entity_id)
+        self._labels.append(code)
+
+    def add_relationship(self, source_id: str, target_id: str):
+        """Record a relationship; endpoints must already be interned"""
+        source = self.index.get(source_id)
+        target = self.index.get(target_id)
+        if source is None or target is None:
+            self.dropped += 1
+            return
+        self._sources.append(source)
+        self._targets.append(target)
+
+    def build(self) -> "GraphProjection":
+        """Freeze the accumulated graph into CSR arrays"""
+        return GraphProjection(
+            ids=self.ids,
+            index=self.index,
+            label_names=self.label_names,
+            labels=np.frombuffer(self._labels, dtype=np.int16).copy(),
+            sources=np.frombuffer(self._sources, dtype=np.int64).copy(),
+            targets=np.frombuffer(self._targets, dtype=np.int64).copy(),
+            generation=self.generation,
+            build_seconds=time.perf_counter() - self.started,
+            dropped_relationships=self.dropped
+        )
+
+
+class GraphProjection:
+    """Immutable CSR snapshot of the graph with vectorized analytics"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        index: Dict[str, int],
+        label_names: List[str],
+        labels: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        generation: int = 0,
+        build_seconds: float = 0.0,
+        dropped_relationships: int = 0
+    ):
+        """
+        Build CSR adjacency from interned relationships
+
+        Args:
+            ids: Entity id per node index
+            index: Entity id -> node index
+            label_names: Label per label code
+            labels: Label code per node index
+            sources: Source node index per relationship
+            targets: Target node index per relationship
+            generation: Service write generation the snapshot reflects
+            build_seconds: Time spent loading and building the snapshot
+            dropped_relationships: Relationships whose endpoints had no entity id
+        """
+        node_count = len(ids)
+        self.ids = ids
+        self.index = index
+        self.label_names = label_names
+        self.labels = labels
+        self.node_count = node_count
+        self.relationship_count = int(sources.size)
+        self.generation = generation
+        self.built_at = time.time()
+        self.build_seconds = build_seconds
+        self.dropped_relationships = dropped_relationships
+
+        # Directed adjacency, one entry per relationship (degree counts)
+        self.out_indptr, self.out_indices = _csr(sources, targets, node_count)
+        self.in_degree = np.bincount(targets, minlength=node_count)
+        self.out_degree = np.diff(self.out_indptr)
+
+        # Undirected adjacency without parallel edges or self-loops
+        # (PageRank and co-occurrence)
+        both_sources = np.concatenate([sources, targets])
+        both_targets = np.concatenate([targets, sources])
+        keep = both_sources != both_targets
+        pairs = np.unique(both_sources[keep] * max(node_count, 1) + both_targets[keep])
+        und_sources = pairs // max(node_count, 1)
+        self.und_indptr, self.und_indices = _csr(und_sources, pairs % max(node_count, 1), node_count)
+        self.neighbor_count = np.diff(self.und_indptr)
+
+        self._pagerank: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def info(self) -> Dict[str, Any]:
+        """
+        Describe the snapshot
+
+        Returns:
+            Dict with node/relationship counts, build time and age
+        """
+        return {
+            "nodes": self.node_count,
+            "relationships": self.relationship_count,
+            "dropped_relationships": self.dropped_relationships,
+            "built_at": self.built_at,
+            "age_seconds": time.time() - self.built_at,
+            "build_seconds": self.build_seconds
+        }
+
+    def pagerank(
+        self,
+        entity_type: Optional[str] = None,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Highest-ranked entities by PageRank over the undirected graph
+
+        Scores are computed once per snapshot by power iteration and reused.
+
+        Args:
+            entity_type: Optional label to rank within
+            limit: Number of entities to return
+
+        Returns:
+            List of {id, type, score}, best first
+
+        Raises:
+            ValueError: If entity_type is invalid
+        """
+        with self._lock:
+            if self._pagerank is None:
+                self._pagerank = self._compute_pagerank()
+        return [
+            {"id": self.ids[i], "type": self.label_names[self.labels[i]], "score": float(self._pagerank[i])}
+            for i in self._top(self._pagerank, entity_type, limit)
+        ]
+
+    def degree(
+        self,
+        entity_type: Optional[str] = None,
+        direction: str = "both",
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Entities with the most relationships
+
+        Args:
+            entity_type: Optional label to rank within
+            direction: 'out', 'in' or 'both'
+            limit: Number of entities to return
+
+        Returns:
+            List of {id, type, degree}, highest first
+
+        Raises:
+            ValueError: If entity_type or direction is invalid
+        """
+        if direction not in DEGREE_DIRECTIONS:
+            raise ValueError(f"Invalid direction: {direction}. Must be one of {DEGREE_DIRECTIONS}")
+        if direction == "out":
+            degrees = self.out_degree
+        elif direction == "in":
+            degrees = self.in_degree
+        else:
+            degrees = self.out_degree + self.in_degree
+        return [
+            {"id": self.ids[i], "type": self.label_names[self.labels[i]], "degree": int(degrees[i])}
+            for i in self._top(degrees, entity_type, limit)
+        ]
+
+    def similar(
+        self,
+        entity_id: str,
+        entity_type: Optional[str] = None,
+        limit: int = 20
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Entities sharing the most neighbours with entity_id (co-occurrence)
+
+        For a feature this is the features found on the same products; for a
+        product, the products sharing its features, problems and scenarios.
+
+        Args:
+            entity_id: Entity to compare against
+            entity_type: Label of candidates (default: the entity's own label)
+            limit: Number of entities to return
+
+        Returns:
+            List of {id, type, shared, jaccard}, most shared first, or None if
+            the entity is not in the snapshot
+
+        Raises:
+            ValueError: If entity_type is invalid
+        """
+        node = self.index.get(entity_id)
+        if node is None:
+            return None
+
+        # Gather the neighbour lists of every neighbour in one vectorized pass
+        neighbors = self.und_indices[self.und_indptr[node]:self.und_indptr[node + 1]]
+        starts = self.und_indptr[neighbors]
+        lengths = self.und_indptr[neighbors + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        second_hop = self.und_indices[offsets + np.arange(lengths.sum())]
+
+        shared = np.bincount(second_hop, minlength=self.node_count)
+        shared[node] = 0
+        union = self.neighbor_count[node] + self.neighbor_count - shared
+        jaccard = np.divide(shared, union, out=np.zeros(self.node_count), where=union > 0)
+
+        label = entity_type or self.label_names[self.labels[node]]
+        # Rank by shared neighbours, breaking ties by Jaccard
+        score = shared + jaccard / 2
+        return [
+            {
+                "id": self.ids[i],
+                "type": self.label_names[self.labels[i]],
+                "shared": int(shared[i]),
+                "jaccard": float(jaccard[i])
+            }
+            for i in self._top(score, label, limit)
+            if shared[i] > 0
+        ]
+
+    def _compute_pagerank(self) -> np.ndarray:
+        """Power iteration; dangling nodes spread their rank uniformly"""
+        n = self.node_count
+        if n == 0:
+            return np.zeros(0)
+        degree = self.neighbor_count.astype(np.float64)
+        dangling = degree == 0
+        rank = np.full(n, 1.0 / n)
+        for _ in range(PAGERANK_MAX_ITERATIONS):
+            share = np.divide(rank, degree, out=np.zeros(n), where=~dangling)
+            updated = np.bincount(
+                self.und_indices, weights=np.repeat(share, self.neighbor_count), minlength=n
+            )
+            updated = PAGERANK_DAMPING * (updated + rank[dangling].sum() / n) + (1 - PAGERANK_DAMPING) / n
+            converged = np.abs(updated - rank).sum() < PAGERANK_TOLERANCE
+            rank = updated
+            if converged:
+                break
+        return rank
+
+    def _top(self, scores: np.ndarray, entity_type: Optional[str], limit: int) -> np.ndarray:
+        """Indices of the `limit` highest scores, optionally within one label"""
+        if entity_type and entity_type not in ENTITY_TYPES:
+            raise ValueError(f"Invalid entity type: {entity_type}")
+        if entity_type is None:
+            candidates = np.arange(self.node_count)
+        elif entity_type in self.label_names:
+            candidates = np.flatnonzero(self.labels == self.label_names.index(entity_type))
+        else:
+            return np.zeros(0, dtype=np.int64)
+        if limit < candidates.size:
+            candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -0,0 +1,165 @@
+"""
+Read-Through Cache
+
+Bounded, TTL-limited LRU for entity and relationship reads. Entries are
+tagged with the entity ids they contain so writes can invalidate exactly the
+entries they affect instead of flushing everything.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+import threading
+import time
+
+MISSING = object()
+
+
+class ReadCache:
+    """Thread-safe, size- and TTL-bounded LRU with tag-based invalidation"""
+
+    def __init__(self, max_size: int = 50000, ttl_seconds: float = 60.0):
+        """
+        Initialize cache
+
+        Args:
+            max_size: Maximum number of entries; least recently used are evicted.
+                0 disables caching.
+            ttl_seconds: Seconds an entry stays valid after it is stored
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, value, tags)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def version(self) -> int:
+        """
+        Current invalidation version
+
+        Take it before reading from the database and pass it to put(): if any
+        invalidation happened in between, the (possibly stale) value is not stored.
+        """
+        with self._lock:
+            return self._version
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Look up an entry
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or MISSING if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[str] = (),
+        version: Optional[int] = None
+    ):
+        """
+        Store an entry
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            tags: Entity ids the value depends on (see invalidate)
+            version: Result of version() taken before the value was read;
+                the value is dropped if an invalidation happened since
+        """
+        if not self.enabled:
+            return
+        tags = tuple(set(tags))
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags: str):
+        """Drop every entry tagged with any of the given entity ids"""
+        with self._lock:
+            self._version += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Report cache effectiveness
+
+        Returns:
+            Dict with hit/miss counters, hit ratio, size and removal counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+    def _remove(self, key: Hashable):
+        """Remove an entry and its tag references (lock must be held)"""
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
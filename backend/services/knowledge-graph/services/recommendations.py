@@ -0,0 +1,196 @@
+"""
+Recommendation Index
+
+Materialized answers to "which products solve problem X for user group Y in
+scenario Z". Every combination of a product's problems (SOLVES), user groups
+(TARGETS) and scenarios (APPLIES_TO), with any of the three left open, maps
+to a list of products kept sorted by score, so a lookup is a dict access and
+a slice. The graph services keep it current on relationship writes.
+"""
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import itertools
+import threading
+import time
+
+# Relationship type -> (facet, weight property)
+RECOMMENDATION_FACETS = {
+    "SOLVES": ("problem", "effectiveness"),
+    "TARGETS": ("user_group", "priority"),
+    "APPLIES_TO": ("scenario", "relevance")
+}
+
+Key = Tuple[Optional[str], Optional[str], Optional[str]]
+Facets = Dict[str, Dict[str, float]]
+
+
+def facet_weight(rel_type: str, properties: Dict[str, Any]) -> float:
+    """Score contribution of one relationship (TARGETS priority 1 is best)"""
+    facet, prop = RECOMMENDATION_FACETS[rel_type]
+    value = properties.get(prop)
+    if facet == "user_group":
+        return 1.0 / max(float(value or 1), 1.0)
+    return float(value if value is not None else 1.0)
+
+
+def facets_from_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Facets]:
+    """
+    Group relationship rows by product
+
+    Args:
+        rows: {"product_id", "type", "target_id", "properties"} records
+
+    Returns:
+        Dict of product id -> facet -> target id -> weight
+    """
+    products: Dict[str, Facets] = {}
+    for row in rows:
+        if row["type"] not in RECOMMENDATION_FACETS or row["target_id"] is None:
+            continue
+        facet, _ = RECOMMENDATION_FACETS[row["type"]]
+        facets = products.setdefault(row["product_id"], {})
+        facets.setdefault(facet, {})[row["target_id"]] = facet_weight(
+            row["type"], row.get("properties") or {}
+        )
+    return products
+
+
+def _entries(facets: Facets) -> List[Tuple[Key, float]]:
+    """Every (problem, user_group, scenario) key a product is listed under, with its score"""
+    options = [
+        [(None, 1.0)] + list(facets.get(facet, {}).items())
+        for facet in ("problem", "user_group", "scenario")
+    ]
+    entries = []
+    for (problem, w1), (group, w2), (scenario, w3) in itertools.product(*options):
+        if problem is None and group is None and scenario is None:
+            continue
+        entries.append(((problem, group, scenario), w1 * w2 * w3))
+    return entries
+
+
+class RecommendationIndex:
+    """Thread-safe (problem, user group, scenario) -> ranked products index"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._facets: Dict[str, Facets] = {}
+        self._entries: Dict[str, List[Tuple[Key, float]]] = {}
+        self._by_target: Dict[str, Set[str]] = {}
+        # key -> [(-score, product_id)], ascending = best first
+        self._ranked: Dict[Key, List[Tuple[float, str]]] = {}
+        self.built_at: Optional[float] = None
+        self.stale = False
+
+    @property
+    def built(self) -> bool:
+        return self.built_at is not None
+
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """Replace the index with the given relationship rows (see facets_from_rows)"""
+        products = facets_from_rows(rows)
+        with self._lock:
+            self._facets, self._entries, self._by_target, self._ranked = {}, {}, {}, {}
+            for product_id, facets in products.items():
+                self._set(product_id, facets, keep_sorted=False)
+            for ranked in self._ranked.values():
+                ranked.sort()
+            self.built_at = time.time()
+            self.stale = False
+
+    def update_products(self, product_ids: Iterable[str], rows: Iterable[Dict[str, Any]]):
+        """
+        Re-index products from their current relationships
+
+        Args:
+            product_ids: Products whose relationships changed
+            rows: Current relationship rows of those products; products without
+                rows are removed
+        """
+        products = facets_from_rows(rows)
+        with self._lock:
+            for product_id in set(product_ids):
+                self._set(product_id, products.get(product_id, {}))
+
+    def remove_entity(self, entity_id: str):
+        """Drop a deleted product, or a deleted problem/user group/scenario from every product"""
+        with self._lock:
+            self._set(entity_id, {})
+            for product_id in self._by_target.pop(entity_id, set()):
+                facets = {
+                    facet: {target: weight for target, weight in targets.items() if target != entity_id}
+                    for facet, targets in self._facets.get(product_id, {}).items()
+                }
+                self._set(product_id, facets)
+
+    def lookup(
+        self,
+        problem: Optional[str] = None,
+        user_group: Optional[str] = None,
+        scenario: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Ranked products for a (problem, user group, scenario) combination
+
+        Args:
+            problem: Problem id, or None for any
+            user_group: UserGroup id, or None for any
+            scenario: Scenario id, or None for any
+            limit: Maximum products to return
+
+        Returns:
+            Tuple of ([{"product_id", "score"}] best first, total matches)
+        """
+        with self._lock:
+            ranked = self._ranked.get((problem, user_group, scenario), [])
+            top, total = ranked[:limit], len(ranked)
+        return [{"product_id": product_id, "score": -score} for score, product_id in top], total
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Describe the index
+
+        Returns:
+            Dict with product and key counts, build time, age and stale flag
+        """
+        with self._lock:
+            return {
+                "products": len(self._facets),
+                "keys": len(self._ranked),
+                "built_at": self.built_at,
+                "age_seconds": time.time() - self.built_at if self.built else None,
+                "stale": self.stale
+            }
+
+    def _set(self, product_id: str, facets: Facets, keep_sorted: bool = True):
+        """Replace a product's entries (lock must be held; bulk loads sort afterwards)"""
+        for key, score in self._entries.pop(product_id, ()):
+            ranked = self._ranked[key]
+            position = bisect_left(ranked, (-score, product_id))
+            if position < len(ranked) and ranked[position] == (-score, product_id):
+                del ranked[position]
+            if not ranked:
+                del self._ranked[key]
+        for targets in self._facets.pop(product_id, {}).values():
+            for target in targets:
+                products = self._by_target.get(target)
+                if products is not None:
+                    products.discard(product_id)
+                    if not products:
+                        del self._by_target[target]
+
+        facets = {facet: targets for facet, targets in facets.items() if targets}
+        if not facets:
+            return
+        self._facets[product_id] = facets
+        self._entries[product_id] = entries = _entries(facets)
+        for key, score in entries:
+            ranked = self._ranked.setdefault(key, [])
+            if keep_sorted:
+                insort(ranked, (-score, product_id))
+            else:
+                ranked.append((-score, product_id))
+        for targets in facets.values():
+            for target in targets:
+                self._by_target.setdefault(target, set()).add(product_id)
@@ -0,0 +1,319 @@
+"""
+Entity Resolution
+
+Fuzzy matching of surface strings ("Gel Memory-Foam") to existing entities
+by name. Names are normalized and split into character trigrams, and each
+label keeps an inverted index from trigram to the entities containing it.
+Scores are trigram Jaccard similarity, as in PostgreSQL's pg_trgm.
+
+Entities are numbered in order of trigram count, and both the postings
+(trigram -> entities) and each entity's trigrams are stored as flat CSR
+arrays, so every posting is sorted by name length. A query then:
+
+- keeps to the entities whose trigram count can reach min_score at all;
+- gathers candidates only from its rarest trigrams (an entity reaching
+  min_score shares at least ceil(min_score * n) of the query's n trigrams,
+  so it occurs in one of the n - ceil(min_score * n) + 1 rarest postings).
+  When a posting exceeds the candidate budget, the names closest in length
+  to the query, which can score highest, are taken first;
+- counts every candidate's shared trigrams in one vectorized gather over
+  the candidates' trigram lists.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from array import array
+import math
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+from .cypher import ENTITY_TYPES
+
+RESOLUTION_MIN_SCORE = 0.3
+# Candidates scored per label and query; larger postings only contribute
+# the names closest in length to the query, trading exactness for latency
+RESOLUTION_MAX_CANDIDATES = 1024
+
+_SEPARATORS = re.compile(r"[\W_]+")
+_NO_POSITIONS = np.zeros(0, dtype=np.int32)
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation and whitespace to single spaces"""
+    if not text.isascii():
+        text = "".join(
+            char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)
+        )
+    return _SEPARATORS.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each normalized word, padded like pg_trgm ('  w', ' wo', ..., 'rd ')"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + length) for each (start, length) pair"""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class TrigramIndex:
+    """Trigram postings over the names of one label's entities"""
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = ()):
+        """
+        Build the index
+
+        Args:
+            entries: (entity id, name) pairs; names without trigrams and
+                repeated ids are skipped
+        """
+        self._lock = threading.Lock()
+        gram_ids: Dict[str, int] = {}
+        flat, sizes = array("i"), array("i")
+        ids, names, seen = [], [], set()
+        for entity_id, name in entries:
+            grams = trigrams(name) if isinstance(name, str) else ()
+            if not grams or entity_id in seen:
+                continue
+            seen.add(entity_id)
+            ids.append(entity_id)
+            names.append(name)
+            sizes.append(len(grams))
+            flat.extend([gram_ids.setdefault(gram, len(gram_ids)) for gram in grams])
+
+        # Renumber entities by trigram count
+        sizes = np.array(sizes, dtype=np.int64)
+        grams = np.array(flat, dtype=np.int32)
+        order = np.argsort(sizes, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        self._gram_ids = gram_ids
+        self._sizes = sizes[order]
+        self._ids = [ids[i] for i in order]
+        self._names = [names[i] for i in order]
+        self._positions = {entity_id: position for position, entity_id in enumerate(self._ids)}
+        self._built = len(self._ids)
+
+        # Each entity's trigrams, in the new order
+        self._entity_offsets = np.zeros(self._built + 1, dtype=np.int64)
+        np.cumsum(self._sizes, out=self._entity_offsets[1:])
+        input_offsets = np.cumsum(sizes) - sizes
+        self._entity_grams = grams[_ranges(input_offsets[order], self._sizes)]
+
+        # Postings: positions grouped by trigram, ascending within each group
+        keys = grams.astype(np.int64) << 32
+        keys |= np.repeat(rank, sizes)
+        keys.sort()
+        self._postings = (keys & 0xFFFFFFFF).astype(np.int32)
+        self._posting_offsets = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys >> 32, minlength=len(gram_ids)), out=self._posting_offsets[1:])
+
+        # Entities added since the build, scored with plain dicts, and
+        # positions (built or added) that were removed or renamed
+        self._added: Dict[str, Set[int]] = {}
+        self._added_sizes: Dict[int, int] = {}
+        self._removed: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._positions
+
+    def add(self, entity_id: str, name: str):
+        """Index a new entity, or the new name of an existing one"""
+        grams = trigrams(name) if isinstance(name, str) else set()
+        with self._lock:
+            self._remove(entity_id)
+            if not grams:
+                return
+            position = len(self._ids)
+            self._ids.append(entity_id)
+            self._names.append(name)
+            self._positions[entity_id] = position
+            self._added_sizes[position] = len(grams)
+            for gram in grams:
+                self._added.setdefault(gram, set()).add(position)
+
+    def remove(self, entity_id: str):
+        """Drop a deleted entity"""
+        with self._lock:
+            self._remove(entity_id)
+
+    def search(self, grams: Set[str], limit: int, min_score: float) -> List[Tuple[float, str, str]]:
+        """
+        Entities whose names are most similar to a query
+
+        Args:
+            grams: Trigrams of the query (see trigrams())
+            limit: Maximum matches
+            min_score: Minimum Jaccard similarity
+
+        Returns:
+            (score, entity id, name) tuples, best first
+        """
+        with self._lock:
+            matches = self._search_built(grams, limit, min_score)
+            size = len(grams)
+            shared: Dict[int, int] = {}
+            for gram in grams:
+                for position in self._added.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            for position, count in shared.items():
+                score = count / (size + self._added_sizes[position] - count)
+                if score >= min_score:
+                    matches.append((score, position))
+            matches.sort(key=lambda match: (-match[0], self._names[match[1]]))
+            return [(score, self._ids[position], self._names[position]) for score, position in matches[:limit]]
+
+    def _posting(self, gram_id: Optional[int]) -> np.ndarray:
+        """Built positions containing a trigram, ascending (i.e. shortest names first)"""
+        if gram_id is None:
+            return _NO_POSITIONS
+        return self._postings[self._posting_offsets[gram_id]:self._posting_offsets[gram_id + 1]]
+
+    def _search_built(self, grams: Set[str], limit: int, min_score: float) -> List[Tuple[float, int]]:
+        """Score the built part of the index (lock must be held)"""
+        size = len(grams)
+        needed = max(1, math.ceil(min_score * size - 1e-9))
+        # Jaccard >= min_score needs min_score * size <= |name| <= size / min_score
+        longest = math.floor(size / min_score + 1e-9) if min_score > 0 else np.iinfo(np.int64).max
+        low, middle = np.searchsorted(self._sizes, np.array((needed, size), dtype=np.int64))
+        high = np.searchsorted(self._sizes, np.int64(longest), side="right")
+        bounds = np.array((low, middle, high), dtype=np.int32)
+        gram_ids = [self._gram_ids.get(gram) for gram in grams]
+        gram_ids.sort(key=lambda gram_id: -1 if gram_id is None else (
+            self._posting_offsets[gram_id + 1] - self._posting_offsets[gram_id]
+        ))
+
+        prefix, budget = [], RESOLUTION_MAX_CANDIDATES
+        for gram_id in gram_ids[:size - needed + 1]:
+            posting = self._posting(gram_id)
+            start, center, stop = np.searchsorted(posting, bounds)
+            if stop - start > budget:
+                # Keep the names closest in length to the query
+                start = min(max(start, center - budget // 2), stop - budget)
+                stop = start + budget
+            prefix.append(posting[start:stop])
+            budget -= stop - start
+            if budget <= 0:
+                break
+        candidates = np.unique(np.concatenate(prefix)) if prefix else _NO_POSITIONS
+        if not len(candidates):
+            return []
+
+        query = np.zeros(len(self._gram_ids), dtype=bool)
+        query[[gram_id for gram_id in gram_ids if gram_id is not None]] = True
+        lengths = self._sizes[candidates]
+        hits = query[self._entity_grams[_ranges(self._entity_offsets[candidates], lengths)]]
+        shared = np.add.reduceat(hits, np.cumsum(lengths) - lengths, dtype=np.int64)
+        scores = shared / (size + lengths - shared)
+        keep = scores >= min_score
+        if self._removed:
+            keep &= ~np.isin(candidates, np.fromiter(self._removed, dtype=np.int32))
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        return [(float(score), int(position)) for score, position in zip(scores, candidates)]
+
+    def _remove(self, entity_id: str):
+        """Tombstone an entity's position (lock must be held)"""
+        position = self._positions.pop(entity_id, None)
+        if position is None:
+            return
+        if position < self._built:
+            self._removed.add(position)
+            return
+        for gram in trigrams(self._names[position]):
+            self._added[gram].discard(position)
+        del self._added_sizes[position]
+
+
+class EntityResolver:
+    """Per-label trigram indexes over entity names"""
+
+    def __init__(self, names: Dict[str, Iterable[Tuple[str, str]]]):
+        """
+        Build the indexes
+
+        Args:
+            names: Label -> (entity id, name) pairs
+        """
+        started = time.time()
+        self._indexes = {label: TrigramIndex(entries) for label, entries in names.items()}
+        self.built_at = time.time()
+        self.build_seconds = self.built_at - started
+
+    def add(self, label: Optional[str], entity_id: str, name: str):
+        """
+        Index a created or renamed entity
+
+        Args:
+            label: Entity type, or None to look it up among indexed entities
+            entity_id: Entity identifier
+            name: New name
+        """
+        if label is None:
+            label = next((known for known, index in self._indexes.items() if entity_id in index), None)
+        if label not in ENTITY_TYPES:
+            return
+        self._indexes.setdefault(label, TrigramIndex()).add(entity_id, name)
+
+    def remove(self, entity_id: str):
+        """Drop a deleted entity"""
+        for index in self._indexes.values():
+            index.remove(entity_id)
+
+    def resolve(
+        self,
+        name: str,
+        entity_type: Optional[str] = None,
+        limit: int = 5,
+        min_score: float = RESOLUTION_MIN_SCORE
+    ) -> List[Dict[str, Any]]:
+        """
+        Best matching entities for a surface string
+
+        Args:
+            name: Surface string to resolve
+            entity_type: Optional label to search; all labels if omitted
+            limit: Maximum candidates
+            min_score: Minimum trigram similarity (0-1)
+
+        Returns:
+            Candidates ({"id", "entity_type", "name", "score"}), best first
+        """
+        grams = trigrams(name)
+        if not grams:
+            return []
+        labels = [entity_type] if entity_type else list(self._indexes)
+        candidates = [
+            {"id": entity_id, "entity_type": label, "name": match, "score": score}
+            for label in labels if label in self._indexes
+            for score, entity_id, match in self._indexes[label].search(grams, limit, min_score)
+        ]
+        candidates.sort(key=lambda candidate: (-candidate["score"], candidate["name"], candidate["id"]))
+        return candidates[:limit]
+
+    def info(self) -> Dict[str, Any]:
+        """
+        Describe the indexes
+
+        Returns:
+            Dict with entity counts (total and per label), build time and age
+        """
+        labels = {label: len(index) for label, index in self._indexes.items()}
+        return {
+            "entities": sum(labels.values()),
+            "labels": labels,
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+            "age_seconds": time.time() - self.built_at
+        }
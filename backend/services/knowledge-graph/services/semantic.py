@@ -0,0 +1,438 @@
+"""
+Semantic Search
+
+Local vector search over entity names and descriptions. Text is split into
+normalized words (plural 's' folded), weighted by sublinear TF-IDF and
+folded into a fixed number of dimensions with the signed hashing trick, so
+each entity becomes one L2-normalized row of a float32 matrix and cosine
+similarity is a matrix-vector product. Nothing is downloaded: IDF weights
+come from the indexed entities themselves, and words first seen after the
+build weigh as much as the rarest indexed ones.
+
+Every label has its own matrix. Labels with many entities are also split
+into an inverted file (IVF): rows are clustered with spherical k-means and
+stored grouped by cluster, and a query only scores the clusters whose
+centroids are closest to it. Results for those labels are approximate, in
+exchange for scanning a few percent of the rows.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from array import array
+import math
+import threading
+import time
+import zlib
+import numpy as np
+from .cypher import ENTITY_TYPES
+from .resolution import normalize
+
+SEMANTIC_DIMENSIONS = 256
+# Labels with at least this many entities get an IVF (0 disables it)
+SEMANTIC_IVF_MIN_ENTITIES = 50000
+SEMANTIC_IVF_PROBES = 32
+
+# Name words count this many times as often as description words
+_NAME_WEIGHT = 2
+_KMEANS_ITERATIONS = 8
+_KMEANS_SAMPLE_PER_CLUSTER = 40
+# Rows scored (or assigned to clusters) per matrix product while building
+_CHUNK_ROWS = 65536
+
+
+def _words(text: Any) -> List[str]:
+    return normalize(text).split() if isinstance(text, str) else []
+
+
+def _stem(word: str) -> str:
+    """Fold a plural 's' ('pillows' -> 'pillow')"""
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def tokens(text: Any) -> List[str]:
+    """Normalized, stemmed words of a text"""
+    return [_stem(word) for word in _words(text)]
+
+
+def document_tokens(name: Any, description: Any) -> List[str]:
+    """Tokens embedded for an entity: its name's (weighted up) and its description's"""
+    return tokens(name) * _NAME_WEIGHT + tokens(description)
+
+
+class _Vocabulary(dict):
+    """Normalized word -> feature id of its stem, numbering new stems as they appear"""
+
+    def __init__(self):
+        super().__init__()
+        self.features: Dict[str, int] = {}
+
+    def __missing__(self, word: str) -> int:
+        feature = self[word] = self.features.setdefault(_stem(word), len(self.features))
+        return feature
+
+
+def _hash(token: str, dimensions: int) -> Tuple[int, float]:
+    """Dimension and sign a token is folded into"""
+    digest = zlib.crc32(token.encode("utf-8"))
+    return digest % dimensions, (1.0 if digest & 0x80000000 else -1.0)
+
+
+def _kmeans(matrix: np.ndarray, clusters: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over the rows of a normalized matrix
+
+    Centroids are trained on a sample, then every row is assigned.
+
+    Returns:
+        (centroids, cluster of each row)
+    """
+    rng = np.random.default_rng(0)
+    rows = len(matrix)
+    sample = matrix[np.sort(rng.choice(rows, min(rows, clusters * _KMEANS_SAMPLE_PER_CLUSTER), replace=False))]
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        members = np.bincount(assignment, minlength=clusters)
+        filled = np.flatnonzero(members)
+        starts = np.cumsum(members) - members
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids[filled] = sums / norms
+    assignment = np.concatenate([
+        np.argmax(matrix[start:start + _CHUNK_ROWS] @ centroids.T, axis=1)
+        for start in range(0, rows, _CHUNK_ROWS)
+    ])
+    return centroids, assignment
+
+
+class LabelVectors:
+    """Entity vectors of one label, optionally grouped into IVF clusters"""
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        ids: List[str],
+        names: List[Optional[str]],
+        clusters: int = 0,
+        probes: int = SEMANTIC_IVF_PROBES
+    ):
+        """
+        Index the vectors
+
+        Args:
+            matrix: L2-normalized float32 rows, one per entity
+            ids: Entity id of each row
+            names: Entity name of each row
+            clusters: IVF clusters (0 = score every row)
+            probes: Clusters scored per query
+        """
+        self._lock = threading.Lock()
+        self._centroids, self._offsets = None, None
+        if clusters > 1 and len(matrix) > clusters:
+            self._centroids, assignment = _kmeans(matrix, clusters)
+            order = np.argsort(assignment, kind="stable")
+            matrix = matrix[order]
+            ids = [ids[i] for i in order]
+            names = [names[i] for i in order]
+            self._offsets = np.zeros(clusters + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignment, minlength=clusters), out=self._offsets[1:])
+        self.probes = probes
+        self._matrix = matrix
+        self._ids = ids
+        self._names = names
+        self._positions = {entity_id: position for position, entity_id in enumerate(ids)}
+        self._built = len(ids)
+        self._alive = np.ones(self._built, dtype=bool)
+        # Vectors added since the build, scored by brute force
+        self._added: Dict[int, np.ndarray] = {}
+        self._added_matrix: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._positions
+
+    @property
+    def clusters(self) -> int:
+        return 0 if self._centroids is None else len(self._centroids)
+
+    def name(self, entity_id: str) -> Optional[str]:
+        """Indexed name of an entity"""
+        position = self._positions.get(entity_id)
+        return None if position is None else self._names[position]
+
+    def add(self, entity_id: str, name: Optional[str], vector: np.ndarray):
+        """Index a new entity, or the new vector of an existing one"""
+        with self._lock:
+            self._remove(entity_id)
+            position = len(self._ids)
+            self._ids.append(entity_id)
+            self._names.append(name)
+            self._positions[entity_id] = position
+            self._added[position] = vector
+            self._added_matrix = None
+
+    def rename(self, entity_id: str, name: str):
+        """Change the name reported for an entity, keeping its vector"""
+        with self._lock:
+            position = self._positions.get(entity_id)
+            if position is not None:
+                self._names[position] = name
+
+    def remove(self, entity_id: str):
+        """Drop a deleted entity"""
+        with self._lock:
+            self._remove(entity_id)
+
+    def search(self, query: np.ndarray, limit: int, min_score: float) -> List[Tuple[float, str, Optional[str]]]:
+        """
+        Entities whose vectors are closest to a query
+
+        Args:
+            query: L2-normalized query vector
+            limit: Maximum matches
+            min_score: Minimum cosine similarity
+
+        Returns:
+            (score, entity id, name) tuples, best first
+        """
+        with self._lock:
+            if self._centroids is None:
+                blocks = [(0, self._built)] if self._built else []
+            else:
+                probes = min(self.probes, len(self._centroids))
+                nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+                blocks = [(self._offsets[cluster], self._offsets[cluster + 1]) for cluster in nearest]
+            scores = [self._matrix[start:stop] @ query for start, stop in blocks]
+            positions = [np.arange(start, stop) for start, stop in blocks]
+            if self._added:
+                if self._added_matrix is None:
+                    added = np.fromiter(self._added, dtype=np.int64, count=len(self._added))
+                    self._added_matrix = (added, np.stack([self._added[position] for position in added]))
+                added, vectors = self._added_matrix
+                scores.append(vectors @ query)
+                positions.append(added)
+            if not scores:
+                return []
+            scores, positions = np.concatenate(scores), np.concatenate(positions)
+            keep = (scores >= min_score) & (scores > 0)
+            built = positions < self._built
+            keep[built] &= self._alive[positions[built]]
+            scores, positions = scores[keep], positions[keep]
+            if len(scores) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                scores, positions = scores[top], positions[top]
+            matches = [
+                (float(score), self._ids[position], self._names[position])
+                for score, position in zip(scores, positions.tolist())
+            ]
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return matches
+
+    def _remove(self, entity_id: str):
+        """Tombstone an entity's position (lock must be held)"""
+        position = self._positions.pop(entity_id, None)
+        if position is None:
+            return
+        if position < self._built:
+            self._alive[position] = False
+        else:
+            del self._added[position]
+            self._added_matrix = None
+
+
+class SemanticIndex:
+    """Hashed TF-IDF vectors of entity names and descriptions, per label"""
+
+    def __init__(
+        self,
+        documents: Dict[str, Iterable[Tuple[str, Optional[str], Optional[str]]]],
+        dimensions: int = SEMANTIC_DIMENSIONS,
+        ivf_min_entities: int = SEMANTIC_IVF_MIN_ENTITIES,
+        ivf_probes: int = SEMANTIC_IVF_PROBES
+    ):
+        """
+        Fit the vectorizer and build the per-label matrices
+
+        Args:
+            documents: Label -> (entity id, name, description) triples;
+                entities without text and repeated ids are skipped
+            dimensions: Vector dimensions
+            ivf_min_entities: Labels with at least this many entities are
+                clustered into about sqrt(count) IVF lists (0 disables)
+            ivf_probes: IVF lists scored per query
+        """
+        started = time.time()
+        self.dimensions = dimensions
+        self.ivf_probes = ivf_probes
+        vocabulary = _Vocabulary()
+        flat, lengths = array("i"), array("i")
+        groups: List[Tuple[str, List[str], List[Optional[str]]]] = []
+        for label, entries in documents.items():
+            ids, names, seen = [], [], set()
+            for entity_id, name, description in entries:
+                name_words, description_words = _words(name), _words(description)
+                if not (name_words or description_words) or entity_id in seen:
+                    continue
+                seen.add(entity_id)
+                ids.append(entity_id)
+                names.append(name)
+                lengths.append(len(name_words) * _NAME_WEIGHT + len(description_words))
+                flat.extend([vocabulary[word] for word in name_words] * _NAME_WEIGHT)
+                flat.extend([vocabulary[word] for word in description_words])
+            groups.append((label, ids, names))
+
+        # Term frequency of each (entity, word) pair, then document frequency
+        count = len(lengths)
+        lengths = np.array(lengths, dtype=np.int64)
+        keys = np.repeat(np.arange(count, dtype=np.int64), lengths) << 32
+        keys |= np.array(flat, dtype=np.int64)
+        keys, frequencies = np.unique(keys, return_counts=True)
+        rows, features = keys >> 32, keys & 0xFFFFFFFF
+        vocabulary = vocabulary.features
+        self._idf = np.log((1 + count) / (1 + np.bincount(features, minlength=len(vocabulary)))) + 1
+        self._idf_unseen = math.log((1 + count) / 2) + 1
+        folded = [_hash(word, dimensions) for word in vocabulary]
+        buckets = np.array([bucket for bucket, _ in folded], dtype=np.int64)
+        signs = np.array([sign for _, sign in folded])
+        self._vocabulary = vocabulary
+        self._buckets, self._signs = buckets, signs
+
+        # Scatter the weights into the matrix a chunk of rows at a time
+        weights = (1 + np.log(frequencies)) * self._idf[features] * signs[features]
+        matrix = np.zeros((count, dimensions), dtype=np.float32)
+        bounds = np.searchsorted(rows, np.arange(0, count + _CHUNK_ROWS, _CHUNK_ROWS))
+        for chunk, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+            start = chunk * _CHUNK_ROWS
+            stop = min(start + _CHUNK_ROWS, count)
+            cells = (rows[first:last] - start) * dimensions + buckets[features[first:last]]
+            matrix[start:stop] = np.bincount(
+                cells, weights=weights[first:last], minlength=(stop - start) * dimensions
+            ).reshape(stop - start, dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+        self._indexes: Dict[str, LabelVectors] = {}
+        start = 0
+        for label, ids, names in groups:
+            stop = start + len(ids)
+            clusters = int(math.sqrt(len(ids))) if ivf_min_entities and len(ids) >= ivf_min_entities else 0
+            # Copies, so the full matrix is released once every label has its rows
+            rows = matrix[start:stop] if clusters else matrix[start:stop].copy()
+            self._indexes[label] = LabelVectors(rows, ids, names, clusters, ivf_probes)
+            start = stop
+        self.built_at = time.time()
+        self.build_seconds = self.built_at - started
+
+    def embed(self, words: List[str]) -> Optional[np.ndarray]:
+        """
+        L2-normalized vector of a token list
+
+        Returns:
+            The vector, or None if it is empty
+        """
+        counts: Dict[str, int] = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word, frequency in counts.items():
+            feature = self._vocabulary.get(word)
+            if feature is None:
+                bucket, sign = _hash(word, self.dimensions)
+                weight = sign * self._idf_unseen
+            else:
+                bucket, weight = self._buckets[feature], self._signs[feature] * self._idf[feature]
+            vector[bucket] += (1 + math.log(frequency)) * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def merge(self, label: Optional[str], entity_id: str, properties: Dict[str, Any]):
+        """
+        Apply an entity write's (possibly partial) properties
+
+        A new description re-embeds the entity. A rename without one only
+        changes the reported name, since descriptions are not kept; the
+        vector catches up at the next rebuild.
+
+        Args:
+            label: Entity type, or None to look it up among indexed entities
+            entity_id: Entity identifier
+            properties: Written properties
+        """
+        if label is None:
+            label = next((known for known, index in self._indexes.items() if entity_id in index), None)
+        if label not in ENTITY_TYPES:
+            return
+        index = self._indexes.get(label)
+        if index is not None and entity_id in index and "description" not in properties:
+            if "name" in properties:
+                index.rename(entity_id, properties["name"])
+            return
+        name = properties["name"] if "name" in properties else (index.name(entity_id) if index else None)
+        vector = self.embed(document_tokens(name, properties.get("description")))
+        if vector is None:
+            self.remove(entity_id)
+            return
+        if index is None:
+            index = self._indexes[label] = LabelVectors(
+                np.zeros((0, self.dimensions), dtype=np.float32), [], [], probes=self.ivf_probes
+            )
+        index.add(entity_id, name, vector)
+
+    def remove(self, entity_id: str):
+        """Drop a deleted entity"""
+        for index in self._indexes.values():
+            index.remove(entity_id)
+
+    def search(
+        self,
+        text: str,
+        entity_types: Optional[List[str]] = None,
+        limit: int = 10,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Entities most similar to a text
+
+        Args:
+            text: Query text
+            entity_types: Labels to search; all labels if omitted
+            limit: Maximum results
+            min_score: Minimum cosine similarity (0-1)
+
+        Returns:
+            Matches ({"id", "entity_type", "name", "score"}), best first
+        """
+        query = self.embed(tokens(text))
+        if query is None:
+            return []
+        labels = entity_types or list(self._indexes)
+        matches = [
+            {"id": entity_id, "entity_type": label, "name": name, "score": score}
+            for label in dict.fromkeys(labels) if label in self._indexes
+            for score, entity_id, name in self._indexes[label].search(query, limit, min_score)
+        ]
+        matches.sort(key=lambda match: (-match["score"], match["id"]))
+        return matches[:limit]
+
+    def info(self) -> Dict[str, Any]:
+        """
+        Describe the index
+
+        Returns:
+            Dict with entity counts (total and per label), IVF clusters per
+            label, vocabulary size, dimensions, build time and age
+        """
+        labels = {label: len(index) for label, index in self._indexes.items()}
+        return {
+            "entities": sum(labels.values()),
+            "labels": labels,
+            "clusters": {label: index.clusters for label, index in self._indexes.items() if index.clusters},
+            "vocabulary": len(self._vocabulary),
+            "dimensions": self.dimensions,
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+            "age_seconds": time.time() - self.built_at
+        }
@@ -4,8 +4,9 @@ Pytest Configuration and Fixtures
 Provides shared test fixtures for unit and integration tests
 """
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
 from services.graph_service import GraphService
+from services.async_graph_service import AsyncGraphService
 
 
 @pytest.fixture
@@ -16,7 +17,7 @@ def mock_neo4j_driver():
     Returns:
         tuple: (mock_driver, mock_session)
     """
-    driver = Mock()
+    driver = MagicMock()
     session = MagicMock()
 
     # Configure session context manager behavior
@@ -58,6 +59,51 @@ def graph_service(mock_neo4j_driver, monkeypatch):
     return service
 
 
+@pytest.fixture
+def mock_async_neo4j_driver():
+    """
+    Mock async Neo4j driver for unit testing
+
+    Returns:
+        tuple: (mock_driver, mock_session)
+    """
+    driver = MagicMock()
+    driver.close = AsyncMock()
+    session = AsyncMock()
+
+    # Configure async session context manager behavior
+    driver.session.return_value.__aenter__.return_value = session
+    driver.session.return_value.__aexit__.return_value = None
+
+    return driver, session
+
+
+@pytest.fixture
+def async_graph_service(mock_async_neo4j_driver, monkeypatch):
+    """
+    AsyncGraphService instance with mocked async driver
+
+    Args:
+        mock_async_neo4j_driver: Mock async driver fixture
+        monkeypatch: pytest monkeypatch fixture
+
+    Returns:
+        AsyncGraphService: Service instance with mocked driver
+    """
+    driver, session = mock_async_neo4j_driver
+
+    monkeypatch.setattr(
+        "neo4j.AsyncGraphDatabase.driver",
+        lambda *args, **kwargs: driver
+    )
+
+    return AsyncGraphService(
+        uri="bolt://localhost:7687",
+        user="neo4j",
+        password="test"
+    )
+
+
 @pytest.fixture
 def sample_product():
     """
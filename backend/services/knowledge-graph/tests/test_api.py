@@ -1,25 +1,33 @@
 """
 Integration Tests for API Endpoints
 
-Tests FastAPI routes with mocked GraphService
+Tests FastAPI routes with mocked AsyncGraphService
 """
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from api.routes import get_graph_service
+from services.async_graph_service import AsyncGraphService
 from unittest.mock import patch, MagicMock
+import json
 
 
 client = TestClient(app)
 
 
+async def _aiter(items):
+    """Async iterator over items (stands in for streamed service results)"""
+    for item in items:
+        yield item
+
+
 @pytest.fixture
 def mock_graph_service():
-    """Mock GraphService for API tests"""
-    with patch("api.routes.get_graph_service") as mock:
-        service = MagicMock()
-        mock.return_value.__enter__ = lambda self: service
-        mock.return_value.__exit__ = lambda self, *args: None
-        yield service
+    """Mock AsyncGraphService for API tests (coroutine methods become AsyncMocks)"""
+    service = MagicMock(spec=AsyncGraphService)
+    app.dependency_overrides[get_graph_service] = lambda: service
+    yield service
+    app.dependency_overrides.pop(get_graph_service, None)
 
 
 def test_root_endpoint():
@@ -240,12 +248,181 @@ def test_delete_relationship_not_found(mock_graph_service):
     assert response.status_code == 404
 
 
+def test_batch_get_entities(mock_graph_service):
+    """Test batch get results keep request order and report missing ids"""
+    mock_graph_service.batch_get_entities.return_value = [
+        {"id": "p2", "found": True, "entity_type": "Product", "properties": {"id": "p2"}},
+        {"id": "nope", "found": False, "entity_type": None, "properties": None}
+    ]
+
+    response = client.post("/api/v1/graph/entities:batchGet", json={"ids": ["p2", "nope"]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [result["id"] for result in data["results"]] == ["p2", "nope"]
+    assert (data["found"], data["missing"]) == (1, 1)
+    mock_graph_service.batch_get_entities.assert_called_once_with(["p2", "nope"], entity_type=None)
+
+
+def test_batch_get_entities_rejects_empty_and_invalid(mock_graph_service):
+    """Test an empty id list is a validation error and a bad type a 400"""
+    assert client.post("/api/v1/graph/entities:batchGet", json={"ids": []}).status_code == 422
+
+    mock_graph_service.batch_get_entities.side_effect = ValueError("Invalid entity type: Bogus")
+    response = client.post("/api/v1/graph/entities:batchGet", json={"ids": ["p1"], "entity_type": "Bogus"})
+    assert response.status_code == 400
+
+
+def test_resolve_entities(mock_graph_service):
+    """Test resolution candidates are returned per input name"""
+    mock_graph_service.resolve_entities.return_value = [
+        {"name": "Gel Memory-Foam", "candidates": [
+            {"id": "f1", "entity_type": "Feature", "name": "gel memory foam", "score": 1.0}
+        ]},
+        {"name": "silk", "candidates": []}
+    ]
+
+    response = client.post("/api/v1/graph/entities:resolve", json={
+        "names": ["Gel Memory-Foam", "silk"], "entity_type": "Feature", "limit": 3
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"][0]["candidates"][0]["id"] == "f1"
+    assert data["message"] == "Matched 1 of 2 names"
+    mock_graph_service.resolve_entities.assert_called_once_with(
+        ["Gel Memory-Foam", "silk"], entity_type="Feature", limit=3, min_score=0.3
+    )
+
+
+def test_semantic_search(mock_graph_service):
+    """Test semantic search returns scored matches"""
+    mock_graph_service.semantic_search.return_value = [
+        {"id": "p1", "entity_type": "Product", "name": "CoolMax Pillow", "score": 0.62}
+    ]
+
+    response = client.post("/api/v1/graph/search/semantic", json={
+        "text": "cooling pillow", "entity_types": ["Product"], "limit": 5
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"][0]["id"] == "p1"
+    assert data["count"] == 1
+    mock_graph_service.semantic_search.assert_called_once_with(
+        "cooling pillow", entity_types=["Product"], limit=5, min_score=0.0
+    )
+
+    mock_graph_service.semantic_search.side_effect = ValueError("Invalid entity type: Bogus")
+    response = client.post("/api/v1/graph/search/semantic", json={"text": "x", "entity_types": ["Bogus"]})
+    assert response.status_code == 400
+
+
+def test_execute_batch(mock_graph_service):
+    """Test batch operations are forwarded in order and counted"""
+    mock_graph_service.execute_batch.return_value = {
+        "operations": 2, "statements": 2, "created": 1, "updated": 0, "deleted": 0, "related": 1
+    }
+
+    response = client.post("/api/v1/graph/batch", json={"operations": [
+        {"op": "create", "entity_type": "Scenario", "properties": {"id": "s1", "name": "Summer"}},
+        {"op": "relate", "from_id": "p1", "to_id": "s1", "rel_type": "APPLIES_TO"}
+    ]})
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "Applied 2 operations in 2 statements"
+    operations = mock_graph_service.execute_batch.call_args[0][0]
+    assert operations[1] == {"op": "relate", "from_id": "p1", "to_id": "s1", "rel_type": "APPLIES_TO", "properties": {}}
+
+
+def test_execute_batch_logs_types_of_unlabelled_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test unlabelled batch updates and deletes log the type of the node they matched"""
+    from unittest.mock import AsyncMock
+    driver, session = mock_async_neo4j_driver
+    appended = MagicMock(consume=AsyncMock())
+    tx = MagicMock()
+    tx.run = AsyncMock(side_effect=[
+        MagicMock(single=AsyncMock(return_value={"applied": [0], "labels": [["Feature"]]})),
+        MagicMock(single=AsyncMock(return_value={"applied": [1], "labels": [["Scenario"]]})),
+        appended
+    ])
+
+    async def execute_write(tx_func, *args, **kwargs):
+        return await tx_func(tx, *args, **kwargs)
+
+    session.execute_write.side_effect = execute_write
+    app.dependency_overrides[get_graph_service] = lambda: async_graph_service
+    try:
+        response = client.post("/api/v1/graph/batch", json={"operations": [
+            {"op": "update", "id": "f1", "properties": {"name": "Gel"}},
+            {"op": "delete", "id": "s1"}
+        ]})
+    finally:
+        app.dependency_overrides.pop(get_graph_service, None)
+
+    assert response.status_code == 200
+    assert "labels(n)" in tx.run.await_args_list[0].args[0]
+    events = tx.run.await_args.kwargs["events"]
+    assert [(event["op"], event["entity_id"], event["entity_type"]) for event in events] == [
+        ("update", "f1", "Feature"), ("delete", "s1", "Scenario")
+    ]
+
+
+def test_execute_batch_reports_operation_errors(mock_graph_service):
+    """Test a rejected batch returns 400 with per-operation errors"""
+    from services.batch import BatchError
+    mock_graph_service.execute_batch.side_effect = BatchError([{"index": 1, "error": "Entity s9 not found"}])
+
+    response = client.post("/api/v1/graph/batch", json={"operations": [
+        {"op": "delete", "id": "s1"}, {"op": "update", "id": "s9", "properties": {"name": "x"}}
+    ]})
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["errors"] == [{"index": 1, "error": "Entity s9 not found"}]
+    assert client.post("/api/v1/graph/batch", json={"operations": [{"op": "merge"}]}).status_code == 422
+
+
+def test_get_product_card_returns_stored_blob(mock_graph_service):
+    """Test a product card is written out as stored, and 404 when missing"""
+    mock_graph_service.get_product_card.return_value = b'{"product":{"id":"p1"},"best_offer":null}'
+
+    response = client.get("/api/v1/graph/products/p1/card")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "success": True,
+        "message": "Product card retrieved successfully",
+        "data": {"product": {"id": "p1"}, "best_offer": None}
+    }
+    mock_graph_service.get_product_card.return_value = None
+    assert client.get("/api/v1/graph/products/p9/card").status_code == 404
+
+
+def test_get_product_cards_keeps_request_order(mock_graph_service):
+    """Test batch cards follow request order and list the missing ids"""
+    mock_graph_service.get_product_cards.return_value = {
+        "p1": b'{"product":{"id":"p1"}}', "p2": b'{"product":{"id":"p2"}}'
+    }
+
+    response = client.post("/api/v1/graph/products/cards", json={"ids": ["p2", "p9", "p1"]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [card["product"]["id"] for card in data["results"]] == ["p2", "p1"]
+    assert data["missing"] == ["p9"]
+    assert data["message"] == "Found 2 of 3 product cards"
+    assert client.post("/api/v1/graph/products/cards", json={"ids": []}).status_code == 422
+
+
 def test_execute_query(mock_graph_service):
     """Test custom query endpoint"""
-    mock_graph_service.execute_cypher.return_value = [
-        {"product": "Test Product 1"},
-        {"product": "Test Product 2"}
-    ]
+    mock_graph_service.execute_query.return_value = {
+        "records": [
+            {"product": "Test Product 1"},
+            {"product": "Test Product 2"}
+        ],
+        "truncated": False
+    }
 
     response = client.post("/api/v1/graph/query", json={
         "query": "MATCH (p:Product) RETURN p.name as product",
@@ -261,7 +438,7 @@ def test_execute_query(mock_graph_service):
 
 def test_execute_query_dangerous(mock_graph_service):
     """Test that dangerous queries are rejected"""
-    mock_graph_service.execute_cypher.side_effect = ValueError("dangerous operation: DROP")
+    mock_graph_service.execute_query.side_effect = ValueError("dangerous operation: DROP")
 
     response = client.post("/api/v1/graph/query", json={
         "query": "DROP DATABASE",
@@ -271,6 +448,67 @@ def test_execute_query_dangerous(mock_graph_service):
     assert response.status_code == 400
 
 
+def test_execute_query_truncated(mock_graph_service):
+    """Test row limits are passed through and truncation is flagged"""
+    mock_graph_service.execute_query.return_value = {
+        "records": [{"n": 1}],
+        "truncated": True
+    }
+
+    response = client.post("/api/v1/graph/query", json={
+        "query": "MATCH (p:Product) RETURN p.id as n",
+        "max_rows": 1,
+        "timeout": 2.5
+    })
+
+    assert response.status_code == 200
+    assert response.json()["truncated"] is True
+    kwargs = mock_graph_service.execute_query.call_args.kwargs
+    assert kwargs["max_rows"] == 1
+    assert kwargs["timeout"] == 2.5
+
+
+def test_execute_query_encodes_neo4j_values(mock_graph_service):
+    """Test temporal values become ISO strings and points coordinate lists"""
+    from neo4j.time import Date, DateTime, Duration
+    from neo4j.spatial import CartesianPoint
+    mock_graph_service.execute_query.return_value = {
+        "records": [{
+            "created": DateTime(2024, 5, 1, 10, 30, 0),
+            "day": Date(2024, 5, 1),
+            "ttl": Duration(days=2),
+            "location": CartesianPoint((1.5, 2.0))
+        }],
+        "truncated": False
+    }
+
+    response = client.post("/api/v1/graph/query", json={"query": "MATCH (n) RETURN n.created AS created"})
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [{
+        "created": "2024-05-01T10:30:00.000000000",
+        "day": "2024-05-01",
+        "ttl": "P2D",
+        "location": [1.5, 2.0]
+    }]
+    assert response.json()["count"] == 1
+    assert response.json()["next_cursor"] is None
+
+
+def test_stdlib_encoder_matches_orjson():
+    """Test the fallback encoder produces the same JSON as orjson"""
+    from neo4j.time import DateTime
+    from api import responses
+    content = {"results": [{"name": "Café", "created": DateTime(2024, 5, 1), "tags": {"a"}}]}
+
+    fast = responses.dumps(content)
+    with patch.object(responses, "orjson", None):
+        slow = responses.dumps(content)
+
+    assert json.loads(fast) == json.loads(slow)
+    assert json.loads(slow)["results"][0]["tags"] == ["a"]
+
+
 def test_search_entities(mock_graph_service):
     """Test search entities endpoint"""
     mock_graph_service.search_entities.return_value = [
@@ -305,3 +543,437 @@ def test_search_entities_with_properties(mock_graph_service):
     assert response.status_code == 200
     data = response.json()
     assert data["count"] == 1
+
+
+def test_pool_metrics(mock_graph_service):
+    """Test connection pool metrics endpoint"""
+    mock_graph_service.pool_metrics.return_value = {
+        "max_pool_size": 50,
+        "in_use": 3,
+        "peak_in_use": 7,
+        "utilization": 0.06
+    }
+
+    response = client.get("/api/v1/graph/pool")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"][0]["max_pool_size"] == 50
+    assert data["results"][0]["in_use"] == 3
+
+
+def test_upsert_relationships_bulk(mock_graph_service):
+    """Test bulk relationship upsert endpoint"""
+    mock_graph_service.upsert_relationships_bulk.return_value = {
+        "created": 1, "matched": 1, "missing": 0, "failed": 0, "errors": []
+    }
+
+    response = client.post("/api/v1/graph/relationships:bulk", json={
+        "relationships": [
+            {"from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE", "from_type": "Product"},
+            {"from_id": "p2", "to_id": "f1", "rel_type": "HAS_FEATURE"}
+        ],
+        "batch_size": 500
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert data["matched"] == 1
+    kwargs = mock_graph_service.upsert_relationships_bulk.call_args.kwargs
+    assert kwargs["batch_size"] == 500
+    assert kwargs["relationships"][0]["from_type"] == "Product"
+
+
+def test_get_subgraph(mock_graph_service):
+    """Test neighborhood endpoint passes traversal bounds"""
+    mock_graph_service.subgraph.return_value = {
+        "root": "prod_123",
+        "nodes": [{"id": "prod_123", "entity_type": "Product", "depth": 0, "properties": {}}],
+        "edges": [],
+        "truncated": False
+    }
+
+    response = client.get(
+        "/api/v1/graph/entities/prod_123/subgraph"
+        "?depth=3&rel_types=HAS_FEATURE&rel_types=SOLVES&max_nodes=50"
+    )
+
+    assert response.status_code == 200
+    assert response.json()["nodes"][0]["id"] == "prod_123"
+    kwargs = mock_graph_service.subgraph.call_args.kwargs
+    assert kwargs["depth"] == 3
+    assert kwargs["rel_types"] == ["HAS_FEATURE", "SOLVES"]
+    assert kwargs["max_nodes"] == 50
+
+
+def test_get_subgraph_not_found(mock_graph_service):
+    """Test neighborhood of a missing entity returns 404"""
+    mock_graph_service.subgraph.return_value = None
+
+    response = client.get("/api/v1/graph/entities/missing/subgraph")
+
+    assert response.status_code == 404
+
+
+def test_get_subgraph_depth_bounded(mock_graph_service):
+    """Test traversal depth is capped"""
+    response = client.get("/api/v1/graph/entities/prod_123/subgraph?depth=99")
+
+    assert response.status_code == 422
+
+
+def test_graph_stats(mock_graph_service):
+    """Test stats endpoint returns counts from the service"""
+    mock_graph_service.graph_stats.return_value = {
+        "total_nodes": 12,
+        "total_relationships": 5,
+        "node_types": [{"type": "Product", "count": 12}],
+        "relationship_types": [{"type": "HAS_FEATURE", "count": 5}]
+    }
+
+    response = client.get("/api/v1/graph/stats")
+
+    assert response.status_code == 200
+    stats = response.json()["results"][0]
+    assert stats["total_nodes"] == 12
+    assert stats["relationship_types"][0]["type"] == "HAS_FEATURE"
+    mock_graph_service.execute_cypher.assert_not_called()
+
+
+def test_cache_metrics(mock_graph_service):
+    """Test read cache metrics endpoint"""
+    mock_graph_service.cache_metrics.return_value = {
+        "entities": {"hits": 9, "misses": 1, "hit_ratio": 0.9},
+        "relationships": {"hits": 0, "misses": 0, "hit_ratio": 0.0}
+    }
+
+    response = client.get("/api/v1/graph/cache")
+
+    assert response.status_code == 200
+    assert response.json()["results"][0]["entities"]["hits"] == 9
+
+
+def test_create_entities_bulk(mock_graph_service):
+    """Test bulk entity creation endpoint"""
+    mock_graph_service.create_entities_bulk.return_value = {
+        "created": 1,
+        "failed": 1,
+        "errors": [{"index": 1, "id": "bad", "error": "Invalid entity type: Bad"}]
+    }
+
+    response = client.post("/api/v1/graph/entities:bulk", json={
+        "entities": [
+            {"entity_type": "Product", "properties": {"id": "prod_1"}},
+            {"entity_type": "Bad", "properties": {"id": "bad"}}
+        ],
+        "batch_size": 500
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is False
+    assert data["created"] == 1
+    assert data["errors"][0]["index"] == 1
+    kwargs = mock_graph_service.create_entities_bulk.call_args.kwargs
+    assert kwargs["batch_size"] == 500
+    assert len(kwargs["entities"]) == 2
+
+
+def test_get_entity_with_type(mock_graph_service):
+    """Test entity lookup passes the entity type through"""
+    mock_graph_service.query_entity.return_value = {"id": "prod_123"}
+
+    response = client.get("/api/v1/graph/entities/prod_123?entity_type=Product")
+
+    assert response.status_code == 200
+    mock_graph_service.query_entity.assert_called_once_with("prod_123", entity_type="Product")
+
+
+def test_get_entity_invalid_type(mock_graph_service):
+    """Test entity lookup with an invalid entity type"""
+    mock_graph_service.query_entity.side_effect = ValueError("Invalid entity type: Bogus")
+
+    response = client.get("/api/v1/graph/entities/prod_123?entity_type=Bogus")
+
+    assert response.status_code == 400
+
+
+def test_list_entities_with_cursor(mock_graph_service):
+    """Test entity listing returns the next page cursor"""
+    mock_graph_service.list_entities.return_value = ([{"id": "prod_1"}], "next-token")
+
+    response = client.get("/api/v1/graph/entities?limit=1&cursor=prev-token")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["next_cursor"] == "next-token"
+    assert mock_graph_service.list_entities.call_args.kwargs["cursor"] == "prev-token"
+
+
+def test_list_entities_invalid_cursor(mock_graph_service):
+    """Test entity listing rejects malformed cursors"""
+    mock_graph_service.list_entities.side_effect = ValueError("Invalid cursor")
+
+    response = client.get("/api/v1/graph/entities?cursor=garbage")
+
+    assert response.status_code == 400
+
+
+def test_list_tampered_cursor_is_rejected(async_graph_service):
+    """Test a decodable cursor missing its keyset fields is a 400, not a 500"""
+    from services.cypher import encode_cursor
+    app.dependency_overrides[get_graph_service] = lambda: async_graph_service
+    try:
+        response = client.get(
+            "/api/v1/graph/entities", params={"cursor": encode_cursor({"label": "Product"})}
+        )
+        assert response.status_code == 400
+        response = client.get(
+            "/api/v1/graph/relationships",
+            params={"cursor": encode_cursor({"label": "Product", "id": "p1"})}
+        )
+        assert response.status_code == 400
+    finally:
+        app.dependency_overrides.pop(get_graph_service, None)
+
+
+def test_list_relationships(mock_graph_service):
+    """Test relationship listing with pagination"""
+    mock_graph_service.list_relationships.return_value = (
+        [{"id": 1, "type": "HAS_FEATURE", "source_id": "prod_1", "target_id": "feat_1"}],
+        None
+    )
+
+    response = client.get("/api/v1/graph/relationships?rel_type=HAS_FEATURE")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 1
+    assert data["next_cursor"] is None
+
+
+def test_export_graph_ndjson(mock_graph_service):
+    """Test graph export streams NDJSON lines"""
+    mock_graph_service.export_graph.return_value = _aiter([
+        {"kind": "node", "labels": ["Product"], "properties": {"id": "prod_1"}},
+        {"kind": "relationship", "type": "HAS_FEATURE", "source_id": "prod_1"}
+    ])
+
+    response = client.get("/api/v1/graph/export?entity_types=Product")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["kind"] for line in lines] == ["node", "relationship"]
+    assert mock_graph_service.export_graph.call_args.kwargs["entity_types"] == ["Product"]
+
+
+def test_export_graph_gzip(mock_graph_service):
+    """Test graph export can be gzip-compressed"""
+    mock_graph_service.export_graph.return_value = _aiter([{"kind": "node", "properties": {}}])
+
+    response = client.get("/api/v1/graph/export?gzip=true")
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    # httpx transparently decodes gzip
+    assert json.loads(response.text.strip())["kind"] == "node"
+
+
+def test_export_graph_aborts_on_failure():
+    """Test a failing export stream ends without the final chunk or gzip trailer"""
+    import asyncio
+    import zlib
+    from api.routes import _ndjson_chunks
+
+    async def records():
+        yield {"kind": "node", "properties": {"id": "prod_1"}}
+        raise RuntimeError("connection lost")
+
+    async def collect(compress):
+        chunks = []
+        with pytest.raises(RuntimeError):
+            async for chunk in _ndjson_chunks(records(), compress=compress):
+                chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(collect(compress=False)) == []
+    decompressor = zlib.decompressobj(wbits=31)
+    decompressor.decompress(b"".join(asyncio.run(collect(compress=True))))
+    assert not decompressor.eof
+
+
+def test_bookmark_header_round_trip(mock_graph_service):
+    """Test request bookmarks are visible to the service and returned updated"""
+    from services.bookmarks import BOOKMARK_HEADER, current_bookmark_scope
+
+    seen = {}
+
+    async def create_entity(*args, **kwargs):
+        scope = current_bookmark_scope()
+        seen["bookmarks"] = list(scope.bookmarks)
+        scope.update(["bm:2"])
+        return "p1"
+
+    mock_graph_service.create_entity.side_effect = create_entity
+
+    response = client.post(
+        "/api/v1/graph/entities",
+        json={"entity_type": "Product", "properties": {"id": "p1", "name": "Widget"}},
+        headers={BOOKMARK_HEADER: "bm:1"}
+    )
+
+    assert response.status_code == 201
+    assert seen["bookmarks"] == ["bm:1"]
+    assert response.headers[BOOKMARK_HEADER] == "bm:2"
+
+
+def _projection():
+    """Small analytics projection: three products sharing features"""
+    from services.projection import ProjectionBuilder
+    builder = ProjectionBuilder()
+    for entity_id in ["p1", "p2", "p3"]:
+        builder.add_node(entity_id, "Product")
+    for entity_id in ["f1", "f2"]:
+        builder.add_node(entity_id, "Feature")
+    for source, target in [("p1", "f1"), ("p2", "f1"), ("p3", "f1"), ("p1", "f2"), ("p2", "f2")]:
+        builder.add_relationship(source, target)
+    return builder.build()
+
+
+def test_analytics_endpoints(mock_graph_service):
+    """Test analytics are computed on the projection returned by the service"""
+    pytest.importorskip("numpy")
+    mock_graph_service.get_projection.return_value = _projection()
+    mock_graph_service.projection_info.return_value = {"nodes": 5, "stale": False}
+
+    response = client.get("/api/v1/graph/analytics/pagerank", params={"entity_type": "Feature", "limit": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"][0]["id"] == "f1"
+    assert data["projection"]["stale"] is False
+
+    response = client.get("/api/v1/graph/analytics/degree", params={"direction": "out", "limit": 2})
+    assert [entry["degree"] for entry in response.json()["results"]] == [2, 2]
+
+    response = client.get("/api/v1/graph/analytics/similar/p1")
+    assert response.json()["results"][0] == {"id": "p2", "type": "Product", "shared": 2, "jaccard": 1.0}
+
+
+def test_analytics_errors(mock_graph_service):
+    """Test invalid parameters map to 400 and unknown entities to 404"""
+    pytest.importorskip("numpy")
+    mock_graph_service.get_projection.return_value = _projection()
+    mock_graph_service.projection_info.return_value = None
+
+    assert client.get("/api/v1/graph/analytics/degree", params={"direction": "sideways"}).status_code == 400
+    assert client.get("/api/v1/graph/analytics/pagerank", params={"entity_type": "Nope"}).status_code == 400
+    assert client.get("/api/v1/graph/analytics/similar/missing").status_code == 404
+
+
+def test_analytics_projection_failure(mock_graph_service):
+    """Test a projection that fails to build is reported like the other analytics routes"""
+    mock_graph_service.get_projection.side_effect = RuntimeError("Neo4j unavailable")
+
+    for path in ("pagerank", "degree", "similar/p1"):
+        response = client.get(f"/api/v1/graph/analytics/{path}")
+        assert response.status_code == 500
+        assert response.json()["detail"] == "Neo4j unavailable"
+
+
+def test_get_recommendations(mock_graph_service):
+    """Test recommendations are passed through from the service"""
+    mock_graph_service.recommend.return_value = {
+        "products": [{"product_id": "p1", "score": 0.9}], "total": 1
+    }
+
+    response = client.get("/api/v1/graph/recommendations", params={"problem": "hot", "user_group": "couples"})
+
+    assert response.status_code == 200
+    assert response.json()["products"] == [{"product_id": "p1", "score": 0.9}]
+    mock_graph_service.recommend.assert_called_once_with(
+        problem="hot", user_group="couples", scenario=None, limit=20
+    )
+
+
+def test_get_recommendations_requires_facet(mock_graph_service):
+    """Test a ValueError from the service maps to 400"""
+    mock_graph_service.recommend.side_effect = ValueError("Specify at least one of problem, user_group or scenario")
+
+    response = client.get("/api/v1/graph/recommendations")
+
+    assert response.status_code == 400
+
+
+def test_get_offers(mock_graph_service):
+    """Test offers for a SKU are passed through from the service"""
+    offers = [{"id": "o1", "sku": "S1", "region": "US", "price": 9.0, "availability": True}]
+    mock_graph_service.find_offers.return_value = offers
+
+    response = client.get("/api/v1/graph/offers", params={"sku": "S1", "region": "US"})
+
+    assert response.status_code == 200
+    assert response.json()["offers"] == offers
+    assert response.json()["count"] == 1
+    mock_graph_service.find_offers.assert_called_once_with("S1", region="US", include_unavailable=False)
+
+
+def test_get_offers_requires_sku(mock_graph_service):
+    """Test a missing SKU is rejected"""
+    response = client.get("/api/v1/graph/offers")
+
+    assert response.status_code == 422
+
+
+def test_upsert_entities(mock_graph_service):
+    """Test upsert counts are reported"""
+    mock_graph_service.upsert_entities.return_value = {
+        "written": 1, "skipped": 2, "failed": 0, "errors": []
+    }
+
+    response = client.post("/api/v1/graph/entities:upsert", json={"entities": [
+        {"entity_type": "Product", "properties": {"id": f"p{i}", "name": "Widget"}} for i in range(3)
+    ]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert (data["written"], data["skipped"]) == (1, 2)
+
+
+def test_get_changes(mock_graph_service):
+    """Test the change feed returns events and the next since"""
+    change = {"seq": 8, "kind": "entity", "op": "update", "entity_type": "Product", "entity_id": "p1"}
+    mock_graph_service.get_changes.return_value = {"changes": [change], "next_since": 8}
+
+    response = client.get("/api/v1/graph/changes", params={"since": 7, "limit": 50})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["changes"] == [change]
+    assert data["count"] == 1
+    assert data["next_since"] == 8
+    mock_graph_service.get_changes.assert_awaited_once_with(7, 50)
+
+    assert client.get("/api/v1/graph/changes", params={"since": -1}).status_code == 422
+
+
+def test_stream_changes_as_server_sent_events(mock_graph_service):
+    """Test the change stream emits SSE events and resumes from Last-Event-ID"""
+    mock_graph_service.stream_changes.return_value = _aiter([
+        {"seq": 3, "kind": "entity", "op": "create", "entity_id": "p1"},
+        {"seq": 4, "kind": "entity", "op": "delete", "entity_id": "p1"}
+    ])
+
+    response = client.get("/api/v1/graph/changes/stream", headers={"Last-Event-ID": "2"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.strip().split("\n\n")
+    assert events[0].split("\n")[:2] == ["id: 3", "event: change"]
+    assert json.loads(events[1].split("data: ", 1)[1])["op"] == "delete"
+    mock_graph_service.stream_changes.assert_called_once_with(2, 100)
+
+    response = client.get("/api/v1/graph/changes/stream", headers={"Last-Event-ID": "abc"})
+    assert response.status_code == 400
@@ -0,0 +1,1648 @@
+"""
+Unit Tests for AsyncGraphService
+
+Tests the async service with a mocked async Neo4j driver
+"""
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from services.async_graph_service import AsyncGraphService
+
+
+class _AsyncResult:
+    """Minimal stand-in for neo4j.AsyncResult"""
+
+    def __init__(self, records):
+        self._records = records
+
+    async def single(self):
+        return self._records[0] if self._records else None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self._records:
+            yield record
+
+
+@pytest.mark.asyncio
+async def test_create_entity(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test entity creation awaits the write transaction"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = sample_product["id"]
+
+    entity_id = await async_graph_service.create_entity("Product", sample_product)
+
+    assert entity_id == sample_product["id"]
+    session.execute_write.assert_awaited_once()
+    assert async_graph_service._label_cache.get(sample_product["id"]) == "Product"
+
+
+@pytest.mark.asyncio
+async def test_create_entity_invalid_type(async_graph_service):
+    """Test entity creation with invalid type"""
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.create_entity("InvalidType", {"id": "test_123"})
+
+
+@pytest.mark.asyncio
+async def test_query_entity_stale_cache(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test a stale cached label falls back to an unlabelled lookup"""
+    driver, session = mock_async_neo4j_driver
+    async_graph_service._label_cache.put("prod_123", "Feature")
+    session.execute_read.side_effect = [None, (sample_product, "Product")]
+
+    result = await async_graph_service.query_entity("prod_123")
+
+    assert result == sample_product
+    assert session.execute_read.await_args_list[1].args[2] is None
+    assert async_graph_service._label_cache.get("prod_123") == "Product"
+
+
+@pytest.mark.asyncio
+async def test_list_entities_cursor(async_graph_service, mock_async_neo4j_driver):
+    """Test async listing returns a next cursor on a full page"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [("Product", {"id": "p1"}), ("Product", {"id": "p2"})]
+
+    entities, next_cursor = await async_graph_service.list_entities(limit=2)
+
+    assert [entity["id"] for entity in entities] == ["p1", "p2"]
+    assert next_cursor is not None
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_track_async_sessions(async_graph_service):
+    """Test async sessions are counted in pool metrics"""
+    await async_graph_service.health_check()
+
+    metrics = async_graph_service.pool_metrics()
+    assert metrics["sessions_total"] == 1
+    assert metrics["in_use"] == 0
+
+
+@pytest.mark.asyncio
+async def test_execute_cypher_dangerous(async_graph_service):
+    """Test dangerous queries are rejected before reaching the driver"""
+    with pytest.raises(ValueError, match="dangerous operation"):
+        await async_graph_service.execute_cypher("MATCH (n) DROP n")
+
+
+@pytest.mark.asyncio
+async def test_export_graph_streams(async_graph_service, mock_async_neo4j_driver):
+    """Test export yields node then relationship records asynchronously"""
+    driver, session = mock_async_neo4j_driver
+    node = MagicMock(element_id="4:1", labels={"Product"})
+    node.__iter__.return_value = iter([("id", "p1")])
+    node.keys.return_value = ["id"]
+    node.__getitem__.side_effect = {"id": "p1"}.__getitem__
+    session.run.side_effect = [
+        _AsyncResult([{"n": node}]),
+        _AsyncResult([{"type": "HAS_FEATURE", "source_id": "p1"}])
+    ]
+
+    records = [record async for record in async_graph_service.export_graph()]
+
+    assert [record["kind"] for record in records] == ["node", "relationship"]
+    assert driver.session.call_args.kwargs["fetch_size"] > 0
+
+
+@pytest.mark.asyncio
+async def test_export_graph_filters_relationship_endpoints(async_graph_service, mock_async_neo4j_driver):
+    """Test a label-filtered export only writes edges between exported nodes"""
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = [_AsyncResult([]), _AsyncResult([]), _AsyncResult([])]
+
+    records = [
+        record async for record in
+        async_graph_service.export_graph(entity_types=["Product", "Feature"], rel_types=["HAS_FEATURE"])
+    ]
+
+    assert records == []
+    query = session.run.await_args.args[0]
+    assert "[r:HAS_FEATURE]" in query
+    assert "WHERE source:Product|Feature AND target:Product|Feature" in query
+
+
+def test_export_graph_validates_eagerly(async_graph_service):
+    """Test invalid export filters raise before streaming starts"""
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        async_graph_service.export_graph(entity_types=["Nope"])
+
+
+@pytest.mark.asyncio
+async def test_query_entity_tx():
+    """Test the async transaction function decodes the record"""
+    tx = AsyncMock()
+    tx.run.return_value = _AsyncResult([{"n": {"id": "p1"}, "labels": ["Product"]}])
+
+    found = await AsyncGraphService._query_entity_tx(tx, "p1", "Product")
+
+    assert found == ({"id": "p1"}, "Product")
+    assert "MATCH (n:Product {id: $id})" in tx.run.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_close(async_graph_service, mock_async_neo4j_driver):
+    """Test close awaits the async driver"""
+    driver, session = mock_async_neo4j_driver
+
+    await async_graph_service.close()
+
+    driver.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_refresh_projection_shares_concurrent_builds(async_graph_service, mock_async_neo4j_driver):
+    """Test concurrent refreshes run a single load from Neo4j"""
+    import asyncio
+    from services.cypher import ENTITY_TYPES
+    pytest.importorskip("numpy")
+    driver, session = mock_async_neo4j_driver
+    node_results = [
+        _AsyncResult([{"id": "p1"}] if label == "Product" else [{"id": "f1"}] if label == "Feature" else [])
+        for label in ENTITY_TYPES
+    ]
+    session.run.side_effect = node_results + [_AsyncResult([{"source_id": "p1", "target_id": "f1"}])]
+
+    first, second = await asyncio.gather(
+        async_graph_service.refresh_projection(),
+        async_graph_service.get_projection()
+    )
+
+    assert first is second
+    assert first.node_count == 2
+    assert first.relationship_count == 1
+    assert session.run.await_count == len(ENTITY_TYPES) + 1
+
+
+@pytest.mark.asyncio
+async def test_recommend_serves_stale_index_while_rebuilding(async_graph_service, mock_async_neo4j_driver):
+    """Test a stale index answers immediately and is rebuilt in the background"""
+    import asyncio
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"product_id": "p1", "type": "SOLVES", "target_id": "hot", "properties": {}}
+    ]
+
+    result = await async_graph_service.recommend(problem="hot")
+    assert result["total"] == 1
+
+    async_graph_service._recommendations.stale = True
+    session.execute_read.return_value = []
+    result = await async_graph_service.recommend(problem="hot")
+    assert result["total"] == 1
+
+    await async_graph_service._recommendations_task
+    assert (await async_graph_service.recommend(problem="hot"))["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_resolve_entities_shares_index_build(async_graph_service, mock_async_neo4j_driver):
+    """Test concurrent resolutions build the trigram index once"""
+    import asyncio
+    from services.cypher import ENTITY_TYPES
+    pytest.importorskip("numpy")
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = [
+        _AsyncResult([{"id": "f1", "name": "Gel Memory Foam"}] if label == "Feature" else [])
+        for label in ENTITY_TYPES
+    ]
+
+    first, second = await asyncio.gather(
+        async_graph_service.resolve_entities(["Gel Memory-Foam"]),
+        async_graph_service.resolve_entities(["gel-infused memory foam"])
+    )
+
+    assert first[0]["candidates"][0]["id"] == "f1"
+    assert second[0]["candidates"][0]["id"] == "f1"
+    assert session.run.await_count == len(ENTITY_TYPES)
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_runs_one_transaction(async_graph_service, mock_async_neo4j_driver):
+    """Test a mixed batch is one awaited write transaction"""
+    driver, session = mock_async_neo4j_driver
+
+    result = await async_graph_service.execute_batch([
+        {"op": "create", "entity_type": "Scenario", "properties": {"id": "s1", "name": "Summer"}},
+        {"op": "relate", "from_id": "p1", "from_type": "Product", "to_id": "s1", "rel_type": "APPLIES_TO"}
+    ])
+
+    assert (result["created"], result["related"], result["statements"]) == (1, 1, 2)
+    session.execute_write.assert_awaited_once()
+    assert async_graph_service._label_cache.get("s1") == "Scenario"
+
+
+@pytest.mark.asyncio
+async def test_semantic_search_shares_index_build(async_graph_service, mock_async_neo4j_driver):
+    """Test concurrent semantic searches build the vector index once"""
+    import asyncio
+    from services.cypher import ENTITY_TYPES
+    pytest.importorskip("numpy")
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = [
+        _AsyncResult(
+            [{"id": "p1", "name": "CoolMax Pillow", "description": "gel memory foam"}]
+            if label == "Product" else []
+        )
+        for label in ENTITY_TYPES
+    ]
+
+    first, second = await asyncio.gather(
+        async_graph_service.semantic_search("cooling pillow"),
+        async_graph_service.semantic_search("memory foam", entity_types=["Product"])
+    )
+
+    assert first[0]["id"] == "p1"
+    assert second[0]["id"] == "p1"
+    assert session.run.await_count == len(ENTITY_TYPES)
+
+
+@pytest.mark.asyncio
+async def test_find_offers_refreshes_delta_in_background(async_graph_service, mock_async_neo4j_driver):
+    """Test the offer index answers immediately while a due delta is fetched"""
+    import asyncio
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"id": "o1", "sku": "S1", "region": "US", "price": 10.0, "availability": True,
+         "updated_at": "2024-05-01T00:00:00"}
+    ]
+
+    assert [offer["id"] for offer in await async_graph_service.find_offers("S1", "US")] == ["o1"]
+
+    async_graph_service.offer_refresh_interval = 0.001
+    await asyncio.sleep(0.002)
+    session.execute_read.return_value = [
+        {"id": "o1", "sku": "S1", "region": "US", "price": 10.0, "availability": False,
+         "updated_at": "2024-05-02T00:00:00"}
+    ]
+    assert len(await async_graph_service.find_offers("S1", "US")) == 1
+
+    await async_graph_service._offers_task
+    assert session.execute_read.call_args.args[1:] == ("2024-05-01T00:00:00",)
+    assert await async_graph_service.find_offers("S1", "US") == []
+
+
+@pytest.mark.asyncio
+async def test_upsert_entities_skips_unchanged(async_graph_service, mock_async_neo4j_driver):
+    """Test unchanged entities cost a hash read and no write"""
+    from services.cypher import content_hash
+    driver, session = mock_async_neo4j_driver
+    properties = {"id": "p1", "name": "Widget"}
+    session.execute_read.return_value = {"p1": content_hash(properties)}
+
+    result = await async_graph_service.upsert_entities([{"entity_type": "Product", "properties": properties}])
+
+    assert result == {"written": 0, "skipped": 1, "failed": 0, "errors": []}
+    session.execute_write.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_get_product_cards_shares_build_and_follows_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test concurrent card reads build once and writes re-render in the same session"""
+    import asyncio
+    import json
+    driver, session = mock_async_neo4j_driver
+    session.run.return_value = _AsyncResult([
+        {"product": {"id": "p1", "name": "CoolMax"}, "features": [{"id": "f1", "name": "Gel"}],
+         "problems": [], "user_groups": [], "offers": [], "competitors": []}
+    ])
+
+    first, second = await asyncio.gather(
+        async_graph_service.get_product_cards(["p1"]),
+        async_graph_service.get_product_card("p1")
+    )
+    assert json.loads(first["p1"])["product"]["name"] == "CoolMax"
+    assert second == first["p1"]
+    assert session.run.await_count == 1
+
+    session.execute_write.return_value = True
+    session.execute_read.return_value = [
+        {"product": {"id": "p1", "name": "CoolMax"}, "features": [{"id": "f1", "name": "Cool Gel"}]}
+    ]
+    await async_graph_service.update_entity("f1", {"name": "Cool Gel"}, entity_type="Feature")
+    card = json.loads(await async_graph_service.get_product_card("p1"))
+    assert card["features"][0]["name"] == "Cool Gel"
+    session.execute_read.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_stream_changes_polls_after_the_latest_event(async_graph_service, mock_async_neo4j_driver):
+    """Test a stream without since starts after the newest event and polls for more"""
+    driver, session = mock_async_neo4j_driver
+    async_graph_service.change_poll_interval = 0
+    session.execute_write.return_value = 0
+    session.execute_read.side_effect = [
+        41,
+        [{"seq": 42, "kind": "entity", "op": "create", "entity_id": "p1"}],
+        [],
+        [{"seq": 43, "kind": "entity", "op": "delete", "entity_id": "p1"}]
+    ]
+
+    stream = async_graph_service.stream_changes(limit=10)
+    changes = [await stream.__anext__(), await stream.__anext__()]
+    await stream.aclose()
+
+    assert [change["seq"] for change in changes] == [42, 43]
+    assert [call.args[1] for call in session.execute_read.await_args_list[1:]] == [41, 42, 42]
+
+
+@pytest.mark.asyncio
+async def test_stream_changes_numbers_pending_events_before_starting(async_graph_service, mock_async_neo4j_driver):
+    """Test a stream without since skips the events pending when it subscribed"""
+    driver, session = mock_async_neo4j_driver
+    order = []
+
+    async def sequence(tx_function, *args, **kwargs):
+        order.append("sequence")
+        return 0
+
+    async def read(tx_function, *args, **kwargs):
+        order.append(tx_function)
+        if tx_function == AsyncGraphService._latest_change_tx:
+            return 41
+        return [{"seq": 42, "kind": "entity", "op": "create", "entity_id": "p1"}]
+
+    session.execute_write.side_effect = sequence
+    session.execute_read.side_effect = read
+
+    stream = async_graph_service.stream_changes(limit=10)
+    assert (await stream.__anext__())["seq"] == 42
+    await stream.aclose()
+
+    assert order[:3] == ["sequence", AsyncGraphService._latest_change_tx, AsyncGraphService._changes_tx]
+    assert session.execute_read.await_args_list[1].args[1] == 41
+
+
+@pytest.mark.asyncio
+async def test_sequence_changes_tx_numbers_pending_events():
+    """Test the async sequencer locks the counter only when events are pending"""
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult([{"pending": 0}]))
+    assert await AsyncGraphService._sequence_changes_tx(tx, 10) == 0
+    assert tx.run.await_count == 1
+
+    lock = MagicMock(consume=AsyncMock())
+    tx.run = AsyncMock(side_effect=[_AsyncResult([{"pending": 2}]), lock, _AsyncResult([{"sequenced": 2}])])
+    assert await AsyncGraphService._sequence_changes_tx(tx, 10) == 2
+    lock.consume.assert_awaited_once()
+    assert tx.run.await_args.kwargs == {"limit": 10}
+
+
+def _explained(query_type, plan=None):
+    """Awaitable result of an EXPLAIN whose summary reports query_type"""
+    return MagicMock(consume=AsyncMock(return_value=MagicMock(query_type=query_type, plan=plan)))
+
+
+@pytest.mark.asyncio
+async def test_create_entity_missing_id(async_graph_service):
+    """Test entity creation without ID"""
+    with pytest.raises(ValueError, match="must include 'id' field"):
+        await async_graph_service.create_entity("Product", {"name": "Test"})
+
+
+@pytest.mark.asyncio
+async def test_create_relationship(async_graph_service, sample_relationship, mock_async_neo4j_driver):
+    """Test relationship creation"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = True
+
+    result = await async_graph_service.create_relationship(
+        from_id=sample_relationship["from_id"],
+        to_id=sample_relationship["to_id"],
+        rel_type=sample_relationship["rel_type"],
+        properties=sample_relationship["properties"]
+    )
+
+    assert result is True
+    session.execute_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_create_relationship_invalid_type(async_graph_service):
+    """Test relationship creation with invalid type"""
+    with pytest.raises(ValueError, match="Invalid relationship type"):
+        await async_graph_service.create_relationship(
+            from_id="prod_123",
+            to_id="feat_456",
+            rel_type="INVALID_TYPE"
+        )
+
+
+@pytest.mark.asyncio
+async def test_query_entity(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test entity query"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+
+    result = await async_graph_service.query_entity("prod_123")
+
+    assert result == sample_product
+    session.execute_read.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_query_entity_not_found(async_graph_service, mock_async_neo4j_driver):
+    """Test query for non-existent entity"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = None
+
+    assert await async_graph_service.query_entity("nonexistent") is None
+
+
+@pytest.mark.asyncio
+async def test_update_entity(async_graph_service, mock_async_neo4j_driver):
+    """Test entity update"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = True
+
+    result = await async_graph_service.update_entity(
+        "prod_123",
+        {"name": "Updated Product", "price": 199.99}
+    )
+
+    assert result is True
+    session.execute_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_delete_entity(async_graph_service, mock_async_neo4j_driver):
+    """Test entity deletion"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = True
+
+    assert await async_graph_service.delete_entity("prod_123") is True
+    session.execute_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_delete_entity_not_found(async_graph_service, mock_async_neo4j_driver):
+    """Test deleting non-existent entity"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = False
+
+    assert await async_graph_service.delete_entity("nonexistent") is False
+
+
+@pytest.mark.asyncio
+async def test_delete_relationship(async_graph_service, mock_async_neo4j_driver):
+    """Test relationship deletion"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = True
+
+    result = await async_graph_service.delete_relationship(
+        from_id="prod_123",
+        to_id="feat_456",
+        rel_type="HAS_FEATURE"
+    )
+
+    assert result is True
+    session.execute_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_query_relationships(async_graph_service, mock_async_neo4j_driver):
+    """Test querying entity relationships"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {
+            "direction": "outgoing",
+            "type": "HAS_FEATURE",
+            "properties": {"confidence": 0.95},
+            "target": {"id": "feat_456", "name": "Cool Feature"}
+        }
+    ]
+
+    result = await async_graph_service.query_relationships(
+        entity_id="prod_123",
+        rel_type="HAS_FEATURE",
+        direction="outgoing"
+    )
+
+    assert len(result) == 1
+    assert result[0]["type"] == "HAS_FEATURE"
+    session.execute_read.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_search_entities(async_graph_service, mock_async_neo4j_driver):
+    """Test entity search"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"id": "prod_123", "name": "Product 1"},
+        {"id": "prod_456", "name": "Product 2"}
+    ]
+
+    result = await async_graph_service.search_entities(
+        entity_type="Product",
+        search_text="Product",
+        limit=10
+    )
+
+    assert len(result) == 2
+    session.execute_read.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_execute_cypher(async_graph_service, mock_async_neo4j_driver):
+    """Test custom Cypher query execution"""
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = [
+        _explained("r"),
+        _AsyncResult([{"product": "Test Product 1"}, {"product": "Test Product 2"}])
+    ]
+
+    result = await async_graph_service.execute_cypher(
+        query="MATCH (p:Product) RETURN p.name as product",
+        params={}
+    )
+
+    assert len(result) == 2
+    assert session.run.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_query_entity_fills_label_cache(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test reads record the entity label for later index seeks"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+    session.execute_write.return_value = True
+
+    await async_graph_service.query_entity("prod_123")
+    await async_graph_service.update_entity("prod_123", {"name": "Updated"})
+
+    args = session.execute_write.await_args.args
+    assert args[0] == AsyncGraphService._update_entity_tx
+    assert args[-1] == "Product"
+
+
+@pytest.mark.asyncio
+async def test_batch_get_entities_groups_by_label(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test a batch get reads misses per label and answers in request order"""
+    driver, session = mock_async_neo4j_driver
+    async_graph_service._label_cache.put("feat_1", "Feature")
+    async_graph_service._label_cache.put("gone", "Feature")
+    session.execute_read.side_effect = [
+        {"prod_123": (sample_product, "Product"), "feat_1": ({"id": "feat_1"}, "Feature")},
+        {}
+    ]
+
+    results = await async_graph_service.batch_get_entities(["feat_1", "prod_123", "missing", "gone", "prod_123"])
+
+    assert [(result["id"], result["found"], result["entity_type"]) for result in results] == [
+        ("feat_1", True, "Feature"), ("prod_123", True, "Product"),
+        ("missing", False, None), ("gone", False, None), ("prod_123", True, "Product")
+    ]
+    assert results[1]["properties"] == sample_product
+    groups = session.execute_read.await_args_list[0].args[1]
+    assert groups == {"Feature": ["feat_1", "gone"], None: ["prod_123", "missing"]}
+    # The stale "gone" label is dropped and retried across every label
+    assert session.execute_read.await_args_list[1].args[1] == {None: ["gone"]}
+    assert async_graph_service._label_cache.get("gone") is None
+
+    # Found entities are now served from the entity cache
+    session.execute_read.side_effect = None
+    session.execute_read.return_value = {}
+    await async_graph_service.batch_get_entities(["prod_123", "feat_1", "missing"])
+    assert session.execute_read.await_args.args[1] == {None: ["missing"]}
+
+
+@pytest.mark.asyncio
+async def test_batch_get_entities_validates_ids(async_graph_service):
+    """Test empty or oversized id lists and unknown types are rejected"""
+    from services.cypher import BATCH_GET_MAX_IDS
+    with pytest.raises(ValueError, match="empty"):
+        await async_graph_service.batch_get_entities([])
+    with pytest.raises(ValueError, match="At most"):
+        await async_graph_service.batch_get_entities(["id"] * (BATCH_GET_MAX_IDS + 1))
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.batch_get_entities(["id"], entity_type="Bogus")
+
+
+@pytest.mark.asyncio
+async def test_entities_by_id_tx_unwinds_ids():
+    """Test a batch read is one UNWIND query per label"""
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult(
+        [{"id": "prod_123", "n": {"id": "prod_123"}, "labels": ["Product"]}]
+    ))
+
+    found = await AsyncGraphService._entities_by_id_tx(tx, {"Product": ["prod_123", "prod_9"]})
+
+    query = tx.run.await_args.args[0]
+    assert "UNWIND $rows AS row" in query
+    assert "MATCH (n:Product {id: row.id})" in query
+    assert tx.run.await_args.kwargs["rows"] == [{"id": "prod_123"}, {"id": "prod_9"}]
+    assert found == {"prod_123": ({"id": "prod_123"}, "Product")}
+
+
+@pytest.mark.asyncio
+async def test_query_entity_invalid_type(async_graph_service):
+    """Test lookups reject unknown entity types"""
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.query_entity("prod_123", entity_type="Bogus")
+
+
+@pytest.mark.asyncio
+async def test_entity_lookup_without_label_spans_labels():
+    """Test an unlabelled id lookup is a UNION of label-qualified index seeks"""
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult([]))
+
+    assert await AsyncGraphService._query_entity_tx(tx, "prod_123", None) is None
+
+    query = tx.run.await_args.args[0]
+    assert "MATCH (n) WHERE" not in query
+    assert "MATCH (n:Merchant {id: $id})" in query
+
+
+@pytest.mark.asyncio
+async def test_search_entities_uses_fulltext_index(async_graph_service, mock_async_neo4j_driver):
+    """Test text search goes through the full-text index path"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"id": "prod_123", "name": "Cool Mattress", "score": 2.5}
+    ]
+
+    result = await async_graph_service.search_entities(entity_type="Product", search_text="cool")
+
+    assert result[0]["score"] == 2.5
+    assert session.execute_read.await_args.args[0] == AsyncGraphService._fulltext_search_tx
+
+
+@pytest.mark.asyncio
+async def test_search_entities_falls_back_without_index(async_graph_service, mock_async_neo4j_driver):
+    """Test text search falls back to a scan when the index is missing"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.side_effect = [
+        Exception("There is no such fulltext schema index: product_search"),
+        [{"id": "prod_123", "name": "Cool Mattress"}]
+    ]
+
+    result = await async_graph_service.search_entities(entity_type="Product", search_text="cool")
+
+    assert len(result) == 1
+    assert session.execute_read.await_args.args[0] == AsyncGraphService._search_entities_tx
+
+
+@pytest.mark.asyncio
+async def test_search_entities_invalid_type(async_graph_service):
+    """Test search rejects unknown entity types"""
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.search_entities(entity_type="Product) DETACH DELETE (n")
+
+
+@pytest.mark.asyncio
+async def test_fulltext_search_tx_ranks_and_highlights():
+    """Test full-text transaction query, escaping and result decoration"""
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult([{
+        "n": {"id": "feat_1", "name": "Gel Memory Foam", "description": "Cooling"},
+        "score": 1.7,
+        "labels": ["Feature"]
+    }]))
+
+    results = await AsyncGraphService._fulltext_search_tx(tx, "Feature", "gel foam:", None, 10)
+
+    query = tx.run.await_args.args[0]
+    params = tx.run.await_args.kwargs
+    assert "db.index.fulltext.queryNodes" in query
+    assert params["index"] == "feature_search"
+    assert params["query"] == "gel foam\\:"
+    assert results[0]["entity_type"] == "Feature"
+    assert results[0]["score"] == 1.7
+    assert results[0]["highlight"] == "<em>Gel</em> Memory <em>Foam</em>"
+
+
+@pytest.mark.asyncio
+async def test_list_entities_resumes_after_cursor(async_graph_service, mock_async_neo4j_driver):
+    """Test entity listing returns a cursor that resumes after the last row"""
+    from services.cypher import decode_cursor
+
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        ("Product", {"id": "prod_1"}),
+        ("Product", {"id": "prod_2"})
+    ]
+
+    entities, next_cursor = await async_graph_service.list_entities(limit=2)
+    assert decode_cursor(next_cursor) == {"label": "Product", "id": "prod_2"}
+
+    session.execute_read.return_value = [("Feature", {"id": "feat_1"})]
+    entities, last_cursor = await async_graph_service.list_entities(limit=2, cursor=next_cursor)
+
+    args = session.execute_read.await_args.args
+    assert args[1][0] == "Product"
+    assert args[2] == "prod_2"
+    assert last_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_list_entities_tx_spans_labels():
+    """Test the listing transaction seeks after the cursor then moves on to later labels"""
+    tx = MagicMock()
+    tx.run = AsyncMock(side_effect=[
+        _AsyncResult([{"n": {"id": "prod_3"}}]),
+        _AsyncResult([{"n": {"id": "feat_1"}}, {"n": {"id": "feat_2"}}])
+    ])
+
+    rows = await AsyncGraphService._list_entities_tx(tx, ["Product", "Feature", "Scenario"], "prod_2", None, 3)
+
+    assert rows == [
+        ("Product", {"id": "prod_3"}),
+        ("Feature", {"id": "feat_1"}),
+        ("Feature", {"id": "feat_2"})
+    ]
+    first, second = tx.run.await_args_list
+    assert "n.id > $after_id" in first.args[0]
+    assert first.kwargs["limit"] == 3
+    assert "after_id" not in second.kwargs
+    assert second.kwargs["limit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_list_relationships_cursor_includes_element_id(async_graph_service, mock_async_neo4j_driver):
+    """Test relationship pages resume from source id and element id"""
+    from services.cypher import decode_cursor
+
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        ("Product", {"source_id": "prod_1", "element_id": "5:abc:10", "type": "HAS_FEATURE"})
+    ]
+
+    relationships, next_cursor = await async_graph_service.list_relationships(limit=1)
+
+    assert len(relationships) == 1
+    assert decode_cursor(next_cursor) == {
+        "label": "Product", "id": "prod_1", "element_id": "5:abc:10"
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_graph_streams_nodes_then_relationships(async_graph_service, mock_async_neo4j_driver):
+    """Test export yields labelled node records before relationship records on a read session"""
+    from neo4j import READ_ACCESS
+    driver, session = mock_async_neo4j_driver
+    node = MagicMock(element_id="4:abc:1", labels=frozenset(["Product"]))
+    node.keys.return_value = ["id"]
+    node.__getitem__.side_effect = {"id": "prod_1"}.__getitem__
+    relationship = {"element_id": "5:abc:1", "type": "HAS_FEATURE",
+                    "source_id": "prod_1", "target_id": "feat_1", "properties": {}}
+    session.run.side_effect = [_AsyncResult([{"n": node}]), _AsyncResult([relationship])]
+
+    records = [record async for record in async_graph_service.export_graph(entity_types=["Product"], fetch_size=500)]
+
+    assert [record["kind"] for record in records] == ["node", "relationship"]
+    assert records[0]["labels"] == ["Product"]
+    assert records[1]["type"] == "HAS_FEATURE"
+    driver.session.assert_called_with(default_access_mode=READ_ACCESS, fetch_size=500)
+
+
+def test_export_graph_invalid_filter(async_graph_service):
+    """Test export validates relationship filters before streaming starts"""
+    with pytest.raises(ValueError, match="Invalid relationship type"):
+        async_graph_service.export_graph(rel_types=["NOT_A_TYPE"])
+
+
+@pytest.mark.asyncio
+async def test_query_entity_served_from_read_cache(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test repeated entity reads hit the read cache"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+
+    first = await async_graph_service.query_entity("prod_123")
+    second = await async_graph_service.query_entity("prod_123")
+
+    assert first == second == sample_product
+    session.execute_read.assert_awaited_once()
+    metrics = async_graph_service.cache_metrics()["entities"]
+    assert metrics["hits"] == 1
+    assert metrics["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_read_cache_respects_entity_type(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test a cached entity is not returned under a different label"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+
+    await async_graph_service.query_entity("prod_123")
+
+    assert await async_graph_service.query_entity("prod_123", entity_type="Feature") is None
+    session.execute_read.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_update_invalidates_read_cache(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test updates drop the cached entity"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+    session.execute_write.return_value = True
+
+    await async_graph_service.query_entity("prod_123")
+    await async_graph_service.update_entity("prod_123", {"name": "Updated"})
+    await async_graph_service.query_entity("prod_123")
+
+    assert session.execute_read.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_relationship_write_invalidates_neighbour_listings(async_graph_service, mock_async_neo4j_driver):
+    """Test relationship listings are invalidated by writes to any entity they embed"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [{
+        "direction": "outgoing",
+        "type": "HAS_FEATURE",
+        "properties": {},
+        "target": {"id": "feat_456"}
+    }]
+    session.execute_write.return_value = True
+
+    await async_graph_service.query_relationships("prod_123")
+    await async_graph_service.query_relationships("prod_123")
+    assert session.execute_read.await_count == 1
+
+    # Updating the neighbour changes the embedded target properties
+    await async_graph_service.update_entity("feat_456", {"name": "Renamed"})
+    await async_graph_service.query_relationships("prod_123")
+    assert session.execute_read.await_count == 2
+
+    await async_graph_service.create_relationship("prod_123", "feat_789", "HAS_FEATURE")
+    await async_graph_service.query_relationships("prod_123")
+    assert session.execute_read.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_write_query_clears_read_cache(async_graph_service, sample_product, mock_async_neo4j_driver):
+    """Test custom write queries flush the read cache"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+    session.run.side_effect = [_explained("rw"), _AsyncResult([])]
+
+    await async_graph_service.query_entity("prod_123")
+    await async_graph_service.execute_cypher("MATCH (n {id: 'x'}) SET n.name = 'y'")
+    await async_graph_service.query_entity("prod_123")
+
+    assert session.execute_read.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_graph_stats_tx_uses_count_store():
+    """Test stats are per-label/per-type counts, not a label group-by scan"""
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult([
+        {"kind": "total", "name": None, "count": 12},
+        {"kind": "node", "name": "Feature", "count": 2},
+        {"kind": "node", "name": "Product", "count": 10},
+        {"kind": "node", "name": "Offer", "count": 0},
+        {"kind": "total_relationships", "name": None, "count": 5},
+        {"kind": "relationship", "name": "HAS_FEATURE", "count": 5}
+    ]))
+
+    stats = await AsyncGraphService._graph_stats_tx(tx)
+
+    query = tx.run.await_args.args[0]
+    assert "labels(n)" not in query
+    assert "MATCH (n:Merchant) RETURN" in query
+    assert "MATCH ()-[r:SOLD_BY]->() RETURN" in query
+    assert stats["total_nodes"] == 12
+    assert stats["total_relationships"] == 5
+    assert stats["node_types"] == [
+        {"type": "Product", "count": 10},
+        {"type": "Feature", "count": 2}
+    ]
+    assert stats["relationship_types"] == [{"type": "HAS_FEATURE", "count": 5}]
+
+
+class _Node(dict):
+    """Stand-in for neo4j.graph.Node"""
+
+    def __init__(self, element_id, label, **properties):
+        super().__init__(properties)
+        self.element_id = element_id
+        self.labels = frozenset([label])
+
+
+class _Rel(dict):
+    """Stand-in for neo4j.graph.Relationship"""
+
+    def __init__(self, element_id, rel_type, start, end, **properties):
+        super().__init__(properties)
+        self.element_id = element_id
+        self.type = rel_type
+        self.start_node = start
+        self.end_node = end
+
+
+@pytest.mark.asyncio
+async def test_subgraph_tx_dedupes_and_bounds():
+    """Test the neighborhood is one bounded query with deduplicated edges"""
+    product = _Node("4:p", "Product", id="prod_123")
+    feature = _Node("4:f", "Feature", id="feat_456")
+    problem = _Node("4:x", "Problem", id="prob_1")
+    has_feature = _Rel("5:1", "HAS_FEATURE", product, feature, confidence=0.9)
+    # Found again from the feature side, and an edge to a node cut by max_nodes
+    solves = _Rel("5:2", "SOLVES", feature, problem)
+    tx = MagicMock()
+    tx.run = AsyncMock(return_value=_AsyncResult([{
+        "levels": [[product], [feature, problem]],
+        "rels": [has_feature, has_feature, solves]
+    }]))
+
+    subgraph = await AsyncGraphService._subgraph_tx(
+        tx, "prod_123", "Product", 2, ["HAS_FEATURE", "SOLVES"], 2, 10
+    )
+
+    query = tx.run.await_args.args[0]
+    assert query.count("LIMIT $fanout") == 2
+    assert "$max_nodes + 1" in query
+    assert "[r:HAS_FEATURE|SOLVES]" in query
+    assert tx.run.await_args.kwargs == {"id": "prod_123", "max_nodes": 2, "fanout": 10}
+    assert [(node["id"], node["depth"], node["entity_type"]) for node in subgraph["nodes"]] == [
+        ("prod_123", 0, "Product"), ("feat_456", 1, "Feature")
+    ]
+    assert subgraph["edges"] == [{
+        "element_id": "5:1",
+        "type": "HAS_FEATURE",
+        "source_id": "prod_123",
+        "target_id": "feat_456",
+        "properties": {"confidence": 0.9}
+    }]
+    assert subgraph["truncated"] is True
+
+    # Exactly max_nodes nodes: nothing was cut
+    tx.run = AsyncMock(return_value=_AsyncResult([{"levels": [[product], [feature]], "rels": [has_feature]}]))
+    subgraph = await AsyncGraphService._subgraph_tx(tx, "prod_123", "Product", 2, None, 2, 10)
+    assert len(subgraph["nodes"]) == 2
+    assert subgraph["truncated"] is False
+
+
+@pytest.mark.asyncio
+async def test_subgraph_validates_bounds(async_graph_service):
+    """Test neighborhood bounds and relationship types are validated"""
+    with pytest.raises(ValueError, match="depth"):
+        await async_graph_service.subgraph("prod_123", depth=10)
+    with pytest.raises(ValueError, match="Invalid relationship type"):
+        await async_graph_service.subgraph("prod_123", rel_types=["BOGUS"])
+
+
+@pytest.mark.asyncio
+async def test_subgraph_fills_label_cache(async_graph_service, mock_async_neo4j_driver):
+    """Test traversed nodes are recorded in the label cache"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = {
+        "root": "prod_123",
+        "nodes": [{"id": "feat_456", "entity_type": "Feature", "depth": 1, "properties": {}}],
+        "edges": [],
+        "truncated": False
+    }
+
+    await async_graph_service.subgraph("prod_123", entity_type="Product")
+
+    assert async_graph_service._label_cache.get("feat_456") == "Feature"
+
+
+@pytest.mark.asyncio
+async def test_execute_query_caps_rows_and_sets_timeout(async_graph_service, mock_async_neo4j_driver):
+    """Test custom queries stop at the row cap and run with a timeout"""
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = [_explained("r"), _AsyncResult([{"n": i} for i in range(5)])]
+
+    result = await async_graph_service.execute_query(
+        "MATCH (p:Product) RETURN p.id AS n", max_rows=3, timeout=5
+    )
+
+    assert result["records"] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert result["truncated"] is True
+    assert session.run.await_args.args[0].timeout == 5
+    assert driver.session.call_args.kwargs["fetch_size"] == async_graph_service.query_fetch_size
+
+
+def test_execute_query_limits_cannot_be_raised(async_graph_service):
+    """Test callers can only tighten the configured guards"""
+    assert async_graph_service._query_limits(10 ** 6, 10 ** 9) == (
+        async_graph_service.query_timeout, async_graph_service.query_max_rows
+    )
+
+
+@pytest.mark.asyncio
+async def test_execute_query_plan_check(async_graph_service, mock_async_neo4j_driver):
+    """Test expensive plans are rejected and validated queries skip EXPLAIN"""
+    driver, session = mock_async_neo4j_driver
+    async_graph_service.query_plan_check = True
+    scan_plan = {
+        "operatorType": "ProduceResults@neo4j",
+        "arguments": {"EstimatedRows": 5e6},
+        "children": [{
+            "operatorType": "AllNodesScan@neo4j",
+            "arguments": {"EstimatedRows": 5e6},
+            "children": []
+        }]
+    }
+    seek_plan = {"operatorType": "NodeUniqueIndexSeek@neo4j", "arguments": {"EstimatedRows": 1}}
+    session.run.side_effect = [
+        _explained("r", scan_plan),
+        _explained("r", seek_plan), _AsyncResult([]),
+        _AsyncResult([])
+    ]
+
+    with pytest.raises(ValueError, match="AllNodesScan"):
+        await async_graph_service.execute_query("MATCH (n) RETURN n")
+    assert session.run.await_args.args[0].text.startswith("EXPLAIN ")
+
+    await async_graph_service.execute_query("MATCH (p:Product {id: $id}) RETURN p", {"id": "p1"})
+    await async_graph_service.execute_query("MATCH (p:Product {id: $id}) RETURN p", {"id": "p2"})
+
+    texts = [call.args[0].text for call in session.run.await_args_list]
+    assert sum(text.startswith("EXPLAIN") for text in texts) == 2
+    assert len(texts) == 4
+
+
+@pytest.mark.asyncio
+async def test_reads_use_read_access_and_writes_do_not(async_graph_service, mock_async_neo4j_driver, sample_product):
+    """Test read paths open read sessions so routing drivers send them to followers"""
+    from neo4j import READ_ACCESS
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = (sample_product, "Product")
+    session.execute_write.return_value = sample_product["id"]
+
+    await async_graph_service.query_entity(sample_product["id"])
+    assert driver.session.call_args.kwargs["default_access_mode"] == READ_ACCESS
+
+    await async_graph_service.create_entity("Product", {"id": "prod_new", "name": "New"})
+    assert "default_access_mode" not in driver.session.call_args.kwargs
+
+    session.run.side_effect = [_explained("r"), _AsyncResult([])]
+    await async_graph_service.execute_query("MATCH (p:Product) RETURN p.id AS id")
+    assert driver.session.call_args.kwargs["default_access_mode"] == READ_ACCESS
+    session.run.side_effect = [_explained("rw"), _AsyncResult([])]
+    await async_graph_service.execute_query("MATCH (p:Product {id: 'x'}) SET p.name = 'y'")
+    assert "default_access_mode" not in driver.session.call_args.kwargs
+
+    # Writes through procedures have no write clause; EXPLAIN still reports them
+    session.run.side_effect = [_explained("w"), _AsyncResult([])]
+    await async_graph_service.execute_query("CALL apoc.create.node(['Tag'], {name: 'x'}) YIELD node RETURN node")
+    assert "default_access_mode" not in driver.session.call_args.kwargs
+    session.run.side_effect = [_AsyncResult([])]
+    await async_graph_service.execute_query("MATCH (p:Product) RETURN p.id AS id")
+    assert driver.session.call_args.kwargs["default_access_mode"] == READ_ACCESS
+
+
+@pytest.mark.asyncio
+async def test_bookmarks_propagate_within_scope(async_graph_service, mock_async_neo4j_driver, sample_product):
+    """Test sessions wait for the request's bookmarks and hand back their own"""
+    from services.bookmarks import bookmark_scope
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = sample_product["id"]
+    session.last_bookmarks.return_value = MagicMock(raw_values=frozenset({"bm:2"}))
+
+    with bookmark_scope(["bm:1"]) as scope:
+        await async_graph_service.create_entity("Product", {"id": "prod_new", "name": "New"})
+
+    bookmarks = driver.session.call_args.kwargs["bookmarks"]
+    assert set(bookmarks.raw_values) == {"bm:1"}
+    assert scope.bookmarks == ["bm:2"]
+
+    await async_graph_service.create_entity("Product", {"id": "prod_other", "name": "Other"})
+    assert "bookmarks" not in driver.session.call_args.kwargs
+
+
+def _projection_results():
+    """session.run results for a projection load: ids per label, then relationships"""
+    from services.cypher import ENTITY_TYPES
+    nodes = {
+        "Product": [{"id": "p1"}, {"id": "p2"}, {"id": "p3"}],
+        "Feature": [{"id": "f1"}, {"id": "f2"}, {"id": "f3"}]
+    }
+    relationships = [
+        {"source_id": source, "target_id": target}
+        for source, target in [
+            ("p1", "f1"), ("p1", "f2"), ("p2", "f1"), ("p2", "f2"),
+            ("p3", "f1"), ("p3", "f3"), ("p1", "f1"), ("ghost", "f1")
+        ]
+    ]
+    return [_AsyncResult(nodes.get(label, [])) for label in ENTITY_TYPES] + [_AsyncResult(relationships)]
+
+
+@pytest.mark.asyncio
+async def test_refresh_projection_builds_csr_snapshot(async_graph_service, mock_async_neo4j_driver):
+    """Test the projection interns ids and drops relationships to unknown ids"""
+    from neo4j import READ_ACCESS
+    pytest.importorskip("numpy")
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = _projection_results()
+
+    projection = await async_graph_service.get_projection()
+
+    assert projection.node_count == 6
+    assert projection.relationship_count == 7
+    assert projection.dropped_relationships == 1
+    assert driver.session.call_args.kwargs["default_access_mode"] == READ_ACCESS
+    # Built once, then served from memory
+    assert await async_graph_service.get_projection() is projection
+    assert async_graph_service.projection_info()["stale"] is False
+
+    async_graph_service._invalidate("p1")
+    assert async_graph_service.projection_info()["stale"] is True
+
+
+@pytest.mark.asyncio
+async def test_projection_analytics(async_graph_service, mock_async_neo4j_driver):
+    """Test PageRank, degree and co-occurrence on a small projection"""
+    pytest.importorskip("numpy")
+    driver, session = mock_async_neo4j_driver
+    session.run.side_effect = _projection_results()
+    projection = await async_graph_service.refresh_projection()
+
+    ranked = projection.pagerank()
+    assert ranked[0]["id"] == "f1"
+    assert sum(entry["score"] for entry in ranked) == pytest.approx(1.0)
+    assert [entry["type"] for entry in projection.pagerank("Product", limit=2)] == ["Product"] * 2
+
+    assert projection.degree("Feature", limit=1) == [{"id": "f1", "type": "Feature", "degree": 4}]
+    assert projection.degree(direction="out", limit=1)[0] == {"id": "p1", "type": "Product", "degree": 3}
+
+    similar = projection.similar("f1")
+    assert [(entry["id"], entry["shared"]) for entry in similar] == [("f2", 2), ("f3", 1)]
+    assert similar[0]["jaccard"] == pytest.approx(2 / 3)
+    assert projection.similar("p1")[0]["id"] == "p2"
+    assert projection.similar("missing") is None
+
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        projection.pagerank("Nope")
+    with pytest.raises(ValueError, match="Invalid direction"):
+        projection.degree(direction="sideways")
+
+
+@pytest.mark.asyncio
+async def test_recommend_builds_index_and_follows_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test the index is built once, updated by relationship writes and rebuilt after raw writes"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"product_id": "p1", "type": "SOLVES", "target_id": "hot", "properties": {"effectiveness": 0.9}},
+        {"product_id": "p1", "type": "TARGETS", "target_id": "couples", "properties": {"priority": 2}},
+        {"product_id": "p2", "type": "SOLVES", "target_id": "hot", "properties": {"effectiveness": 0.95}}
+    ]
+
+    result = await async_graph_service.recommend(problem="hot")
+    assert [entry["product_id"] for entry in result["products"]] == ["p2", "p1"]
+    await async_graph_service.recommend(problem="hot")
+    assert session.execute_read.await_count == 1
+
+    # A new SOLVES relationship re-indexes just its product
+    session.execute_write.return_value = True
+    session.execute_read.return_value = [
+        {"product_id": "p3", "type": "SOLVES", "target_id": "hot", "properties": {"effectiveness": 1.0}}
+    ]
+    await async_graph_service.create_relationship("p3", "hot", "SOLVES", from_type="Product", to_type="Problem")
+    assert session.execute_read.await_args.args[1:] == (["p3"],)
+    assert (await async_graph_service.recommend(problem="hot"))["products"][0]["product_id"] == "p3"
+    assert (await async_graph_service.recommend(user_group="couples"))["total"] == 1
+
+    # Writes through custom Cypher cannot be attributed: rebuilt in the background
+    session.run.side_effect = [_explained("w"), _AsyncResult([])]
+    await async_graph_service.execute_query("MATCH (p:Product {id: 'p1'}) DETACH DELETE p")
+    session.execute_read.return_value = []
+    assert (await async_graph_service.recommend(problem="hot"))["total"] == 3
+    await async_graph_service._recommendations_task
+    assert (await async_graph_service.recommend(problem="hot"))["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_recommend_requires_a_facet(async_graph_service):
+    """Test a lookup needs at least one of problem, user_group or scenario"""
+    with pytest.raises(ValueError, match="at least one"):
+        await async_graph_service.recommend()
+
+
+@pytest.mark.asyncio
+async def test_resolve_entities_builds_index_and_follows_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test names resolve across labels and entity writes update the index"""
+    pytest.importorskip("numpy")
+    from services.cypher import ENTITY_TYPES
+    driver, session = mock_async_neo4j_driver
+    names = {
+        "Product": [{"id": "p1", "name": "CoolMax Gel Memory Foam Pillow"}],
+        "Feature": [{"id": "f1", "name": "Gel Memory Foam"}, {"id": "f2", "name": "Bamboo Cover"}]
+    }
+    session.run.side_effect = [_AsyncResult(names.get(label, [])) for label in ENTITY_TYPES]
+
+    results = await async_graph_service.resolve_entities(["gel memory-foam", "silk"], limit=2)
+
+    assert [result["name"] for result in results] == ["gel memory-foam", "silk"]
+    best = results[0]["candidates"][0]
+    assert (best["id"], best["entity_type"], best["score"]) == ("f1", "Feature", 1.0)
+    assert results[0]["candidates"][1]["id"] == "p1"
+    assert results[1]["candidates"] == []
+    products = await async_graph_service.resolve_entities(["gel memory foam"], entity_type="Product")
+    assert products[0]["candidates"][0]["id"] == "p1"
+    assert session.run.await_count == len(ENTITY_TYPES)
+    assert async_graph_service.cache_metrics()["resolution"]["entities"] == 3
+
+    session.execute_write.return_value = "f9"
+    await async_graph_service.create_entity("Feature", {"id": "f9", "name": "Silk Cover"})
+    session.execute_write.return_value = True
+    await async_graph_service.delete_entity("f1", "Feature")
+    results = await async_graph_service.resolve_entities(["silk cover", "gel memory foam"], entity_type="Feature")
+    assert results[0]["candidates"][0]["id"] == "f9"
+    assert results[1]["candidates"] == []
+
+
+@pytest.mark.asyncio
+async def test_resolve_entities_validates_request(async_graph_service):
+    """Test empty name lists, bad types, limits and scores are rejected"""
+    with pytest.raises(ValueError, match="empty"):
+        await async_graph_service.resolve_entities([])
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.resolve_entities(["gel"], entity_type="Bogus")
+    with pytest.raises(ValueError, match="min_score"):
+        await async_graph_service.resolve_entities(["gel"], min_score=1.5)
+
+
+@pytest.mark.asyncio
+async def test_semantic_search_builds_index_and_follows_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test semantic search loads entity texts once, filters labels and follows entity writes"""
+    pytest.importorskip("numpy")
+    from services.cypher import ENTITY_TYPES
+    driver, session = mock_async_neo4j_driver
+    documents = {
+        "Product": [
+            {"id": "p1", "name": "CoolMax Pillow", "description": "Gel-infused memory foam that sleeps cool"},
+            {"id": "p2", "name": "Latex Mattress", "description": "Firm natural latex"}
+        ],
+        "Feature": [{"id": "f1", "name": "Cooling Gel", "description": None}]
+    }
+    session.run.side_effect = [_AsyncResult(documents.get(label, [])) for label in ENTITY_TYPES]
+
+    results = await async_graph_service.semantic_search("cool gel pillow", limit=5)
+
+    assert [result["id"] for result in results] == ["p1", "f1"]
+    assert results[0]["entity_type"] == "Product" and 0 < results[0]["score"] <= 1
+    features = await async_graph_service.semantic_search("gel", entity_types=["Feature"])
+    assert [result["id"] for result in features] == ["f1"]
+    assert session.run.await_count == len(ENTITY_TYPES)
+    assert async_graph_service.cache_metrics()["semantic"]["entities"] == 3
+
+    session.execute_write.return_value = "p9"
+    await async_graph_service.create_entity("Product", {"id": "p9", "name": "Latex Topper", "description": "latex"})
+    session.execute_write.return_value = True
+    await async_graph_service.delete_entity("p2", "Product")
+    assert [result["id"] for result in await async_graph_service.semantic_search("latex")] == ["p9"]
+
+
+@pytest.mark.asyncio
+async def test_semantic_search_validates_request(async_graph_service):
+    """Test blank texts, bad types, limits and scores are rejected"""
+    with pytest.raises(ValueError, match="empty"):
+        await async_graph_service.semantic_search("  ")
+    with pytest.raises(ValueError, match="Invalid entity type"):
+        await async_graph_service.semantic_search("gel", entity_types=["Product", "Bogus"])
+    with pytest.raises(ValueError, match="limit"):
+        await async_graph_service.semantic_search("gel", limit=0)
+    with pytest.raises(ValueError, match="min_score"):
+        await async_graph_service.semantic_search("gel", min_score=-0.1)
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_counts_operations(async_graph_service, mock_async_neo4j_driver):
+    """Test a planned batch reports per-kind counts and caches every written label"""
+    driver, session = mock_async_neo4j_driver
+
+    result = await async_graph_service.execute_batch([
+        {"op": "create", "entity_type": "Product", "properties": {
+            "id": "p1", "name": "Cloud Pillow", "sku": "SKU-1", "category": "pillows", "brand": "Acme"
+        }},
+        {"op": "create", "entity_type": "Feature", "properties": {"id": "f1", "name": "Gel", "feature_type": "material"}},
+        {"op": "relate", "from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE", "properties": {"confidence": 0.9}},
+        {"op": "create", "entity_type": "Feature", "properties": {"id": "f2", "name": "Latex", "feature_type": "material"}},
+        {"op": "relate", "from_id": "p1", "to_id": "f2", "rel_type": "HAS_FEATURE"},
+        {"op": "update", "id": "f1", "properties": {"importance_score": 0.8}},
+        {"op": "delete", "id": "f0", "entity_type": "Feature"}
+    ])
+
+    assert result == {
+        "operations": 7, "statements": 5, "created": 3, "updated": 1, "deleted": 1, "related": 2
+    }
+    assert session.execute_write.await_args.args[0] == AsyncGraphService._batch_tx
+    assert async_graph_service._label_cache.get("p1") == "Product"
+    assert async_graph_service._label_cache.get("f2") == "Feature"
+
+
+@pytest.mark.asyncio
+async def test_batch_tx_rolls_back_on_missing_entity():
+    """Test an update matching no entity aborts the transaction"""
+    from services.batch import BatchError, plan_batch
+    plan = plan_batch([
+        {"op": "create", "entity_type": "Scenario", "properties": {"id": "s1", "name": "Summer"}},
+        {"op": "update", "id": "s9", "entity_type": "Scenario", "properties": {"name": "Winter"}}
+    ], lambda entity_id, entity_type: (entity_type, False))
+    tx = MagicMock()
+    tx.run = AsyncMock(side_effect=[_AsyncResult([{"created": 1}]), _AsyncResult([{"applied": []}])])
+
+    with pytest.raises(BatchError) as error:
+        await AsyncGraphService._batch_tx(tx, plan.statements)
+
+    assert error.value.errors == [{"index": 1, "error": "Entity s9 not found"}]
+    assert tx.run.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_retries_stale_cached_labels(async_graph_service, mock_async_neo4j_driver):
+    """Test a batch failing on a cached label is retried probing every label"""
+    from services.batch import BatchError
+    driver, session = mock_async_neo4j_driver
+    async_graph_service._label_cache.put("f1", "Problem")
+    session.execute_write.side_effect = [BatchError([{"index": 0, "error": "Entity f1 not found"}]), None]
+
+    await async_graph_service.execute_batch([{"op": "update", "id": "f1", "properties": {"name": "Gel"}}])
+
+    assert session.execute_write.await_count == 2
+    retried = session.execute_write.await_args.args[1]
+    assert "CALL {" in retried[0].query
+    assert async_graph_service._label_cache.get("f1") is None
+
+
+def _offers():
+    return [
+        {"id": "o1", "sku": "S1", "region": "US", "price": 12.0, "availability": True,
+         "updated_at": "2024-05-01T10:00:00"},
+        {"id": "o2", "sku": "S1", "region": "US", "price": 9.0, "availability": True,
+         "valid_until": "2024-06-01T00:00:00", "updated_at": "2024-05-02T10:00:00"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_find_offers_loads_index_and_follows_writes(async_graph_service, mock_async_neo4j_driver):
+    """Test the offer index is loaded once, then kept current by this service's writes"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = _offers()
+    async_graph_service.offer_refresh_interval = 0
+
+    assert [offer["id"] for offer in await async_graph_service.find_offers("S1", "US")] == ["o1"]
+    assert session.execute_read.await_args.args[1:] == (None,)
+    await async_graph_service.find_offers("S1")
+    assert session.execute_read.await_count == 1
+
+    session.execute_write.return_value = "o9"
+    await async_graph_service.create_entity(
+        "Offer", {"id": "o9", "sku": "S1", "region": "US", "price": 3.0, "availability": True}
+    )
+    assert [offer["id"] for offer in await async_graph_service.find_offers("S1", "US")] == ["o9", "o1"]
+
+    session.execute_write.return_value = True
+    await async_graph_service.update_entity("o9", {"availability": False})
+    assert [offer["id"] for offer in await async_graph_service.find_offers("S1", "US")] == ["o1"]
+
+    await async_graph_service.delete_entity("o1", "Offer")
+    assert await async_graph_service.find_offers("S1", "US") == []
+    assert session.execute_read.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_offers_applies_delta_since_watermark(async_graph_service, mock_async_neo4j_driver):
+    """Test a refresh fetches offers updated since the watermark unless full"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = _offers()
+    await async_graph_service.refresh_offers()
+
+    session.execute_read.return_value = [dict(_offers()[0], price=20.0, updated_at="2024-05-03T00:00:00")]
+    await async_graph_service.refresh_offers()
+    assert session.execute_read.await_args.args[1:] == ("2024-05-02T10:00:00",)
+    assert async_graph_service.offer_metrics()["watermark"] == "2024-05-03T00:00:00"
+    assert async_graph_service.offer_metrics()["offers"] == 2
+
+    session.execute_read.return_value = []
+    await async_graph_service.refresh_offers(full=True)
+    assert session.execute_read.await_args.args[1:] == (None,)
+    assert async_graph_service.offer_metrics()["offers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_offer_delta_starts_from_a_utc_second_watermark(async_graph_service, mock_async_neo4j_driver):
+    """Test the delta after an offset, sub-second updated_at seeks from its UTC second"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [dict(_offers()[0], updated_at="2024-05-02T12:00:00.250+02:00")]
+
+    await async_graph_service.refresh_offers()
+    await async_graph_service.refresh_offers()
+
+    assert session.execute_read.await_args.args[1:] == ("2024-05-02T10:00:00",)
+
+
+@pytest.mark.asyncio
+async def test_find_offers_requires_sku(async_graph_service):
+    """Test an empty SKU is rejected"""
+    with pytest.raises(ValueError, match="sku"):
+        await async_graph_service.find_offers("")
+
+
+def _card_row(product_id="p1", **overrides):
+    row = {
+        "product": {"id": product_id, "name": "CoolMax Pillow", "sku": "S1"},
+        "features": [{"id": "f1", "name": "Gel Foam", "importance_score": 0.5}],
+        "problems": [], "user_groups": [], "competitors": [],
+        "offers": [{"id": "o1", "sku": "S1", "price": 30.0, "availability": True}]
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.mark.asyncio
+async def test_get_product_cards_follow_product_creates_and_deletes(async_graph_service, mock_async_neo4j_driver):
+    """Test new products get a card as soon as they are written and deleted ones lose it"""
+    driver, session = mock_async_neo4j_driver
+    session.run.return_value = _AsyncResult([_card_row("p1")])
+    assert list(await async_graph_service.get_product_cards(["p1", "p9"])) == ["p1"]
+
+    session.execute_write.return_value = "p2"
+    session.execute_read.return_value = [_card_row("p2")]
+    await async_graph_service.create_entity("Product", {"id": "p2", "name": "Second"})
+    assert session.execute_read.await_args.args[1:] == (["p2"],)
+    assert await async_graph_service.get_product_card("p2") is not None
+
+    session.execute_write.return_value = True
+    await async_graph_service.delete_entity("p2", "Product")
+    assert await async_graph_service.get_product_card("p2") is None
+    assert session.run.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_product_cards_rerenders_failed_and_expired_cards(async_graph_service, mock_async_neo4j_driver):
+    """Test cards left dirty by a failed update or past their offer window are re-rendered on read"""
+    import json
+    import time
+    driver, session = mock_async_neo4j_driver
+    session.run.return_value = _AsyncResult([_card_row("p1")])
+    await async_graph_service.get_product_cards(["p1"])
+
+    session.execute_write.return_value = True
+    session.execute_read.side_effect = RuntimeError("leader switch")
+    await async_graph_service.update_entity("p1", {"name": "Renamed"}, entity_type="Product")
+    assert async_graph_service.product_card_metrics()["dirty"] == 1
+
+    session.execute_read.side_effect = None
+    session.execute_read.return_value = [_card_row("p1", product={"id": "p1", "name": "Renamed"})]
+    assert json.loads(await async_graph_service.get_product_card("p1"))["product"]["name"] == "Renamed"
+
+    cards = async_graph_service._cards._cards
+    cards["p1"] = cards["p1"]._replace(expires_at=time.time() - 1)
+    await async_graph_service.get_product_card("p1")
+    assert session.execute_read.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_get_product_cards_validates_ids(async_graph_service):
+    """Test empty and oversized id lists are rejected"""
+    with pytest.raises(ValueError, match="must not be empty"):
+        await async_graph_service.get_product_cards([])
+    with pytest.raises(ValueError, match="At most"):
+        await async_graph_service.get_product_cards([f"p{i}" for i in range(1001)])
+
+
+@pytest.mark.asyncio
+async def test_compact_changes_numbers_then_expires_in_batches(async_graph_service, mock_async_neo4j_driver):
+    """Test compaction numbers pending events and deletes past both retention limits"""
+    import time
+    from services.cypher import CHANGE_FEED_BATCH_SIZE
+    driver, session = mock_async_neo4j_driver
+    async_graph_service.change_retention_events = 100
+    async_graph_service.change_retention_seconds = 60
+    session.execute_read.return_value = 250
+    session.execute_write.side_effect = [
+        CHANGE_FEED_BATCH_SIZE, 5,        # sequencing
+        CHANGE_FEED_BATCH_SIZE, 50,       # by seq
+        0                                 # by stamp
+    ]
+
+    result = await async_graph_service.compact_changes()
+
+    assert result == {"sequenced": CHANGE_FEED_BATCH_SIZE + 5, "deleted": CHANGE_FEED_BATCH_SIZE + 50}
+    calls = session.execute_write.await_args_list
+    assert calls[2].args[1:] == ("seq", 151, CHANGE_FEED_BATCH_SIZE)
+    assert calls[4].args[1] == "stamp"
+    assert calls[4].args[2] < time.time_ns() - 59 * 10 ** 9
+
+    async_graph_service.change_retention_events = async_graph_service.change_retention_seconds = 0
+    session.execute_write.side_effect = [0]
+    assert await async_graph_service.compact_changes() == {"sequenced": 0, "deleted": 0}
+
+
+@pytest.mark.asyncio
+async def test_write_tx_appends_change_events():
+    """Test write transaction functions log their changes in the same transaction"""
+    from services.cypher import append_changes_query
+    appended = MagicMock(consume=AsyncMock())
+    tx = MagicMock()
+    tx.run = AsyncMock(side_effect=[_AsyncResult([{"n": MagicMock(labels={"Feature"})}]), appended])
+
+    assert await AsyncGraphService._update_entity_tx(tx, "f1", {"name": "Gel"}, None, changes=True)
+
+    query, = tx.run.await_args.args
+    assert query == append_changes_query()
+    assert tx.run.await_args.kwargs["events"] == [{
+        "source": "knowledge-graph", "kind": "entity", "op": "update",
+        "entity_type": "Feature", "entity_id": "f1", "properties": '{"name":"Gel"}'
+    }]
+    appended.consume.assert_awaited_once()
+
+    tx.run = AsyncMock(return_value=_AsyncResult([{"deleted": 0}]))
+    assert not await AsyncGraphService._delete_entity_tx(tx, "f9", "Feature", changes=True)
+    assert tx.run.await_count == 1
+
+    tx.run = AsyncMock(side_effect=[_AsyncResult([{"deleted": 1, "labels": ["Feature"]}]), appended])
+    assert await AsyncGraphService._delete_entity_tx(tx, "f1", changes=True)
+    assert tx.run.await_args.kwargs["events"][0]["entity_type"] == "Feature"
+
+
+@pytest.mark.asyncio
+async def test_batch_tx_logs_one_append_for_the_batch():
+    """Test a mixed batch appends the events of every statement at the end"""
+    from services.batch import plan_batch
+    from services.cypher import append_changes_query
+    plan = plan_batch([
+        {"op": "create", "entity_type": "Feature",
+         "properties": {"id": "f1", "name": "Gel", "feature_type": "material"}},
+        {"op": "relate", "from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE",
+         "from_type": "Product", "to_type": "Feature"},
+        {"op": "delete", "id": "s1", "entity_type": "Scenario"}
+    ], lambda entity_id, entity_type: (entity_type, False))
+    tx = MagicMock()
+    tx.run = AsyncMock(side_effect=[
+        _AsyncResult([{"created": 1}]),
+        _AsyncResult([{"applied": [1], "created": [1]}]),
+        _AsyncResult([{"applied": [2], "labels": [["Scenario"]]}]),
+        MagicMock(consume=AsyncMock())
+    ])
+
+    await AsyncGraphService._batch_tx(tx, plan.statements, changes=True)
+
+    assert tx.run.await_count == 4
+    assert tx.run.await_args.args[0] == append_changes_query()
+    events = tx.run.await_args.kwargs["events"]
+    assert [(event["kind"], event["op"]) for event in events] == [
+        ("entity", "create"), ("relationship", "create"), ("entity", "delete")
+    ]
+    assert events[2]["entity_type"] == "Scenario"
+
+
+@pytest.mark.asyncio
+async def test_writes_pass_change_feed_setting(async_graph_service, mock_async_neo4j_driver):
+    """Test writes ask their transaction to log changes unless the feed is disabled"""
+    driver, session = mock_async_neo4j_driver
+    session.execute_write.return_value = True
+
+    await async_graph_service.update_entity("f1", {"name": "Gel"}, entity_type="Feature")
+    assert session.execute_write.await_args.kwargs == {"changes": True}
+
+    async_graph_service.change_feed = False
+    await async_graph_service.delete_relationship("p1", "f1", "HAS_FEATURE")
+    assert session.execute_write.await_args.kwargs == {"changes": False}
+
+
+@pytest.mark.asyncio
+async def test_get_changes_pages_by_sequence(async_graph_service, mock_async_neo4j_driver):
+    """Test change reads decode events and return the next since"""
+    from neo4j import READ_ACCESS
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = [
+        {"seq": 4, "kind": "entity", "op": "create", "entity_id": "p1", "properties": '{"name":"A"}'},
+        {"seq": 5, "kind": "relationship", "op": "delete", "rel_type": "HAS_FEATURE"}
+    ]
+
+    page = await async_graph_service.get_changes(since=3, limit=2)
+
+    assert [change["seq"] for change in page["changes"]] == [4, 5]
+    assert page["changes"][0]["properties"] == {"name": "A"}
+    assert page["changes"][1]["entity_id"] is None
+    assert page["next_since"] == 5
+    assert session.execute_read.await_args.args[1:] == (3, 2)
+    assert driver.session.call_args_list[0].kwargs["default_access_mode"] == READ_ACCESS
+
+    session.execute_read.return_value = []
+    assert (await async_graph_service.get_changes(since=5))["next_since"] == 5
+    with pytest.raises(ValueError):
+        await async_graph_service.get_changes(since=-1)
+    with pytest.raises(ValueError):
+        await async_graph_service.get_changes(limit=0)
+
+
+@pytest.mark.asyncio
+async def test_get_changes_shares_one_rate_limited_sequencing_run(async_graph_service, mock_async_neo4j_driver):
+    """Test change reads start at most one background sequencing run per poll interval"""
+    import asyncio
+    driver, session = mock_async_neo4j_driver
+    session.execute_read.return_value = []
+    session.execute_write.return_value = 3
+
+    await asyncio.gather(*(async_graph_service.get_changes(since=0) for _ in range(5)))
+    assert await async_graph_service._sequence_task == 3
+    await async_graph_service.get_changes(since=0)
+
+    session.execute_write.assert_awaited_once()
+    assert session.execute_write.await_args.args[0] == AsyncGraphService._sequence_changes_tx
+
+    async_graph_service._changes_sequenced_at -= async_graph_service.change_poll_interval
+    await async_graph_service.get_changes(since=0)
+    await async_graph_service._sequence_task
+    assert session.execute_write.await_count == 2
@@ -1,247 +1,783 @@
 """
 Unit Tests for GraphService
 
-Tests core graph database operations with mocked Neo4j driver
+Tests the bulk write service with a mocked Neo4j driver, and the query
+builders and in-memory indexes shared with AsyncGraphService
 """
 import pytest
+import time
 from services.graph_service import GraphService
 from unittest.mock import Mock, MagicMock
 
 
-def test_create_entity(graph_service, sample_product, mock_neo4j_driver):
-    """Test entity creation"""
+def test_health_check_success(graph_service, mock_neo4j_driver):
+    """Test successful health check"""
     driver, session = mock_neo4j_driver
 
-    # Mock transaction result
-    session.execute_write.return_value = sample_product["id"]
+    mock_result = Mock()
+    mock_result.single.return_value = {"test": 1}
+    session.run.return_value = mock_result
 
-    # Execute
-    entity_id = graph_service.create_entity("Product", sample_product)
+    result = graph_service.health_check()
+
+    assert result is True
+
+
+def test_health_check_failure(graph_service, mock_neo4j_driver):
+    """Test failed health check"""
+    driver, session = mock_neo4j_driver
+    session.run.side_effect = Exception("Connection failed")
 
-    # Assert
-    assert entity_id == sample_product["id"]
-    session.execute_write.assert_called_once()
+    result = graph_service.health_check()
 
+    assert result is False
 
-def test_create_entity_invalid_type(graph_service):
-    """Test entity creation with invalid type"""
-    with pytest.raises(ValueError, match="Invalid entity type"):
-        graph_service.create_entity("InvalidType", {"id": "test_123"})
 
+def test_close(graph_service):
+    """Test closing service connection"""
+    # Should not raise exception
+    graph_service.close()
+    assert True
 
-def test_create_entity_missing_id(graph_service):
-    """Test entity creation without ID"""
-    with pytest.raises(ValueError, match="must include 'id' field"):
-        graph_service.create_entity("Product", {"name": "Test"})
 
+def test_from_settings_passes_pool_options(monkeypatch):
+    """Test that pool options from settings reach the driver"""
+    captured = {}
 
-def test_create_relationship(graph_service, sample_relationship, mock_neo4j_driver):
-    """Test relationship creation"""
-    driver, session = mock_neo4j_driver
-    session.execute_write.return_value = True
-
-    # Execute
-    result = graph_service.create_relationship(
-        from_id=sample_relationship["from_id"],
-        to_id=sample_relationship["to_id"],
-        rel_type=sample_relationship["rel_type"],
-        properties=sample_relationship["properties"]
+    def fake_driver(uri, **kwargs):
+        captured.update(kwargs)
+        return MagicMock()
+
+    monkeypatch.setattr("neo4j.GraphDatabase.driver", fake_driver)
+    settings = Mock(
+        NEO4J_URI="bolt://localhost:7687",
+        NEO4J_USER="neo4j",
+        NEO4J_PASSWORD="test",
+        NEO4J_MAX_CONNECTION_POOL_SIZE=25,
+        NEO4J_CONNECTION_ACQUISITION_TIMEOUT=5.0,
+        NEO4J_MAX_CONNECTION_LIFETIME=600
     )
 
-    # Assert
-    assert result is True
-    session.execute_write.assert_called_once()
+    service = GraphService.from_settings(settings)
 
+    assert captured["max_connection_pool_size"] == 25
+    assert captured["connection_acquisition_timeout"] == 5.0
+    assert captured["max_connection_lifetime"] == 600
+    assert service.pool_metrics()["max_pool_size"] == 25
 
-def test_create_relationship_invalid_type(graph_service):
-    """Test relationship creation with invalid type"""
-    with pytest.raises(ValueError, match="Invalid relationship type"):
-        graph_service.create_relationship(
-            from_id="prod_123",
-            to_id="feat_456",
-            rel_type="INVALID_TYPE"
-        )
 
+def test_pool_metrics_track_sessions(graph_service, mock_neo4j_driver):
+    """Test pool metrics count sessions in use and released"""
+    with graph_service._pooled_session():
+        assert graph_service.pool_metrics()["in_use"] == 1
+    graph_service.health_check()
 
-def test_query_entity(graph_service, sample_product, mock_neo4j_driver):
-    """Test entity query"""
-    driver, session = mock_neo4j_driver
+    metrics = graph_service.pool_metrics()
+    assert metrics["in_use"] == 0
+    assert metrics["idle"] == metrics["max_pool_size"]
+    assert metrics["peak_in_use"] == 1
+    assert metrics["sessions_total"] == 2
+    assert "avg_acquisition_ms" not in metrics
+
+
+def test_pool_defaults_match_settings(monkeypatch):
+    """Test a service built without pool options uses the settings defaults"""
+    from config import Settings
+    captured = {}
 
-    # Mock query result
-    session.execute_read.return_value = sample_product
+    def fake_driver(uri, **kwargs):
+        captured.update(kwargs)
+        return MagicMock()
 
-    # Execute
-    result = graph_service.query_entity("prod_123")
+    monkeypatch.setattr("neo4j.GraphDatabase.driver", fake_driver)
+    GraphService(uri="bolt://localhost:7687", user="neo4j", password="test")
 
-    # Assert
-    assert result == sample_product
-    session.execute_read.assert_called_once()
+    defaults = {name: field.default for name, field in Settings.model_fields.items()}
+    assert captured["max_connection_pool_size"] == defaults["NEO4J_MAX_CONNECTION_POOL_SIZE"]
+    assert captured["connection_acquisition_timeout"] == defaults["NEO4J_CONNECTION_ACQUISITION_TIMEOUT"]
+    assert captured["max_connection_lifetime"] == defaults["NEO4J_MAX_CONNECTION_LIFETIME"]
 
 
-def test_query_entity_not_found(graph_service, mock_neo4j_driver):
-    """Test query for non-existent entity"""
+def test_create_entities_bulk_groups_by_label(graph_service, mock_neo4j_driver):
+    """Test bulk creation groups rows by label and chunks them"""
     driver, session = mock_neo4j_driver
-    session.execute_read.return_value = None
+    session.execute_write.side_effect = lambda tx_func, label, rows, changes: len(rows)
 
-    result = graph_service.query_entity("nonexistent")
+    entities = [
+        {"entity_type": "Product", "properties": {"id": f"prod_{i}"}}
+        for i in range(5)
+    ] + [{"entity_type": "Feature", "properties": {"id": "feat_1"}}]
 
-    assert result is None
+    result = graph_service.create_entities_bulk(entities, batch_size=2)
 
+    assert result == {"created": 6, "failed": 0, "errors": []}
+    # Products: 3 chunks of <=2 rows, Features: 1 chunk
+    assert session.execute_write.call_count == 4
+    labels = [call.args[1] for call in session.execute_write.call_args_list]
+    assert labels == ["Product", "Product", "Product", "Feature"]
 
-def test_update_entity(graph_service, mock_neo4j_driver):
-    """Test entity update"""
+
+def test_create_entities_bulk_reports_row_errors(graph_service, mock_neo4j_driver):
+    """Test bulk creation isolates failing rows without aborting the batch"""
     driver, session = mock_neo4j_driver
-    session.execute_write.return_value = True
 
-    result = graph_service.update_entity(
-        "prod_123",
-        {"name": "Updated Product", "price": 199.99}
-    )
+    def execute_write(tx_func, label, payload, changes):
+        if tx_func == GraphService._create_entities_batch_tx:
+            raise Exception("constraint violation")
+        if payload["id"] == "prod_dup":
+            raise Exception("already exists")
+        return payload["id"]
 
-    assert result is True
-    session.execute_write.assert_called_once()
+    session.execute_write.side_effect = execute_write
 
+    result = graph_service.create_entities_bulk([
+        {"entity_type": "Product", "properties": {"id": "prod_1"}},
+        {"entity_type": "Product", "properties": {"id": "prod_dup"}},
+        {"entity_type": "Invalid", "properties": {"id": "x"}},
+        {"entity_type": "Feature", "properties": {"name": "no id"}},
+    ])
 
-def test_delete_entity(graph_service, mock_neo4j_driver):
-    """Test entity deletion"""
-    driver, session = mock_neo4j_driver
-    session.execute_write.return_value = True
+    assert result["created"] == 1
+    assert result["failed"] == 3
+    assert [error["index"] for error in result["errors"]] == [1, 2, 3]
+    assert "already exists" in result["errors"][0]["error"]
 
-    result = graph_service.delete_entity("prod_123")
 
-    assert result is True
-    session.execute_write.assert_called_once()
+def test_label_cache_evicts_least_recently_used():
+    """Test the label cache stays bounded"""
+    from services.label_cache import LabelCache
 
+    cache = LabelCache(max_size=2)
+    cache.put("a", "Product")
+    cache.put("b", "Feature")
+    cache.get("a")
+    cache.put("c", "Problem")
 
-def test_delete_entity_not_found(graph_service, mock_neo4j_driver):
-    """Test deleting non-existent entity"""
-    driver, session = mock_neo4j_driver
-    session.execute_write.return_value = False
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "Product"
 
-    result = graph_service.delete_entity("nonexistent")
 
-    assert result is False
+def test_cursor_roundtrip():
+    """Test cursors are opaque and decode back to their position"""
+    from services.cypher import encode_cursor, decode_cursor
 
+    cursor = encode_cursor({"label": "Feature", "id": "feat_9"})
 
-def test_delete_relationship(graph_service, mock_neo4j_driver):
-    """Test relationship deletion"""
-    driver, session = mock_neo4j_driver
-    session.execute_write.return_value = True
+    assert "feat_9" not in cursor
+    assert decode_cursor(cursor) == {"label": "Feature", "id": "feat_9"}
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not-a-cursor")
 
-    result = graph_service.delete_relationship(
-        from_id="prod_123",
-        to_id="feat_456",
-        rel_type="HAS_FEATURE"
-    )
 
-    assert result is True
-    session.execute_write.assert_called_once()
+def test_read_cache_ttl_and_stale_fill():
+    """Test entries expire and fills racing an invalidation are dropped"""
+    from services.read_cache import ReadCache, MISSING
 
+    cache = ReadCache(max_size=10, ttl_seconds=0.01)
+    cache.put("a", 1, tags=["a"])
+    time.sleep(0.02)
+    assert cache.get("a") is MISSING
+    assert cache.metrics()["expirations"] == 1
 
-def test_query_relationships(graph_service, mock_neo4j_driver):
-    """Test querying entity relationships"""
-    driver, session = mock_neo4j_driver
+    cache = ReadCache(max_size=10, ttl_seconds=60)
+    version = cache.version()
+    cache.invalidate("a")
+    cache.put("a", 1, tags=["a"], version=version)
+    assert cache.get("a") is MISSING
 
-    # Mock relationship results
-    mock_relationships = [
-        {
-            "direction": "outgoing",
-            "type": "HAS_FEATURE",
-            "properties": {"confidence": 0.95},
-            "target": {"id": "feat_456", "name": "Cool Feature"}
-        }
-    ]
-    session.execute_read.return_value = mock_relationships
 
-    # Execute
-    result = graph_service.query_relationships(
-        entity_id="prod_123",
-        rel_type="HAS_FEATURE",
-        direction="outgoing"
-    )
+def test_read_cache_evicts_least_recently_used():
+    """Test the read cache stays bounded and drops tag references"""
+    from services.read_cache import ReadCache, MISSING
+
+    cache = ReadCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1, tags=["x"])
+    cache.put("b", 2, tags=["x"])
+    cache.get("a")
+    cache.put("c", 3, tags=["y"])
 
-    # Assert
-    assert len(result) == 1
-    assert result[0]["type"] == "HAS_FEATURE"
-    session.execute_read.assert_called_once()
+    assert len(cache) == 2
+    assert cache.get("b") is MISSING
+    cache.invalidate("x")
+    assert cache.get("a") is MISSING
+    assert cache.get("c") == 3
 
 
-def test_search_entities(graph_service, mock_neo4j_driver):
-    """Test entity search"""
+def test_upsert_relationships_bulk_groups_and_counts(graph_service, mock_neo4j_driver):
+    """Test relationships are merged per (type, labels) with created/matched/missing counts"""
     driver, session = mock_neo4j_driver
+    session.execute_write.side_effect = [
+        {"created": 1, "matched": 0},
+        {"created": 0, "matched": 1}
+    ]
 
-    # Mock search results
-    mock_entities = [
-        {"id": "prod_123", "name": "Product 1"},
-        {"id": "prod_456", "name": "Product 2"}
+    result = graph_service.upsert_relationships_bulk([
+        {"from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE",
+         "from_type": "Product", "to_type": "Feature", "properties": {"w": 1}},
+        {"from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE",
+         "from_type": "Product", "to_type": "Feature", "properties": {"w": 2}},
+        {"from_id": "p1", "to_id": "f2", "rel_type": "HAS_FEATURE",
+         "from_type": "Product", "to_type": "Feature"},
+        {"from_id": "f1", "to_id": "x1", "rel_type": "SOLVES",
+         "from_type": "Feature", "to_type": "Problem"},
+        {"from_id": "p1", "to_id": "f1", "rel_type": "BOGUS"}
+    ])
+
+    assert result["created"] == 1
+    assert result["matched"] == 1
+    assert result["missing"] == 1
+    assert result["failed"] == 1
+    assert result["errors"][0]["index"] == 4
+    first = session.execute_write.call_args_list[0].args
+    assert first[0] == GraphService._merge_relationships_batch_tx
+    assert first[1:4] == ("HAS_FEATURE", "Product", "Feature")
+    # Repeated pairs are collapsed, last properties winning
+    assert [(row["to_id"], row["properties"]) for row in first[4]] == [("f1", {"w": 2}), ("f2", {})]
+
+
+def test_upsert_relationships_bulk_reports_failed_chunks(graph_service, mock_neo4j_driver):
+    """Test a failing chunk reports each of its rows"""
+    driver, session = mock_neo4j_driver
+    session.execute_write.side_effect = Exception("deadlock")
+
+    result = graph_service.upsert_relationships_bulk([
+        {"from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE"},
+        {"from_id": "p2", "to_id": "f1", "rel_type": "HAS_FEATURE"}
+    ])
+
+    assert result["failed"] == 2
+    assert [error["index"] for error in result["errors"]] == [0, 1]
+
+
+def test_merge_relationships_batch_query_is_idempotent():
+    """Test the batch upsert uses MERGE on label-qualified endpoints"""
+    tx = MagicMock()
+    tx.run.return_value.single.return_value = {"created": 2, "matched": 0}
+
+    counts = GraphService._merge_relationships_batch_tx(tx, "SOLVES", "Feature", None, [])
+
+    query = tx.run.call_args.args[0]
+    assert "MERGE (from)-[r:SOLVES]->(to)" in query
+    assert "CREATE" not in query
+    assert "MATCH (from:Feature {id: row.from_id})" in query
+    assert "WITH row MATCH (to:Problem {id: row.to_id})" in query
+    assert counts == {"created": 2, "matched": 0}
+
+
+def _recommendation_rows():
+    return [
+        {"product_id": "p1", "type": "SOLVES", "target_id": "hot", "properties": {"effectiveness": 0.9}},
+        {"product_id": "p1", "type": "TARGETS", "target_id": "couples", "properties": {"priority": 2}},
+        {"product_id": "p2", "type": "SOLVES", "target_id": "hot", "properties": {"effectiveness": 0.95}},
+        {"product_id": "p2", "type": "APPLIES_TO", "target_id": "summer", "properties": {}},
+        {"product_id": "p3", "type": "TARGETS", "target_id": "couples", "properties": {"priority": 1}}
     ]
-    session.execute_read.return_value = mock_entities
 
-    # Execute
-    result = graph_service.search_entities(
-        entity_type="Product",
-        search_text="Product",
-        limit=10
-    )
 
-    # Assert
-    assert len(result) == 2
-    session.execute_read.assert_called_once()
+def test_recommendation_index_ranks_combinations():
+    """Test every facet combination is ranked and deletions propagate"""
+    from services.recommendations import RecommendationIndex
 
+    index = RecommendationIndex()
+    index.load(_recommendation_rows())
 
-def test_execute_cypher(graph_service, mock_neo4j_driver):
-    """Test custom Cypher query execution"""
-    driver, session = mock_neo4j_driver
+    products, total = index.lookup(problem="hot")
+    assert [entry["product_id"] for entry in products] == ["p2", "p1"]
+    assert total == 2
+    assert index.lookup(user_group="couples")[0] == [
+        {"product_id": "p3", "score": 1.0}, {"product_id": "p1", "score": 0.5}
+    ]
+    assert index.lookup("hot", "couples")[0] == [{"product_id": "p1", "score": 0.45}]
+    assert index.lookup("hot", scenario="summer")[0] == [{"product_id": "p2", "score": 0.95}]
+    assert index.lookup("hot", limit=1)[1] == 2
+
+    index.remove_entity("hot")
+    assert index.lookup(problem="hot") == ([], 0)
+    index.remove_entity("p3")
+    assert [entry["product_id"] for entry in index.lookup(user_group="couples")[0]] == ["p1"]
+
+    index.update_products(["p1"], [])
+    assert index.lookup(user_group="couples") == ([], 0)
+    assert index.metrics()["products"] == 1
+
+
+def test_trigram_index_matches_brute_force():
+    """Test indexed trigram similarity equals a brute-force Jaccard scan"""
+    pytest.importorskip("numpy")
+    import random
+    from services.resolution import TrigramIndex, trigrams, normalize
+
+    assert normalize("Gel  Memory-Foam_Pillow") == "gel memory foam pillow"
+    assert normalize("Crème Brûlée") == "creme brulee"
+    assert trigrams("Gel") == {"  g", " ge", "gel", "el "}
+
+    random.seed(7)
+    words = ["gel", "memory", "foam", "cooling", "pillow", "latex", "king", "queen", "bamboo"]
+    names = [" ".join(random.sample(words, random.randint(1, 4))) for _ in range(500)]
+    index = TrigramIndex((f"e{i}", name) for i, name in enumerate(names))
+    for query in ["gel memory foam", "Gel Memory-Foam", "gel-infused memory foam", "kng pilow"]:
+        grams = trigrams(query)
+        expected = sorted(
+            (len(grams & trigrams(name)) / len(grams | trigrams(name)) for name in names), reverse=True
+        )
+        expected = [round(score, 9) for score in expected[:5] if score >= 0.3]
+        assert [round(score, 9) for score, _, _ in index.search(grams, 5, 0.3)] == expected
 
-    # Mock query result
-    mock_result = MagicMock()
-    mock_record1 = {"product": "Test Product 1"}
-    mock_record2 = {"product": "Test Product 2"}
-    mock_result.__iter__ = Mock(return_value=iter([mock_record1, mock_record2]))
-    session.run.return_value = mock_result
 
-    # Execute
-    result = graph_service.execute_cypher(
-        query="MATCH (p:Product) RETURN p.name as product",
-        params={}
-    )
+def test_trigram_index_follows_adds_and_removes():
+    """Test added, renamed and removed entities are reflected without a rebuild"""
+    pytest.importorskip("numpy")
+    from services.resolution import TrigramIndex, trigrams
 
-    # Assert
-    assert len(result) == 2
-    session.run.assert_called_once()
+    index = TrigramIndex([("f1", "Gel Memory Foam"), ("f2", "Latex Foam")])
+    query = trigrams("gel memory-foam")
+    assert [entity_id for _, entity_id, _ in index.search(query, 5, 0.3)] == ["f1"]
 
+    index.add("f3", "gel memory foam")
+    index.add("f1", "Bamboo Cover")
+    assert [entity_id for _, entity_id, _ in index.search(query, 5, 0.3)] == ["f3"]
+    index.remove("f3")
+    assert index.search(query, 5, 0.3) == []
+    assert len(index) == 2 and "f1" in index and "f3" not in index
 
-def test_execute_cypher_dangerous_query(graph_service):
-    """Test that dangerous queries are rejected"""
-    with pytest.raises(ValueError, match="dangerous operation"):
-        graph_service.execute_cypher("DROP DATABASE", {})
 
+def test_semantic_index_ivf_matches_exact_scan():
+    """Test IVF search probing every cluster equals a brute-force cosine scan"""
+    np = pytest.importorskip("numpy")
+    import random
+    from services.semantic import SemanticIndex, tokens
 
-def test_health_check_success(graph_service, mock_neo4j_driver):
-    """Test successful health check"""
-    driver, session = mock_neo4j_driver
+    assert tokens("Cooling Pillows, 2-pack") == ["cooling", "pillow", "2", "pack"]
 
-    mock_result = Mock()
-    mock_result.single.return_value = {"test": 1}
-    session.run.return_value = mock_result
+    random.seed(3)
+    words = ["gel", "memory", "foam", "cooling", "pillow", "latex", "king", "queen", "bamboo", "cover"]
+    documents = [
+        (f"p{i}", " ".join(random.sample(words, 2)), " ".join(random.choices(words, k=8)))
+        for i in range(400)
+    ]
+    exact = SemanticIndex({"Product": documents}, dimensions=64, ivf_min_entities=0)
+    clustered = SemanticIndex({"Product": documents}, dimensions=64, ivf_min_entities=100, ivf_probes=20)
+    assert exact.info()["clusters"] == {} and clustered.info()["clusters"] == {"Product": 20}
+
+    vectors = exact._indexes["Product"]._matrix
+    for query in ["cooling gel pillow", "bamboo covers", "king latex"]:
+        expected = np.sort(vectors @ exact.embed(tokens(query)))[::-1][:5]
+        for index in (exact, clustered):
+            scores = [match["score"] for match in index.search(query, limit=5)]
+            assert np.allclose(scores, expected, atol=1e-6)
+
+
+def test_semantic_index_follows_writes():
+    """Test added, re-described, renamed and removed entities are reflected without a rebuild"""
+    pytest.importorskip("numpy")
+    from services.semantic import SemanticIndex
+
+    index = SemanticIndex({
+        "Product": [
+            ("p1", "Cloud Pillow", "cooling gel memory foam"),
+            ("p2", "Firm Mattress", "pocket springs and latex")
+        ]
+    })
+    assert [match["id"] for match in index.search("cooling gel foam")] == ["p1"]
+
+    index.merge("Product", "p3", {"name": "Arctic Pillow", "description": "cooling gel layer"})
+    index.merge(None, "p1", {"description": "organic cotton"})
+    index.merge(None, "p2", {"name": "Soft Mattress"})
+    assert [match["id"] for match in index.search("cooling gel")] == ["p3"]
+    assert index.search("cloud cotton")[0]["id"] == "p1"
+    assert index.search("latex")[0]["name"] == "Soft Mattress"
+
+    index.remove("p3")
+    assert index.search("arctic") == []
+    assert index.info()["entities"] == 2
+
+
+def _batch_operations():
+    return [
+        {"op": "create", "entity_type": "Product", "properties": {
+            "id": "p1", "name": "Cloud Pillow", "sku": "SKU-1", "category": "pillows", "brand": "Acme"
+        }},
+        {"op": "create", "entity_type": "Feature", "properties": {"id": "f1", "name": "Gel", "feature_type": "material"}},
+        {"op": "relate", "from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE", "properties": {"confidence": 0.9}},
+        {"op": "create", "entity_type": "Feature", "properties": {"id": "f2", "name": "Latex", "feature_type": "material"}},
+        {"op": "relate", "from_id": "p1", "to_id": "f2", "rel_type": "HAS_FEATURE"},
+        {"op": "update", "id": "f1", "properties": {"importance_score": 0.8}},
+        {"op": "delete", "id": "f0", "entity_type": "Feature"}
+    ]
 
-    result = graph_service.health_check()
 
-    assert result is True
+def test_plan_batch_groups_operations_by_kind_and_label():
+    """Test batch operations are grouped into few UNWIND statements without reordering dependents"""
+    from services.batch import plan_batch
 
+    plan = plan_batch(_batch_operations(), lambda entity_id, entity_type: (entity_type, False))
+
+    assert [(statement.op, len(statement.rows)) for statement in plan.statements] == [
+        ("create", 1), ("create", 2), ("relate", 2), ("update", 1), ("delete", 1)
+    ]
+    assert "MATCH (n:Feature {id: row.id})" in plan.statements[3].query
+    assert "MATCH (from:Product {id: row.from_id})" in plan.statements[2].query
+    assert plan.counts() == {"created": 3, "updated": 1, "deleted": 1, "related": 2}
+
+    # Re-creating a deleted id must stay after the delete
+    recreate = plan_batch([
+        {"op": "create", "entity_type": "Scenario", "properties": {"id": "s1", "name": "Summer"}},
+        {"op": "delete", "id": "s2", "entity_type": "Scenario"},
+        {"op": "create", "entity_type": "Scenario", "properties": {"id": "s2", "name": "Winter"}}
+    ], lambda entity_id, entity_type: (entity_type, False))
+    assert [statement.op for statement in recreate.statements] == ["create", "delete", "create"]
+
+
+def test_plan_batch_validates_against_models():
+    """Test every invalid operation is reported before anything is planned"""
+    from services.batch import BatchError, plan_batch
+
+    with pytest.raises(BatchError) as error:
+        plan_batch([
+            {"op": "create", "entity_type": "Offer", "properties": {"id": "o1", "name": "Deal", "price": 0}},
+            {"op": "create", "entity_type": "Feature", "properties": {"id": "f1", "name": "Gel", "feature_type": "x"}},
+            {"op": "update", "id": "f1", "properties": {"importance_score": 2}},
+            {"op": "relate", "from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE",
+             "properties": {"confidence": -1}},
+            {"op": "merge", "id": "f1"},
+            {"op": "update", "id": "f1", "properties": {"id": "f2"}}
+        ], lambda entity_id, entity_type: (entity_type, False))
+
+    errors = {entry["index"]: entry["error"] for entry in error.value.errors}
+    assert sorted(errors) == [0, 2, 3, 4, 5]
+    assert "price: Input should be greater than 0" in errors[0]
+    assert "importance_score" in errors[2]
+    assert "confidence" in errors[3]
+    assert "Unknown operation" in errors[4]
+
+
+def _offers():
+    return [
+        {"id": "o1", "sku": "S1", "region": "US", "price": 12.0, "availability": True,
+         "updated_at": "2024-05-01T10:00:00"},
+        {"id": "o2", "sku": "S1", "region": "US", "price": 9.0, "availability": True,
+         "valid_until": "2024-06-01T00:00:00", "updated_at": "2024-05-02T10:00:00"},
+        {"id": "o3", "sku": "S1", "region": "EU", "price": 8.0, "availability": False},
+        {"id": "o4", "sku": "S1", "region": "US", "price": 5.0, "availability": True,
+         "valid_from": "2024-07-01T00:00:00+00:00"},
+        {"id": "o5", "region": "US", "price": 1.0, "availability": True}
+    ]
+
+
+def test_offer_index_filters_validity_window():
+    """Test lookups honour valid_from/valid_until, availability and price order"""
+    from services.offers import OfferIndex, parse_timestamp
+
+    index = OfferIndex()
+    index.load(_offers())
+    may = parse_timestamp("2024-05-15T00:00:00")
+    july = parse_timestamp("2024-07-15T00:00:00")
+
+    assert [offer["id"] for offer in index.lookup("S1", "US", at=may)] == ["o2", "o1"]
+    assert [offer["id"] for offer in index.lookup("S1", "US", at=july)] == ["o4", "o1"]
+    assert [offer["id"] for offer in index.lookup("S1", at=may)] == ["o2", "o1"]
+    assert [offer["id"] for offer in index.lookup("S1", at=may, include_unavailable=True)] == ["o2", "o1", "o3"]
+    assert "starts" not in index.lookup("S1", "US", at=may)[0]
+    assert index.metrics()["offers"] == 4  # o5 has no sku
+    assert index.watermark == "2024-05-02T10:00:00"
+
+    # Partial writes keep the other fields; moving region re-keys the offer
+    index.merge("o1", {"price": 4.0, "region": "EU"})
+    assert [(offer["id"], offer["price"]) for offer in index.lookup("S1", "EU", at=may)] == [("o1", 4.0)]
+    assert [offer["id"] for offer in index.lookup("S1", "US", at=may)] == ["o2"]
+    index.remove("o2")
+    assert index.lookup("S1", "US", at=may) == []
+    assert "o2" not in index and "o1" in index
+
+
+def test_offer_delta_compares_raw_updated_at():
+    """Test the delta seeks the raw property from a UTC second watermark"""
+    from services.cypher import offers_query
+
+    query = offers_query(since=True)
+    assert "datetime(o.updated_at)" not in query
+    assert "o.updated_at >= $since" in query
+    assert "o.updated_at >= datetime($since)" in query
+
+
+def _card_row(product_id="p1", **overrides):
+    row = {
+        "product": {"id": product_id, "name": "CoolMax Pillow", "sku": "S1", "content_hash": "abc"},
+        "features": [
+            {"id": "f1", "name": "Gel Foam", "importance_score": 0.5, "confidence": 0.9},
+            {"id": "f2", "name": "Bamboo Cover", "importance_score": 0.9, "confidence": 0.8}
+        ],
+        "problems": [
+            {"id": "hot", "name": "Night Sweats", "severity": "high", "effectiveness": 0.6, "via": None},
+            {"id": "hot", "name": "Night Sweats", "severity": "high", "effectiveness": 0.8, "via": "f1"},
+            {"id": "pain", "name": "Neck Pain", "severity": "low", "effectiveness": 0.7, "via": "f2"}
+        ],
+        "user_groups": [{"id": "g2", "name": "Athletes", "priority": 2}, {"id": "g1", "name": "Hot Sleepers", "priority": 1}],
+        "offers": [
+            {"id": "o1", "sku": "S1", "price": 30.0, "availability": True},
+            {"id": "o2", "sku": "S1", "price": 20.0, "availability": True,
+             "valid_from": "2024-05-01T00:00:00", "valid_until": "2024-06-01T00:00:00"},
+            {"id": "o3", "sku": "S1", "price": 10.0, "availability": False}
+        ],
+        "competitors": [{"id": "c1", "name": "Purple", "comparison_type": "cheaper"}]
+    }
+    row.update(overrides)
+    return row
+
+
+def test_product_card_render_picks_best_offer_and_expiry():
+    """Test a card merges problems, orders its lists and picks the cheapest valid offer"""
+    import json
+    from services.cards import render
+    from services.offers import parse_timestamp
+
+    may = parse_timestamp("2024-05-15T00:00:00")
+    product_id, card = render(_card_row(), at=may)
+    body = json.loads(card.blob)
+
+    assert product_id == "p1"
+    assert body["product"] == {"id": "p1", "name": "CoolMax Pillow", "sku": "S1"}
+    assert [feature["id"] for feature in body["features"]] == ["f2", "f1"]
+    assert body["problems"][0] == {
+        "id": "hot", "name": "Night Sweats", "severity": "high", "effectiveness": 0.8, "via": ["f1"]
+    }
+    assert [group["id"] for group in body["user_groups"]] == ["g1", "g2"]
+    assert (body["best_offer"]["id"], body["offer_count"]) == ("o2", 2)
+    assert card.expires_at == parse_timestamp("2024-06-01T00:00:00")
+    assert set(card.related) == {"f1", "f2", "hot", "pain", "g1", "g2", "o1", "o2", "o3", "c1"}
+
+    _, later = render(_card_row(), at=parse_timestamp("2024-07-01T00:00:00"))
+    assert json.loads(later.blob)["best_offer"]["id"] == "o1"
+    assert later.expires_at is None
+
+
+def test_product_card_index_tracks_dirty_cards_and_snapshots(tmp_path):
+    """Test writes to related entities dirty the right cards and snapshots round-trip"""
+    import json
+    from services.cards import ProductCardIndex
+
+    index = ProductCardIndex()
+    index.touch(["p1"])
+    assert not index.dirty  # nothing to dirty before the first build
+    index.load([_card_row("p1"), _card_row("p2", features=[], problems=[], offers=[])])
+
+    found, pending = index.get(["p1", "p2", "p9"])
+    assert set(found) == {"p1", "p2"} and pending == []
+    index.touch(["f1"])
+    index.touch(["p9"], products=["p3"])
+    assert sorted(index.claim()) == ["p1", "p3"]
+    assert not index.dirty
+
+    index.remove("c1")  # both products compare with c1
+    assert sorted(index.claim()) == ["p1", "p2"]
+    index.update_products(["p1", "p2"], [_card_row("p1", competitors=[])])
+    assert set(index.get(["p1", "p2"])[0]) == {"p1"}
+    assert json.loads(index.get(["p1"])[0]["p1"])["competitors"] == []
+
+    index.touch(["f2"])
+    path = str(tmp_path / "cards.ndjson")
+    assert index.save(path) == 1
+    restored = ProductCardIndex()
+    assert restored.restore(path, max_age=60)
+    assert restored.get(["p1"]) == ({"p1": index.get(["p1"])[0]["p1"]}, ["p1"])
+    restored.claim()
+    restored.touch(["o1"])
+    assert restored.claim() == ["p1"]
+    assert not ProductCardIndex().restore(path, max_age=0)
+    assert not ProductCardIndex().restore(str(tmp_path / "missing.ndjson"), max_age=60)
+
+
+def test_bulk_loader_reads_typed_csv_and_ndjson(tmp_path):
+    """Test file rows are typed and shaped for the bulk service calls"""
+    from services.bulk_loader import read_rows, entity_rows, relationship_rows
+
+    products = tmp_path / "products.csv"
+    products.write_text("id,name,price:float,stock:int,sku\np1,Widget,9.5,3,007\np2,Gadget,,1,008\n")
+    links = tmp_path / "links.ndjson"
+    links.write_text('{"from_id": "p1", "to_id": "f1", "to_type": "Feature", "confidence": 0.9}\n\n')
+
+    entities = list(entity_rows(read_rows(str(products)), "Product"))
+    assert entities[0] == {
+        "entity_type": "Product",
+        "properties": {"id": "p1", "name": "Widget", "price": 9.5, "stock": 3, "sku": "007"}
+    }
+    assert "price" not in entities[1]["properties"]
+
+    relationships = list(relationship_rows(read_rows(str(links)), "HAS_FEATURE"))
+    assert relationships == [{
+        "from_id": "p1", "to_id": "f1", "rel_type": "HAS_FEATURE",
+        "from_type": None, "to_type": "Feature", "properties": {"confidence": 0.9}
+    }]
+
+    with pytest.raises(ValueError, match="Unsupported input format"):
+        read_rows(str(tmp_path / "data.xml"))
+
+
+def test_bulk_loader_synthetic_catalog_is_consistent():
+    """Test synthetic relationships only reference generated, typed entities"""
+    from services.bulk_loader import synthetic_entities, synthetic_relationships
+
+    entities = {row["properties"]["id"]: row["entity_type"] for row in synthetic_entities(1000)}
+    relationships = list(synthetic_relationships(1000))
+
+    assert 990 <= len(entities) <= 1000
+    assert relationships
+    assert all(entities[row["from_id"]] == row["from_type"] == "Product" for row in relationships)
+    assert all(entities[row["to_id"]] == row["to_type"] for row in relationships)
+    assert list(synthetic_relationships(1000)) == relationships
+
+
+def test_bulk_loader_runs_parallel_batches_and_reports():
+    """Test batches are written concurrently and errors map to input rows"""
+    from services.bulk_loader import BulkLoader, format_report
+
+    service = Mock()
+    service.create_entities_bulk.side_effect = lambda batch, batch_size: {
+        "created": len(batch) - 1,
+        "failed": 1,
+        "errors": [{"index": 1, "id": batch[1]["properties"]["id"], "error": "exists"}]
+    }
+    service.upsert_relationships_bulk.return_value = {
+        "created": 1, "matched": 1, "missing": 1, "failed": 0, "errors": []
+    }
+    loader = BulkLoader(service, batch_size=3, workers=2)
+
+    rows = ({"entity_type": "Product", "properties": {"id": f"p{i}"}} for i in range(8))
+    report = loader.load_entities(rows)
+
+    # The last batch holds two rows
+    assert report["rows"] == 8
+    assert service.create_entities_bulk.call_count == 3
+    assert report["written"] == 5
+    assert report["failed"] == 3
+    assert sorted(error["index"] for error in report["errors"]) == [1, 4, 7]
+
+    relationships = loader.load_relationships([{"from_id": "a", "to_id": "b"}] * 3)
+    assert relationships["written"] == 2
+    assert relationships["missing"] == 1
+    assert "relationships" in format_report([report, relationships])
+
+
+def test_content_hash_ignores_timestamps_and_key_order():
+    """Test the upsert digest only changes with real content changes"""
+    from services.cypher import content_hash
+
+    base = content_hash({"id": "p1", "name": "Widget", "price": 10})
+    assert content_hash({"price": 10, "name": "Widget", "id": "p1", "updated_at": "2024-01-01"}) == base
+    assert content_hash({"id": "p1", "name": "Widget", "price": 11}) != base
+
+
+def test_upsert_entities_skips_unchanged(graph_service, mock_neo4j_driver):
+    """Test only new or changed entities are written"""
+    from services.cypher import content_hash
 
-def test_health_check_failure(graph_service, mock_neo4j_driver):
-    """Test failed health check"""
     driver, session = mock_neo4j_driver
-    session.run.side_effect = Exception("Connection failed")
+    unchanged = {"id": "p1", "name": "Widget"}
+    changed = {"id": "p2", "name": "Gadget v2"}
+    new = {"id": "p3", "name": "Gizmo"}
+    session.execute_read.return_value = {
+        "p1": content_hash(unchanged),
+        "p2": content_hash({"id": "p2", "name": "Gadget"})
+    }
+    session.execute_write.return_value = 2
+
+    result = graph_service.upsert_entities([
+        {"entity_type": "Product", "properties": unchanged},
+        {"entity_type": "Product", "properties": changed},
+        {"entity_type": "Product", "properties": new},
+        {"entity_type": "Nope", "properties": {"id": "x"}}
+    ])
+
+    assert result == {
+        "written": 2, "skipped": 1, "failed": 1,
+        "errors": [{"index": 3, "id": "x", "error": "Invalid entity type: Nope"}]
+    }
+    rows = session.execute_write.call_args.args[2]
+    assert [row["id"] for row in rows] == ["p2", "p3"]
+    assert rows[0]["hash"] == content_hash(changed)
+
+    # Nothing changed: no write transaction at all
+    session.execute_write.reset_mock()
+    session.execute_read.return_value = {"p1": content_hash(unchanged)}
+    result = graph_service.upsert_entities([{"entity_type": "Product", "properties": unchanged}])
+    assert result["skipped"] == 1
+    session.execute_write.assert_not_called()
+
+
+def test_upsert_entities_batch_query_guards_on_hash():
+    """Test the write repeats the hash check and partial updates void the hash"""
+    from services.cypher import upsert_entities_batch_query, update_entity_query
+
+    query = upsert_entities_batch_query("Product")
+    assert "MERGE (n:Product {id: row.id})" in query
+    assert "n.content_hash <> row.hash" in query
+    assert "n.content_hash = null" in update_entity_query("Product", ["name"])
+
+
+def test_append_changes_query_takes_no_shared_lock():
+    """Test writers append pending events and only the sequencer numbers them"""
+    from services.cypher import append_changes_query, changes_query, sequence_changes_query
+
+    query = append_changes_query()
+    assert "ChangeSequence" not in query
+    assert "CREATE (c:ChangeEvent:PendingChange)" in query
+    assert "c.seq" not in query
+    assert "ORDER BY c.stamp, c.position LIMIT $limit" in sequence_changes_query()
+    assert "REMOVE c:PendingChange" in sequence_changes_query()
+    assert "ORDER BY c.seq" in changes_query()
+
+
+def test_etl_change_log_matches_the_change_feed_format():
+    """Test the ETL pipeline's copy of the append query and events has not drifted"""
+    import importlib.util
+    from pathlib import Path
+    from services.changes import entity_change, relationship_change
+    from services.cypher import append_changes_query
+
+    path = Path(__file__).parents[2] / "etl-processing" / "processors" / "change_log.py"
+    spec = importlib.util.spec_from_file_location("etl_change_log", path)
+    etl = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(etl)
+
+    assert etl.APPEND_CHANGES_QUERY.split() == append_changes_query().split()
+    assert etl.entity_change("create", "Feature", "f1", {"name": "Gel"}) == dict(
+        entity_change("create", "Feature", "f1", {"name": "Gel"}), source="etl-processing"
+    )
+    assert etl.relationship_change("HAS_FEATURE", "p1", "f1", {"confidence": 0.9}) == dict(
+        relationship_change("create", "HAS_FEATURE", "p1", "f1", {"confidence": 0.9}),
+        source="etl-processing"
+    )
 
-    result = graph_service.health_check()
 
-    assert result is False
+def test_bulk_write_changes_cover_written_rows_only():
+    """Test upsert and merge events skip unchanged rows and missing endpoints"""
+    from services.changes import merge_changes, upsert_changes
 
+    rows = [
+        {"id": "p1", "properties": {"id": "p1", "name": "A"}, "hash": "a"},
+        {"id": "p2", "properties": {"id": "p2", "name": "B"}, "hash": "b"},
+        {"id": "p3", "properties": {"id": "p3", "name": "C"}, "hash": "c"}
+    ]
+    events = upsert_changes("Product", rows, ["p1", "p2"], {"p2": "old"}, "2024-01-01")
+    assert [(event["op"], event["entity_id"]) for event in events] == [("create", "p1"), ("update", "p2")]
 
-def test_close(graph_service):
-    """Test closing service connection"""
-    # Should not raise exception
-    graph_service.close()
-    assert True
+    relationships = [
+        {"index": i, "from_id": f"p{i}", "to_id": "f1", "properties": {}} for i in range(3)
+    ]
+    events = merge_changes("HAS_FEATURE", relationships, {"created_rows": [2], "matched_rows": [0]})
+    assert [(event["op"], event["from_id"]) for event in events] == [("update", "p0"), ("create", "p2")]
+
+
+def test_change_labels_are_not_entities():
+    """Test change log nodes are left out of statistics, exports and unlabelled search"""
+    from services.cypher import export_node_queries, graph_stats, search_entities_query
+
+    stats = graph_stats([
+        {"kind": "total", "name": None, "count": 12},
+        {"kind": "internal", "name": "ChangeEvent", "count": 9},
+        {"kind": "internal", "name": "ChangeSequence", "count": 1}
+    ])
+    assert stats["total_nodes"] == 2
+    assert "NOT n:ChangeEvent" in export_node_queries(None)[0]
+    assert "NOT n:ChangeEvent" in search_entities_query(None, None, {"op": "create"}, 10)[0]